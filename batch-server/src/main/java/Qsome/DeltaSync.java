@@ -0,0 +1,469 @@
+// File: Qsome/DeltaSync.java
+package Qsome;
+
+import org.json.JSONArray;
+import org.json.JSONObject;
+
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.DataInputStream;
+import java.io.DataOutputStream;
+import java.io.EOFException;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.RandomAccessFile;
+import java.nio.ByteBuffer;
+import java.nio.MappedByteBuffer;
+import java.nio.channels.FileChannel;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.StandardCopyOption;
+import java.nio.file.attribute.FileTime;
+import java.security.MessageDigest;
+import java.security.NoSuchAlgorithmException;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+import java.util.stream.Stream;
+
+/**
+ * rsync-style directory sync helpers for the orchestrator side of sync_push / sync_pull.
+ * The manifest, signature and delta formats match the RPA client's commands/sync.py:
+ * a manifest maps relative paths ('/' separated) to [size, mtimeMs]; signatures are
+ * [weak, strong] per full block; a delta is a stream of F/C/D/E/X/Z records.
+ */
+public class DeltaSync {
+    public static final int DEFAULT_BLOCK_SIZE = 64 * 1024;
+    private static final byte[] DELTA_MAGIC = "RPADELTA1\n".getBytes(StandardCharsets.US_ASCII);
+    private static final int MAX_LITERAL = 1024 * 1024;
+    private static final String SYNC_DIR_NAME = ".sync";
+
+    private DeltaSync() {
+    }
+
+    /** Returns {relative path: [size, mtimeMs]} for the files under root. */
+    public static JSONObject scanDirectory(Path root) throws IOException {
+        JSONObject manifest = new JSONObject();
+        if (!Files.isDirectory(root)) {
+            return manifest;
+        }
+        try (Stream<Path> paths = Files.walk(root)) {
+            for (Path path : (Iterable<Path>) paths::iterator) {
+                Path relative = root.relativize(path);
+                if (!Files.isRegularFile(path) || relative.startsWith(SYNC_DIR_NAME)) {
+                    continue;
+                }
+                JSONArray entry = new JSONArray();
+                entry.put(Files.size(path));
+                entry.put(Files.getLastModifiedTime(path).toMillis());
+                manifest.put(relative.toString().replace('\\', '/'), entry);
+            }
+        }
+        return manifest;
+    }
+
+    /** Paths of the source manifest that are missing from the destination or differ in size or mtime. */
+    public static List<String> changedPaths(JSONObject source, JSONObject destination) {
+        List<String> changed = new ArrayList<>();
+        for (String path : source.keySet()) {
+            JSONArray entry = source.getJSONArray(path);
+            JSONArray other = destination.optJSONArray(path);
+            if (other == null || other.getLong(0) != entry.getLong(0) || other.getLong(1) != entry.getLong(1)) {
+                changed.add(path);
+            }
+        }
+        return changed;
+    }
+
+    /** Joins a manifest path to root, refusing paths that would escape it. */
+    public static Path resolveRelative(Path root, String relativePath) {
+        Path base = root.toAbsolutePath().normalize();
+        Path path = base.resolve(relativePath).normalize();
+        if (!path.startsWith(base) || path.equals(base)) {
+            throw new IllegalArgumentException("Path '" + relativePath + "' is outside the sync directory.");
+        }
+        return path;
+    }
+
+    private static int weakHash(ByteSource data, long offset, int length) {
+        int a = 0;
+        int b = 0;
+        for (int i = 0; i < length; i++) {
+            int value = data.get(offset + i);
+            a += value;
+            b += (length - i) * value;
+        }
+        return (a & 0xFFFF) | ((b & 0xFFFF) << 16);
+    }
+
+    private static String strongHash(byte[] block, int length) {
+        try {
+            MessageDigest md5 = MessageDigest.getInstance("MD5");
+            md5.update(block, 0, length);
+            StringBuilder hex = new StringBuilder();
+            byte[] digest = md5.digest();
+            for (int i = 0; i < 8; i++) {
+                hex.append(String.format("%02x", digest[i]));
+            }
+            return hex.toString();
+        } catch (NoSuchAlgorithmException e) {
+            throw new IllegalStateException(e);
+        }
+    }
+
+    /** [[weak, strong], ...] for each full block of the file. */
+    public static JSONArray blockSignatures(Path file, int blockSize) throws IOException {
+        JSONArray signatures = new JSONArray();
+        byte[] block = new byte[blockSize];
+        try (InputStream in = new BufferedInputStream(Files.newInputStream(file))) {
+            while (in.readNBytes(block, 0, blockSize) == blockSize) {
+                JSONArray signature = new JSONArray();
+                signature.put(weakHash(ByteSource.of(block), 0, blockSize));
+                signature.put(strongHash(block, blockSize));
+                signatures.put(signature);
+            }
+        }
+        return signatures;
+    }
+
+    /** Random access to the source file: memory-mapped, or read through a small window if over 2 GB. */
+    private interface ByteSource {
+        int get(long offset) throws IOException;
+
+        void read(long offset, byte[] into, int length) throws IOException;
+
+        static ByteSource of(byte[] bytes) {
+            return new ByteSource() {
+                public int get(long offset) {
+                    return bytes[(int) offset] & 0xFF;
+                }
+
+                public void read(long offset, byte[] into, int length) {
+                    System.arraycopy(bytes, (int) offset, into, 0, length);
+                }
+            };
+        }
+
+        static ByteSource of(MappedByteBuffer buffer) {
+            return new ByteSource() {
+                public int get(long offset) {
+                    return buffer.get((int) offset) & 0xFF;
+                }
+
+                public void read(long offset, byte[] into, int length) {
+                    ByteBuffer view = buffer.duplicate();
+                    view.position((int) offset);
+                    view.get(into, 0, length);
+                }
+            };
+        }
+    }
+
+    /** Writes delta records. */
+    public static class DeltaWriter implements AutoCloseable {
+        private final DataOutputStream out;
+        private long literalBytes;
+        private long copiedBlocks;
+        private int pendingIndex = -1;
+        private int pendingCount;
+
+        public DeltaWriter(OutputStream out) throws IOException {
+            this.out = new DataOutputStream(new BufferedOutputStream(out));
+            this.out.write(DELTA_MAGIC);
+        }
+
+        private void writePath(String path) throws IOException {
+            byte[] encoded = path.getBytes(StandardCharsets.UTF_8);
+            out.writeInt(encoded.length);
+            out.write(encoded);
+        }
+
+        void beginFile(String path, long size, long mtimeMs, int blockSize) throws IOException {
+            out.writeByte('F');
+            writePath(path);
+            out.writeLong(size);
+            out.writeLong(mtimeMs);
+            out.writeInt(blockSize);
+        }
+
+        void copy(int blockIndex) throws IOException {
+            if (pendingIndex >= 0 && pendingIndex + pendingCount == blockIndex) {
+                pendingCount++;
+                return;
+            }
+            flushCopies();
+            pendingIndex = blockIndex;
+            pendingCount = 1;
+        }
+
+        private void flushCopies() throws IOException {
+            if (pendingIndex >= 0) {
+                out.writeByte('C');
+                out.writeInt(pendingIndex);
+                out.writeInt(pendingCount);
+                copiedBlocks += pendingCount;
+                pendingIndex = -1;
+            }
+        }
+
+        void literal(byte[] data, int length) throws IOException {
+            flushCopies();
+            out.writeByte('D');
+            out.writeInt(length);
+            out.write(data, 0, length);
+            literalBytes += length;
+        }
+
+        void endFile(byte[] sha256) throws IOException {
+            flushCopies();
+            out.writeByte('E');
+            out.write(sha256);
+        }
+
+        public void delete(String path) throws IOException {
+            out.writeByte('X');
+            writePath(path);
+        }
+
+        public long getLiteralBytes() {
+            return literalBytes;
+        }
+
+        public long getCopiedBlocks() {
+            return copiedBlocks;
+        }
+
+        @Override
+        public void close() throws IOException {
+            out.writeByte('Z');
+            out.close();
+        }
+    }
+
+    private static void emitLiteral(DeltaWriter writer, ByteSource data, long start, long end, byte[] buffer) throws IOException {
+        for (long offset = start; offset < end; offset += MAX_LITERAL) {
+            int length = (int) Math.min(MAX_LITERAL, end - offset);
+            data.read(offset, buffer, length);
+            writer.literal(buffer, length);
+        }
+    }
+
+    /**
+     * Appends the delta that turns the destination's version of a file (described by its block
+     * signatures; null for a new file) into source. Blocks the destination already has are found at
+     * any offset with the rolling checksum and sent as copies.
+     */
+    public static void writeFileDelta(DeltaWriter writer, String relativePath, Path source, long mtimeMs,
+                                      JSONArray signatures, int blockSize) throws IOException {
+        long size = Files.size(source);
+        writer.beginFile(relativePath, size, mtimeMs, blockSize);
+        MessageDigest sha256;
+        try {
+            sha256 = MessageDigest.getInstance("SHA-256");
+        } catch (NoSuchAlgorithmException e) {
+            throw new IOException(e);
+        }
+        byte[] buffer = new byte[Math.max(MAX_LITERAL, blockSize)];
+        try (RandomAccessFile file = new RandomAccessFile(source.toFile(), "r")) {
+            ByteSource data;
+            if (size <= Integer.MAX_VALUE) {
+                data = ByteSource.of(file.getChannel().map(FileChannel.MapMode.READ_ONLY, 0, size));
+            } else {
+                // Too large to map: no block matching, the file is sent as literals.
+                signatures = null;
+                data = new ByteSource() {
+                    public int get(long offset) throws IOException {
+                        file.seek(offset);
+                        return file.read();
+                    }
+
+                    public void read(long offset, byte[] into, int length) throws IOException {
+                        file.seek(offset);
+                        file.readFully(into, 0, length);
+                    }
+                };
+            }
+
+            long literalStart = 0;
+            if (signatures != null && signatures.length() > 0 && size >= blockSize) {
+                Map<Integer, List<Object[]>> blocks = new HashMap<>();
+                for (int i = 0; i < signatures.length(); i++) {
+                    JSONArray signature = signatures.getJSONArray(i);
+                    blocks.computeIfAbsent(signature.getInt(0), k -> new ArrayList<>()).add(new Object[]{i, signature.getString(1)});
+                }
+                long k = 0;
+                int weak = weakHash(data, 0, blockSize);
+                int a = weak & 0xFFFF;
+                int b = weak >>> 16;
+                while (true) {
+                    int match = -1;
+                    List<Object[]> candidates = blocks.get((a & 0xFFFF) | ((b & 0xFFFF) << 16));
+                    if (candidates != null) {
+                        data.read(k, buffer, blockSize);
+                        String strong = strongHash(buffer, blockSize);
+                        for (Object[] candidate : candidates) {
+                            if (strong.equals(candidate[1])) {
+                                match = (Integer) candidate[0];
+                                break;
+                            }
+                        }
+                    }
+                    if (match >= 0) {
+                        emitLiteral(writer, data, literalStart, k, buffer);
+                        writer.copy(match);
+                        k += blockSize;
+                        literalStart = k;
+                        if (k + blockSize > size) {
+                            break;
+                        }
+                        weak = weakHash(data, k, blockSize);
+                        a = weak & 0xFFFF;
+                        b = weak >>> 16;
+                        continue;
+                    }
+                    if (k + blockSize >= size) {
+                        break;
+                    }
+                    // Roll the window one byte: a and b are kept mod 2^16.
+                    int out = data.get(k);
+                    int in = data.get(k + blockSize);
+                    a = (a - out + in) & 0xFFFF;
+                    b = (b - blockSize * out + a) & 0xFFFF;
+                    k++;
+                }
+            }
+            emitLiteral(writer, data, literalStart, size, buffer);
+
+            for (long offset = 0; offset < size; offset += MAX_LITERAL) {
+                int length = (int) Math.min(MAX_LITERAL, size - offset);
+                data.read(offset, buffer, length);
+                sha256.update(buffer, 0, length);
+            }
+        }
+        writer.endFile(sha256.digest());
+    }
+
+    /**
+     * Applies a delta to the directory root. Every file is written to a temporary file beside its
+     * destination and checked against its SHA-256; files are only moved into place, and deletions
+     * made, once the whole delta has been staged, so a bad delta changes nothing.
+     *
+     * @return {"updated": n, "deleted": n}
+     */
+    public static JSONObject applyDelta(Path delta, Path root) throws IOException {
+        List<Path[]> staged = new ArrayList<>();
+        List<Long> stagedMtimes = new ArrayList<>();
+        List<Path> deletions = new ArrayList<>();
+        try (DataInputStream in = new DataInputStream(new BufferedInputStream(Files.newInputStream(delta)))) {
+            byte[] magic = new byte[DELTA_MAGIC.length];
+            in.readFully(magic);
+            if (!Arrays.equals(magic, DELTA_MAGIC)) {
+                throw new IOException("Not a sync delta.");
+            }
+            while (true) {
+                int record = in.readByte();
+                if (record == 'Z') {
+                    break;
+                }
+                if (record == 'X') {
+                    deletions.add(resolveRelative(root, readPath(in)));
+                    continue;
+                }
+                if (record != 'F') {
+                    throw new IOException("Unexpected delta record " + (char) record);
+                }
+                String relativePath = readPath(in);
+                long size = in.readLong();
+                long mtimeMs = in.readLong();
+                int blockSize = in.readInt();
+                Path target = resolveRelative(root, relativePath);
+                Files.createDirectories(target.getParent());
+                Path temp = target.resolveSibling("." + target.getFileName() + ".sync");
+                staged.add(new Path[]{temp, target});
+                stagedMtimes.add(mtimeMs);
+                applyFile(in, relativePath, target, temp, size, blockSize);
+            }
+        } catch (IOException | RuntimeException e) {
+            for (Path[] entry : staged) {
+                Files.deleteIfExists(entry[0]);
+            }
+            throw e;
+        }
+
+        for (int i = 0; i < staged.size(); i++) {
+            Path[] entry = staged.get(i);
+            Files.setLastModifiedTime(entry[0], FileTime.fromMillis(stagedMtimes.get(i)));
+            Files.move(entry[0], entry[1], StandardCopyOption.REPLACE_EXISTING, StandardCopyOption.ATOMIC_MOVE);
+        }
+        for (Path path : deletions) {
+            Files.deleteIfExists(path);
+        }
+        JSONObject result = new JSONObject();
+        result.put("updated", staged.size());
+        result.put("deleted", deletions.size());
+        return result;
+    }
+
+    private static void applyFile(DataInputStream in, String relativePath, Path target, Path temp, long size, int blockSize) throws IOException {
+        MessageDigest sha256;
+        try {
+            sha256 = MessageDigest.getInstance("SHA-256");
+        } catch (NoSuchAlgorithmException e) {
+            throw new IOException(e);
+        }
+        byte[] buffer = new byte[Math.max(MAX_LITERAL, blockSize)];
+        long written = 0;
+        try (OutputStream out = new BufferedOutputStream(Files.newOutputStream(temp));
+             RandomAccessFile basis = Files.isRegularFile(target) ? new RandomAccessFile(target.toFile(), "r") : null) {
+            while (true) {
+                int record = in.readByte();
+                if (record == 'C') {
+                    int index = in.readInt();
+                    int count = in.readInt();
+                    if (basis == null) {
+                        throw new IOException("Delta copies blocks of '" + relativePath + "', which does not exist.");
+                    }
+                    basis.seek((long) index * blockSize);
+                    for (int i = 0; i < count; i++) {
+                        try {
+                            basis.readFully(buffer, 0, blockSize);
+                        } catch (EOFException e) {
+                            throw new IOException("'" + relativePath + "' changed since its signatures were taken.");
+                        }
+                        out.write(buffer, 0, blockSize);
+                        sha256.update(buffer, 0, blockSize);
+                        written += blockSize;
+                    }
+                } else if (record == 'D') {
+                    int length = in.readInt();
+                    in.readFully(buffer, 0, length);
+                    out.write(buffer, 0, length);
+                    sha256.update(buffer, 0, length);
+                    written += length;
+                } else if (record == 'E') {
+                    byte[] expected = new byte[32];
+                    in.readFully(expected);
+                    if (!Arrays.equals(expected, sha256.digest())) {
+                        throw new IOException("SHA-256 mismatch for '" + relativePath + "'.");
+                    }
+                    break;
+                } else {
+                    throw new IOException("Unexpected delta record " + (char) record + " in '" + relativePath + "'.");
+                }
+            }
+        }
+        if (written != size) {
+            throw new IOException("'" + relativePath + "' is " + written + " bytes, expected " + size + ".");
+        }
+    }
+
+    private static String readPath(DataInputStream in) throws IOException {
+        byte[] encoded = new byte[in.readInt()];
+        in.readFully(encoded);
+        return new String(encoded, StandardCharsets.UTF_8);
+    }
+}
@@ -68,6 +68,7 @@ public class Main {
             testSendFileToRPA(); 
             testScreenshot();     
             testGetFileFromRPA(); 
+            testStreamFileFromRPA();
 
         } catch (Exception e) {
             System.err.println("An error occurred during the test flow: " + e.getMessage());
@@ -194,24 +195,24 @@ public class Main {
         
         JSONObject screenshotResponse = sendCommandAndAwaitResponse("screenshot", params);
 
-        if (screenshotResponse.optString("status").equalsIgnoreCase("file_uploaded")) {
-            JSONObject fileDetails = rpaOrchestratorNode.getRPACommandResponsePayload(screenshotResponse);
-            String filename = fileDetails.optString("filename");
-            String base64Content = fileDetails.optString("file_content_base64");
+        if (rpaOrchestratorNode.isRPACommandSuccessful(screenshotResponse)) {
+            JSONObject screenshotDetails = rpaOrchestratorNode.getRPACommandResponsePayload(screenshotResponse);
+            String base64Content = screenshotDetails.optString("image_base64");
+            String extension = screenshotDetails.optString("mimeType", "image/jpeg").replace("image/", "");
 
-            if (filename != null && !filename.isEmpty() && base64Content != null && !base64Content.isEmpty()) {
+            if (base64Content != null && !base64Content.isEmpty()) {
                 JSONObject fileTransferPayload = new JSONObject();
-                fileTransferPayload.put("filename", filename);
+                fileTransferPayload.put("filename", "screenshot_" + screenshotDetails.optString("contentHash") + "." + extension);
                 fileTransferPayload.put("file_content_base64", base64Content);
                 fileTransferPayload.put("request_id", screenshotResponse.optString("requestId")); 
 
                 Path savedPath = Node.receiveFileAndSave(fileTransferPayload, ORCHESTRATOR_DOWNLOAD_DIR);
                 System.out.println("Screenshot saved by Orchestrator to: " + savedPath.toAbsolutePath());
             } else {
-                System.err.println("Screenshot response missing file content details.");
+                System.err.println("Screenshot response missing inline image content.");
             }
         } else {
-            System.err.println("Screenshot command did not return expected 'file_uploaded' status.");
+            System.err.println("Screenshot command failed. Response: " + screenshotResponse.toString());
         }
     }
 
@@ -245,4 +246,12 @@ public class Main {
             System.err.println("Get File command did not return expected 'file_uploaded' status.");
         }
     }
+
+    private static void testStreamFileFromRPA() throws Exception {
+        System.out.println("\n--- Testing streaming get_file (RPA Client -> Orchestrator, chunked) ---");
+        String rpaClientSourceFilePath = "C:/Users/vaidh/Downloads/DSA Practice.xlsx";
+        Path target = Path.of(ORCHESTRATOR_DOWNLOAD_DIR, "streamed_" + new File(rpaClientSourceFilePath).getName());
+        Path savedPath = rpaOrchestratorNode.getFileFromRPAClient(NODE_ID, rpaClientSourceFilePath, target);
+        System.out.println("Streamed file saved by Orchestrator to: " + savedPath.toAbsolutePath() + " (" + Files.size(savedPath) + " bytes)");
+    }
 }
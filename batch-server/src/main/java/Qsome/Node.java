@@ -9,6 +9,11 @@ import java.nio.file.Path;
 import java.nio.file.Paths;
 import java.util.Base64;
 import java.util.HashMap;
+import java.util.HashSet;
+import java.util.Set;
+import java.security.MessageDigest;
+import java.security.NoSuchAlgorithmException;
+import java.util.List;
 import java.util.Map;
 import java.util.Stack;
 import java.util.UUID;
@@ -21,9 +26,14 @@ import java.util.logging.Logger;
 import java.nio.charset.StandardCharsets;
 import java.io.ByteArrayInputStream;
 import java.io.ByteArrayOutputStream;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.nio.file.StandardCopyOption;
+import java.nio.file.StandardOpenOption;
 
 // HTTP Client imports
 import java.net.URI;
+import java.net.URLEncoder;
 import java.net.http.HttpClient;
 import java.net.http.HttpRequest;
 import java.net.http.HttpResponse;
@@ -34,6 +44,7 @@ import org.json.JSONArray; // Added for Actions.touch method
 
 // AWT and JCodec imports (REQUIRED EXTERNAL DEPENDENCIES for JCodec, AWT is standard Java)
 import java.awt.Graphics2D;
+import java.awt.Rectangle;
 import java.awt.RenderingHints;
 import java.awt.event.KeyEvent;
 import java.awt.image.BufferedImage;
@@ -70,6 +81,10 @@ public class Node {
     public static final int COMMAND_EXECUTION_TIMEOUT_SECONDS = 60;
     // Interval for polling the command status
     private static final long POLLING_INTERVAL_MS = 500; // Poll every 500ms
+    // Chunked transfers: a transfer with no new chunk for this long is resumed from the bytes received
+    private static final int TRANSFER_STALL_TIMEOUT_SECONDS = 60;
+    private static final int TRANSFER_MAX_RESUMES = 5;
+    private static final long TRANSFER_POLLING_INTERVAL_MS = 50;
 
     public Node(String orchestratorNodeId, JSONObject nodeAttributes, String relayServerUrl, String batchId, String accessToken) {
         this.orchestratorNodeId = orchestratorNodeId;
@@ -287,7 +302,10 @@ public class Node {
     }
 
     /**
-     * Sends a file from the Orchestrator to the RPA Client via a 'receive_file' command.
+     * Sends a file from the Orchestrator to the RPA Client.
+     * If the node already has the content in its blob cache (from an earlier transfer of the
+     * same bytes), it is placed with 'materialize' and nothing is sent. Otherwise the file is
+     * streamed through the relay's push endpoint (see pushFileToRPAClient).
      *
      * @param targetRpaNodeId The ID of the target RPA Node.
      * @param sourceFile The local File object to send.
@@ -298,36 +316,232 @@ public class Node {
      */
     public JSONObject sendFileToRPAClient(String targetRpaNodeId, File sourceFile, String rpaClientDestinationFileName)
             throws InterruptedException, ExecutionException, TimeoutException, IOException {
-        
-        if (!sourceFile.exists() || !sourceFile.isFile()) {
-            System.err.println("Java: sendFileToRPAClient failed: Source file does not exist or is not a file: " + sourceFile.getAbsolutePath());
+        if (!sourceFile.isFile()) {
             throw new IllegalArgumentException("Source file not found or not a file: " + sourceFile.getAbsolutePath());
         }
+        String sha256 = sha256Hex(sourceFile.toPath());
+        JSONObject response = materializeOnRPAClient(targetRpaNodeId, sha256, rpaClientDestinationFileName);
+        if (isRPACommandSuccessful(response)) {
+            System.out.println("Java: '" + sourceFile.getName() + "' was cached on node '" + targetRpaNodeId + "'; materialized without sending.");
+            return response;
+        }
+        response = pushFileToRPAClient(targetRpaNodeId, sourceFile.toPath(), rpaClientDestinationFileName, sha256, true);
+        if (isRPACommandSuccessful(response)) {
+            System.out.println("Java: sendFileToRPAClient completed. File '" + sourceFile.getName() + "' sent to node '" + targetRpaNodeId + "' successfully.");
+        } else {
+            System.err.println("Java: sendFileToRPAClient failed. Final server response: " + response.toString());
+        }
+        return response;
+    }
+
+    /**
+     * Streams a file to the RPA Client through the relay's push endpoint.
+     * The body is sent straight from disk, the relay forwards it in acknowledged chunks,
+     * and the node writes it to a temporary file in its download directory, renaming it
+     * into place once size and SHA-256 match. The SHA-256 is computed here first so the
+     * relay can also reject a body corrupted on the way in.
+     *
+     * @param targetRpaNodeId The ID of the target RPA Node.
+     * @param sourceFile The local file to send.
+     * @param rpaClientDestinationFileName The path on the RPA client, relative to its download directory.
+     * @return The relay's JSON response: status, path, size and sha256 on success.
+     * @throws IOException if the file cannot be read.
+     */
+    public JSONObject pushFileToRPAClient(String targetRpaNodeId, Path sourceFile, String rpaClientDestinationFileName)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        return pushFileToRPAClient(targetRpaNodeId, sourceFile, rpaClientDestinationFileName, sha256Hex(sourceFile), true);
+    }
+
+    private JSONObject pushFileToRPAClient(String targetRpaNodeId, Path sourceFile, String rpaClientDestinationFileName, String sha256, boolean cache)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        if (!Files.isRegularFile(sourceFile)) {
+            System.err.println("Java: pushFileToRPAClient failed: Source file does not exist or is not a file: " + sourceFile.toAbsolutePath());
+            throw new IllegalArgumentException("Source file not found or not a file: " + sourceFile.toAbsolutePath());
+        }
+        String pushUrl = relayServerBaseUrl + this.batchId + "/node/" + targetRpaNodeId + "/push/"
+            + "?filename=" + URLEncoder.encode(rpaClientDestinationFileName, StandardCharsets.UTF_8)
+            + "&sha256=" + sha256
+            + (cache ? "" : "&cache=0");
+
+        HttpRequest.Builder builder = HttpRequest.newBuilder()
+            .uri(URI.create(pushUrl))
+            .header("Content-Type", "application/octet-stream")
+            .POST(HttpRequest.BodyPublishers.ofFile(sourceFile));
+        if (this.accessToken != null && !this.accessToken.isEmpty()) {
+            builder.header("Authorization", "Bearer " + this.accessToken);
+        }
+        System.out.println("Java: Pushing '" + sourceFile.getFileName() + "' (" + Files.size(sourceFile) + " bytes) to RPA node " + targetRpaNodeId + " as '" + rpaClientDestinationFileName + "'");
+        HttpResponse<String> response = httpClient.sendAsync(builder.build(), HttpResponse.BodyHandlers.ofString()).get();
+        return new JSONObject(response.body());
+    }
 
-        // Read file content
-        byte[] fileBytes = Files.readAllBytes(sourceFile.toPath());
-        String base64FileContent = Base64.getEncoder().encodeToString(fileBytes);
 
-        // Construct the 'receive_file' command payload for the RPA client
+    /**
+     * Places a file the RPA Client already has in its blob cache at rpaClientDestinationFileName.
+     * The response is unsuccessful, with "blobMissing" in its payload, if the content is not cached.
+     *
+     * @param targetRpaNodeId The ID of the target RPA Node.
+     * @param sha256 SHA-256 hex digest of the content.
+     * @param rpaClientDestinationFileName The path on the RPA client, relative to its download directory.
+     * @return The polled response of the 'materialize' command.
+     */
+    public JSONObject materializeOnRPAClient(String targetRpaNodeId, String sha256, String rpaClientDestinationFileName)
+            throws InterruptedException, ExecutionException, TimeoutException {
         JSONObject params = new JSONObject();
-        params.put("filename", rpaClientDestinationFileName); // Target filename on RPA client
-        params.put("file_content_base64", base64FileContent); // Base64 content (matches Python's expectation)
+        params.put("sha256", sha256);
+        params.put("destination", rpaClientDestinationFileName);
+        JSONObject commandPayload = new JSONObject();
+        commandPayload.put("commandType", "materialize");
+        commandPayload.put("params", params);
+        return sendRPACommand(targetRpaNodeId, commandPayload);
+    }
+
 
+    /**
+     * Makes remoteDirectory on the RPA Client match localDirectory, sending only what changed.
+     * Files whose size and mtime match are skipped; for changed files the node returns block
+     * signatures of its version and only blocks it lacks are sent (see DeltaSync). The delta is
+     * pushed as one file and applied by 'sync_push', which stages and verifies every file before
+     * replacing any of them.
+     *
+     * @param targetRpaNodeId The ID of the target RPA Node.
+     * @param localDirectory The source directory on the Orchestrator.
+     * @param remoteDirectory The directory on the RPA client to update.
+     * @param delete Whether to remove files on the RPA client that are not in localDirectory.
+     * @return The polled response of 'sync_push' (updated and deleted counts), or of 'sync_signatures' if nothing changed.
+     * @throws IOException if the local directory cannot be read or the delta cannot be written.
+     */
+    public JSONObject syncPushToRPAClient(String targetRpaNodeId, Path localDirectory, String remoteDirectory, boolean delete)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        JSONObject manifest = DeltaSync.scanDirectory(localDirectory);
+        JSONObject params = new JSONObject();
+        params.put("directory", remoteDirectory);
+        params.put("files", manifest);
+        params.put("blockSize", DeltaSync.DEFAULT_BLOCK_SIZE);
         JSONObject commandPayload = new JSONObject();
-        commandPayload.put("commandType", "receive_file"); // Matches Python's SystemCommands.receive_file
+        commandPayload.put("commandType", "sync_signatures");
         commandPayload.put("params", params);
+        JSONObject response = sendRPACommand(targetRpaNodeId, commandPayload);
+        if (!isRPACommandSuccessful(response)) {
+            System.err.println("Java: syncPushToRPAClient failed to get signatures: " + response.toString());
+            return response;
+        }
+        JSONObject payload = getRPACommandResponsePayload(response);
+        JSONArray changed = payload.getJSONArray("changed");
+        JSONObject signatures = payload.optJSONObject("signatures");
+        JSONArray extra = delete ? payload.optJSONArray("extra") : null;
+        int blockSize = payload.optInt("blockSize", DeltaSync.DEFAULT_BLOCK_SIZE);
+        if (changed.length() == 0 && (extra == null || extra.length() == 0)) {
+            System.out.println("Java: '" + remoteDirectory + "' on node '" + targetRpaNodeId + "' is already up to date.");
+            return response;
+        }
 
-        System.out.println("Java: Sending file '" + sourceFile.getName() + "' as command 'receive_file' to RPA node: " + targetRpaNodeId);
+        String remoteDelta = ".sync/" + UUID.randomUUID().toString().replace("-", "") + ".delta";
+        Path delta = Files.createTempFile("sync", ".delta");
+        try {
+            DeltaSync.DeltaWriter writer = new DeltaSync.DeltaWriter(Files.newOutputStream(delta));
+            try {
+                for (int i = 0; i < changed.length(); i++) {
+                    String path = changed.getString(i);
+                    DeltaSync.writeFileDelta(writer, path, DeltaSync.resolveRelative(localDirectory, path),
+                        manifest.getJSONArray(path).getLong(1), signatures == null ? null : signatures.optJSONArray(path), blockSize);
+                }
+                for (int i = 0; extra != null && i < extra.length(); i++) {
+                    writer.delete(extra.getString(i));
+                }
+            } finally {
+                writer.close();
+            }
+            System.out.println("Java: Sync delta for '" + remoteDirectory + "': " + changed.length() + " changed, "
+                + writer.getLiteralBytes() + " literal bytes, " + writer.getCopiedBlocks() + " blocks reused (" + Files.size(delta) + " bytes).");
 
-        // Send the command via the standard RPA command mechanism
-        JSONObject finalRPAStatusResponse = sendRPACommand(targetRpaNodeId, commandPayload); 
-        
-        if (isRPACommandSuccessful(finalRPAStatusResponse)) {
-            System.out.println("Java: sendFileToRPAClient command completed. File '" + sourceFile.getName() + "' sent to node '" + targetRpaNodeId + "' successfully.");
+            response = pushFileToRPAClient(targetRpaNodeId, delta, remoteDelta, sha256Hex(delta), false);
+            if (!"success".equalsIgnoreCase(response.optString("status"))) {
+                System.err.println("Java: syncPushToRPAClient failed to push the delta: " + response.toString());
+                return response;
+            }
+        } finally {
+            Files.deleteIfExists(delta);
+        }
+
+        params = new JSONObject();
+        params.put("directory", remoteDirectory);
+        params.put("delta", remoteDelta);
+        commandPayload = new JSONObject();
+        commandPayload.put("commandType", "sync_push");
+        commandPayload.put("params", params);
+        response = sendRPACommand(targetRpaNodeId, commandPayload);
+        if (isRPACommandSuccessful(response)) {
+            System.out.println("Java: syncPushToRPAClient completed for '" + remoteDirectory + "' on node '" + targetRpaNodeId + "'.");
         } else {
-            System.err.println("Java: sendFileToRPAClient command failed. Final server response: " + finalRPAStatusResponse.toString());
+            System.err.println("Java: syncPushToRPAClient failed to apply the delta: " + response.toString());
+        }
+        return response;
+    }
+
+    /**
+     * Makes localDirectory match remoteDirectory on the RPA Client, fetching only what changed.
+     * The node compares this side's manifest with its files, asks for block signatures of the
+     * local versions of changed files, and builds a delta that is downloaded with a streaming,
+     * resumable get_file. It is applied with DeltaSync.applyDelta, which stages and verifies
+     * every file before replacing any of them.
+     *
+     * @param targetRpaNodeId The ID of the target RPA Node.
+     * @param remoteDirectory The source directory on the RPA client.
+     * @param localDirectory The directory on the Orchestrator to update.
+     * @param delete Whether to remove local files that are not in remoteDirectory.
+     * @return The result of applying the delta: updated and deleted counts.
+     * @throws IOException if the sync fails or the delta does not apply.
+     */
+    public JSONObject syncPullFromRPAClient(String targetRpaNodeId, String remoteDirectory, Path localDirectory, boolean delete)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        Files.createDirectories(localDirectory);
+        JSONObject manifest = DeltaSync.scanDirectory(localDirectory);
+        JSONObject params = new JSONObject();
+        params.put("directory", remoteDirectory);
+        params.put("files", manifest);
+        params.put("blockSize", DeltaSync.DEFAULT_BLOCK_SIZE);
+        params.put("delete", delete);
+        JSONObject commandPayload = new JSONObject();
+        commandPayload.put("commandType", "sync_pull");
+        commandPayload.put("params", params);
+        JSONObject response = sendRPACommand(targetRpaNodeId, commandPayload);
+        if (!isRPACommandSuccessful(response)) {
+            throw new IOException("sync_pull failed for " + remoteDirectory + ": " + response);
+        }
+        JSONObject payload = getRPACommandResponsePayload(response);
+        if (!payload.optBoolean("complete", true)) {
+            JSONArray needed = payload.getJSONArray("needSignatures");
+            int blockSize = payload.optInt("blockSize", DeltaSync.DEFAULT_BLOCK_SIZE);
+            JSONObject signatures = new JSONObject();
+            for (int i = 0; i < needed.length(); i++) {
+                String path = needed.getString(i);
+                signatures.put(path, DeltaSync.blockSignatures(DeltaSync.resolveRelative(localDirectory, path), blockSize));
+            }
+            params.put("signatures", signatures);
+            params.put("blockSize", blockSize);
+            response = sendRPACommand(targetRpaNodeId, commandPayload);
+            if (!isRPACommandSuccessful(response)) {
+                throw new IOException("sync_pull failed for " + remoteDirectory + ": " + response);
+            }
+            payload = getRPACommandResponsePayload(response);
+        }
+        System.out.println("Java: Sync delta for '" + remoteDirectory + "': " + payload.optInt("changed") + " changed, "
+            + payload.optLong("literalBytes") + " literal bytes, " + payload.optLong("copiedBlocks") + " blocks reused ("
+            + payload.optLong("deltaSize") + " bytes).");
+
+        Path tempDirectory = Files.createTempDirectory("sync");
+        Path delta = tempDirectory.resolve("pull.delta");
+        try {
+            getFileFromRPAClient(targetRpaNodeId, payload.getString("deltaPath"), delta);
+            JSONObject result = DeltaSync.applyDelta(delta, localDirectory);
+            System.out.println("Java: syncPullFromRPAClient completed for '" + localDirectory + "': " + result.toString());
+            return result;
+        } finally {
+            Files.deleteIfExists(delta);
+            Files.deleteIfExists(tempDirectory.resolve("pull.delta.part"));
+            Files.deleteIfExists(tempDirectory);
         }
-        return finalRPAStatusResponse;
     }
 
 
@@ -362,6 +576,152 @@ public class Node {
     }
 
 
+    /**
+     * Downloads a file from the RPA Client with a streaming 'get_file'.
+     * Chunks are pulled from the relay and appended to "<localPath>.part", so memory use is one chunk
+     * whatever the file size. A stalled or interrupted transfer is resumed from the bytes already on
+     * disk (also across runs, as the .part file is kept). The SHA-256 reported by the node is checked
+     * before the .part file is moved to localPath.
+     *
+     * @param targetRpaNodeId The ID of the target RPA Node.
+     * @param remoteFilePath The path of the file on the RPA client.
+     * @param localPath Where to save the file.
+     * @return localPath once the file is complete and verified.
+     * @throws IOException if the transfer fails, cannot be resumed, or the checksum does not match.
+     */
+    public Path getFileFromRPAClient(String targetRpaNodeId, String remoteFilePath, Path localPath)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        JSONObject params = new JSONObject();
+        params.put("filePath", remoteFilePath);
+        params.put("stream", true);
+        return pullTransfer(targetRpaNodeId, "get_file", params, remoteFilePath, localPath);
+    }
+
+    /**
+     * Downloads the files under remoteDirectory matching the glob patterns (e.g. "**\/*.log") as one
+     * archive, built on the fly by the node's 'get_files' and streamed like getFileFromRPAClient
+     * (resumable, SHA-256 verified). The archive's last entry, ".rpa-manifest.json", lists the
+     * size, mtime and SHA-256 of every file in it.
+     *
+     * @param targetRpaNodeId The ID of the target RPA Node.
+     * @param remoteDirectory The directory on the RPA client to collect files from.
+     * @param patterns Glob patterns relative to remoteDirectory; "**" spans directories.
+     * @param format "tar" or "zip".
+     * @param compression "none", "gzip" or "zstd" for tar; "none" or "deflate" for zip.
+     * @param localArchive Where to save the archive.
+     * @return localArchive once the archive is complete and verified.
+     * @throws IOException if the transfer fails, cannot be resumed, or the checksum does not match.
+     */
+    public Path getFilesFromRPAClient(String targetRpaNodeId, String remoteDirectory, List<String> patterns,
+                                      String format, String compression, Path localArchive)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        JSONObject params = new JSONObject();
+        params.put("directory", remoteDirectory);
+        params.put("patterns", new JSONArray(patterns));
+        params.put("format", format);
+        params.put("compression", compression);
+        return pullTransfer(targetRpaNodeId, "get_files", params, remoteDirectory + " " + patterns, localArchive);
+    }
+
+    private Path pullTransfer(String targetRpaNodeId, String commandType, JSONObject params, String description, Path localPath)
+            throws InterruptedException, ExecutionException, TimeoutException, IOException {
+        Path partPath = localPath.resolveSibling(localPath.getFileName() + ".part");
+        if (localPath.getParent() != null) {
+            Files.createDirectories(localPath.getParent());
+        }
+        long offset = Files.exists(partPath) ? Files.size(partPath) : 0;
+
+        for (int attempt = 0; attempt <= TRANSFER_MAX_RESUMES; attempt++) {
+            params.put("offset", offset);
+            JSONObject commandPayload = new JSONObject();
+            commandPayload.put("commandType", commandType);
+            commandPayload.put("params", params);
+
+            JSONObject response = sendRPACommand(targetRpaNodeId, commandPayload);
+            if (!isRPACommandSuccessful(response)) {
+                throw new IOException("Streaming " + commandType + " failed for " + description + ": " + response);
+            }
+            String transferId = getRPACommandResponsePayload(response).getString("transferId");
+            System.out.println("Java: Pulling '" + description + "' from offset " + offset + " (transfer " + transferId + ")");
+
+            String expectedSha256 = null;
+            String transferUrl = relayServerBaseUrl + this.batchId + "/node/" + targetRpaNodeId + "/transfer/" + transferId + "/";
+            try (OutputStream out = Files.newOutputStream(partPath, StandardOpenOption.CREATE, StandardOpenOption.APPEND)) {
+                long lastProgress = System.currentTimeMillis();
+                while (expectedSha256 == null) {
+                    HttpResponse<byte[]> chunk = httpClient.send(transferRequest(transferUrl), HttpResponse.BodyHandlers.ofByteArray());
+                    String chunkOffset = chunk.headers().firstValue("X-Transfer-Offset").orElse(null);
+                    if (chunkOffset == null) {
+                        JSONObject status = new JSONObject(new String(chunk.body(), StandardCharsets.UTF_8));
+                        if ("error".equalsIgnoreCase(status.optString("status"))) {
+                            System.err.println("Java: Transfer " + transferId + " failed on the node: " + status.optString("message"));
+                            break;
+                        }
+                        if (System.currentTimeMillis() - lastProgress > TRANSFER_STALL_TIMEOUT_SECONDS * 1000L) {
+                            System.err.println("Java: Transfer " + transferId + " stalled at offset " + offset + ".");
+                            break;
+                        }
+                        Thread.sleep(TRANSFER_POLLING_INTERVAL_MS);
+                        continue;
+                    }
+                    if (Long.parseLong(chunkOffset) != offset) {
+                        // A chunk was lost between relay and orchestrator; resume from what we have.
+                        System.err.println("Java: Transfer " + transferId + " sent offset " + chunkOffset + ", expected " + offset + ".");
+                        break;
+                    }
+                    out.write(chunk.body());
+                    offset += chunk.body().length;
+                    lastProgress = System.currentTimeMillis();
+                    if (chunk.headers().firstValue("X-Transfer-Eof").isPresent()) {
+                        expectedSha256 = chunk.headers().firstValue("X-Transfer-Sha256").orElse("");
+                    }
+                }
+            }
+
+            if (expectedSha256 != null) {
+                String actualSha256 = sha256Hex(partPath);
+                if (!actualSha256.equalsIgnoreCase(expectedSha256)) {
+                    Files.deleteIfExists(partPath);
+                    throw new IOException("Checksum mismatch for " + description + ": expected " + expectedSha256 + ", got " + actualSha256);
+                }
+                Files.move(partPath, localPath, StandardCopyOption.REPLACE_EXISTING, StandardCopyOption.ATOMIC_MOVE);
+                System.out.println("Java: Saved '" + description + "' to " + localPath.toAbsolutePath() + " (" + offset + " bytes, sha256 verified).");
+                return localPath;
+            }
+        }
+        throw new IOException("Transfer of " + description + " did not complete after " + TRANSFER_MAX_RESUMES + " resumes.");
+    }
+
+    private HttpRequest transferRequest(String url) {
+        HttpRequest.Builder builder = HttpRequest.newBuilder()
+            .uri(URI.create(url))
+            .timeout(Duration.ofSeconds(30))
+            .GET();
+        if (this.accessToken != null && !this.accessToken.isEmpty()) {
+            builder.header("Authorization", "Bearer " + this.accessToken);
+        }
+        return builder.build();
+    }
+
+    private static String sha256Hex(Path file) throws IOException {
+        try (InputStream in = Files.newInputStream(file)) {
+            MessageDigest digest = MessageDigest.getInstance("SHA-256");
+            byte[] buffer = new byte[1024 * 1024];
+            int read;
+            while ((read = in.read(buffer)) != -1) {
+                digest.update(buffer, 0, read);
+            }
+            StringBuilder hex = new StringBuilder();
+            for (byte b : digest.digest()) {
+                hex.append(String.format("%02x", b));
+            }
+            return hex.toString();
+        } catch (NoSuchAlgorithmException e) {
+            throw new IOException(e);
+        }
+    }
+
+
     /**
      * Public Static Helper Method: decodeBase64Image (Moved and made static)
      * Decodes a Base64 string into a BufferedImage.
@@ -495,11 +855,12 @@ class Actions {
 
     public void mouseDoubleClick(int x, int y, int button) {
         JSONObject payload = new JSONObject();
-        payload.put("commandType", "mouse_double_click");
+        payload.put("commandType", "mouse_click");
         JSONObject params = new JSONObject();
         params.put("x", x);
         params.put("y", y);
         params.put("button", button);
+        params.put("clicks", 2);
         payload.put("params", params);
 
         try {
@@ -630,26 +991,58 @@ class Actions {
         }
     }
 
+    /**
+     * Taps a sequence of points in one round-trip. Each step is either "x,y" (a left click)
+     * or a JSON sub-command such as {"commandType":"type_text","params":{"text":"abc"}}.
+     */
     public void touch(String[] stepList) {
+        JSONArray steps = new JSONArray();
+        for (String step : stepList) {
+            String trimmed = step.trim();
+            if (trimmed.startsWith("{")) {
+                steps.put(new JSONObject(trimmed));
+            } else {
+                String[] xy = trimmed.split(",");
+                JSONObject params = new JSONObject();
+                params.put("x", Integer.parseInt(xy[0].trim()));
+                params.put("y", Integer.parseInt(xy[1].trim()));
+                steps.put(new JSONObject().put("commandType", "mouse_click").put("params", params));
+            }
+        }
+        batch(steps, true);
+    }
+
+    /**
+     * Runs sub-commands back-to-back on the node in a single relay round-trip instead of one
+     * command (and polling loop) per step. Each step is {"commandType", "params"} with optional
+     * "delayMs" (pause after the step) and "waitFor" (wait_for parameters checked before it).
+     * Returns the aggregated response payload with per-step "results", or null on failure.
+     */
+    public JSONObject batch(JSONArray steps, boolean stopOnError) {
         JSONObject payload = new JSONObject();
-        payload.put("commandType", "touch_sequence"); // Needs implementation in Python `input.py`
+        payload.put("commandType", "batch");
         JSONObject params = new JSONObject();
-        params.put("steps", new JSONArray(stepList)); // JSONArray is used here
+        params.put("steps", steps);
+        params.put("stopOnError", stopOnError);
         payload.put("params", params);
 
         try {
             JSONObject finalRPAStatusResponse = node.sendRPACommand(node.getBotName(), payload);
+            JSONObject rpaResponse = node.getRPACommandResponsePayload(finalRPAStatusResponse);
             if (node.isRPACommandSuccessful(finalRPAStatusResponse)) {
-                System.out.println("Java: touch command completed. Final server response: " + finalRPAStatusResponse.toString());
+                System.out.println("Java: batch of " + steps.length() + " steps completed.");
             } else {
-                System.err.println("Java: touch command failed. Final server response: " + finalRPAStatusResponse.toString());
+                System.err.println("Java: batch command failed. Final server response: " + finalRPAStatusResponse.toString());
             }
+            return rpaResponse;
         } catch (TimeoutException e) {
-            System.err.println("touch sequence command timed out: " + e.getMessage());
+            System.err.println("batch command timed out: " + e.getMessage());
             e.printStackTrace();
+            return null;
         } catch (Exception e) {
-            System.err.println("Error during touch sequence: " + e.getMessage());
+            System.err.println("Error during batch: " + e.getMessage());
             e.printStackTrace();
+            return null;
         }
     }
 
@@ -717,6 +1110,9 @@ class Screen {
     private final Node node;
     private final Actions action;
 
+    private final Map<String, CachedScreenshot> screenshotCache = new HashMap<>();
+    private final Set<String> uploadedTemplates = new HashSet<>();
+
     public Screen(Node n, Actions a) {
         this.node = n;
         this.action = a;
@@ -727,28 +1123,45 @@ class Screen {
     }
 
     public BufferedImage screenshot() {
+        return screenshot(null);
+    }
+
+    /**
+     * Captures the node's screen, or the given region of it. The last image and its content hash
+     * are cached per region; the hash is sent as if_none_match, so polling a static screen only
+     * transfers a small "unchanged" response and the cached image is returned.
+     */
+    public BufferedImage screenshot(Rectangle region) {
         JSONObject payload = new JSONObject();
         payload.put("commandType", "screenshot");
+        JSONObject params = new JSONObject();
+        params.put("format", "png");
+        String cacheKey = region == null ? "full" : region.x + "," + region.y + "," + region.width + "," + region.height;
+        if (region != null) {
+            params.put("region", new JSONArray().put(region.x).put(region.y).put(region.width).put(region.height));
+        }
+        CachedScreenshot cached = screenshotCache.get(cacheKey);
+        if (cached != null) {
+            params.put("if_none_match", cached.contentHash);
+        }
+        payload.put("params", params);
 
         try {
             JSONObject finalRPAStatusResponse = node.sendRPACommand(node.getBotName(), payload);
             if (node.isRPACommandSuccessful(finalRPAStatusResponse)) {
-                System.out.println("Java: screenshot command completed. Final server response: " + finalRPAStatusResponse.toString());
-                
-                if ("file_uploaded".equalsIgnoreCase(finalRPAStatusResponse.optString("status")) || 
-                    (finalRPAStatusResponse.has("response") && "file_uploaded".equalsIgnoreCase(finalRPAStatusResponse.optJSONObject("response").optString("status")))) {
-                    
-                    JSONObject fileDetails = node.getRPACommandResponsePayload(finalRPAStatusResponse); 
-                    String base64Image = fileDetails.optString("file_content_base64", null); 
-                    
-                    if (base64Image != null && !base64Image.isEmpty()) {
-                        return Node.decodeBase64Image(base64Image); 
-                    } else {
-                        System.err.println("Java: screenshot command returned 'file_uploaded' status but missing base64 content in payload.");
+                JSONObject result = node.getRPACommandResponsePayload(finalRPAStatusResponse);
+                if (result.optBoolean("unchanged") && cached != null) {
+                    return cached.image;
+                }
+                String base64Image = result.optString("image_base64", null);
+                if (base64Image != null && !base64Image.isEmpty()) {
+                    BufferedImage image = Node.decodeBase64Image(base64Image);
+                    if (image != null) {
+                        screenshotCache.put(cacheKey, new CachedScreenshot(result.optString("contentHash"), image));
                     }
-                } else {
-                    System.err.println("Java: screenshot command did not return expected 'file_uploaded' status. Response: " + finalRPAStatusResponse.toString());
+                    return image;
                 }
+                System.err.println("Java: screenshot command returned no image. Response: " + finalRPAStatusResponse.toString());
             } else {
                 System.err.println("Java: screenshot command failed. Final server response: " + finalRPAStatusResponse.toString());
             }
@@ -764,75 +1177,89 @@ class Screen {
         }
     }
 
+    private static class CachedScreenshot {
+        final String contentHash;
+        final BufferedImage image;
+
+        CachedScreenshot(String contentHash, BufferedImage image) {
+            this.contentHash = contentHash;
+            this.image = image;
+        }
+    }
+
     public boolean findImage(BufferedImage image) {
+        JSONObject result = locateImage(image, null);
+        return result != null && result.optBoolean("found", false);
+    }
+
+    public boolean findImageInRegion(BufferedImage image, int x, int y, int width, int height) {
+        JSONObject result = locateImage(image, new Rectangle(x, y, width, height));
+        return result != null && result.optBoolean("found", false);
+    }
+
+    /**
+     * Runs locate_image on the node and returns its response payload (found, x, y, width, height,
+     * center, confidence), or null on failure. Templates are cached on the node by SHA-256 of their
+     * PNG bytes, so after the first upload only the hash is sent.
+     */
+    public JSONObject locateImage(BufferedImage image, Rectangle region) {
         try {
-            String base64Image = Base64.getEncoder().encodeToString(Node.imageToBytes(image, "png"));
-            JSONObject payload = new JSONObject();
-            payload.put("commandType", "find_image"); 
-            JSONObject params = new JSONObject();
-            params.put("image", base64Image);
-            payload.put("params", params);
+            byte[] templateBytes = Node.imageToBytes(image, "png");
+            String templateHash = sha256Hex(templateBytes);
+            boolean sendTemplate = !uploadedTemplates.contains(templateHash);
+            for (int attempt = 0; attempt < 2; attempt++) {
+                JSONObject payload = new JSONObject();
+                payload.put("commandType", "locate_image");
+                JSONObject params = new JSONObject();
+                if (sendTemplate) {
+                    params.put("template", Base64.getEncoder().encodeToString(templateBytes));
+                } else {
+                    params.put("templateHash", templateHash);
+                }
+                if (region != null) {
+                    params.put("region", new JSONArray().put(region.x).put(region.y).put(region.width).put(region.height));
+                }
+                payload.put("params", params);
 
-            JSONObject finalRPAStatusResponse = node.sendRPACommand(node.getBotName(), payload);
-            if (node.isRPACommandSuccessful(finalRPAStatusResponse)) {
-                System.out.println("Java: findImage command completed. Final server response: " + finalRPAStatusResponse.toString());
+                JSONObject finalRPAStatusResponse = node.sendRPACommand(node.getBotName(), payload);
                 JSONObject rpaResponse = node.getRPACommandResponsePayload(finalRPAStatusResponse);
-                return rpaResponse.optBoolean("found", false);
-            } else {
-                System.err.println("Java: findImage command failed. Final server response: " + finalRPAStatusResponse.toString());
-                return false;
+                if (node.isRPACommandSuccessful(finalRPAStatusResponse)) {
+                    uploadedTemplates.add(templateHash);
+                    return rpaResponse;
+                }
+                if (!sendTemplate && rpaResponse.optBoolean("templateMissing", false)) {
+                    // The node evicted the template (or restarted); upload it again.
+                    uploadedTemplates.remove(templateHash);
+                    sendTemplate = true;
+                    continue;
+                }
+                System.err.println("Java: locate_image command failed. Final server response: " + finalRPAStatusResponse.toString());
+                return null;
             }
+            return null;
         } catch (TimeoutException e) {
-            System.err.println("findImage command timed out: " + e.getMessage());
+            System.err.println("locate_image command timed out: " + e.getMessage());
             e.printStackTrace();
-            return false;
+            return null;
         } catch (InterruptedException e) { 
             Thread.currentThread().interrupt(); 
-            System.err.println("findImage command interrupted: " + e.getMessage());
-            e.printStackTrace();
-            return false;
-        } catch (ExecutionException e) { 
-            System.err.println("findImage command execution error: " + e.getCause().getMessage());
+            System.err.println("locate_image command interrupted: " + e.getMessage());
             e.printStackTrace();
-            return false;
+            return null;
         } catch (Exception e) { 
-            System.err.println("Error during findImage: " + e.getMessage());
+            System.err.println("Error during locate_image: " + e.getMessage());
             e.printStackTrace();
-            return false;
+            return null;
         }
     }
 
-    public boolean findImageInRegion(BufferedImage image, int x, int y, int width, int height) {
-        try {
-            String base64Image = Base64.getEncoder().encodeToString(Node.imageToBytes(image, "png"));
-            JSONObject payload = new JSONObject();
-            payload.put("commandType", "find_image_in_region"); 
-            JSONObject params = new JSONObject();
-            params.put("image", base64Image);
-            params.put("x", x);
-            params.put("y", y);
-            params.put("width", width);
-            params.put("height", height);
-            payload.put("params", params);
-
-            JSONObject finalRPAStatusResponse = node.sendRPACommand(node.getBotName(), payload);
-            if (node.isRPACommandSuccessful(finalRPAStatusResponse)) {
-                System.out.println("Java: findImageInRegion command completed. Final server response: " + finalRPAStatusResponse.toString());
-                JSONObject rpaResponse = node.getRPACommandResponsePayload(finalRPAStatusResponse);
-                return rpaResponse.optBoolean("found", false);
-            } else {
-                System.err.println("Java: findImageInRegion command failed. Final server response: " + finalRPAStatusResponse.toString());
-                return false;
-            }
-        } catch (TimeoutException e) {
-            System.err.println("findImageInRegion command timed out: " + e.getMessage());
-            e.printStackTrace();
-            return false;
-        } catch (Exception e) {
-            System.err.println("Error during findImageInRegion: " + e.getMessage());
-            e.printStackTrace();
+    private static String sha256Hex(byte[] data) throws NoSuchAlgorithmException {
+        byte[] digest = MessageDigest.getInstance("SHA-256").digest(data);
+        StringBuilder hex = new StringBuilder(digest.length * 2);
+        for (byte b : digest) {
+            hex.append(String.format("%02x", b));
         }
-        return false; // Added return statement for all paths
+        return hex.toString();
     }
 
     public void clickImage(BufferedImage image) {
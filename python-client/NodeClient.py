@@ -12,11 +12,13 @@ import base64
 import time
 
 from commands import CommandDispatcher 
+from commands.transfers import get_transfer_manager
+from utils.outgoing_scheduler import OutgoingScheduler, CLASS_BULK
 
 logger = logging.getLogger('NodeClient')
 
 class NodeClient:
-    def send_image_frame(self, img_bytes):
+    def send_image_frame(self, img_bytes, mime_type="image/jpeg"):
         """
         Sends an image frame to the Relay Server via the main WebSocket connection.
         The message is formatted for the relay to identify it as an image frame.
@@ -27,6 +29,7 @@ class NodeClient:
             message = {
                 "type": "image_frame",
                 "frame_data": encoded_frame,
+                "mime_type": mime_type,
                 "node_id": self.node_id,
                 "timestamp": time.time()
             }
@@ -50,7 +53,9 @@ class NodeClient:
         self.dispatcher = CommandDispatcher(node_client_ref=self)
 
         self.command_queue = queue.Queue()
-        self.outgoing_ws_queue = queue.Queue()
+        # Outgoing messages are scheduled by traffic class (control/frame/bulk) with a byte budget,
+        # so large uploads and image frames cannot delay command responses.
+        self.outgoing_ws_queue = OutgoingScheduler(on_drop=self._on_outgoing_dropped)
 
         self.worker_thread = threading.Thread(target=self._command_worker, daemon=True)
         self._ws_sender_thread = threading.Thread(target=self._websocket_sender, daemon=True)
@@ -75,6 +80,16 @@ class NodeClient:
                     self.command_queue.put(command_data)
                 else:
                     logger.warning(f"NodeClient: Received 'command' type message without 'command' data: {message}")
+            elif msg_type == 'input':
+                # Live remote control input: handled on this thread, not queued behind commands.
+                self.dispatcher.remote_control_cmds.handle_input_message(data)
+            elif msg_type == 'file_chunk_ack':
+                # The relay has handed chunks up to 'offset' to the orchestrator; opens the transfer's window.
+                get_transfer_manager().ack(data.get('transferId'), data.get('offset', 0))
+            elif msg_type == 'file_push_chunk':
+                # Streamed push from the relay: written straight to disk, acknowledged so the relay sends more.
+                ack = get_transfer_manager().receive_chunk(data, self.download_dir)
+                self.send_outgoing_ws_message(dict(ack, type='file_push_ack'))
             elif msg_type == 'node_status_check':
                 logger.info("NodeClient: Received node_status_check from server. Sending pong.")
                 self._send_command_response("N/A", "PONG", {"message": "Client is alive."})
@@ -200,26 +215,46 @@ class NodeClient:
     def _websocket_sender(self):
         logger.info("NodeClient: WebSocket sender thread started.")
         while self.running:
-            try:
-                message_to_send = self.outgoing_ws_queue.get(timeout=1)
-                if self.ws and self.ws.sock and self.ws.sock.connected:
-                    self.ws.send(json.dumps(message_to_send)) # Ensure message is dumped to JSON string
-                    logger.debug(f"NodeClient: Sent WS message type: {message_to_send.get('type')}, Req ID: {message_to_send.get('response', {}).get('requestId')}")
-                else:
-                    logger.warning("NodeClient: WebSocket not connected, re-queuing message for later.")
-                    self.outgoing_ws_queue.put(message_to_send)
-                    time.sleep(1) # Wait before retrying
-                self.outgoing_ws_queue.task_done()
-            except queue.Empty:
-                time.sleep(0.1) # Small sleep to prevent busy-waiting
+            if not (self.ws and self.ws.sock and self.ws.sock.connected):
+                # Leave messages in the scheduler while disconnected; its byte budget bounds the backlog.
+                time.sleep(0.5)
                 continue
+            next_message = self.outgoing_ws_queue.get(timeout=1)
+            if next_message is None:
+                continue
+            traffic_class, item = next_message
+            try:
+                self.ws.send(item.payload) # Payload is already serialized to JSON by the scheduler
+                self.outgoing_ws_queue.mark_sent(traffic_class, item)
+                logger.debug(f"NodeClient: Sent WS message type: {item.msg_type} ({traffic_class}, {item.size} bytes)")
+            except (websocket.WebSocketConnectionClosedException, OSError) as e:
+                logger.warning(f"NodeClient: WebSocket send failed ({e}), re-queuing {traffic_class} message for later.")
+                self.outgoing_ws_queue.requeue(traffic_class, item)
+                time.sleep(1) # Wait before retrying
             except Exception as e:
                 logger.exception(f"NodeClient: Error in WebSocket sender: {e}")
                 self.running = False # Stop sender thread on critical error
         logger.info("NodeClient: WebSocket sender thread stopped.")
 
-    def send_outgoing_ws_message(self, message):
-        self.outgoing_ws_queue.put(message)
+    def send_outgoing_ws_message(self, message, traffic_class=None, coalesce_key=None):
+        return self.outgoing_ws_queue.put(message, traffic_class=traffic_class, coalesce_key=coalesce_key)
+
+    def _on_outgoing_dropped(self, traffic_class, item):
+        """
+        A queued bulk message (file content or a transfer chunk) was evicted to keep
+        the outgoing queue within its byte budget; its request can no longer succeed.
+        Dropped frames need no report, the stream resyncs with a keyframe.
+        """
+        if traffic_class != CLASS_BULK or not item.request_id:
+            return
+        self._send_command_response(
+            item.request_id, "error",
+            error_message=f"Outgoing '{item.msg_type}' message ({item.size} bytes) was dropped to stay within the outgoing byte budget; retry the request."
+        )
+
+    def get_outgoing_metrics(self):
+        """Returns per-traffic-class metrics of the outgoing message scheduler."""
+        return self.outgoing_ws_queue.get_metrics()
 
     # --- MODIFIED: _send_command_response to accept and use request_id ---
     def _send_command_response(self, request_id, status, response_payload=None, error_message=None, traceback=None):
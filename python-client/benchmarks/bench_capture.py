@@ -0,0 +1,37 @@
+# File: benchmarks/bench_capture.py
+#
+# Measures screen captures per second for each capture backend.
+# Usage: python benchmarks/bench_capture.py [--seconds 3] [--region 0,0,800,600] [--backend xshm ...]
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands.capture import benchmark_backends, DEFAULT_BACKEND_ORDER
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screen capture backends.")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Duration per backend.")
+    parser.add_argument("--region", help="Capture region as left,top,width,height.")
+    parser.add_argument("--backend", action="append", choices=DEFAULT_BACKEND_ORDER, help="Backend(s) to run; defaults to all.")
+    args = parser.parse_args()
+
+    region = [int(v) for v in args.region.split(",")] if args.region else None
+    results = benchmark_backends(args.backend, duration=args.seconds, region=region)
+
+    print(f"{'backend':<10} {'size':>10} {'captures':>9} {'fps':>8} {'ms/capture':>11}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['backend']:<10} unavailable: {result['error']}")
+        else:
+            print(f"{result['backend']:<10} {result['size']:>10} {result['captures']:>9} {result['fps']:>8} {result['ms_per_capture']:>11}")
+    if os.environ.get("BENCH_JSON"):
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
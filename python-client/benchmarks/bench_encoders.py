@@ -0,0 +1,95 @@
+# File: benchmarks/bench_encoders.py
+#
+# Reports encode time and output size per encoder backend on sample screens.
+# Usage: python benchmarks/bench_encoders.py [--image screen.png ...] [--capture] [--repeat 10]
+#
+# Without --image/--capture, two synthetic screens are used: a flat UI-like
+# desktop with text and a noisy, photo-like one.
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from commands.encoders import ENCODER_CLASSES, get_encoder, prepare_image
+
+# (backend, quality, subsampling, grayscale) combinations to run.
+CASES = [
+    ("turbojpeg", 75, "4:2:0", False),
+    ("pillow-jpeg", 95, None, False),
+    ("pillow-jpeg", 75, "4:2:0", False),
+    ("pillow-jpeg", 50, "4:2:0", False),
+    ("pillow-jpeg", 75, "4:4:4", False),
+    ("pillow-jpeg", 75, None, True),
+    ("pillow-webp", 70, None, False),
+    ("pillow-webp", 100, None, False),
+    ("pillow-png", None, None, False),
+]
+
+
+def synthetic_ui(width=1920, height=1080):
+    image = Image.new("RGB", (width, height), (236, 239, 244))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 40), fill=(45, 52, 64))
+    draw.rectangle((0, 40, 260, height), fill=(216, 222, 233))
+    for row in range(60, height - 40, 22):
+        draw.text((290, row), "Invoice 2024-%05d   ACME Corp.   1,234.56 EUR   Approved" % row, fill=(30, 30, 30))
+    for i in range(12):
+        draw.rectangle((20, 60 + i * 48, 240, 96 + i * 48), fill=(94, 129, 172))
+    return image
+
+
+def synthetic_photo(width=1920, height=1080):
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([(x * 255 // width), (y * 255 // height), ((x + y) * 255 // (width + height))], axis=2)
+    noise = rng.integers(0, 40, size=(height, width, 3))
+    return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+
+
+def load_samples(args):
+    samples = []
+    for path in args.image or []:
+        samples.append((os.path.basename(path), Image.open(path).convert("RGB")))
+    if args.capture:
+        from commands.capture import get_screen_capture
+        samples.append(("capture", get_screen_capture().grab()))
+    if not samples:
+        samples = [("synthetic-ui", synthetic_ui()), ("synthetic-photo", synthetic_photo())]
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image encoder backends.")
+    parser.add_argument("--image", action="append", help="Sample screenshot file(s).")
+    parser.add_argument("--capture", action="store_true", help="Also benchmark a live screen capture.")
+    parser.add_argument("--repeat", type=int, default=10, help="Encodes per case.")
+    parser.add_argument("--scale", type=float, default=None, help="Downscale factor applied before encoding.")
+    args = parser.parse_args()
+
+    print(f"{'sample':<16} {'backend':<12} {'quality':>7} {'subsamp':>8} {'gray':>5} {'ms':>8} {'bytes':>10}")
+    for sample_name, image in load_samples(args):
+        for backend, quality, subsampling, grayscale in CASES:
+            encoder_format = ENCODER_CLASSES[backend].format
+            try:
+                encoder = get_encoder(encoder_format, backend)
+            except ValueError as e:
+                print(f"{sample_name:<16} {backend:<12} unavailable: {e}")
+                continue
+            prepared = prepare_image(image, args.scale, grayscale)
+            data = encoder.encode(prepared, quality=quality, subsampling=subsampling)  # Warm up
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                data = encoder.encode(prepared, quality=quality, subsampling=subsampling)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / args.repeat
+            print(f"{sample_name:<16} {backend:<12} {str(quality or '-'):>7} {subsampling or '-':>8} "
+                  f"{'yes' if grayscale else 'no':>5} {elapsed_ms:>8.1f} {len(data):>10}")
+
+
+if __name__ == "__main__":
+    main()
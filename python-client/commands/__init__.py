@@ -1,5 +1,6 @@
 # File: commands/__init__.py
 
+import time
 import logging
 import traceback
 
@@ -8,9 +9,13 @@ from .system import SystemCommands
 from .email import EmailCommands
 from .api import APICallCommands
 from .remote_control import RemoteControlCommands
+from .vision import VisionCommands
+from .wait_for import WaitForCommands
 
 log = logging.getLogger(__name__)
 
+MAX_BATCH_STEPS = 1000
+
 class CommandDispatcher:
     """
     Dispatches commands received from the Django Relay Server to appropriate
@@ -28,6 +33,8 @@ class CommandDispatcher:
         self.email_cmds = EmailCommands(node_client_ref=self.node_client_ref) # Pass ref if email commands ever need to send responses
         self.api_cmds = APICallCommands(node_client_ref=self.node_client_ref) # Pass ref if API commands ever need to send responses
         self.remote_control_cmds = RemoteControlCommands(node_client_ref=self.node_client_ref)
+        self.vision_cmds = VisionCommands(node_client_ref=self.node_client_ref)
+        self.wait_for_cmds = WaitForCommands(node_client_ref=self.node_client_ref, vision_cmds=self.vision_cmds)
 
         # Map command types (from incoming JSON) to their specific handler methods
         # Ensure that ALL these mapped methods now expect a single 'params' dictionary as their argument.
@@ -41,6 +48,10 @@ class CommandDispatcher:
             'key_combo': self.input_cmds.key_combo,
             'type_text': self.input_cmds.type_text,
             'combo_click': self.input_cmds.combo_click,
+            'key_down': self.input_cmds.key_down,
+            'key_up': self.input_cmds.key_up,
+            'input_events': self.input_cmds.input_events,
+            'copy_clipboard': self.input_cmds.copy_clipboard,
 
             # System commands
             'screenshot': self.system_cmds.screenshot,
@@ -53,23 +64,51 @@ class CommandDispatcher:
             'upload_file': self.system_cmds.upload_file, # This will use send_file_to_relay
             'receive_file': self.system_cmds.receive_file, 
             'run_shell_command': self.system_cmds.run_shell_command,
+            'start_process': self.system_cmds.start_process,
+            'process_status': self.system_cmds.process_status,
+            'read_output': self.system_cmds.read_output,
+            'kill_process': self.system_cmds.kill_process,
             'launch_application': self.system_cmds.launch_application,
             'activate_window': self.system_cmds.activate_window,
             'wait': self.system_cmds.wait,
             'get_file': self.system_cmds.get_file, 
+            'get_files': self.system_cmds.get_files,
+            'has_blobs': self.system_cmds.has_blobs,
+            'materialize': self.system_cmds.materialize,
+            'sync_signatures': self.system_cmds.sync_signatures,
+            'sync_push': self.system_cmds.sync_push,
+            'sync_pull': self.system_cmds.sync_pull,
+            'get_outgoing_metrics': self.system_cmds.get_outgoing_metrics,
+
+            # Screen vision commands (template matching on the node)
+            'locate_image': self.vision_cmds.locate_image,
+            'locate_all_images': self.vision_cmds.locate_all_images,
+
+            # Wait-condition engine (evaluated on the node until one holds or the timeout expires)
+            'wait_for': self.wait_for_cmds.wait_for,
+
+            # Runs an ordered list of the commands above in one round-trip
+            'batch': self.execute_batch,
 
             # Email commands
             'send_email': self.email_cmds.send_email,
+            'send_emails_bulk': self.email_cmds.send_emails_bulk,
             'read_latest_email': self.email_cmds.read_latest_email,
+            'wait_for_email': self.email_cmds.wait_for_email,
+            'list_emails': self.email_cmds.list_emails,
+            'download_attachments': self.email_cmds.download_attachments,
 
             # Local API Call Commands
             'get_data_from_local_api': self.api_cmds.get_data_from_local_api,
             'post_data_to_local_api': self.api_cmds.post_data_to_local_api, 
+            'batch_local_api': self.api_cmds.batch_local_api,
 
             # Remote control commands
             'start_remote_control': self.remote_control_cmds.start_remote_control,
             'stop_remote_control': self.remote_control_cmds.stop_remote_control,
             'send_input': self.remote_control_cmds.send_input,
+            'request_keyframe': self.remote_control_cmds.request_keyframe,
+            'update_stream_settings': self.remote_control_cmds.update_stream_settings,
         }
 
     def execute_command(self, command_data):
@@ -136,4 +175,68 @@ class CommandDispatcher:
                 "message": f"Exception during command execution: {str(e)}",
                 "traceback": traceback.format_exc(),
                 "requestId": request_id
-            }
\ No newline at end of file
+            }
+
+    def execute_batch(self, params):
+        """
+        Runs an ordered list of sub-commands back-to-back in one round-trip.
+
+        params:
+            steps: [{"commandType": ..., "params": {...}, "delayMs": 0, "waitFor": {...}}, ...]
+                delayMs pauses after the step; waitFor holds wait_for parameters
+                that must be satisfied before the step runs.
+            delayMs: default pause after each step (default 0)
+            stopOnError: stop at the first failed step (default True); otherwise continue
+
+        Returns one aggregated response with the result of every executed step.
+        """
+        request_id = params.get('requestId')
+        steps = params.get('steps')
+        stop_on_error = params.get('stopOnError', True)
+        default_delay_ms = params.get('delayMs', 0)
+        if not isinstance(steps, list) or not steps:
+            return {"status": "error", "action": "batch", "message": "'steps' must be a non-empty list.", "requestId": request_id}
+        if len(steps) > MAX_BATCH_STEPS:
+            return {"status": "error", "action": "batch", "message": f"A batch may contain at most {MAX_BATCH_STEPS} steps.", "requestId": request_id}
+
+        log.info(f"[Dispatcher] Running batch of {len(steps)} steps (stopOnError={stop_on_error}). RequestId: {request_id}")
+        started = time.monotonic()
+        results = []
+        failed = []
+        for index, step in enumerate(steps):
+            step = step if isinstance(step, dict) else {}
+            command_type = step.get('commandType')
+            step_started = time.monotonic()
+            if command_type == 'batch':
+                result = {"status": "error", "message": "Batches cannot be nested."}
+            elif step.get('waitFor'):
+                wait_result = self.wait_for_cmds.wait_for(dict(step['waitFor'], requestId=request_id))
+                if wait_result.get('status') == 'success':
+                    result = self.execute_command({'commandType': command_type, 'requestId': request_id, 'params': dict(step.get('params') or {})})
+                    result['waitFor'] = wait_result
+                else:
+                    result = {"status": "error", "message": f"waitFor condition not met: {wait_result.get('message')}", "waitFor": wait_result}
+            else:
+                result = self.execute_command({'commandType': command_type, 'requestId': request_id, 'params': dict(step.get('params') or {})})
+
+            result.pop('requestId', None)
+            result.update(index=index, commandType=command_type, elapsedMs=round((time.monotonic() - step_started) * 1000, 1))
+            results.append(result)
+            if result.get('status') not in ('success', 'file_uploaded'):
+                failed.append(index)
+                if stop_on_error:
+                    break
+            delay_ms = step.get('delayMs', default_delay_ms)
+            if delay_ms and index < len(steps) - 1:
+                time.sleep(delay_ms / 1000.0)
+
+        return {
+            "status": "error" if failed else "success",
+            "action": "batch",
+            "message": f"{len(results) - len(failed)} of {len(steps)} steps succeeded." if failed else f"All {len(steps)} steps succeeded.",
+            "completed": len(results),
+            "failedSteps": failed,
+            "results": results,
+            "elapsedMs": round((time.monotonic() - started) * 1000, 1),
+            "requestId": request_id
+        }
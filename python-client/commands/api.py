@@ -1,14 +1,109 @@
 # api.py
 import requests
 import json # For handling JSON data in requests/responses
+import time
+import threading
 import logging # Import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .http_session import get_api_session, POOL_MAXSIZE
 
 log = logging.getLogger(__name__) # Initialize logger for this module
 
+LOCAL_PREFIXES = ('http://localhost', 'https://localhost', 'http://127.0.0.1', 'https://127.0.0.1')
+DEFAULT_BATCH_CONCURRENCY = 8
+MAX_BATCH_CALLS = 1000
+# Conditional GET cache: responses kept for revalidation with If-None-Match / If-Modified-Since.
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BODY_BYTES = 4 * 1024 * 1024
+
+
+class ConditionalCache:
+    """
+    Remembers GET responses that carried an ETag or Last-Modified, keyed by URL,
+    query parameters and request headers. A repeated request revalidates the entry;
+    on 304 Not Modified the remembered body is returned without transferring it
+    again. Least recently used entries are dropped beyond CACHE_MAX_ENTRIES.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url, query_params, headers):
+        return json.dumps([url, query_params or {}, headers or {}], sort_keys=True, default=str)
+
+    def validators(self, key):
+        """Conditional request headers for a cached entry (empty if there is none)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return {}
+            self._entries.move_to_end(key)
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def store(self, key, response, data):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified) or len(response.content) > CACHE_MAX_BODY_BYTES:
+            return
+        if "no-store" in response.headers.get("Cache-Control", ""):
+            return
+        with self._lock:
+            self._entries[key] = {"etag": etag, "last_modified": last_modified, "data": data, "http_status": response.status_code}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
 class APICallCommands:
     def __init__(self, node_client_ref=None):
-        self.node_client_ref = node_client_ref 
+        self.node_client_ref = node_client_ref
         self.default_timeout = 10 # seconds
+        # Keep-alive pool (one per host), so repeated calls skip connection and TLS setup.
+        # It is not the downloads' shared session: API calls must not share cookies.
+        self.session = get_api_session()
+        self.cache = ConditionalCache()
+
+    @staticmethod
+    def _decode(response, url):
+        try:
+            response_data = response.json()
+            log.info(f"API: Received JSON response from {url}")
+        except (json.JSONDecodeError, ValueError):
+            response_data = response.text
+            log.info(f"API: Received non-JSON text response from {url}")
+        return response_data
+
+    def _get(self, url, headers, query_params, timeout, use_cache):
+        """GET with optional conditional-request caching. Returns (http status, data, served from cache)."""
+        key = self.cache.key(url, query_params, headers) if use_cache else None
+        request_headers = dict(headers, **self.cache.validators(key)) if use_cache else headers
+        response = self.session.get(url, headers=request_headers, params=query_params, timeout=timeout)
+        if use_cache and response.status_code == 304:
+            entry = self.cache.get(key)
+            if entry is not None:
+                log.info(f"API: {url} not modified; using cached response.")
+                return entry["http_status"], entry["data"], True
+            # Evicted in the meantime: fetch unconditionally.
+            response = self.session.get(url, headers=headers, params=query_params, timeout=timeout)
+        response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+        response_data = self._decode(response, url)
+        if use_cache:
+            self.cache.store(key, response, response_data)
+        return response.status_code, response_data, False
 
     def get_data_from_local_api(self, params):
         """
@@ -17,7 +112,8 @@ class APICallCommands:
             'url': 'http://localhost:8000/api/data', # The local API URL
             'headers': {'Authorization': 'Bearer ...'}, # Optional: HTTP headers
             'query_params': {'param1': 'value1'}, # Optional: Query parameters
-            'timeout': 10 # Optional: Request timeout in seconds
+            'timeout': 10, # Optional: Request timeout in seconds
+            'cache': True # Optional: revalidate a remembered response with its ETag/Last-Modified
         }
         """
         url = params.get('url')
@@ -28,27 +124,19 @@ class APICallCommands:
         if not url:
             log.error("Missing 'url' parameter for get_data_from_local_api.")
             return {"status": "error", "message": "Missing 'url' parameter for get_data_from_local_api."}
-        
+
         # Security warning for non-local URLs
-        if not url.startswith(('http://localhost', 'https://localhost', 'http://127.0.0.1', 'https://127.0.0.1')):
+        if not url.startswith(LOCAL_PREFIXES):
              log.warning(f"API: Attempting to access non-local URL (might be security risk for 'local' API command): {url}")
-        
+
         try:
             log.info(f"API: Sending GET request to {url} with query_params={query_params}")
-            response = requests.get(url, headers=headers, params=query_params, timeout=timeout)
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            try:
-                response_data = response.json()
-                log.info(f"API: Received JSON response from {url}")
-            except json.JSONDecodeError:
-                response_data = response.text
-                log.info(f"API: Received non-JSON text response from {url}")
-
+            http_status, response_data, cached = self._get(url, headers, query_params, timeout, bool(params.get('cache')))
             return {
                 "status": "success",
                 "message": f"Data retrieved successfully from {url}.",
-                "http_status": response.status_code,
+                "http_status": http_status,
+                "cached": cached,
                 "data": response_data
             }
         except requests.exceptions.Timeout:
@@ -84,11 +172,11 @@ class APICallCommands:
         if not url:
             log.error("Missing 'url' parameter for post_data_to_local_api.")
             return {"status": "error", "message": "Missing 'url' parameter for post_data_to_local_api."}
-        
+
         # Security warning for non-local URLs
-        if not url.startswith(('http://localhost', 'https://localhost', 'http://127.0.0.1', 'https://127.0.0.1')):
+        if not url.startswith(LOCAL_PREFIXES):
              log.warning(f"API: Attempting to access non-local URL (might be security risk for 'local' API command): {url}")
-        
+
         if json_payload and form_data:
             log.error("Cannot send both 'json_payload' and 'form_data' in a POST request.")
             return {"status": "error", "message": "Cannot send both 'json_payload' and 'form_data' in a POST request."}
@@ -96,20 +184,14 @@ class APICallCommands:
         try:
             log.info(f"API: Sending POST request to {url}")
             if json_payload:
-                response = requests.post(url, headers=headers, json=json_payload, timeout=timeout)
+                response = self.session.post(url, headers=headers, json=json_payload, timeout=timeout)
             elif form_data:
-                response = requests.post(url, headers=headers, data=form_data, timeout=timeout)
+                response = self.session.post(url, headers=headers, data=form_data, timeout=timeout)
             else:
-                response = requests.post(url, headers=headers, timeout=timeout) # Send empty POST
+                response = self.session.post(url, headers=headers, timeout=timeout) # Send empty POST
 
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            try:
-                response_data = response.json()
-                log.info(f"API: Received JSON response from {url}")
-            except json.JSONDecodeError:
-                response_data = response.text
-                log.info(f"API: Received non-JSON text response from {url}")
+            response_data = self._decode(response, url)
 
             return {
                 "status": "success",
@@ -130,3 +212,56 @@ class APICallCommands:
             log.error(f"API: Unexpected error in post_data_to_local_api: {str(e)}", exc_info=True)
             return {"status": "error", "message": f"Unexpected error in post_data_to_local_api: {str(e)}"}
 
+    def batch_local_api(self, params):
+        """
+        Runs several local API calls concurrently over the shared connection pool
+        and returns all results together, in request order.
+        params: {
+            'requests': [ # Each item takes the params of get_data_from_local_api or post_data_to_local_api
+                {'method': 'GET', 'url': 'http://localhost:8000/api/items/1', 'cache': True},
+                {'method': 'POST', 'url': 'http://localhost:8000/api/submit', 'json_payload': {'key': 'value'}}
+            ],
+            'concurrency': 8, # Optional: calls in flight at once
+            'stopOnError': False # Optional: skip calls not yet started once one fails
+        }
+        """
+        calls = params.get('requests')
+        if not isinstance(calls, list) or not calls:
+            log.error("Missing 'requests' list for batch_local_api.")
+            return {"status": "error", "message": "'requests' must be a non-empty list."}
+        if len(calls) > MAX_BATCH_CALLS:
+            return {"status": "error", "message": f"A batch may contain at most {MAX_BATCH_CALLS} calls."}
+        concurrency = max(1, min(int(params.get('concurrency', DEFAULT_BATCH_CONCURRENCY)), POOL_MAXSIZE))
+        stop_on_error = bool(params.get('stopOnError', False))
+        failed = threading.Event()
+
+        def run(indexed_call):
+            index, call = indexed_call
+            call = call if isinstance(call, dict) else {}
+            call_started = time.monotonic()
+            method = str(call.get('method', 'GET')).upper()
+            if stop_on_error and failed.is_set():
+                result = {"status": "skipped", "message": "Skipped after an earlier call failed."}
+            elif method == 'GET':
+                result = self.get_data_from_local_api(call)
+            elif method == 'POST':
+                result = self.post_data_to_local_api(call)
+            else:
+                result = {"status": "error", "message": f"Unsupported method '{method}'; use GET or POST."}
+            if result.get("status") == "error":
+                failed.set()
+            result.update(index=index, method=method, url=call.get('url'), elapsedMs=round((time.monotonic() - call_started) * 1000, 1))
+            return result
+
+        started = time.monotonic()
+        log.info(f"API: Running {len(calls)} calls with concurrency {concurrency}.")
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="local-api") as pool:
+            results = list(pool.map(run, enumerate(calls)))
+        failed_calls = [result["index"] for result in results if result.get("status") != "success"]
+        return {
+            "status": "error" if failed_calls else "success",
+            "message": f"{len(results) - len(failed_calls)} of {len(results)} calls succeeded." if failed_calls else f"All {len(results)} calls succeeded.",
+            "failedCalls": failed_calls,
+            "results": results,
+            "elapsedMs": round((time.monotonic() - started) * 1000, 1)
+        }
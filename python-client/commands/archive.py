@@ -0,0 +1,251 @@
+# File: commands/archive.py
+
+import os
+import io
+import glob
+import json
+import time
+import zlib
+import tarfile
+import zipfile
+import hashlib
+import logging
+
+try:
+    import zstandard  # Optional: zstd compression of tar archives
+except ImportError:
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = ("tar", "zip")
+COMPRESSIONS = {"tar": ("none", "gzip", "zstd"), "zip": ("none", "deflate")}
+# Last entry of every archive: {name: {size, mtimeMs, sha256}} of the files before it.
+MANIFEST_NAME = ".rpa-manifest.json"
+READ_SIZE = 1024 * 1024
+
+
+def select_files(root, patterns, min_size=None, max_size=None, modified_after=None, modified_before=None):
+    """
+    Files under root matching any of the glob patterns ('**' spans directories)
+    and the size (bytes) and mtime (epoch seconds) bounds. Returns sorted
+    (path, archive name, size, mtime) tuples; the order is stable so an
+    archive of the same files can be rebuilt byte for byte to resume it.
+    Absolute patterns and '..' are refused, and matches whose real path
+    (symlinks resolved) is outside root are skipped, so every archive name
+    stays inside the archive.
+    """
+    root = os.path.abspath(root)
+    real_root = os.path.realpath(root)
+    for pattern in patterns:
+        parts = pattern.replace("\\", "/").split("/")
+        if os.path.isabs(pattern) or pattern.startswith(("/", "\\")) or ".." in parts:
+            raise ValueError(f"Pattern '{pattern}' is outside the directory.")
+    selected = {}
+    for pattern in patterns:
+        for path in glob.iglob(os.path.join(glob.escape(root), pattern), recursive=True):
+            path = os.path.abspath(path)
+            if path in selected or not os.path.isfile(path):
+                continue
+            real_path = os.path.realpath(path)
+            if os.path.commonpath([real_root, real_path]) != real_root:
+                log.warning(f"[Archive] Skipped '{path}': it resolves outside '{root}'.")
+                continue
+            st = os.stat(path)
+            if min_size is not None and st.st_size < min_size:
+                continue
+            if max_size is not None and st.st_size > max_size:
+                continue
+            if modified_after is not None and st.st_mtime < modified_after:
+                continue
+            if modified_before is not None and st.st_mtime > modified_before:
+                continue
+            selected[path] = (path, os.path.relpath(path, root).replace(os.sep, "/"), st.st_size, st.st_mtime)
+    return [selected[path] for path in sorted(selected)]
+
+
+class _Sink(io.RawIOBase):
+    """Write-only stream collecting bytes until the archive generator hands them on."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class ArchiveStream:
+    """
+    Builds a tar or zip archive of files on the fly, as an iterator of chunks
+    of about chunk_size bytes; only the current chunk is held in memory.
+    Each file is hashed as it is read, and a manifest of names, sizes, mtimes
+    and SHA-256 digests is appended as the last entry (MANIFEST_NAME).
+
+    A file that changes size while being archived keeps its listed size in a
+    tar (truncated, or padded with zeros) and is marked "changed" in the manifest.
+    """
+
+    def __init__(self, files, fmt="tar", compression="none", chunk_size=READ_SIZE, level=None):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(ARCHIVE_FORMATS)}.")
+        if compression not in COMPRESSIONS[fmt]:
+            raise ValueError(f"compression for {fmt} must be one of: {', '.join(COMPRESSIONS[fmt])}.")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression needs the 'zstandard' package on the node.")
+        self.files = files
+        self.format = fmt
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.level = level
+        self.manifest = {}
+
+    def __iter__(self):
+        raw = self._zip() if self.format == "zip" else self._tar()
+        if self.compression in ("gzip", "zstd"):
+            raw = self._compress(raw)
+        pending = bytearray()
+        for data in raw:
+            pending += data
+            while len(pending) >= self.chunk_size:
+                yield bytes(pending[:self.chunk_size])
+                del pending[:self.chunk_size]
+        if pending:
+            yield bytes(pending)
+
+    def _read(self, path, size, name):
+        """Yields the file's bytes, recording its manifest entry once read."""
+        hasher = hashlib.sha256()
+        total = 0
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(READ_SIZE if size is None else min(READ_SIZE, size - total))
+                if not data:
+                    break
+                hasher.update(data)
+                total += len(data)
+                yield data
+            changed = size is not None and (total != size or f.read(1) != b"")
+        entry = {"size": total, "mtimeMs": int(os.path.getmtime(path) * 1000), "sha256": hasher.hexdigest()}
+        if changed:
+            entry["changed"] = True
+            log.warning(f"[Archive] '{path}' changed size while being archived.")
+        self.manifest[name] = entry
+
+    def _manifest_mtime(self):
+        # Newest file's mtime rather than the current time, so a rebuilt archive is identical.
+        return int(max((mtime for _, _, _, mtime in self.files), default=315532800))
+
+    def _manifest_bytes(self):
+        return json.dumps(self.manifest, sort_keys=True).encode("utf-8")
+
+    def _tar(self):
+        # Headers are written by hand so each file streams through in READ_SIZE pieces.
+        for path, name, size, mtime in self.files:
+            info = tarfile.TarInfo(name)
+            info.size = size
+            info.mtime = int(mtime)
+            info.mode = 0o644
+            yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+            written = 0
+            try:
+                for data in self._read(path, size, name):
+                    written += len(data)
+                    yield data
+            except OSError as e:
+                log.warning(f"[Archive] Could not read '{path}': {e}")
+                self.manifest[name] = {"error": str(e)}
+            if written < size:
+                self.manifest[name]["changed"] = True
+                yield bytes(size - written)
+            if size % tarfile.BLOCKSIZE:
+                yield bytes(tarfile.BLOCKSIZE - size % tarfile.BLOCKSIZE)
+        manifest = self._manifest_bytes()
+        info = tarfile.TarInfo(MANIFEST_NAME)
+        info.size = len(manifest)
+        info.mtime = self._manifest_mtime()
+        yield info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+        yield manifest
+        if len(manifest) % tarfile.BLOCKSIZE:
+            yield bytes(tarfile.BLOCKSIZE - len(manifest) % tarfile.BLOCKSIZE)
+        yield bytes(tarfile.BLOCKSIZE * 2)
+
+    def _zip(self):
+        # zipfile writes to an unseekable stream with data descriptors after each entry.
+        sink = _Sink()
+        compression = zipfile.ZIP_DEFLATED if self.compression == "deflate" else zipfile.ZIP_STORED
+        with zipfile.ZipFile(sink, "w", compression=compression, allowZip64=True) as zf:
+            for path, name, size, mtime in self.files:
+                info = zipfile.ZipInfo(name, date_time=time.localtime(max(mtime, 315532800))[:6])
+                info.compress_type = compression
+                info.external_attr = 0o644 << 16
+                try:
+                    with zf.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as entry:
+                        for data in self._read(path, None, name):
+                            entry.write(data)
+                            if sink.buffer:
+                                yield sink.drain()
+                except OSError as e:
+                    log.warning(f"[Archive] Could not read '{path}': {e}")
+                    self.manifest[name] = {"error": str(e)}
+                yield sink.drain()
+            zf.writestr(zipfile.ZipInfo(MANIFEST_NAME, date_time=time.localtime(self._manifest_mtime())[:6]),
+                        self._manifest_bytes())
+        yield sink.drain()
+
+    def _compress(self, raw):
+        if self.compression == "zstd":
+            compressor = zstandard.ZstdCompressor(level=self.level or 3).compressobj()
+            flush = compressor.flush
+        else:
+            # wbits 31: gzip container, with a zero mtime in its header so output is reproducible.
+            compressor = zlib.compressobj(self.level or 6, zlib.DEFLATED, 31)
+            flush = compressor.flush
+        for data in raw:
+            out = compressor.compress(data)
+            if out:
+                yield out
+        yield flush()
+
+
+class ResumableStream:
+    """
+    Splits a reproducible chunk iterator at a byte offset: prefix() yields the
+    bytes before it (to be hashed, not sent) and chunks() the rest. Used to
+    resume an archive transfer by rebuilding the archive.
+    """
+
+    def __init__(self, source, offset):
+        self._iterator = iter(source)
+        self.offset = offset
+        self._carry = b""
+
+    def prefix(self):
+        remaining = self.offset
+        while remaining > 0:
+            data = next(self._iterator, None)
+            if data is None:
+                raise ValueError(f"offset {self.offset} is beyond the end of the archive.")
+            if len(data) > remaining:
+                self._carry = data[remaining:]
+                data = data[:remaining]
+            remaining -= len(data)
+            yield data
+
+    def chunks(self):
+        if self._carry:
+            yield self._carry
+        yield from self._iterator
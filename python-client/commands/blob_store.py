@@ -0,0 +1,193 @@
+# File: commands/blob_store.py
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+
+log = logging.getLogger(__name__)
+
+BLOB_DIR_NAME = ".blob_cache"
+INDEX_FILE_NAME = "index.json"
+# Size budget of the store; least recently used blobs are evicted beyond it.
+DEFAULT_MAX_BYTES = int(os.environ.get("RPA_BLOB_CACHE_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+HASH_READ_SIZE = 1024 * 1024
+MATERIALIZE_MODES = ("copy", "link")
+
+
+def is_sha256(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value.lower())
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _signature(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class BlobStore:
+    """
+    Content-addressed file store, keyed by SHA-256, under the download
+    directory. Files received by the node are added by hard link where the
+    filesystem allows (so a cached copy costs no extra space while the
+    original exists) and by copy otherwise. Each blob's size and mtime are
+    recorded; a blob whose file no longer matches (e.g. the linked original
+    was edited in place) is dropped rather than served. Blobs beyond the size
+    budget are evicted least recently used first.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._index = self._load_index()
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.root, INDEX_FILE_NAME)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        # Keep only entries whose file is still there and unchanged.
+        valid = {}
+        for sha256, entry in index.items():
+            try:
+                if _signature(self._blob_path(sha256)) == entry["signature"]:
+                    valid[sha256] = entry
+            except (OSError, KeyError, TypeError):
+                pass
+        return valid
+
+    def _save_index(self):
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._index, f)
+        os.replace(temp_path, os.path.join(self.root, INDEX_FILE_NAME))
+
+    @property
+    def used_bytes(self):
+        return sum(entry["signature"][0] for entry in self._index.values())
+
+    def _valid(self, sha256):
+        """Index entry of a blob if present and unchanged (dropping it otherwise). Call with the lock held."""
+        entry = self._index.get(sha256)
+        if entry is None:
+            return None
+        try:
+            if _signature(self._blob_path(sha256)) == entry["signature"]:
+                return entry
+        except OSError:
+            pass
+        log.warning(f"[Blobs] Blob {sha256} changed or vanished on disk; dropped from the store.")
+        del self._index[sha256]
+        self._remove_file(sha256)
+        return None
+
+    def has(self, sha256):
+        with self._lock:
+            return self._valid(sha256.lower()) is not None
+
+    def add_file(self, path, sha256=None):
+        """Adds an existing file (hashing it unless sha256 is given). Returns the hash."""
+        sha256 = (sha256 or file_sha256(path)).lower()
+        with self._lock:
+            if self._valid(sha256) is not None:
+                self._index[sha256]["lastUsed"] = time.time()
+                return sha256
+            blob_path = self._blob_path(sha256)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(blob_path), suffix=".tmp")
+            os.close(fd)
+            os.remove(temp_path)
+            try:
+                os.link(path, temp_path)
+            except OSError:
+                shutil.copyfile(path, temp_path)
+            os.replace(temp_path, blob_path)
+            self._index[sha256] = {"signature": _signature(blob_path), "lastUsed": time.time()}
+            self._evict()
+            self._save_index()
+        log.info(f"[Blobs] Cached {path} as {sha256}.")
+        return sha256
+
+    def materialize(self, sha256, destination, mode="copy"):
+        """
+        Places a blob at destination, atomically (the file appears complete or
+        not at all). 'copy' gives an independent file; 'link' a hard link,
+        which is instant but must not be modified in place. Raises KeyError if
+        the blob is not in the store.
+        """
+        if mode not in MATERIALIZE_MODES:
+            raise ValueError(f"mode must be one of: {', '.join(MATERIALIZE_MODES)}.")
+        sha256 = sha256.lower()
+        with self._lock:
+            entry = self._valid(sha256)
+            if entry is None:
+                raise KeyError(sha256)
+            entry["lastUsed"] = time.time()
+            self._save_index()
+            blob_path = self._blob_path(sha256)
+        directory = os.path.dirname(os.path.abspath(destination))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(destination)}.", suffix=".part")
+        os.close(fd)
+        try:
+            if mode == "link":
+                os.remove(temp_path)
+                os.link(blob_path, temp_path)
+            else:
+                shutil.copyfile(blob_path, temp_path)
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return entry["signature"][0]
+
+    def _evict(self):
+        used = self.used_bytes
+        for sha256, entry in sorted(self._index.items(), key=lambda item: item[1]["lastUsed"]):
+            if used <= self.max_bytes:
+                break
+            used -= entry["signature"][0]
+            del self._index[sha256]
+            self._remove_file(sha256)
+            log.info(f"[Blobs] Evicted {sha256} ({entry['signature'][0]} bytes).")
+
+    def _remove_file(self, sha256):
+        try:
+            os.remove(self._blob_path(sha256))
+        except OSError:
+            pass
+
+    def snapshot(self):
+        with self._lock:
+            return {"blobs": len(self._index), "usedBytes": self.used_bytes, "maxBytes": self.max_bytes}
+
+
+_shared_stores = {}
+_shared_lock = threading.Lock()
+
+
+def get_blob_store(download_dir):
+    """Returns the shared blob store of a download directory."""
+    root = os.path.join(os.path.abspath(download_dir), BLOB_DIR_NAME)
+    with _shared_lock:
+        if root not in _shared_stores:
+            _shared_stores[root] = BlobStore(root)
+        return _shared_stores[root]
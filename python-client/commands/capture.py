@@ -0,0 +1,521 @@
+# File: commands/capture.py
+
+import os
+import sys
+import hashlib
+import time
+import ctypes
+import ctypes.util
+import threading
+import logging
+from collections import OrderedDict
+
+from PIL import Image
+
+log = logging.getLogger(__name__)
+
+# Environment variable to force a specific backend ('xshm', 'mss' or 'pyautogui').
+CAPTURE_BACKEND_ENV = "RPA_CAPTURE_BACKEND"
+# Shared memory images the XShm backend keeps for reuse (one per recent capture size).
+MAX_SHM_IMAGES = 4
+
+
+class CaptureError(Exception):
+    """Raised when a capture backend cannot be initialised or a grab fails."""
+
+
+class CaptureBackend:
+    """
+    Base class for screen capture backends.
+
+    Monitors follow the mss convention: index 0 is the bounding box of all
+    monitors, 1..N are the individual monitors. Each monitor is a dict with
+    'left', 'top', 'width' and 'height'.
+    """
+    name = "base"
+
+    def monitors(self):
+        raise NotImplementedError
+
+    def grab(self, left, top, width, height):
+        """Returns a PIL RGB image of the given area in virtual screen coordinates."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# --- X11 shared memory backend ---
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class _XImage(ctypes.Structure):
+    # Only the leading fields are declared; the struct is always allocated by Xlib.
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+class _XRRScreenResources(ctypes.Structure):
+    _fields_ = [
+        ("timestamp", ctypes.c_ulong),
+        ("configTimestamp", ctypes.c_ulong),
+        ("ncrtc", ctypes.c_int),
+        ("crtcs", ctypes.POINTER(ctypes.c_ulong)),
+        ("noutput", ctypes.c_int),
+        ("outputs", ctypes.POINTER(ctypes.c_ulong)),
+        ("nmode", ctypes.c_int),
+        ("modes", ctypes.c_void_p),
+    ]
+
+
+class _XRRCrtcInfo(ctypes.Structure):
+    _fields_ = [
+        ("timestamp", ctypes.c_ulong),
+        ("x", ctypes.c_int),
+        ("y", ctypes.c_int),
+        ("width", ctypes.c_uint),
+        ("height", ctypes.c_uint),
+        ("mode", ctypes.c_ulong),
+        ("rotation", ctypes.c_ushort),
+        ("noutput", ctypes.c_int),
+        ("outputs", ctypes.POINTER(ctypes.c_ulong)),
+        ("rotations", ctypes.c_ushort),
+        ("npossible", ctypes.c_int),
+        ("possible", ctypes.POINTER(ctypes.c_ulong)),
+    ]
+
+
+_ZPIXMAP = 2
+_ALL_PLANES = 0xFFFFFFFFFFFFFFFF if ctypes.sizeof(ctypes.c_ulong) == 8 else 0xFFFFFFFF
+_IPC_PRIVATE = 0
+_IPC_CREAT = 0o1000
+_IPC_RMID = 0
+
+_X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+
+class XShmCaptureBackend(CaptureBackend):
+    """
+    Grabs the X11 root window through the MIT-SHM extension (XShmGetImage),
+    the same approach mss uses. The server copies pixels straight into a
+    shared memory segment, avoiding the socket round-trip of XGetImage and
+    the subprocess of scrot. Works under Xvfb.
+
+    Shared memory images are cached per capture size and reused between grabs;
+    only the MAX_SHM_IMAGES most recently used sizes keep their segments.
+    """
+    name = "xshm"
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise CaptureError("XShm capture is only available on Linux.")
+        if not os.environ.get("DISPLAY"):
+            raise CaptureError("DISPLAY is not set.")
+
+        self._xlib = self._load("X11")
+        self._xext = self._load("Xext")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        try:
+            self._xrandr = self._load("Xrandr")
+        except CaptureError:
+            self._xrandr = None
+        self._declare_functions()
+
+        self._last_error = None
+        # Xlib's default error handler exits the process; record errors instead.
+        self._error_handler = _X_ERROR_HANDLER(self._on_x_error)
+        self._xlib.XSetErrorHandler(self._error_handler)
+
+        self._display = self._xlib.XOpenDisplay(None)
+        if not self._display:
+            raise CaptureError(f"Cannot open X display {os.environ.get('DISPLAY')}.")
+        if not self._xext.XShmQueryExtension(self._display):
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+            raise CaptureError("X server does not support the MIT-SHM extension.")
+
+        screen = self._xlib.XDefaultScreen(self._display)
+        self._root = self._xlib.XRootWindow(self._display, screen)
+        self._visual = self._xlib.XDefaultVisual(self._display, screen)
+        self._depth = self._xlib.XDefaultDepth(self._display, screen)
+        self._screen_width = self._xlib.XDisplayWidth(self._display, screen)
+        self._screen_height = self._xlib.XDisplayHeight(self._display, screen)
+        self._images = OrderedDict()  # (width, height) -> (XImage pointer, XShmSegmentInfo), least recent first
+        self._monitors = None
+
+    @staticmethod
+    def _load(name):
+        path = ctypes.util.find_library(name)
+        if not path:
+            raise CaptureError(f"lib{name} not found.")
+        return ctypes.CDLL(path)
+
+    def _declare_functions(self):
+        x, xext, libc = self._xlib, self._xext, self._libc
+        x.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x.XOpenDisplay.restype = ctypes.c_void_p
+        x.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x.XSetErrorHandler.argtypes = [_X_ERROR_HANDLER]
+        x.XSetErrorHandler.restype = ctypes.c_void_p
+        x.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x.XRootWindow.restype = ctypes.c_ulong
+        x.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x.XDefaultVisual.restype = ctypes.c_void_p
+        x.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x.XFree.argtypes = [ctypes.c_void_p]
+
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint,
+        ]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage), ctypes.c_int, ctypes.c_int, ctypes.c_ulong,
+        ]
+
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+        if self._xrandr:
+            xrr = self._xrandr
+            xrr.XRRGetScreenResourcesCurrent.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+            xrr.XRRGetScreenResourcesCurrent.restype = ctypes.POINTER(_XRRScreenResources)
+            xrr.XRRGetCrtcInfo.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XRRScreenResources), ctypes.c_ulong]
+            xrr.XRRGetCrtcInfo.restype = ctypes.POINTER(_XRRCrtcInfo)
+            xrr.XRRFreeScreenResources.argtypes = [ctypes.POINTER(_XRRScreenResources)]
+            xrr.XRRFreeCrtcInfo.argtypes = [ctypes.POINTER(_XRRCrtcInfo)]
+
+    def _on_x_error(self, display, event):
+        self._last_error = "X protocol error"
+        return 0
+
+    def monitors(self):
+        if self._monitors is None:
+            root = {"left": 0, "top": 0, "width": self._screen_width, "height": self._screen_height}
+            monitors = [root]
+            if self._xrandr:
+                resources = self._xrandr.XRRGetScreenResourcesCurrent(self._display, self._root)
+                try:
+                    for index in range(resources.contents.ncrtc):
+                        crtc = self._xrandr.XRRGetCrtcInfo(self._display, resources, resources.contents.crtcs[index])
+                        try:
+                            info = crtc.contents
+                            if info.noutput > 0 and info.width and info.height:
+                                monitors.append({"left": info.x, "top": info.y, "width": info.width, "height": info.height})
+                        finally:
+                            self._xrandr.XRRFreeCrtcInfo(crtc)
+                finally:
+                    self._xrandr.XRRFreeScreenResources(resources)
+            if len(monitors) == 1:
+                monitors.append(dict(root))
+            self._monitors = monitors
+        return self._monitors
+
+    def _get_image(self, width, height):
+        cached = self._images.get((width, height))
+        if cached:
+            self._images.move_to_end((width, height))
+            return cached
+        while len(self._images) >= MAX_SHM_IMAGES:
+            _, evicted = self._images.popitem(last=False)
+            self._free_image(*evicted)
+
+        shminfo = _XShmSegmentInfo()
+        ximage = self._xext.XShmCreateImage(
+            self._display, self._visual, self._depth, _ZPIXMAP, None, ctypes.byref(shminfo), width, height
+        )
+        if not ximage:
+            raise CaptureError("XShmCreateImage failed.")
+        size = ximage.contents.bytes_per_line * ximage.contents.height
+        shminfo.shmid = self._libc.shmget(_IPC_PRIVATE, size, _IPC_CREAT | 0o600)
+        if shminfo.shmid < 0:
+            self._xlib.XFree(ximage)
+            raise CaptureError(f"shmget failed (errno {ctypes.get_errno()}).")
+        address = self._libc.shmat(shminfo.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            self._libc.shmctl(shminfo.shmid, _IPC_RMID, None)
+            self._xlib.XFree(ximage)
+            raise CaptureError(f"shmat failed (errno {ctypes.get_errno()}).")
+        shminfo.shmaddr = address
+        shminfo.readOnly = 0
+        ximage.contents.data = address
+
+        self._last_error = None
+        self._xext.XShmAttach(self._display, ctypes.byref(shminfo))
+        self._xlib.XSync(self._display, 0)
+        # The segment is destroyed automatically once both sides detach.
+        self._libc.shmctl(shminfo.shmid, _IPC_RMID, None)
+        if self._last_error:
+            self._libc.shmdt(address)
+            self._xlib.XFree(ximage)
+            raise CaptureError(f"XShmAttach failed: {self._last_error}")
+
+        cached = (ximage, shminfo)
+        self._images[(width, height)] = cached
+        return cached
+
+    def _free_image(self, ximage, shminfo):
+        # The segment was marked for removal at creation; it goes away once both sides detach.
+        self._xext.XShmDetach(self._display, ctypes.byref(shminfo))
+        self._xlib.XSync(self._display, 0)
+        self._libc.shmdt(shminfo.shmaddr)
+        self._xlib.XFree(ximage)
+
+    def grab(self, left, top, width, height):
+        ximage, _ = self._get_image(width, height)
+        self._last_error = None
+        if not self._xext.XShmGetImage(self._display, self._root, ximage, left, top, _ALL_PLANES) or self._last_error:
+            raise CaptureError(f"XShmGetImage failed for region ({left}, {top}, {width}, {height}).")
+        info = ximage.contents
+        if info.bits_per_pixel != 32:
+            raise CaptureError(f"Unsupported X image depth: {info.bits_per_pixel} bits per pixel.")
+        size = info.bytes_per_line * info.height
+        buffer = (ctypes.c_char * size).from_address(info.data)
+        # Decoding BGRX into a fresh RGB image copies the pixels out of the shared segment.
+        return Image.frombuffer("RGB", (width, height), buffer, "raw", "BGRX", info.bytes_per_line, 1)
+
+    def close(self):
+        if not self._display:
+            return
+        for ximage, shminfo in self._images.values():
+            self._free_image(ximage, shminfo)
+        self._images.clear()
+        self._xlib.XCloseDisplay(self._display)
+        self._display = None
+
+
+# --- mss and pyautogui backends ---
+
+class MssCaptureBackend(CaptureBackend):
+    """Uses the mss package when it is installed (Windows, macOS and X11)."""
+    name = "mss"
+
+    def __init__(self):
+        try:
+            import mss
+        except ImportError as e:
+            raise CaptureError("mss is not installed.") from e
+        self._sct = mss.mss()
+
+    def monitors(self):
+        return [
+            {"left": m["left"], "top": m["top"], "width": m["width"], "height": m["height"]}
+            for m in self._sct.monitors
+        ]
+
+    def grab(self, left, top, width, height):
+        shot = self._sct.grab({"left": left, "top": top, "width": width, "height": height})
+        return Image.frombuffer("RGB", shot.size, shot.bgra, "raw", "BGRX")
+
+    def close(self):
+        self._sct.close()
+
+
+class PyAutoGUICaptureBackend(CaptureBackend):
+    """Fallback backend; single monitor only."""
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+
+    def monitors(self):
+        width, height = self._pyautogui.size()
+        screen = {"left": 0, "top": 0, "width": width, "height": height}
+        return [screen, dict(screen)]
+
+    def grab(self, left, top, width, height):
+        image = self._pyautogui.screenshot(region=(left, top, width, height))
+        return image.convert("RGB") if image.mode != "RGB" else image
+
+
+BACKENDS = {
+    XShmCaptureBackend.name: XShmCaptureBackend,
+    MssCaptureBackend.name: MssCaptureBackend,
+    PyAutoGUICaptureBackend.name: PyAutoGUICaptureBackend,
+}
+DEFAULT_BACKEND_ORDER = (XShmCaptureBackend.name, MssCaptureBackend.name, PyAutoGUICaptureBackend.name)
+
+
+def parse_region(region):
+    """
+    Normalizes a region parameter to a (left, top, width, height) tuple.
+    Accepts [left, top, width, height] or a dict with x/y (or left/top) and width/height.
+    """
+    if region is None:
+        return None
+    if isinstance(region, dict):
+        left = region.get("left", region.get("x"))
+        top = region.get("top", region.get("y"))
+        values = (left, top, region.get("width"), region.get("height"))
+    elif isinstance(region, (list, tuple)) and len(region) == 4:
+        values = tuple(region)
+    else:
+        raise ValueError("region must be [left, top, width, height] or a dict with x, y, width and height.")
+    if any(v is None for v in values):
+        raise ValueError(f"region is incomplete: {region}")
+    left, top, width, height = (int(v) for v in values)
+    if width <= 0 or height <= 0:
+        raise ValueError(f"region width and height must be positive: {region}")
+    return left, top, width, height
+
+
+def image_content_hash(image):
+    """Hash of the pixels (and geometry) of an image, independent of the encoding used to send it."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode('ascii'))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class ScreenCapture:
+    """
+    Screen capture service shared by the screenshot command and remote control
+    streaming. Picks the fastest available backend, falling back to pyautogui.
+    Grabs are serialized because the X11 connection is not thread-safe.
+    """
+
+    def __init__(self, backend=None):
+        self._lock = threading.Lock()
+        self.backend = self._create_backend(backend or os.environ.get(CAPTURE_BACKEND_ENV))
+
+    @staticmethod
+    def _create_backend(preferred=None):
+        order = (preferred,) if preferred else DEFAULT_BACKEND_ORDER
+        errors = []
+        for name in order:
+            backend_cls = BACKENDS.get(name)
+            if backend_cls is None:
+                errors.append(f"{name}: unknown backend")
+                continue
+            try:
+                backend = backend_cls()
+                log.info(f"[Capture] Using '{name}' screen capture backend.")
+                return backend
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                log.debug(f"[Capture] Backend '{name}' unavailable: {e}")
+        raise CaptureError(f"No screen capture backend available ({'; '.join(errors)}).")
+
+    @property
+    def backend_name(self):
+        return self.backend.name
+
+    def monitors(self):
+        with self._lock:
+            return [dict(m) for m in self.backend.monitors()]
+
+    def resolve_area(self, region=None, monitor=None):
+        """
+        Returns the (left, top, width, height) to grab. A region is relative to
+        the selected monitor (or to the whole virtual screen when no monitor is
+        given) and is clipped to it.
+        """
+        monitors = self.backend.monitors()
+        if monitor is None:
+            bounds = monitors[0]
+        else:
+            monitor = int(monitor)
+            if monitor < 0 or monitor >= len(monitors):
+                raise ValueError(f"monitor must be between 0 and {len(monitors) - 1}, got {monitor}.")
+            bounds = monitors[monitor]
+
+        region = parse_region(region)
+        if region is None:
+            return bounds["left"], bounds["top"], bounds["width"], bounds["height"]
+
+        left = max(region[0], 0)
+        top = max(region[1], 0)
+        right = min(region[0] + region[2], bounds["width"])
+        bottom = min(region[1] + region[3], bounds["height"])
+        if right <= left or bottom <= top:
+            raise ValueError(f"region {region} lies outside the monitor ({bounds['width']}x{bounds['height']}).")
+        return bounds["left"] + left, bounds["top"] + top, right - left, bottom - top
+
+    def grab(self, region=None, monitor=None):
+        """Captures the screen (or a region of it) and returns a PIL RGB image."""
+        with self._lock:
+            left, top, width, height = self.resolve_area(region, monitor)
+            return self.backend.grab(left, top, width, height)
+
+    def close(self):
+        with self._lock:
+            self.backend.close()
+
+
+_shared_capture = None
+_shared_capture_lock = threading.Lock()
+
+
+def get_screen_capture():
+    """Returns the process-wide ScreenCapture instance, creating it on first use."""
+    global _shared_capture
+    with _shared_capture_lock:
+        if _shared_capture is None:
+            _shared_capture = ScreenCapture()
+        return _shared_capture
+
+
+def benchmark_backends(names=None, duration=3.0, region=None):
+    """
+    Measures captures per second for each available backend.
+    Returns a list of dicts with backend name, captures, fps and ms per capture
+    (or the error if the backend could not be used).
+    """
+    results = []
+    for name in names or DEFAULT_BACKEND_ORDER:
+        try:
+            capture = ScreenCapture(backend=name)
+        except CaptureError as e:
+            results.append({"backend": name, "error": str(e)})
+            continue
+        try:
+            capture.grab(region)  # Warm up: allocates shared memory / buffers
+            count = 0
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                capture.grab(region)
+                count += 1
+            elapsed = time.perf_counter() - start
+            left, top, width, height = capture.resolve_area(region)
+            results.append({
+                "backend": name,
+                "size": f"{width}x{height}",
+                "captures": count,
+                "fps": round(count / elapsed, 1),
+                "ms_per_capture": round(elapsed * 1000 / count, 2),
+            })
+        except Exception as e:
+            results.append({"backend": name, "error": str(e)})
+        finally:
+            capture.close()
+    return results
@@ -0,0 +1,256 @@
+# File: commands/downloads.py
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .blob_store import file_sha256
+from .http_session import get_http_session, DEFAULT_TIMEOUT, POOL_MAXSIZE
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONNECTIONS = 4
+# Files smaller than this per extra connection are not worth splitting.
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+READ_SIZE = 256 * 1024
+# Segment progress is saved to the state file at most this often, so a resume repeats little.
+STATE_SAVE_INTERVAL_SECONDS = 2
+SEGMENT_RETRIES = 3
+
+
+class DownloadError(Exception):
+    pass
+
+
+class RemoteChangedError(DownloadError):
+    """The remote file no longer matches the partial download; it must start over."""
+
+
+class Download:
+    """
+    Downloads a URL to a file through the shared connection pool.
+
+    When the server advertises byte ranges and a length, the file is split into
+    segments fetched over parallel connections, each written at its offset in
+    "<destination>.part". Per-segment progress is kept in "<destination>.part.json"
+    together with the response's ETag/Last-Modified, so a later attempt continues
+    where it stopped unless the remote file has changed (without a validator,
+    there is no telling, and the download starts over). Servers without ranges
+    get a single streamed GET. The .part file is renamed over the destination
+    only once complete (and its SHA-256 matched, if one was given).
+
+    `progress(downloaded, total)` is called from worker threads as data arrives;
+    total is None when the server sends no length.
+    """
+
+    def __init__(self, url, destination, connections=DEFAULT_CONNECTIONS, sha256=None, headers=None,
+                 timeout=DEFAULT_TIMEOUT, progress=None, session=None):
+        self.url = url
+        self.destination = destination
+        self.part_path = destination + ".part"
+        self.state_path = destination + ".part.json"
+        self.connections = max(1, min(int(connections), POOL_MAXSIZE))
+        self.sha256 = sha256.lower() if sha256 else None
+        self.headers = dict(headers or {})
+        # Byte offsets and lengths must be of the file itself, not of a compressed encoding.
+        self.headers.setdefault("Accept-Encoding", "identity")
+        self.timeout = timeout
+        self.session = session or get_http_session()
+        self._progress = progress
+        self._lock = threading.Lock()
+        self.size = None
+        self.downloaded = 0
+        self.resumed_bytes = 0
+        self.segments = 0
+        self._single_digest = None
+        self._abort = threading.Event()
+
+    def _report(self, count):
+        with self._lock:
+            self.downloaded += count
+            downloaded = self.downloaded
+        if self._progress:
+            self._progress(downloaded, self.size)
+
+    def _probe(self):
+        """Length, range support and validator of the resource (None/False if unknown)."""
+        response = self.session.head(self.url, headers=self.headers, timeout=self.timeout, allow_redirects=True)
+        if response.status_code >= 400:
+            # Some servers refuse HEAD; a plain GET is tried instead.
+            return None, False, None
+        length = response.headers.get("Content-Length")
+        ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.headers.get("Content-Encoding") not in (None, "identity"):
+            # The length is of the encoded body; ranges would be too.
+            return None, False, validator
+        return (int(length) if length and length.isdigit() else None), ranges, validator
+
+    def run(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.destination)), exist_ok=True)
+        size, ranges, validator = self._probe()
+        self.size = size
+        if ranges and size:
+            self._ranged(size, validator)
+        else:
+            self._single()
+        self._finish()
+        return self.result()
+
+    def result(self):
+        return {
+            "size": self.downloaded,
+            "segments": self.segments,
+            "resumedBytes": self.resumed_bytes,
+            "sha256": self.sha256
+        }
+
+    # --- Ranged, multi-connection download ---
+
+    def _load_state(self, size, validator):
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if (state.get("url") == self.url and state.get("size") == size and state.get("validator") == validator
+                    and validator and os.path.getsize(self.part_path) == size):
+                return state
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save_state(self, state):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.state_path)
+
+    def _ranged(self, size, validator):
+        state = self._load_state(size, validator)
+        if state is None:
+            count = max(1, min(self.connections, size // MIN_SEGMENT_SIZE))
+            bounds = [size * i // count for i in range(count + 1)]
+            # [start, end (exclusive), next offset to fetch]
+            state = {"url": self.url, "size": size, "validator": validator,
+                     "segments": [[bounds[i], bounds[i + 1], bounds[i]] for i in range(count)]}
+            with open(self.part_path, "wb") as f:
+                f.truncate(size)
+            self._save_state(state)
+        else:
+            self.resumed_bytes = sum(done - start for start, _, done in state["segments"])
+            self.downloaded = self.resumed_bytes
+            log.info(f"[Download] Resuming {self.url} with {self.resumed_bytes} of {size} bytes already on disk.")
+        self.segments = len(state["segments"])
+
+        pending = [segment for segment in state["segments"] if segment[2] < segment[1]]
+        saver = _StateSaver(self, state)
+        try:
+            with ThreadPoolExecutor(max_workers=len(pending) or 1, thread_name_prefix="download") as pool:
+                futures = [pool.submit(self._fetch_segment, segment, validator, saver) for segment in pending]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    self._abort.set() # Stop the other segments; their progress is kept.
+                    raise
+        except RemoteChangedError:
+            self._remove_state()
+            raise
+        finally:
+            if os.path.exists(self.state_path):
+                saver.save()
+
+    def _fetch_segment(self, segment, validator, saver):
+        start, end, _ = segment
+        attempts = 0
+        # Unbuffered, so bytes recorded in the state file have reached the OS.
+        with open(self.part_path, "r+b", buffering=0) as f:
+            while segment[2] < end:
+                headers = dict(self.headers, Range=f"bytes={segment[2]}-{end - 1}")
+                if validator:
+                    # If the file changed, the server sends all of it with 200 instead of a 206.
+                    headers["If-Range"] = validator
+                try:
+                    with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                        if response.status_code == 200:
+                            raise RemoteChangedError(f"Expected a partial response for bytes {segment[2]}-{end - 1}, "
+                                                     f"got the whole file; the remote file has changed.")
+                        response.raise_for_status()
+                        f.seek(segment[2])
+                        for data in response.iter_content(chunk_size=READ_SIZE):
+                            data = data[:end - segment[2]]
+                            f.write(data)
+                            segment[2] += len(data)
+                            self._report(len(data))
+                            saver.maybe_save()
+                            if segment[2] >= end or self._abort.is_set():
+                                break
+                    if self._abort.is_set():
+                        return
+                    if segment[2] < end:
+                        raise DownloadError(f"Connection closed at byte {segment[2]} of segment {start}-{end - 1}.")
+                except RemoteChangedError:
+                    raise
+                except (DownloadError, OSError, requests.exceptions.RequestException) as e:
+                    attempts += 1
+                    if attempts > SEGMENT_RETRIES:
+                        raise
+                    log.warning(f"[Download] Segment {start}-{end - 1} interrupted at {segment[2]} ({e}); retrying.")
+                    time.sleep(attempts)
+
+    # --- Single-connection download ---
+
+    def _single(self):
+        self.segments = 1
+        hasher = hashlib.sha256()
+        with self.session.get(self.url, headers=self.headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            length = response.headers.get("Content-Length")
+            if self.size is None and length and length.isdigit() and "Content-Encoding" not in response.headers:
+                self.size = int(length)
+            with open(self.part_path, "wb") as f:
+                for data in response.iter_content(chunk_size=READ_SIZE):
+                    f.write(data)
+                    hasher.update(data)
+                    self._report(len(data))
+        self._single_digest = hasher.hexdigest()
+
+    def _finish(self):
+        if self.size is not None and os.path.getsize(self.part_path) != self.size:
+            raise DownloadError(f"Received {os.path.getsize(self.part_path)} bytes, expected {self.size}.")
+        if self.sha256:
+            digest = self._single_digest or file_sha256(self.part_path)
+            if digest != self.sha256:
+                os.remove(self.part_path)
+                self._remove_state()
+                raise DownloadError(f"SHA-256 mismatch: got {digest}, expected {self.sha256}.")
+        os.replace(self.part_path, self.destination)
+        self._remove_state()
+
+    def _remove_state(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+
+class _StateSaver:
+    """Writes segment progress to the state file, at most every STATE_SAVE_INTERVAL_SECONDS."""
+
+    def __init__(self, download, state):
+        self.download = download
+        self.state = state
+        self._lock = threading.Lock()
+        self._last = time.monotonic()
+
+    def maybe_save(self):
+        if time.monotonic() - self._last >= STATE_SAVE_INTERVAL_SECONDS:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            self._last = time.monotonic()
+            self.download._save_state(self.state)
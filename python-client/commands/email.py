@@ -11,15 +11,39 @@ import ssl
 import logging
 import traceback
 import os # Make sure os is imported for file operations
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .mail_pool import get_imap_pool, get_smtp_pool, IDLE_SLICE_SECONDS, MAX_SMTP_CONNECTIONS
+from .mail_compose import render, as_list, message_chunks
+from .mail_listing import get_uid_state, parse_fetch, summarize_message, summarize_structure, uid_set, DEFAULT_HEADER_FIELDS, FETCH_BATCH_SIZE
+from .mail_attachments import AttachmentIndex, select_attachments, save_part
 
 log = logging.getLogger(__name__)
 
+DEFAULT_WAIT_TIMEOUT_SECONDS = 30.0
+DEFAULT_POLL_INTERVAL_SECONDS = 2.0
+MIN_POLL_INTERVAL_SECONDS = 0.5
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_ATTACHMENT_MESSAGES = 1000
+DEFAULT_SMTP_CONCURRENCY = 3
+MAX_BULK_MESSAGES = 5000
+# A message is retried once on a fresh connection if its connection drops while sending it.
+BULK_SEND_ATTEMPTS = 2
+
 class EmailCommands:
     def __init__(self, node_client_ref=None):
         self.node_client_ref = node_client_ref
         # No hardcoded server details here. They will be resolved dynamically
         # either from command parameters or based on a 'service_provider' parameter.
-        pass
+        # Mailbox listing state (last listed UIDs) is kept next to received files.
+        if self.node_client_ref and hasattr(self.node_client_ref, 'download_dir'):
+            self.download_dir = self.node_client_ref.download_dir
+        else:
+            self.download_dir = os.path.join(os.getcwd(), 'rpa_client_downloads')
 
     def _get_email_config(self, params):
         """
@@ -157,9 +181,55 @@ class EmailCommands:
             log.error(f"Error sending email: {e}", exc_info=True)
             return {"status": "error", "message": f"Error sending email: {e}", "traceback": traceback.format_exc()}
 
+    @staticmethod
+    def _search_criteria(params):
+        """IMAP SEARCH criteria for the from_email / subject_substring / unread_only filters."""
+        criteria = []
+        if params.get("unread_only", True):
+            criteria.append('UNSEEN')
+        # Add FROM/SUBJECT filters if provided. IMAP search allows literal strings.
+        if params.get("from_email"):
+            criteria.extend(['FROM', f'"{params["from_email"]}"'])
+        if params.get("subject_substring"):
+            criteria.extend(['SUBJECT', f'"{params["subject_substring"]}"'])
+        return criteria
+
+    @staticmethod
+    def _email_data(raw_email):
+        """Sender, subject, date and plain/HTML bodies of a raw RFC822 message."""
+        msg = email.message_from_bytes(raw_email)
+        body = ""
+        html_body = ""
+
+        def text(part):
+            payload = part.get_payload(decode=True) or b""
+            return payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+
+        if msg.is_multipart():
+            for part in msg.walk():
+                ctype = part.get_content_type()
+                cdisp = str(part.get('Content-Disposition'))
+
+                if ctype == 'text/plain' and 'attachment' not in cdisp:
+                    body = text(part)
+                    # Prefer plain text, but store HTML if available for more comprehensive return
+                elif ctype == 'text/html' and 'attachment' not in cdisp:
+                    html_body = text(part)
+        else:
+            body = text(msg)
+
+        return {
+            "sender": msg['from'],
+            "subject": msg['subject'],
+            "body": body, # Plain text body
+            "html_body": html_body, # HTML body if present
+            "date": msg['date']
+        }
+
     def read_latest_email(self, params):
         """
-        Reads the latest email (or latest unread) from the inbox.
+        Reads the latest email (or latest unread) from the inbox, over a pooled
+        IMAP connection (see mail_pool.ImapPool).
         Params:
             email_user (str): Email address to login as.
             email_password (str): Email password (use App Password for Gmail/Outlook).
@@ -172,90 +242,507 @@ class EmailCommands:
         Returns:
             dict: Email details (sender, subject, body, date) or error.
         """
+        config = None
         try:
             config = self._get_email_config(params) # Get config from parameters
 
-            from_email_filter = params.get("from_email")
-            subject_substring_filter = params.get("subject_substring")
-            unread_only = params.get("unread_only", True)
+            with get_imap_pool().connection(config) as connection:
+                connection.select('inbox')
+                mail = connection.imap
 
-            mail = imaplib.IMAP4_SSL(config["imap_server"], config["imap_port"])
-            mail.login(config["user"], config["password"])
-            mail.select('inbox')
+                # If no filter at all, search ALL
+                search_criteria = self._search_criteria(params) or ['ALL']
+                status, email_ids = mail.search(None, *search_criteria)
+                email_id_list = email_ids[0].split()
 
-            search_criteria = []
-            if unread_only:
-                search_criteria.append('UNSEEN')
-            
-            # Add FROM/SUBJECT filters if provided. IMAP search allows literal strings.
-            # Example: mail.search(None, 'FROM', 'example@domain.com', 'SUBJECT', 'Hello')
-            if from_email_filter:
-                search_criteria.extend(['FROM', from_email_filter])
-            if subject_substring_filter:
-                search_criteria.extend(['SUBJECT', subject_substring_filter])
-
-            # If no specific search criteria other than unread_only, search all
-            if not search_criteria and not unread_only: # If no filter at all, means search ALL
-                search_criteria.append('ALL')
-            elif not search_criteria and unread_only: # If only unread_only was initially added
-                pass # search_criteria already has 'UNSEEN'
-
-            status, email_ids = mail.search(None, *search_criteria)
-            email_id_list = email_ids[0].split()
-
-            if not email_id_list:
-                log.info("No emails found matching criteria.")
-                mail.logout()
-                return {"status": "success", "action": "read_latest_email", "message": "No emails found.", "email_data": None}
-
-            # Get the latest email ID (highest number)
-            latest_email_id = email_id_list[-1] 
-            
-            status, msg_data = mail.fetch(latest_email_id, '(RFC822)') # Fetch the entire email content
-            raw_email = msg_data[0][1]
-            msg = email.message_from_bytes(raw_email)
-
-            sender = msg['from']
-            subject = msg['subject']
-            date = msg['date']
-            body = ""
-            html_body = ""
-
-            if msg.is_multipart():
-                for part in email.iterators.walk(msg): # Use email.iterators.walk for robustness
-                    ctype = part.get_content_type()
-                    cdisp = str(part.get('Content-Disposition'))
-
-                    if ctype == 'text/plain' and 'attachment' not in cdisp:
-                        body = part.get_payload(decode=True).decode()
-                        # Prefer plain text, but store HTML if available for more comprehensive return
-                    elif ctype == 'text/html' and 'attachment' not in cdisp:
-                        html_body = part.get_payload(decode=True).decode()
-            else:
-                body = msg.get_payload(decode=True).decode()
+                if not email_id_list:
+                    log.info("No emails found matching criteria.")
+                    return {"status": "success", "action": "read_latest_email", "message": "No emails found.", "email_data": None}
 
-            # Mark as seen (optional, uncomment if desired)
-            # mail.store(latest_email_id, '+FLAGS', '\\Seen') 
+                # Get the latest email ID (highest number)
+                latest_email_id = email_id_list[-1]
 
-            mail.logout()
-            
-            email_data = {
-                "sender": sender,
-                "subject": subject,
-                "body": body, # Plain text body
-                "html_body": html_body, # HTML body if present
-                "date": date
-            }
-            log.info(f"Successfully read latest email from '{sender}' with subject '{subject}'.")
+                status, msg_data = mail.fetch(latest_email_id, '(RFC822)') # Fetch the entire email content
+                email_data = self._email_data(msg_data[0][1])
+
+            log.info(f"Successfully read latest email from '{email_data['sender']}' with subject '{email_data['subject']}'.")
             return {"status": "success", "action": "read_latest_email", "message": "Email read successfully.", "email_data": email_data}
 
         except ValueError as ve:
             log.error(f"read_latest_email parameter error: {ve}")
             return {"status": "error", "message": str(ve)}
         except imaplib.IMAP4.error as ie:
-            log.error(f"IMAP error: {ie}. Check server, port, and credentials for {config['user']}.")
+            log.error(f"IMAP error: {ie}. Check server, port, and credentials for {config['user'] if config else 'unknown user'}.")
             return {"status": "error", "message": f"IMAP connection or login failed: {ie}"}
         except Exception as e:
             log.error(f"Error reading email: {e}", exc_info=True)
             return {"status": "error", "message": f"Error reading email: {e}", "traceback": traceback.format_exc()}
 
+    def wait_for_email(self, params):
+        """
+        Waits for a matching email to arrive and returns it as soon as it does,
+        e.g. a one-time password. One pooled IMAP connection is held in IDLE, so
+        the server pushes new mail; servers without IDLE are polled every
+        poll_interval seconds on the same connection.
+        Params:
+            (account params as for read_latest_email)
+            from_email (str, optional): Filter by sender email.
+            subject_substring (str, optional): Filter by subject substring.
+            unread_only (bool, optional): Only match unread emails. Defaults to True.
+            mailbox (str, optional): Mailbox to watch. Defaults to 'inbox'.
+            timeout (float, optional): Seconds to wait. Defaults to 30.
+            poll_interval (float, optional): Seconds between checks without IDLE. Defaults to 2.
+            after_uid (int, optional): Match messages with a higher UID. Defaults to the
+                mailbox's next UID when the wait starts, i.e. only mail arriving from now on.
+            mark_seen (bool, optional): Mark the returned message as read. Defaults to True.
+        Returns:
+            dict: email_data (as read_latest_email, plus 'uid'), or an error with timedOut on timeout.
+        """
+        request_id = params.get('requestId')
+        config = None
+        started = time.monotonic()
+        try:
+            config = self._get_email_config(params)
+            mailbox = params.get("mailbox", "inbox")
+            timeout = float(params.get("timeout", DEFAULT_WAIT_TIMEOUT_SECONDS))
+            poll_interval = max(MIN_POLL_INTERVAL_SECONDS, float(params.get("poll_interval", DEFAULT_POLL_INTERVAL_SECONDS)))
+            criteria = self._search_criteria(params)
+            deadline = started + timeout
+
+            with get_imap_pool().connection(config) as connection:
+                connection.select(mailbox)
+                mail = connection.imap
+                after_uid = params.get("after_uid")
+                if after_uid is None:
+                    after_uid = self._uid_next(mail, mailbox) - 1
+                after_uid = int(after_uid)
+                use_idle = connection.supports_idle()
+                log.info(f"[Mail] Waiting up to {timeout}s for mail in '{mailbox}' after UID {after_uid} "
+                         f"({'IDLE' if use_idle else f'polling every {poll_interval}s'}). RequestId: {request_id}")
+                checks = 0
+                while True:
+                    checks += 1
+                    status, data = mail.uid('SEARCH', None, f'UID {after_uid + 1}:*', *criteria)
+                    # "n:*" always includes the highest UID, even if it is below n.
+                    uids = [int(uid) for uid in (data[0] or b"").split() if int(uid) > after_uid]
+                    if uids:
+                        uid = uids[0]
+                        fetch_item = '(RFC822)' if params.get("mark_seen", True) else '(BODY.PEEK[])'
+                        status, msg_data = mail.uid('FETCH', str(uid), fetch_item)
+                        email_data = dict(self._email_data(msg_data[0][1]), uid=uid)
+                        elapsed = round(time.monotonic() - started, 3)
+                        log.info(f"[Mail] Matching email UID {uid} from '{email_data['sender']}' after {elapsed}s. RequestId: {request_id}")
+                        return {
+                            "status": "success",
+                            "action": "wait_for_email",
+                            "message": "Email received.",
+                            "email_data": email_data,
+                            "elapsedSeconds": elapsed,
+                            "checks": checks,
+                            "requestId": request_id
+                        }
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if use_idle:
+                        connection.idle(min(remaining, IDLE_SLICE_SECONDS))
+                    else:
+                        time.sleep(min(poll_interval, remaining))
+                        mail.noop() # Lets the server report new messages
+
+            log.info(f"[Mail] No matching email within {timeout}s. RequestId: {request_id}")
+            return {
+                "status": "error",
+                "action": "wait_for_email",
+                "timedOut": True,
+                "message": f"No matching email arrived within {timeout} seconds.",
+                "afterUid": after_uid,
+                "elapsedSeconds": round(time.monotonic() - started, 3),
+                "checks": checks,
+                "requestId": request_id
+            }
+        except ValueError as ve:
+            log.error(f"wait_for_email parameter error: {ve}")
+            return {"status": "error", "action": "wait_for_email", "message": str(ve), "requestId": request_id}
+        except imaplib.IMAP4.error as ie:
+            log.error(f"IMAP error: {ie}. Check server, port, and credentials for {config['user'] if config else 'unknown user'}.")
+            return {"status": "error", "action": "wait_for_email", "message": f"IMAP connection or login failed: {ie}", "requestId": request_id}
+        except Exception as e:
+            log.error(f"Error waiting for email: {e}", exc_info=True)
+            return {"status": "error", "action": "wait_for_email", "message": f"Error waiting for email: {e}",
+                    "traceback": traceback.format_exc(), "requestId": request_id}
+
+    @staticmethod
+    def _mailbox_status(mail, mailbox, item):
+        status, data = mail.status(mailbox, f'({item})')
+        match = re.search(item.encode("ascii") + rb" (\d+)", data[0] or b"")
+        if status != "OK" or not match:
+            raise imaplib.IMAP4.error(f"Cannot read {item} of '{mailbox}': {data}")
+        return int(match.group(1))
+
+    def _uid_next(self, mail, mailbox):
+        return self._mailbox_status(mail, mailbox, 'UIDNEXT')
+
+    def list_emails(self, params):
+        """
+        Lists the messages of a mailbox by headers and attachment structure only
+        (BODY.PEEK[HEADER.FIELDS ...] and BODYSTRUCTURE, so nothing is marked as
+        read and no bodies are transferred), oldest first, one page at a time.
+        With track (the default) the last listed UID is remembered per account,
+        mailbox and set of filters, so each call continues where the previous one stopped:
+        after the first full pass, a call only returns mail that arrived since.
+        Bodies and attachments are fetched by follow-up commands, by UID.
+        Params:
+            (account params as for read_latest_email)
+            mailbox (str, optional): Mailbox to list. Defaults to 'inbox'.
+            page_size (int, optional): Most messages returned per call. Defaults to 100.
+            track (bool, optional): Continue from, and advance, the remembered UID. Defaults to True.
+            after_uid (int, optional): List messages with a higher UID (overrides the remembered one).
+            reset (bool, optional): Forget the remembered UID and list from the start.
+            header_fields (list, optional): Headers to fetch. Defaults to From, To, Cc, Subject, Date, Message-ID.
+            from_email, subject_substring (str, optional): Filters, as for read_latest_email.
+            unread_only (bool, optional): Only list unread messages. Defaults to False.
+        Returns:
+            dict: emails (uid, headers, flags, size, contentType, attachments[partId, filename, ...]),
+                  lastUid (pass as after_uid for the next page when not tracking), hasMore, remaining.
+        """
+        request_id = params.get('requestId')
+        config = None
+        started = time.monotonic()
+        try:
+            config = self._get_email_config(params)
+            mailbox = params.get("mailbox", "inbox")
+            page_size = max(1, min(int(params.get("page_size", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE))
+            track = bool(params.get("track", True))
+            header_fields = params.get("header_fields") or DEFAULT_HEADER_FIELDS
+            if not all(isinstance(field, str) and re.fullmatch(r"[A-Za-z0-9-]+", field) for field in header_fields):
+                raise ValueError("'header_fields' must be a list of header names.")
+            criteria = self._search_criteria(dict(params, unread_only=params.get("unread_only", False)))
+            uid_state = get_uid_state(self.download_dir)
+            state_key = uid_state.key(config, mailbox, criteria)
+
+            with get_imap_pool().connection(config) as connection:
+                connection.select(mailbox)
+                mail = connection.imap
+                uid_validity = self._mailbox_status(mail, mailbox, 'UIDVALIDITY')
+                uid_next = self._uid_next(mail, mailbox)
+
+                known_validity, last_uid = uid_state.get(state_key) if track else (None, 0)
+                validity_changed = known_validity is not None and known_validity != uid_validity
+                if validity_changed:
+                    log.warning(f"[Mail] UIDVALIDITY of '{mailbox}' changed ({known_validity} -> {uid_validity}); listing it from the start.")
+                if validity_changed or params.get("reset"):
+                    last_uid = 0
+                if params.get("after_uid") is not None:
+                    last_uid = int(params["after_uid"])
+
+                status, data = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*', *criteria)
+                # "n:*" always includes the highest UID, even if it is below n.
+                uids = sorted(int(uid) for uid in (data[0] or b"").split() if int(uid) > last_uid)
+                page, remaining = uids[:page_size], len(uids) - min(len(uids), page_size)
+
+                fetch_items = f"(UID FLAGS RFC822.SIZE INTERNALDATE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({' '.join(header_fields).upper()})])"
+                emails = []
+                for offset in range(0, len(page), FETCH_BATCH_SIZE):
+                    status, data = mail.uid('FETCH', uid_set(page[offset:offset + FETCH_BATCH_SIZE]), fetch_items)
+                    if status != "OK":
+                        raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+                    emails.extend(summarize_message(items) for items in parse_fetch(data) if "UID" in items)
+                emails.sort(key=lambda message: message["uid"])
+
+            if page:
+                new_last_uid = page[-1]
+            else:
+                new_last_uid = last_uid
+            if not remaining:
+                # Nothing further matched, so later searches can start after everything that exists now.
+                new_last_uid = max(new_last_uid, uid_next - 1)
+            if track:
+                uid_state.set(state_key, uid_validity, new_last_uid)
+
+            log.info(f"[Mail] Listed {len(emails)} messages of '{mailbox}' after UID {last_uid} "
+                     f"({remaining} more). RequestId: {request_id}")
+            return {
+                "status": "success",
+                "action": "list_emails",
+                "message": f"Listed {len(emails)} messages.",
+                "mailbox": mailbox,
+                "emails": emails,
+                "afterUid": last_uid,
+                "lastUid": new_last_uid,
+                "hasMore": remaining > 0,
+                "remaining": remaining,
+                "uidValidity": uid_validity,
+                "uidValidityChanged": validity_changed,
+                "elapsedSeconds": round(time.monotonic() - started, 3),
+                "requestId": request_id
+            }
+        except ValueError as ve:
+            log.error(f"list_emails parameter error: {ve}")
+            return {"status": "error", "action": "list_emails", "message": str(ve), "requestId": request_id}
+        except imaplib.IMAP4.error as ie:
+            log.error(f"IMAP error: {ie}. Check server, port, and credentials for {config['user'] if config else 'unknown user'}.")
+            return {"status": "error", "action": "list_emails", "message": f"IMAP error: {ie}", "requestId": request_id}
+        except Exception as e:
+            log.error(f"Error listing emails: {e}", exc_info=True)
+            return {"status": "error", "action": "list_emails", "message": f"Error listing emails: {e}",
+                    "traceback": traceback.format_exc(), "requestId": request_id}
+
+    def download_attachments(self, params):
+        """
+        Saves attachments of the given messages to files under download_dir.
+        Each selected part is fetched in pieces (BODY.PEEK[part]<offset.length>)
+        and decoded as it arrives, so memory use does not grow with attachment
+        size, and messages are not marked as read. Files are deduplicated by
+        SHA-256: a part saved before is not fetched again while its file is
+        intact, and content already in the directory is not written twice.
+        Params:
+            (account params as for read_latest_email)
+            uids (list of int): Messages to process (UIDs as returned by list_emails).
+            mailbox (str, optional): Mailbox of the messages. Defaults to 'inbox'.
+            destination (str, optional): Subdirectory of download_dir to save into. Defaults to 'attachments'.
+            filename_pattern (str or list, optional): Glob(s) the file name must match, e.g. '*.pdf'.
+            content_types (list, optional): Glob(s) the MIME type must match, e.g. ['application/pdf', 'image/*'].
+            min_size, max_size (int, optional): Bounds on the (estimated) decoded size in bytes.
+            part_ids (list, optional): Only these part ids (as listed by list_emails).
+            dedupe (bool, optional): Skip parts and content already saved. Defaults to True.
+        Returns:
+            dict: files (uid, partId, filename, path, size, sha256, skipped, duplicate), failed (uid, partId, message).
+        """
+        request_id = params.get('requestId')
+        config = None
+        started = time.monotonic()
+        try:
+            config = self._get_email_config(params)
+            mailbox = params.get("mailbox", "inbox")
+            uids = params.get("uids")
+            if uids is None and params.get("uid") is not None:
+                uids = [params["uid"]]
+            if not isinstance(uids, list) or not uids:
+                raise ValueError("'uids' must be a non-empty list of message UIDs.")
+            if len(uids) > MAX_ATTACHMENT_MESSAGES:
+                raise ValueError(f"At most {MAX_ATTACHMENT_MESSAGES} messages can be processed per call.")
+            uids = sorted({int(uid) for uid in uids})
+            patterns = params.get("filename_pattern")
+            patterns = [patterns] if isinstance(patterns, str) else patterns
+            content_types = params.get("content_types")
+            content_types = [content_types] if isinstance(content_types, str) else content_types
+            min_size = params.get("min_size")
+            max_size = params.get("max_size")
+            part_ids = [str(part_id) for part_id in params.get("part_ids") or []]
+            dedupe = bool(params.get("dedupe", True))
+
+            base_dir = os.path.abspath(self.download_dir)
+            directory = os.path.abspath(os.path.join(base_dir, params.get("destination", "attachments")))
+            if os.path.commonpath([base_dir, directory]) != base_dir:
+                raise ValueError("'destination' must be inside the download directory.")
+            os.makedirs(directory, exist_ok=True)
+            index = AttachmentIndex(directory)
+
+            files, failed = [], []
+            with get_imap_pool().connection(config) as connection:
+                connection.select(mailbox)
+                mail = connection.imap
+                uid_validity = self._mailbox_status(mail, mailbox, 'UIDVALIDITY')
+                part_prefix = f"{get_uid_state(self.download_dir).key(config, mailbox)}/{uid_validity}"
+
+                structures = {}
+                for offset in range(0, len(uids), FETCH_BATCH_SIZE):
+                    status, data = mail.uid('FETCH', uid_set(uids[offset:offset + FETCH_BATCH_SIZE]), '(UID BODYSTRUCTURE)')
+                    if status != "OK":
+                        raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+                    for items in parse_fetch(data):
+                        if "UID" in items and "BODYSTRUCTURE" in items:
+                            structures[int(items["UID"])] = summarize_structure(items["BODYSTRUCTURE"])
+
+                for uid in uids:
+                    if uid not in structures:
+                        failed.append({"uid": uid, "partId": None, "message": "Message not found."})
+                        continue
+                    selected = select_attachments(structures[uid]["attachments"], patterns, content_types,
+                                                  min_size, max_size, part_ids)
+                    for attachment in selected:
+                        part_key = f"{part_prefix}/{uid}/{attachment['partId']}"
+                        try:
+                            result = save_part(mail, uid, attachment, directory, index, part_key, dedupe)
+                        except (ValueError, OSError) as e:
+                            log.error(f"[Mail] Could not save part {attachment['partId']} of UID {uid}: {e}")
+                            failed.append({"uid": uid, "partId": attachment["partId"], "message": str(e)})
+                            continue
+                        files.append(dict(result, uid=uid, partId=attachment["partId"], filename=attachment.get("filename"),
+                                          contentType=attachment.get("contentType")))
+
+            written = sum(1 for entry in files if not entry["duplicate"])
+            log.info(f"[Mail] Saved {written} new attachment files ({len(files) - written} already present) "
+                     f"from {len(uids)} messages to {directory}. RequestId: {request_id}")
+            return {
+                "status": "error" if failed else "success",
+                "action": "download_attachments",
+                "message": f"{len(files)} attachments saved, {written} new; {len(failed)} failed." if failed
+                           else f"{len(files)} attachments saved, {written} new.",
+                "directory": directory,
+                "files": files,
+                "failed": failed,
+                "elapsedSeconds": round(time.monotonic() - started, 3),
+                "requestId": request_id
+            }
+        except ValueError as ve:
+            log.error(f"download_attachments parameter error: {ve}")
+            return {"status": "error", "action": "download_attachments", "message": str(ve), "requestId": request_id}
+        except imaplib.IMAP4.error as ie:
+            log.error(f"IMAP error: {ie}. Check server, port, and credentials for {config['user'] if config else 'unknown user'}.")
+            return {"status": "error", "action": "download_attachments", "message": f"IMAP error: {ie}", "requestId": request_id}
+        except Exception as e:
+            log.error(f"Error downloading attachments: {e}", exc_info=True)
+            return {"status": "error", "action": "download_attachments", "message": f"Error downloading attachments: {e}",
+                    "traceback": traceback.format_exc(), "requestId": request_id}
+
+    def send_emails_bulk(self, params):
+        """
+        Sends many templated emails over a few persistent SMTP connections.
+        Each worker keeps one authenticated connection (pooled across commands)
+        and sends its share of the messages back to back on it, pipelining each
+        message's envelope where the server supports it. Message data, including
+        attachments, is encoded and written to the connection as it is read.
+        Params:
+            (account params as for send_email)
+            template (dict): subject, body and optional is_html; $name placeholders are
+                filled from each message's variables.
+            messages (list of dict): to_email (str or list), optional cc, bcc, variables,
+                attachments (paths, in addition to the shared ones), subject/body overrides.
+            attachments (list, optional): File paths attached to every message.
+            concurrency (int, optional): Parallel SMTP connections. Defaults to 3.
+        Returns:
+            dict: results (index, to, status, message, refused, elapsedMs) per message, in order.
+        """
+        request_id = params.get('requestId')
+        config = None
+        started = time.monotonic()
+        try:
+            config = self._get_email_config(params)
+            template = params.get("template") or {}
+            messages = params.get("messages")
+            if not isinstance(messages, list) or not messages:
+                raise ValueError("'messages' must be a non-empty list.")
+            if len(messages) > MAX_BULK_MESSAGES:
+                raise ValueError(f"At most {MAX_BULK_MESSAGES} messages can be sent per call.")
+            shared_attachments = params.get("attachments") or []
+            concurrency = max(1, min(int(params.get("concurrency", DEFAULT_SMTP_CONCURRENCY)), MAX_SMTP_CONNECTIONS, len(messages)))
+        except ValueError as ve:
+            log.error(f"send_emails_bulk parameter error: {ve}")
+            return {"status": "error", "action": "send_emails_bulk", "message": str(ve), "requestId": request_id}
+
+        pool = get_smtp_pool()
+        opened_before = pool.stats["opened"]
+        pending = list(enumerate(messages))
+        pending_lock = threading.Lock()
+        abort = threading.Event()
+        results = [None] * len(messages)
+        attempts = {}
+
+        def prepare(message):
+            """Envelope and content of one message, or ValueError if it is incomplete."""
+            message = message if isinstance(message, dict) else {}
+            variables = message.get("variables") or {}
+            to, cc, bcc = as_list(message.get("to_email")), as_list(message.get("cc")), as_list(message.get("bcc"))
+            if not to:
+                raise ValueError("Missing 'to_email'.")
+            subject = render(message.get("subject", template.get("subject")), variables)
+            body = render(message.get("body", template.get("body")), variables)
+            if not subject or body is None:
+                raise ValueError("Missing subject or body (in the message or the template).")
+            attachments = list(shared_attachments) + list(message.get("attachments") or [])
+            missing = [path for path in attachments if not os.path.isfile(path)]
+            if missing:
+                raise ValueError(f"Attachment file not found: {', '.join(missing)}")
+            is_html = message.get("is_html", template.get("is_html", False))
+            return to, cc, bcc, subject, body, is_html, attachments
+
+        def next_message():
+            with pending_lock:
+                return pending.pop(0) if pending and not abort.is_set() else None
+
+        def send(connection, index, message, attempt):
+            message_started = time.monotonic()
+            result = {"index": index, "to": message.get("to_email") if isinstance(message, dict) else None}
+            try:
+                to, cc, bcc, subject, body, is_html, attachments = prepare(message)
+                chunks = message_chunks(config["user"], to, cc, subject, body, is_html, attachments)
+                refused = connection.send(config["user"], to + cc + bcc, chunks)
+                result.update(status="success", message="Sent.", refused={k: v[1].decode(errors="replace") for k, v in refused.items()})
+            except ValueError as ve:
+                result.update(status="error", message=str(ve))
+            except smtplib.SMTPRecipientsRefused as e:
+                result.update(status="error", message="All recipients were refused.",
+                              refused={k: v[1].decode(errors="replace") for k, v in e.recipients.items()})
+            except (smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                result.update(status="error", message=f"Refused by the server: {e.smtp_code} {e.smtp_error.decode(errors='replace')}")
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPResponseException, OSError) as e:
+                # The connection is unusable; the message is requeued unless it has been tried enough.
+                if attempt + 1 < BULK_SEND_ATTEMPTS:
+                    with pending_lock:
+                        pending.insert(0, (index, message))
+                    attempts[index] = attempt + 1
+                else:
+                    result.update(status="error", message=f"Connection failed while sending: {e}")
+                    results[index] = dict(result, elapsedMs=round((time.monotonic() - message_started) * 1000, 1))
+                raise
+            results[index] = dict(result, elapsedMs=round((time.monotonic() - message_started) * 1000, 1))
+
+        def worker():
+            failures = 0 # Consecutive connection failures; the server is given up on after a few.
+            while not abort.is_set():
+                try:
+                    with pool.connection(config) as connection:
+                        while connection.reusable():
+                            item = next_message()
+                            if item is None:
+                                return
+                            index, message = item
+                            send(connection, index, message, attempts.get(index, 0))
+                            failures = 0
+                except smtplib.SMTPAuthenticationError as e:
+                    log.error(f"send_emails_bulk: Authentication failed for {config['user']}: {e}")
+                    abort.set()
+                    raise
+                except (smtplib.SMTPException, OSError) as e:
+                    failures += 1
+                    if failures >= BULK_SEND_ATTEMPTS:
+                        log.error(f"[Mail] SMTP connection to {config['smtp_server']} keeps failing ({e}); giving up.")
+                        abort.set()
+                        raise
+                    log.warning(f"[Mail] SMTP connection lost during bulk send ({e}); reconnecting.")
+
+        log.info(f"[Mail] Sending {len(messages)} emails over {concurrency} SMTP connections. RequestId: {request_id}")
+        failure = None
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="smtp") as executor:
+            futures = [executor.submit(worker) for _ in range(concurrency)]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    failure = failure or e
+
+        for index, result in enumerate(results):
+            if result is None:
+                reason = f"Not sent: {failure}" if failure else "Not sent."
+                results[index] = {"index": index, "to": messages[index].get("to_email") if isinstance(messages[index], dict) else None,
+                                  "status": "error", "message": reason}
+        failed = [result["index"] for result in results if result["status"] != "success"]
+        sent = len(results) - len(failed)
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+        log.info(f"[Mail] Bulk send finished: {sent} of {len(results)} sent in {elapsed_ms} ms. RequestId: {request_id}")
+        response = {
+            "status": "error" if failed else "success",
+            "action": "send_emails_bulk",
+            "message": f"{sent} of {len(results)} emails sent." if failed else f"All {len(results)} emails sent.",
+            "sent": sent,
+            "failedMessages": failed,
+            "results": results,
+            "connectionsOpened": pool.stats["opened"] - opened_before,
+            "elapsedMs": elapsed_ms,
+            "requestId": request_id
+        }
+        if isinstance(failure, smtplib.SMTPAuthenticationError):
+            response["message"] = "Email authentication failed."
+        return response
@@ -0,0 +1,190 @@
+# File: commands/encoders.py
+
+import io
+import logging
+
+from PIL import Image
+
+try:
+    from turbojpeg import TurboJPEG, TJSAMP_444, TJSAMP_422, TJSAMP_420, TJSAMP_GRAY, TJPF_RGB, TJPF_GRAY
+except ImportError:  # PyTurboJPEG is optional; Pillow is used when it is not installed
+    TurboJPEG = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_JPEG_QUALITY = 75
+DEFAULT_WEBP_QUALITY = 70
+
+# Chroma subsampling names accepted from commands, mapped to Pillow's JPEG 'subsampling' values.
+SUBSAMPLING = {"4:4:4": 0, "4:2:2": 1, "4:2:0": 2}
+
+
+class ImageEncoder:
+    """Base class for image encoders. encode() takes a PIL image and returns bytes."""
+    name = "base"
+    format = None
+    mime_type = None
+
+    def encode(self, image, quality=None, subsampling=None):
+        raise NotImplementedError
+
+
+class PillowJpegEncoder(ImageEncoder):
+    name = "pillow-jpeg"
+    format = "jpeg"
+    mime_type = "image/jpeg"
+
+    def encode(self, image, quality=None, subsampling=None):
+        options = {"quality": quality or DEFAULT_JPEG_QUALITY}
+        if subsampling is not None and image.mode != "L":
+            options["subsampling"] = SUBSAMPLING[subsampling]
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", **options)
+        return buf.getvalue()
+
+
+class PillowPngEncoder(ImageEncoder):
+    """Lossless; quality is ignored. Uses a fast zlib level since screens compress well anyway."""
+    name = "pillow-png"
+    format = "png"
+    mime_type = "image/png"
+
+    def encode(self, image, quality=None, subsampling=None):
+        buf = io.BytesIO()
+        image.save(buf, format="PNG", compress_level=1)
+        return buf.getvalue()
+
+
+class PillowWebpEncoder(ImageEncoder):
+    """quality=100 switches to lossless WebP."""
+    name = "pillow-webp"
+    format = "webp"
+    mime_type = "image/webp"
+
+    def encode(self, image, quality=None, subsampling=None):
+        quality = quality or DEFAULT_WEBP_QUALITY
+        buf = io.BytesIO()
+        # method 0 is the fastest encoder setting; the size difference on screen content is small.
+        image.save(buf, format="WEBP", quality=quality, lossless=quality >= 100, method=0)
+        return buf.getvalue()
+
+
+class TurboJpegEncoder(ImageEncoder):
+    """libjpeg-turbo through PyTurboJPEG; typically 2-3x faster than Pillow's JPEG encoder."""
+    name = "turbojpeg"
+    format = "jpeg"
+    mime_type = "image/jpeg"
+
+    def __init__(self):
+        if TurboJPEG is None:
+            raise ImportError("PyTurboJPEG is not installed.")
+        self._turbo = TurboJPEG()
+
+    def encode(self, image, quality=None, subsampling=None):
+        import numpy as np
+        if image.mode == "L":
+            pixel_format, jpeg_subsample = TJPF_GRAY, TJSAMP_GRAY
+        else:
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            pixel_format = TJPF_RGB
+            jpeg_subsample = {"4:4:4": TJSAMP_444, "4:2:2": TJSAMP_422}.get(subsampling, TJSAMP_420)
+        pixels = np.asarray(image)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+        return self._turbo.encode(
+            pixels, quality=quality or DEFAULT_JPEG_QUALITY, pixel_format=pixel_format, jpeg_subsample=jpeg_subsample
+        )
+
+
+ENCODER_CLASSES = {
+    TurboJpegEncoder.name: TurboJpegEncoder,
+    PillowJpegEncoder.name: PillowJpegEncoder,
+    PillowPngEncoder.name: PillowPngEncoder,
+    PillowWebpEncoder.name: PillowWebpEncoder,
+}
+# Preferred backend order per format.
+FORMAT_BACKENDS = {
+    "jpeg": (TurboJpegEncoder.name, PillowJpegEncoder.name),
+    "png": (PillowPngEncoder.name,),
+    "webp": (PillowWebpEncoder.name,),
+}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+_encoders = {}
+
+
+def normalize_format(image_format):
+    image_format = (image_format or "jpeg").lower()
+    image_format = FORMAT_ALIASES.get(image_format, image_format)
+    if image_format not in FORMAT_BACKENDS:
+        raise ValueError(f"Unsupported image format '{image_format}'. Use one of: {', '.join(FORMAT_BACKENDS)}.")
+    return image_format
+
+
+def get_encoder(image_format="jpeg", backend=None):
+    """
+    Returns a (cached) encoder instance for the format. backend selects a
+    specific implementation by name; otherwise the fastest available one is used.
+    """
+    image_format = normalize_format(image_format)
+    names = (backend,) if backend else FORMAT_BACKENDS[image_format]
+    errors = []
+    for name in names:
+        # Checked before the cache, so a backend of another format is refused whether or not it was used.
+        encoder_cls = ENCODER_CLASSES.get(name)
+        if encoder_cls is None or encoder_cls.format != image_format:
+            raise ValueError(f"Encoder backend '{name}' does not produce {image_format}.")
+        if name in _encoders:
+            return _encoders[name]
+        try:
+            _encoders[name] = encoder_cls()
+            return _encoders[name]
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            log.debug(f"[Encoder] Backend '{name}' unavailable: {e}")
+    raise ValueError(f"No encoder backend available for {image_format} ({'; '.join(errors)}).")
+
+
+def available_backends():
+    """Returns the names of encoder backends that can be instantiated here."""
+    names = []
+    for image_format, backends in FORMAT_BACKENDS.items():
+        for name in backends:
+            try:
+                get_encoder(image_format, name)
+                names.append(name)
+            except ValueError:
+                pass
+    return names
+
+
+def prepare_image(image, scale=None, grayscale=False):
+    """Applies the downscale factor and grayscale conversion before encoding."""
+    if scale is not None:
+        scale = float(scale)
+        if not 0 < scale <= 1:
+            raise ValueError(f"scale must be in (0, 1], got {scale}.")
+        if scale < 1:
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR)
+    if grayscale and image.mode != "L":
+        image = image.convert("L")
+    return image
+
+
+def validate_subsampling(subsampling):
+    if subsampling is not None and subsampling not in SUBSAMPLING:
+        raise ValueError(f"subsampling must be one of: {', '.join(SUBSAMPLING)}.")
+    return subsampling
+
+
+def encode_image(image, image_format="jpeg", quality=None, subsampling=None, scale=None, grayscale=False, backend=None):
+    """
+    Scales, converts and encodes an image in one call.
+    Returns (encoded bytes, mime type, (width, height) of the encoded image).
+    """
+    encoder = get_encoder(image_format, backend)
+    image = prepare_image(image, scale, grayscale)
+    data = encoder.encode(image, quality=quality, subsampling=validate_subsampling(subsampling))
+    return data, encoder.mime_type, image.size
@@ -0,0 +1,69 @@
+# File: commands/frame_delta.py
+
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TILE_SIZE = 64
+
+
+class TileDiffer:
+    """
+    Compares consecutive frames on a fixed tile grid and reports which areas
+    changed. Horizontally adjacent dirty tiles in the same tile row are merged
+    into one rectangle, which keeps the number of separately encoded images
+    (and their JPEG header overhead) low for typical UI updates.
+
+    Frames are NumPy arrays of shape (height, width, channels).
+    """
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE):
+        self.tile_size = tile_size
+        self._previous = None
+
+    def reset(self):
+        """Forgets the previous frame so the next diff reports a keyframe."""
+        self._previous = None
+
+    def diff(self, frame):
+        """
+        Returns a list of changed (x, y, width, height) rectangles, an empty list
+        when nothing changed, or None when there is no comparable previous frame
+        (first frame, or the resolution changed) and a keyframe is required.
+        The given frame becomes the reference for the next call.
+        """
+        previous = self._previous
+        self._previous = frame
+        if previous is None or previous.shape != frame.shape:
+            return None
+
+        # Fast path: a static screen costs one vectorised comparison.
+        if np.array_equal(frame, previous):
+            return []
+
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        tile = self.tile_size
+        cols = -(-width // tile)
+        # Treat each row as a flat run of bytes and OR-reduce per tile row, then per tile column.
+        changed = np.not_equal(frame.reshape(height, width * channels), previous.reshape(height, width * channels))
+        changed = np.logical_or.reduceat(changed, np.arange(0, height, tile), axis=0)
+        dirty = np.logical_or.reduceat(changed, np.arange(0, width * channels, tile * channels), axis=1)
+
+        rects = []
+        for row in np.flatnonzero(dirty.any(axis=1)):
+            row_flags = dirty[row]
+            col = 0
+            while col < cols:
+                if not row_flags[col]:
+                    col += 1
+                    continue
+                start = col
+                while col < cols and row_flags[col]:
+                    col += 1
+                x = start * tile
+                y = int(row) * tile
+                rects.append((x, y, min(col * tile, width) - x, min(y + tile, height) - y))
+        return rects
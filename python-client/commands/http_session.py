@@ -0,0 +1,66 @@
+# File: commands/http_session.py
+
+import threading
+import logging
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+log = logging.getLogger(__name__)
+
+# Connections kept open per host. Ranged downloads open one per segment, so this is also
+# the most connections a single download can use.
+POOL_MAXSIZE = 16
+# (connect, read) seconds: connecting fails fast; a read may wait on a slow server.
+DEFAULT_TIMEOUT = (10, 60)
+
+
+def _new_session(cookies=True):
+    session = requests.Session()
+    if not cookies:
+        # An empty allowed_domains list rejects every cookie, so nothing a response sets is kept.
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    # Only connection failures are retried here: nothing has been sent or received yet,
+    # so it is safe for any method. Callers decide about retrying on responses.
+    adapter = HTTPAdapter(
+        pool_connections=POOL_MAXSIZE,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=Retry(total=None, connect=3, read=False, status=0, backoff_factor=0.5)
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_shared_session = None
+_api_session = None
+_shared_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Returns the process-wide requests session. Reusing it keeps TCP and TLS
+    connections alive between commands instead of reconnecting per request.
+    """
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = _new_session()
+            log.debug("[HTTP] Created shared session.")
+        return _shared_session
+
+
+def get_api_session():
+    """
+    Returns the process-wide session for API commands. It pools connections
+    like the shared session but keeps no cookies, so a cookie set by one call
+    is never sent with another (calls may target different users or tenants).
+    """
+    global _api_session
+    with _shared_lock:
+        if _api_session is None:
+            _api_session = _new_session(cookies=False)
+            log.debug("[HTTP] Created API session.")
+        return _api_session
@@ -1,17 +1,34 @@
 # python-client/commands/input.py
 
-import pyautogui
+import time
 import logging
 
+from .input_backend import get_input_backend, button_name, paste_text, get_clipboard, ClipboardError, PASTE_SETTLE_SECONDS
+
 log = logging.getLogger(__name__)
 
+# type_text mode 'auto' pastes text at least this long instead of typing it key by key.
+PASTE_THRESHOLD_CHARS = 200
+
 class InputCommands:
+    """
+    Keyboard and mouse commands. Events go through the shared input backend
+    (XTest, uinput or pyautogui, see input_backend.py), which adds no implicit
+    delay. Every command accepts an optional 'pause' (seconds to wait after
+    it), and repeated events accept an 'interval' between them.
+    """
     def __init__(self, node_client_ref=None):
         self.node_client_ref = node_client_ref
-        # Recommended location for pyautogui global settings
-        pyautogui.PAUSE = 0.05    # Add a small pause after each pyautogui call (e.g., 0.05 seconds)
-        # pyautogui.FAILSAFE = True # Uncomment for debugging safety (moves mouse to 0,0 on corners for emergency stop)
-        pass
+
+    @property
+    def backend(self):
+        return get_input_backend()
+
+    @staticmethod
+    def _pace(params):
+        pause = params.get("pause", 0)
+        if pause:
+            time.sleep(pause)
 
     def move(self, params):
         """Moves the mouse to specified coordinates."""
@@ -20,7 +37,8 @@ class InputCommands:
         duration = params.get("duration", 0)
         log.info(f"[Input] Moving mouse to ({x},{y}) over {duration} seconds.")
         try:
-            pyautogui.moveTo(x, y, duration=duration)
+            self.backend.move(x, y, duration=duration)
+            self._pace(params)
             return {"status": "success", "action": "mouse_move", "x": x, "y": y}
         except Exception as e:
             log.error(f"[Input] Error moving mouse to ({x},{y}): {e}", exc_info=True)
@@ -29,26 +47,17 @@ class InputCommands:
     def click(self, params):
         """
         Performs a mouse click at specified coordinates.
-        Converts Java's InputEvent button mask to PyAutoGUI's string representation.
+        'button' is Java's InputEvent button mask (or 'left'/'middle'/'right').
         """
         x = params.get("x")
         y = params.get("y")
-        button_mask = params.get("button") # This is the integer mask from Java
-        clicks = params.get("clicks", 1) 
-
-        pyautogui_button = 'left' # Default to left click
-        if button_mask == 1024: # InputEvent.BUTTON1_DOWN_MASK (Left click)
-            pyautogui_button = 'left'
-        elif button_mask == 2048: # InputEvent.BUTTON2_DOWN_MASK (Middle click)
-            pyautogui_button = 'middle'
-        elif button_mask == 4096: # InputEvent.BUTTON3_DOWN_MASK (Right click)
-            pyautogui_button = 'right'
-        # Add more mappings if needed for other buttons
-
-        log.info(f"[Input] Clicking at ({x},{y}) with button: {pyautogui_button}, clicks: {clicks}")
+        clicks = params.get("clicks", 1)
+        log.info(f"[Input] Clicking at ({x},{y}) with button: {params.get('button')}, clicks: {clicks}")
         try:
-            pyautogui.click(x=x, y=y, clicks=clicks, button=pyautogui_button) 
-            return {"status": "success", "action": "mouse_click", "x": x, "y": y, "button": pyautogui_button, "clicks": clicks}
+            button = button_name(params.get("button"))
+            self.backend.click(x, y, button=button, clicks=clicks, interval=params.get("interval", 0))
+            self._pace(params)
+            return {"status": "success", "action": "mouse_click", "x": x, "y": y, "button": button, "clicks": clicks}
         except Exception as e:
             log.error(f"[Input] Error clicking at ({x},{y}): {e}", exc_info=True)
             return {"status": "error", "action": "mouse_click", "message": str(e)}
@@ -58,45 +67,66 @@ class InputCommands:
         x = params.get("x")
         y = params.get("y")
         duration = params.get("duration", 0)
-        button_mask = params.get("button")
-
-        pyautogui_button = 'left'
-        if button_mask == 1024: pyautogui_button = 'left'
-        elif button_mask == 2048: pyautogui_button = 'middle'
-        elif button_mask == 4096: pyautogui_button = 'right'
-
-        log.info(f"[Input] Dragging mouse to ({x},{y}) with button: {pyautogui_button} over {duration} seconds.")
+        log.info(f"[Input] Dragging mouse to ({x},{y}) with button: {params.get('button')} over {duration} seconds.")
         try:
-            pyautogui.dragTo(x, y, duration=duration, button=pyautogui_button)
-            return {"status": "success", "action": "mouse_drag", "x": x, "y": y, "button": pyautogui_button}
+            button = button_name(params.get("button"))
+            self.backend.drag(x, y, button=button, duration=duration)
+            self._pace(params)
+            return {"status": "success", "action": "mouse_drag", "x": x, "y": y, "button": button}
         except Exception as e:
             log.error(f"[Input] Error dragging mouse to ({x},{y}): {e}", exc_info=True)
             return {"status": "error", "action": "mouse_drag", "message": str(e)}
 
     def scroll(self, params):
-        """Scrolls the mouse wheel."""
+        """Scrolls the mouse wheel, at (x, y) if given, otherwise at the current position."""
         clicks = params.get("clicks")
-        x = params.get("x", pyautogui.position().x) # Use current position if not specified
-        y = params.get("y", pyautogui.position().y) # Use current position if not specified
+        x = params.get("x")
+        y = params.get("y")
         log.info(f"[Input] Scrolling mouse by {clicks} clicks at ({x},{y}).")
         try:
-            pyautogui.scroll(clicks, x=x, y=y)
+            self.backend.scroll(clicks, x=x, y=y, horizontal=params.get("horizontal", False))
+            self._pace(params)
             return {"status": "success", "action": "mouse_scroll", "clicks": clicks}
         except Exception as e:
             log.error(f"[Input] Error scrolling mouse by {clicks} clicks: {e}", exc_info=True)
             return {"status": "error", "action": "mouse_scroll", "message": str(e)}
 
     def press_key(self, params):
-        """Presses a single key."""
+        """Presses a single key ('presses' times, 'interval' seconds apart)."""
         key = params.get("key") # Can be a string like 'enter', 'shift' or character
         log.info(f"[Input] Pressing key: {key}")
         try:
-            pyautogui.press(key)
+            self.backend.press(key, presses=params.get("presses", 1), interval=params.get("interval", 0))
+            self._pace(params)
             return {"status": "success", "action": "key_press", "key": key}
         except Exception as e:
             log.error(f"[Input] Error pressing key '{key}': {e}", exc_info=True)
             return {"status": "error", "action": "key_press", "message": str(e)}
 
+    def key_down(self, params):
+        """Holds a key down until key_up."""
+        key = params.get("key")
+        log.info(f"[Input] Key down: {key}")
+        try:
+            self.backend.key(key, True)
+            self._pace(params)
+            return {"status": "success", "action": "key_down", "key": key}
+        except Exception as e:
+            log.error(f"[Input] Error pressing down key '{key}': {e}", exc_info=True)
+            return {"status": "error", "action": "key_down", "message": str(e)}
+
+    def key_up(self, params):
+        """Releases a key held by key_down."""
+        key = params.get("key")
+        log.info(f"[Input] Key up: {key}")
+        try:
+            self.backend.key(key, False)
+            self._pace(params)
+            return {"status": "success", "action": "key_up", "key": key}
+        except Exception as e:
+            log.error(f"[Input] Error releasing key '{key}': {e}", exc_info=True)
+            return {"status": "error", "action": "key_up", "message": str(e)}
+
     def key_combo(self, params):
         """Performs a key combination (hotkey)."""
         keys = params.get("keys") # List of strings e.g., ['ctrl', 'shift', 'esc']
@@ -105,21 +135,54 @@ class InputCommands:
 
         log.info(f"[Input] Pressing key combo: {keys}")
         try:
-            pyautogui.hotkey(*keys)
+            self.backend.hotkey(keys, interval=params.get("interval", 0))
+            self._pace(params)
             return {"status": "success", "action": "key_combo", "keys": keys}
         except Exception as e:
             log.error(f"[Input] Error with key combo '{keys}': {e}", exc_info=True)
             return {"status": "error", "action": "key_combo", "message": str(e)}
 
     def type_text(self, params):
-        """Types a string of text."""
+        """
+        Types a string of text.
+        'mode': 'type' (key events), 'paste' (via the clipboard) or 'auto' (default):
+        paste long text or text with characters the keyboard layout cannot type,
+        falling back to typing when the clipboard is unavailable and the text is typeable.
+        'interval': seconds between keystrokes in 'type' mode (default 0).
+        'restoreClipboard': restore the previous clipboard after pasting (default True).
+        'pasteSettleSeconds': time the application gets to read the pasted text before
+        the clipboard is restored (default 0.15).
+        """
         text = params.get("text")
-        log.info(f"[Input] Typing text: '{text}'")
+        mode = params.get("mode", "auto")
+        log.info(f"[Input] Typing {len(text or '')} characters (mode={mode}).")
         try:
-            pyautogui.write(text)
-            return {"status": "success", "action": "type_text", "typed_text": text}
+            if not isinstance(text, str):
+                raise ValueError("text must be a string.")
+            if mode not in ("auto", "type", "paste"):
+                raise ValueError("mode must be 'auto', 'type' or 'paste'.")
+            settle_seconds = float(params.get("pasteSettleSeconds", PASTE_SETTLE_SECONDS))
+            if settle_seconds < 0:
+                raise ValueError("pasteSettleSeconds must not be negative.")
+            backend = self.backend
+            typeable = mode == "auto" and all(backend.can_type(c) for c in text)
+            if mode == "auto":
+                mode = "type" if typeable and len(text) < PASTE_THRESHOLD_CHARS else "paste"
+            if mode == "paste":
+                try:
+                    paste_text(backend, text, restore_clipboard=params.get("restoreClipboard", True),
+                               settle_seconds=settle_seconds)
+                except ClipboardError as e:
+                    if not typeable:
+                        raise
+                    log.warning(f"[Input] Clipboard unavailable ({e}); typing {len(text)} characters instead.")
+                    mode = "type"
+            if mode == "type":
+                backend.type_text(text, interval=params.get("interval", 0))
+            self._pace(params)
+            return {"status": "success", "action": "type_text", "typed_text": text, "mode": mode}
         except Exception as e:
-            log.error(f"[Input] Error typing text '{text}': {e}", exc_info=True)
+            log.error(f"[Input] Error typing text: {e}", exc_info=True)
             return {"status": "error", "action": "type_text", "message": str(e)}
 
     def combo_click(self, params):
@@ -129,20 +192,48 @@ class InputCommands:
         keys = params.get("keys", []) # List of keys to hold down
         x = params.get("x")
         y = params.get("y")
-        button_mask = params.get("button")
 
-        pyautogui_button = 'left'
-        if button_mask == 1024: pyautogui_button = 'left'
-        elif button_mask == 2048: pyautogui_button = 'middle'
-        elif button_mask == 4096: pyautogui_button = 'right'
+        log.info(f"[Input] Executing combo_click: keys={keys}, click at ({x},{y}) with {params.get('button')}")
+        try:
+            button = button_name(params.get("button"))
+            # One event list: modifiers down, click, modifiers up (in reverse).
+            events = [{"type": "key", "key": key, "action": "down"} for key in keys]
+            events.append({"type": "button", "button": button, "action": "click", "x": x, "y": y})
+            events += [{"type": "key", "key": key, "action": "up"} for key in reversed(keys)]
+            try:
+                self.backend.inject(events, interval=params.get("interval", 0))
+            except Exception:
+                for key in keys: # Ensure keys are released even if the click fails
+                    self.backend.key(key, False)
+                raise
+            self._pace(params)
+            return {"status": "success", "action": "combo_click", "keys": keys, "x":x, "y":y, "button": button}
+        except Exception as e:
+            log.error(f"[Input] Error with combo_click: {e}", exc_info=True)
+            return {"status": "error", "action": "combo_click", "message": str(e)}
+
+    def input_events(self, params):
+        """
+        Injects a list of low-level events in one call (see InputBackend.inject for
+        the event format), 'interval' seconds apart (default 0: one flush for all).
+        """
+        events = params.get("events")
+        if not isinstance(events, list):
+            return {"status": "error", "action": "input_events", "message": "events must be a list."}
+        log.info(f"[Input] Injecting {len(events)} input events.")
+        try:
+            count = self.backend.inject(events, interval=params.get("interval", 0))
+            self._pace(params)
+            return {"status": "success", "action": "input_events", "count": count, "backend": self.backend.name}
+        except Exception as e:
+            log.error(f"[Input] Error injecting input events: {e}", exc_info=True)
+            return {"status": "error", "action": "input_events", "message": str(e)}
 
-        log.info(f"[Input] Executing combo_click: keys={keys}, click at ({x},{y}) with {pyautogui_button}\")")
+    def copy_clipboard(self, params):
+        """Returns the node's clipboard text."""
+        log.info("[Input] Reading clipboard.")
         try:
-            for key in keys:
-                pyautogui.keyDown(key) # Press down all keys in combo
-            pyautogui.click(x=x, y=y, button=pyautogui_button)
-        finally: # Ensure keys are released even if click fails
-            for key in keys:
-                pyautogui.keyUp(key) # Release all keys in combo
-        
-        return {"status": "success", "action": "combo_click", "keys": keys, "x":x, "y":y, "button": pyautogui_button}
\ No newline at end of file
+            return {"status": "success", "action": "copy_clipboard", "clipboardContent": get_clipboard()}
+        except Exception as e:
+            log.error(f"[Input] Error reading clipboard: {e}", exc_info=True)
+            return {"status": "error", "action": "copy_clipboard", "message": str(e)}
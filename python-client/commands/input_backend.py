@@ -0,0 +1,719 @@
+# File: commands/input_backend.py
+
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import threading
+import logging
+
+try:
+    import evdev  # Optional: needed for the uinput backend (Linux, e.g. Wayland sessions)
+    from evdev import ecodes
+except ImportError:
+    evdev = None
+
+try:
+    import pyperclip  # Optional: clipboard access for paste-mode typing (installed with pyautogui)
+except ImportError:
+    pyperclip = None
+
+log = logging.getLogger(__name__)
+
+# Environment variable to force a specific backend ('xtest', 'uinput' or 'pyautogui').
+INPUT_BACKEND_ENV = "RPA_INPUT_BACKEND"
+
+# Java's InputEvent button masks as sent by the batch server (BUTTONn_DOWN_MASK and the
+# legacy BUTTONn_MASK values), plus plain button numbers 1-3.
+BUTTON_MASKS = {
+    1024: "left", 2048: "middle", 4096: "right",
+    16: "left", 8: "middle", 4: "right",
+    1: "left", 2: "middle", 3: "right",
+}
+BUTTONS = ("left", "middle", "right")
+SHIFT_KEYS = ("shift", "shiftleft", "shiftright")
+
+# Smallest step used when a move or drag is spread over a duration.
+MOTION_STEP_SECONDS = 1 / 60
+# Default time the focused application gets to read the clipboard before it is restored.
+PASTE_SETTLE_SECONDS = 0.15
+
+
+class InputError(Exception):
+    """Raised when an input backend cannot be initialised or an event cannot be injected."""
+
+
+class ClipboardError(InputError):
+    """Raised when the clipboard cannot be read or written (no pyperclip or no clipboard tool)."""
+
+
+def button_name(button):
+    """Maps a Java button mask, a button name or None (left) to 'left', 'middle' or 'right'."""
+    if button is None:
+        return "left"
+    if isinstance(button, str) and button.lower() in BUTTONS:
+        return button.lower()
+    try:
+        return BUTTON_MASKS[int(button)]
+    except (KeyError, ValueError, TypeError):
+        raise ValueError(f"Unknown mouse button {button!r}. Use a Java button mask or one of: {', '.join(BUTTONS)}.") from None
+
+
+def normalize_key(key):
+    """
+    Normalizes key names to pyautogui's vocabulary: lowercase without spaces,
+    so Java's KeyEvent.getKeyText() output ('Page Up') and browser key names work.
+    Single characters are kept as-is (case matters for typing).
+    """
+    if not isinstance(key, str) or not key:
+        raise ValueError(f"Invalid key {key!r}.")
+    if len(key) == 1:
+        return key
+    name = key.lower().replace(" ", "").replace("_", "")
+    # Browser KeyboardEvent.key names: 'ArrowUp' -> 'up'.
+    return name[5:] if name.startswith("arrow") else name
+
+
+class InputBackend:
+    """
+    Base class for input injection. Subclasses implement the primitives
+    (_move, _button, _wheel, _key, _char); this class builds clicks, drags,
+    hotkeys, typing and bulk event lists on top of them.
+
+    There is no implicit pause between events: callers pass an interval. With
+    interval 0, queued events are flushed to the system once per call.
+    """
+    name = "base"
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._held_shift = set()  # Shift keys pressed through _key and not yet released
+
+    # Primitives -------------------------------------------------------
+
+    def position(self):
+        raise NotImplementedError
+
+    def _move(self, x, y):
+        raise NotImplementedError
+
+    def _button(self, button, down):
+        raise NotImplementedError
+
+    def _wheel(self, dx, dy):
+        """dy > 0 scrolls up, dx > 0 scrolls right, in wheel clicks."""
+        raise NotImplementedError
+
+    def _key(self, key, down):
+        raise NotImplementedError
+
+    def can_type(self, char):
+        """True if the character can be typed with key events on this backend."""
+        raise NotImplementedError
+
+    def _char(self, char):
+        """Types one character (with shift if needed)."""
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    # Composite actions ------------------------------------------------
+
+    def _step(self, interval):
+        if interval:
+            self.flush()
+            time.sleep(interval)
+
+    def _note_shift(self, key, down):
+        """Tracks held shift keys, so a key that needs shift is not given a second shift press."""
+        if key in SHIFT_KEYS:
+            (self._held_shift.add if down else self._held_shift.discard)(key)
+
+    def move(self, x, y, duration=0):
+        with self._lock:
+            if duration and duration > 0:
+                start_x, start_y = self.position()
+                steps = max(1, int(duration / MOTION_STEP_SECONDS))
+                for i in range(1, steps):
+                    self._move(round(start_x + (x - start_x) * i / steps), round(start_y + (y - start_y) * i / steps))
+                    self._step(duration / steps)
+            self._move(int(x), int(y))
+            self.flush()
+
+    def click(self, x=None, y=None, button="left", clicks=1, interval=0):
+        with self._lock:
+            if x is not None and y is not None:
+                self._move(int(x), int(y))
+            for i in range(max(1, int(clicks))):
+                if i:
+                    self._step(interval)
+                self._button(button, True)
+                self._button(button, False)
+            self.flush()
+
+    def button(self, button, down):
+        with self._lock:
+            self._button(button, down)
+            self.flush()
+
+    def drag(self, x, y, button="left", duration=0):
+        with self._lock:
+            self._button(button, True)
+            self._step(MOTION_STEP_SECONDS)  # Lets the application register the press before the move
+            self.move(x, y, duration)
+            self._button(button, False)
+            self.flush()
+
+    def scroll(self, clicks, x=None, y=None, horizontal=False):
+        with self._lock:
+            if x is not None and y is not None:
+                self._move(int(x), int(y))
+            self._wheel(int(clicks), 0) if horizontal else self._wheel(0, int(clicks))
+            self.flush()
+
+    def key(self, key, down):
+        with self._lock:
+            self._key(normalize_key(key), down)
+            self.flush()
+
+    def press(self, key, presses=1, interval=0):
+        key = normalize_key(key)
+        with self._lock:
+            for i in range(max(1, int(presses))):
+                if i:
+                    self._step(interval)
+                self._key(key, True)
+                self._key(key, False)
+            self.flush()
+
+    def hotkey(self, keys, interval=0):
+        keys = [normalize_key(k) for k in keys]
+        with self._lock:
+            try:
+                for key in keys:
+                    self._key(key, True)
+                    self._step(interval)
+            finally:
+                # Release in reverse order even if a press failed.
+                for key in reversed(keys):
+                    self._key(key, False)
+                self.flush()
+
+    def type_text(self, text, interval=0):
+        unsupported = sorted({c for c in text if not self.can_type(c)})
+        if unsupported:
+            raise InputError(f"Backend '{self.name}' cannot type: {''.join(unsupported)!r}")
+        with self._lock:
+            for i, char in enumerate(text):
+                if i:
+                    self._step(interval)
+                self._char(char)
+            self.flush()
+
+    def inject(self, events, interval=0, skip_errors=False):
+        """
+        Injects a list of events in order, flushing once at the end (or after
+        every event when interval > 0). Events are dicts:
+            {"type": "move", "x": 10, "y": 20}
+            {"type": "button", "button": "left", "action": "down" | "up" | "click"}
+            {"type": "wheel", "dy": 1, "dx": 0}
+            {"type": "key", "key": "a", "action": "down" | "up" | "press"}
+            {"type": "text", "text": "hello"}
+        With skip_errors, an event that cannot be injected (e.g. an unmapped
+        key) is logged and skipped instead of aborting the rest.
+        Returns the number of events injected.
+        """
+        injected = 0
+        with self._lock:
+            try:
+                for i, event in enumerate(events):
+                    if i:
+                        self._step(interval)
+                    try:
+                        self._inject_one(event)
+                        injected += 1
+                    except (InputError, ValueError, KeyError) as e:
+                        if not skip_errors:
+                            raise
+                        log.warning(f"[Input] Skipping input event {event}: {e}")
+            finally:
+                self.flush()
+        return injected
+
+    def _inject_one(self, event):
+        kind = event.get("type")
+        if kind == "move":
+            self._move(int(event["x"]), int(event["y"]))
+        elif kind == "button":
+            button, action = button_name(event.get("button")), event.get("action", "click")
+            if "x" in event and "y" in event:
+                self._move(int(event["x"]), int(event["y"]))
+            if action in ("down", "click"):
+                self._button(button, True)
+            if action in ("up", "click"):
+                self._button(button, False)
+        elif kind == "wheel":
+            self._wheel(int(event.get("dx", 0)), int(event.get("dy", 0)))
+        elif kind == "key":
+            key, action = normalize_key(event["key"]), event.get("action", "press")
+            if action in ("down", "press"):
+                self._key(key, True)
+            if action in ("up", "press"):
+                self._key(key, False)
+        elif kind == "text":
+            for char in event["text"]:
+                if not self.can_type(char):
+                    raise InputError(f"Backend '{self.name}' cannot type {char!r}")
+                self._char(char)
+        else:
+            raise ValueError(f"Unknown input event type {kind!r}.")
+
+
+# X keysym names for pyautogui key names.
+_X_KEYSYMS = {
+    "enter": "Return", "return": "Return", "\n": "Return", "\r": "Return", "tab": "Tab", "\t": "Tab",
+    "space": "space", " ": "space", "backspace": "BackSpace", "delete": "Delete", "del": "Delete",
+    "esc": "Escape", "escape": "Escape",
+    "shift": "Shift_L", "shiftleft": "Shift_L", "shiftright": "Shift_R",
+    "ctrl": "Control_L", "control": "Control_L", "ctrlleft": "Control_L", "ctrlright": "Control_R",
+    "alt": "Alt_L", "altleft": "Alt_L", "altright": "Alt_R", "option": "Alt_L", "altgr": "ISO_Level3_Shift",
+    "win": "Super_L", "winleft": "Super_L", "winright": "Super_R", "super": "Super_L",
+    "command": "Super_L", "cmd": "Super_L", "meta": "Super_L", "windows": "Super_L",
+    "up": "Up", "down": "Down", "left": "Left", "right": "Right", "home": "Home", "end": "End",
+    "pageup": "Prior", "pgup": "Prior", "pagedown": "Next", "pgdn": "Next", "insert": "Insert",
+    "capslock": "Caps_Lock", "numlock": "Num_Lock", "scrolllock": "Scroll_Lock",
+    "printscreen": "Print", "prtsc": "Print", "print": "Print", "pause": "Pause", "menu": "Menu", "apps": "Menu",
+    "volumeup": "XF86AudioRaiseVolume", "volumedown": "XF86AudioLowerVolume", "volumemute": "XF86AudioMute",
+}
+_X_BUTTONS = {"left": 1, "middle": 2, "right": 3}
+# X wheel buttons: 4/5 vertical, 6/7 horizontal.
+_X_WHEEL = {"up": 4, "down": 5, "left": 6, "right": 7}
+
+
+class XTestInputBackend(InputBackend):
+    """
+    Injects events through the X11 XTEST extension (what xdotool uses).
+    Requests are queued on the display connection and sent with one XFlush,
+    so a burst of events costs a single write instead of one per event.
+    """
+    name = "xtest"
+
+    def __init__(self):
+        super().__init__()
+        if not sys.platform.startswith("linux"):
+            raise InputError("XTest input is only available on Linux.")
+        if not os.environ.get("DISPLAY"):
+            raise InputError("DISPLAY is not set.")
+        self._xlib = self._load("X11")
+        self._xtst = self._load("Xtst")
+        self._declare_functions()
+        self._display = self._xlib.XOpenDisplay(None)
+        if not self._display:
+            raise InputError(f"Cannot open X display {os.environ.get('DISPLAY')}.")
+        ints = [ctypes.c_int() for _ in range(4)]
+        if not self._xtst.XTestQueryExtension(self._display, *(ctypes.byref(i) for i in ints)):
+            self._xlib.XCloseDisplay(self._display)
+            self._display = None
+            raise InputError("X server does not support the XTEST extension.")
+        self._root = self._xlib.XDefaultRootWindow(self._display)
+        self._keycodes = {}  # keysym -> (keycode, needs_shift) or None
+        self._shift = self._keycode(self._keysym("Shift_L"))[0]
+
+    @staticmethod
+    def _load(name):
+        path = ctypes.util.find_library(name)
+        if not path:
+            raise InputError(f"lib{name} not found.")
+        return ctypes.CDLL(path)
+
+    def _declare_functions(self):
+        x, xtst = self._xlib, self._xtst
+        x.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x.XOpenDisplay.restype = ctypes.c_void_p
+        x.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x.XFlush.argtypes = [ctypes.c_void_p]
+        x.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x.XDefaultRootWindow.restype = ctypes.c_ulong
+        x.XStringToKeysym.argtypes = [ctypes.c_char_p]
+        x.XStringToKeysym.restype = ctypes.c_ulong
+        x.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        x.XKeysymToKeycode.restype = ctypes.c_ubyte
+        x.XkbKeycodeToKeysym.argtypes = [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_int, ctypes.c_int]
+        x.XkbKeycodeToKeysym.restype = ctypes.c_ulong
+        x.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong] + [ctypes.c_void_p] * 7
+        xtst.XTestQueryExtension.argtypes = [ctypes.c_void_p] + [ctypes.POINTER(ctypes.c_int)] * 4
+        xtst.XTestFakeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+
+    def _keysym(self, name):
+        keysym = self._xlib.XStringToKeysym(name.encode("ascii"))
+        if not keysym:
+            raise ValueError(f"Unknown key {name!r}.")
+        return keysym
+
+    @staticmethod
+    def _char_keysym(char):
+        code = ord(char)
+        # Latin-1 keysyms equal their code point; everything else uses the Unicode keysym range.
+        return code if 0x20 <= code <= 0x7E or 0xA0 <= code <= 0xFF else 0x01000000 | code
+
+    def _keycode(self, keysym):
+        """Returns (keycode, needs_shift) for a keysym, or None if the keyboard map has no key for it."""
+        if keysym not in self._keycodes:
+            entry = None
+            keycode = self._xlib.XKeysymToKeycode(self._display, keysym)
+            if keycode:
+                if self._xlib.XkbKeycodeToKeysym(self._display, keycode, 0, 0) == keysym:
+                    entry = (keycode, False)
+                elif self._xlib.XkbKeycodeToKeysym(self._display, keycode, 0, 1) == keysym:
+                    entry = (keycode, True)
+                else:
+                    # Reachable only through other levels (e.g. AltGr); press the key unshifted.
+                    entry = (keycode, False)
+            self._keycodes[keysym] = entry
+        return self._keycodes[keysym]
+
+    def position(self):
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        root_x, root_y, win_x, win_y = (ctypes.c_int() for _ in range(4))
+        mask = ctypes.c_uint()
+        with self._lock:
+            self._xlib.XQueryPointer(self._display, self._root, ctypes.byref(root), ctypes.byref(child),
+                                     ctypes.byref(root_x), ctypes.byref(root_y), ctypes.byref(win_x),
+                                     ctypes.byref(win_y), ctypes.byref(mask))
+        return root_x.value, root_y.value
+
+    def _move(self, x, y):
+        self._xtst.XTestFakeMotionEvent(self._display, -1, x, y, 0)
+
+    def _button(self, button, down):
+        self._xtst.XTestFakeButtonEvent(self._display, _X_BUTTONS[button_name(button)], int(down), 0)
+
+    def _wheel(self, dx, dy):
+        for amount, positive, negative in ((dy, "up", "down"), (dx, "right", "left")):
+            button = _X_WHEEL[positive if amount > 0 else negative]
+            for _ in range(abs(amount)):
+                self._xtst.XTestFakeButtonEvent(self._display, button, 1, 0)
+                self._xtst.XTestFakeButtonEvent(self._display, button, 0, 0)
+
+    def _key(self, key, down):
+        if key in _X_KEYSYMS:
+            keysym = self._keysym(_X_KEYSYMS[key])
+        elif len(key) == 1:
+            keysym = self._char_keysym(key)
+        elif key.startswith("f") and key[1:].isdigit():
+            keysym = self._keysym(key.upper())
+        else:
+            keysym = self._keysym(key)
+        entry = self._keycode(keysym)
+        if entry is None:
+            raise InputError(f"No key on the current keyboard layout produces {key!r}.")
+        keycode, shift = entry[0], entry[1] and not self._held_shift
+        # Shifted characters ('A', '!') get shift around the event, as _char does.
+        if shift:
+            self._xtst.XTestFakeKeyEvent(self._display, self._shift, 1, 0)
+        self._xtst.XTestFakeKeyEvent(self._display, keycode, int(down), 0)
+        if shift:
+            self._xtst.XTestFakeKeyEvent(self._display, self._shift, 0, 0)
+        self._note_shift(key, down)
+
+    def can_type(self, char):
+        keysym = self._keysym(_X_KEYSYMS[char]) if char in _X_KEYSYMS else self._char_keysym(char)
+        return self._keycode(keysym) is not None
+
+    def _char(self, char):
+        keysym = self._keysym(_X_KEYSYMS[char]) if char in _X_KEYSYMS else self._char_keysym(char)
+        keycode, shift = self._keycode(keysym)
+        if shift:
+            self._xtst.XTestFakeKeyEvent(self._display, self._shift, 1, 0)
+        self._xtst.XTestFakeKeyEvent(self._display, keycode, 1, 0)
+        self._xtst.XTestFakeKeyEvent(self._display, keycode, 0, 0)
+        if shift:
+            self._xtst.XTestFakeKeyEvent(self._display, self._shift, 0, 0)
+
+    def flush(self):
+        self._xlib.XFlush(self._display)
+
+    def close(self):
+        with self._lock:
+            if self._display:
+                self._xlib.XCloseDisplay(self._display)
+                self._display = None
+
+
+# US layout: characters typed with shift and the unshifted key that produces them.
+_US_SHIFTED = {
+    "!": "1", "@": "2", "#": "3", "$": "4", "%": "5", "^": "6", "&": "7", "*": "8", "(": "9", ")": "0",
+    "_": "-", "+": "=", "{": "[", "}": "]", "|": "\\", ":": ";", "\"": "'", "<": ",", ">": ".", "?": "/", "~": "`",
+}
+_US_SYMBOL_KEYS = {
+    "-": "KEY_MINUS", "=": "KEY_EQUAL", "[": "KEY_LEFTBRACE", "]": "KEY_RIGHTBRACE", "\\": "KEY_BACKSLASH",
+    ";": "KEY_SEMICOLON", "'": "KEY_APOSTROPHE", ",": "KEY_COMMA", ".": "KEY_DOT", "/": "KEY_SLASH", "`": "KEY_GRAVE",
+}
+# Linux input event codes for pyautogui key names.
+_EVDEV_KEYS = {
+    "enter": "KEY_ENTER", "return": "KEY_ENTER", "\n": "KEY_ENTER", "\r": "KEY_ENTER", "tab": "KEY_TAB", "\t": "KEY_TAB",
+    "space": "KEY_SPACE", " ": "KEY_SPACE", "backspace": "KEY_BACKSPACE", "delete": "KEY_DELETE", "del": "KEY_DELETE",
+    "esc": "KEY_ESC", "escape": "KEY_ESC",
+    "shift": "KEY_LEFTSHIFT", "shiftleft": "KEY_LEFTSHIFT", "shiftright": "KEY_RIGHTSHIFT",
+    "ctrl": "KEY_LEFTCTRL", "control": "KEY_LEFTCTRL", "ctrlleft": "KEY_LEFTCTRL", "ctrlright": "KEY_RIGHTCTRL",
+    "alt": "KEY_LEFTALT", "altleft": "KEY_LEFTALT", "altright": "KEY_RIGHTALT", "option": "KEY_LEFTALT", "altgr": "KEY_RIGHTALT",
+    "win": "KEY_LEFTMETA", "winleft": "KEY_LEFTMETA", "winright": "KEY_RIGHTMETA", "super": "KEY_LEFTMETA",
+    "command": "KEY_LEFTMETA", "cmd": "KEY_LEFTMETA", "meta": "KEY_LEFTMETA", "windows": "KEY_LEFTMETA",
+    "up": "KEY_UP", "down": "KEY_DOWN", "left": "KEY_LEFT", "right": "KEY_RIGHT", "home": "KEY_HOME", "end": "KEY_END",
+    "pageup": "KEY_PAGEUP", "pgup": "KEY_PAGEUP", "pagedown": "KEY_PAGEDOWN", "pgdn": "KEY_PAGEDOWN", "insert": "KEY_INSERT",
+    "capslock": "KEY_CAPSLOCK", "numlock": "KEY_NUMLOCK", "scrolllock": "KEY_SCROLLLOCK",
+    "printscreen": "KEY_SYSRQ", "prtsc": "KEY_SYSRQ", "print": "KEY_SYSRQ", "pause": "KEY_PAUSE",
+    "menu": "KEY_COMPOSE", "apps": "KEY_COMPOSE",
+    "volumeup": "KEY_VOLUMEUP", "volumedown": "KEY_VOLUMEDOWN", "volumemute": "KEY_MUTE",
+}
+_EVDEV_BUTTONS = {"left": "BTN_LEFT", "middle": "BTN_MIDDLE", "right": "BTN_RIGHT"}
+
+
+class UInputBackend(InputBackend):
+    """
+    Injects events through a virtual /dev/uinput device (python-evdev), which
+    also works without an X server, e.g. under Wayland. The pointer is an
+    absolute device spanning the virtual screen. Typing assumes a US layout.
+    Requires write access to /dev/uinput.
+    """
+    name = "uinput"
+
+    def __init__(self, screen_size=None):
+        super().__init__()
+        if evdev is None:
+            raise InputError("python-evdev is not installed.")
+        if not sys.platform.startswith("linux"):
+            raise InputError("uinput is only available on Linux.")
+        if screen_size is None:
+            from .capture import get_screen_capture
+            bounds = get_screen_capture().monitors()[0]
+            screen_size = (bounds["width"], bounds["height"])
+        self._width, self._height = screen_size
+        keys = {getattr(ecodes, name) for name in _EVDEV_KEYS.values()}
+        keys |= {getattr(ecodes, name) for name in _US_SYMBOL_KEYS.values()}
+        keys |= {getattr(ecodes, f"KEY_{c}") for c in "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"}
+        keys |= {getattr(ecodes, f"KEY_F{n}") for n in range(1, 25)}
+        keys |= {getattr(ecodes, name) for name in _EVDEV_BUTTONS.values()}
+        capabilities = {
+            ecodes.EV_KEY: sorted(keys),
+            ecodes.EV_REL: [ecodes.REL_WHEEL, ecodes.REL_HWHEEL],
+            ecodes.EV_ABS: [
+                (ecodes.ABS_X, evdev.AbsInfo(0, 0, self._width - 1, 0, 0, 0)),
+                (ecodes.ABS_Y, evdev.AbsInfo(0, 0, self._height - 1, 0, 0, 0)),
+            ],
+        }
+        try:
+            self._device = evdev.UInput(capabilities, name="rpa-node-input")
+        except OSError as e:
+            raise InputError(f"Cannot create uinput device: {e}")
+        self._position = (0, 0)
+
+    def position(self):
+        # uinput cannot read the pointer back; this is the last position we set.
+        return self._position
+
+    def _emit(self, event_type, code, value):
+        self._device.write(event_type, code, value)
+        self._device.syn()
+
+    def _move(self, x, y):
+        x = min(max(0, x), self._width - 1)
+        y = min(max(0, y), self._height - 1)
+        self._device.write(ecodes.EV_ABS, ecodes.ABS_X, x)
+        self._device.write(ecodes.EV_ABS, ecodes.ABS_Y, y)
+        self._device.syn()
+        self._position = (x, y)
+
+    def _button(self, button, down):
+        self._emit(ecodes.EV_KEY, getattr(ecodes, _EVDEV_BUTTONS[button_name(button)]), int(down))
+
+    def _wheel(self, dx, dy):
+        if dy:
+            self._emit(ecodes.EV_REL, ecodes.REL_WHEEL, dy)
+        if dx:
+            self._emit(ecodes.EV_REL, ecodes.REL_HWHEEL, dx)
+
+    @staticmethod
+    def _code(key):
+        """Returns (evdev key code, needs_shift) for a key name or character, or None."""
+        if key in _EVDEV_KEYS:
+            return getattr(ecodes, _EVDEV_KEYS[key]), False
+        if len(key) == 1:
+            shift = key in _US_SHIFTED or key.isupper()
+            base = _US_SHIFTED.get(key, key.lower())
+            if base in _US_SYMBOL_KEYS:
+                return getattr(ecodes, _US_SYMBOL_KEYS[base]), shift
+            if base.isascii() and base.isalnum():
+                return getattr(ecodes, f"KEY_{base.upper()}"), shift
+            return None
+        if key.startswith("f") and key[1:].isdigit():
+            return getattr(ecodes, f"KEY_F{key[1:]}", None), False
+        return None
+
+    def _key(self, key, down):
+        entry = self._code(key)
+        if entry is None or entry[0] is None:
+            raise InputError(f"Key {key!r} is not supported by the uinput backend.")
+        code, shift = entry[0], entry[1] and not self._held_shift
+        if shift:
+            self._emit(ecodes.EV_KEY, ecodes.KEY_LEFTSHIFT, 1)
+        self._emit(ecodes.EV_KEY, code, int(down))
+        if shift:
+            self._emit(ecodes.EV_KEY, ecodes.KEY_LEFTSHIFT, 0)
+        self._note_shift(key, down)
+
+    def can_type(self, char):
+        return self._code(char) is not None
+
+    def _char(self, char):
+        code, shift = self._code(char)
+        if shift:
+            self._emit(ecodes.EV_KEY, ecodes.KEY_LEFTSHIFT, 1)
+        self._emit(ecodes.EV_KEY, code, 1)
+        self._emit(ecodes.EV_KEY, code, 0)
+        if shift:
+            self._emit(ecodes.EV_KEY, ecodes.KEY_LEFTSHIFT, 0)
+
+    def close(self):
+        with self._lock:
+            self._device.close()
+
+
+class PyAutoGUIInputBackend(InputBackend):
+    """Fallback using pyautogui (Windows, macOS, or when no direct backend is available)."""
+    name = "pyautogui"
+
+    def __init__(self):
+        super().__init__()
+        import pyautogui
+        self._pyautogui = pyautogui
+        # Pacing is explicit per command; pyautogui's global pause would add 50 ms+ per event.
+        pyautogui.PAUSE = 0
+
+    def position(self):
+        point = self._pyautogui.position()
+        return point.x, point.y
+
+    def _move(self, x, y):
+        self._pyautogui.moveTo(x, y)
+
+    def _button(self, button, down):
+        (self._pyautogui.mouseDown if down else self._pyautogui.mouseUp)(button=button_name(button))
+
+    def _wheel(self, dx, dy):
+        if dy:
+            self._pyautogui.scroll(dy)
+        if dx:
+            self._pyautogui.hscroll(dx)
+
+    def _known(self, key):
+        return key in self._pyautogui.KEYBOARD_KEYS or key.lower() in self._pyautogui.KEYBOARD_KEYS
+
+    def _key(self, key, down):
+        if not self._known(key):
+            raise ValueError(f"Unknown key {key!r}.")
+        (self._pyautogui.keyDown if down else self._pyautogui.keyUp)(key)
+
+    def can_type(self, char):
+        return self._known(char)
+
+    def _char(self, char):
+        self._pyautogui.press(char)
+
+    def drag(self, x, y, button="left", duration=0):
+        with self._lock:
+            self._pyautogui.dragTo(x, y, duration=duration, button=button_name(button))
+
+
+BACKENDS = {
+    XTestInputBackend.name: XTestInputBackend,
+    UInputBackend.name: UInputBackend,
+    PyAutoGUIInputBackend.name: PyAutoGUIInputBackend,
+}
+DEFAULT_BACKEND_ORDER = (XTestInputBackend.name, UInputBackend.name, PyAutoGUIInputBackend.name)
+
+
+def create_input_backend(preferred=None):
+    """Returns the first backend that can be initialised, or the preferred one."""
+    order = (preferred,) if preferred else DEFAULT_BACKEND_ORDER
+    errors = []
+    for name in order:
+        backend_cls = BACKENDS.get(name)
+        if backend_cls is None:
+            errors.append(f"{name}: unknown backend")
+            continue
+        try:
+            backend = backend_cls()
+            log.info(f"[Input] Using '{name}' input backend.")
+            return backend
+        except Exception as e:
+            errors.append(f"{name}: {e}")
+            log.debug(f"[Input] Backend '{name}' unavailable: {e}")
+    raise InputError(f"No input backend available ({'; '.join(errors)}).")
+
+
+_shared_backend = None
+_shared_backend_lock = threading.Lock()
+
+
+def get_input_backend():
+    """Returns the process-wide input backend, creating it on first use."""
+    global _shared_backend
+    with _shared_backend_lock:
+        if _shared_backend is None:
+            _shared_backend = create_input_backend(os.environ.get(INPUT_BACKEND_ENV))
+        return _shared_backend
+
+
+def get_clipboard():
+    if pyperclip is None:
+        raise ClipboardError("Clipboard access needs pyperclip.")
+    try:
+        return pyperclip.paste()
+    except Exception as e:
+        raise ClipboardError(f"Cannot read the clipboard: {e}") from e
+
+
+def set_clipboard(text):
+    if pyperclip is None:
+        raise ClipboardError("Clipboard access needs pyperclip.")
+    try:
+        pyperclip.copy(text)
+    except Exception as e:
+        raise ClipboardError(f"Cannot write the clipboard: {e}") from e
+
+
+def paste_text(backend, text, restore_clipboard=True, settle_seconds=PASTE_SETTLE_SECONDS):
+    """
+    Enters text by putting it on the clipboard and pressing the paste shortcut,
+    which takes the same time for 20 characters as for 20,000. The previous
+    clipboard content is restored afterwards unless restore_clipboard is False.
+
+    The application reads the clipboard asynchronously once it handles the
+    shortcut, which the system gives no notice of; the restore therefore waits
+    settle_seconds after the shortcut is flushed. Slow applications need more.
+    Raises ClipboardError, before any key is pressed, if the text cannot be
+    put on the clipboard.
+    """
+    previous = None
+    if restore_clipboard:
+        try:
+            previous = get_clipboard()
+        except ClipboardError as e:
+            log.debug(f"[Input] Could not read clipboard before paste: {e}")
+    set_clipboard(text)
+    backend.hotkey(["command" if sys.platform == "darwin" else "ctrl", "v"])
+    if previous is not None:
+        time.sleep(settle_seconds)
+        try:
+            set_clipboard(previous)
+        except ClipboardError as e:
+            # The text was pasted; a failed restore must not fail (or repeat) the paste.
+            log.warning(f"[Input] Could not restore the clipboard after paste: {e}")
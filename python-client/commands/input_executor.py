@@ -0,0 +1,128 @@
+# File: commands/input_executor.py
+
+import time
+import threading
+import logging
+from collections import deque
+
+from .input_backend import get_input_backend
+
+log = logging.getLogger(__name__)
+
+# Pointer moves and wheel events older than this (estimated from client timestamps) are dropped.
+DEFAULT_LATENCY_BUDGET_SECONDS = 0.25
+# Number of recent (receive time - client time) samples used to estimate the clock offset.
+CLOCK_SAMPLES = 256
+EVENT_TYPES = ("move", "button", "wheel", "key", "text")
+# Only these are dropped when late: a later move supersedes them. Buttons and keys are always
+# injected, since dropping a press or release would leave a button or key stuck.
+DROPPABLE_TYPES = ("move", "wheel")
+
+
+class InputExecutor:
+    """
+    Injects live remote control input on a dedicated thread, independent of
+    the node's command queue.
+
+    Events are queued by submit() and drained in batches. Each batch has runs
+    of consecutive pointer moves collapsed to the last position and late
+    moves/wheel events dropped, and is then injected with a single backend
+    flush. Lateness is judged from the client timestamp 't' (milliseconds):
+    the smallest (receive time - t) seen recently approximates the clock
+    offset plus the best-case network delay, and anything further behind
+    than the latency budget is stale.
+    """
+
+    def __init__(self, latency_budget=DEFAULT_LATENCY_BUDGET_SECONDS):
+        self.latency_budget = latency_budget
+        self._cond = threading.Condition()
+        self._queue = deque()
+        self._offsets = deque(maxlen=CLOCK_SAMPLES)
+        self._thread = None
+        self._running = False
+        self.stats = {"received": 0, "injected": 0, "coalesced": 0, "droppedLate": 0, "droppedStale": 0, "errors": 0, "batches": 0}
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="input-executor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._queue.clear()
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def submit(self, events):
+        """Queues a list of events. Returns the number accepted."""
+        received_at = time.time() * 1000
+        with self._cond:
+            for event in events:
+                if event.get("t") is not None:
+                    self._offsets.append(received_at - float(event["t"]))
+                self._queue.append(event)
+            self.stats["received"] += len(events)
+            self._cond.notify()
+        return len(events)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                batch = list(self._queue)
+                self._queue.clear()
+                offset = min(self._offsets) if self._offsets else None
+            batch = self._drop_late(self._coalesce(batch), offset)
+            if not batch:
+                continue
+            try:
+                # An unmappable key from the viewer must not take the rest of the batch with it.
+                injected = get_input_backend().inject(batch, skip_errors=True)
+                self.stats["injected"] += injected
+                self.stats["errors"] += len(batch) - injected
+                self.stats["batches"] += 1
+            except Exception as e:
+                self.stats["errors"] += len(batch)
+                log.error(f"[Input] Failed to inject {len(batch)} remote control events: {e}")
+
+    def _coalesce(self, batch):
+        """Keeps only the last of each run of consecutive pointer moves."""
+        result = []
+        for event in batch:
+            if event.get("type") == "move" and result and result[-1].get("type") == "move":
+                result[-1] = event
+                self.stats["coalesced"] += 1
+            else:
+                result.append(event)
+        return result
+
+    def _drop_late(self, batch, offset):
+        if offset is None or not self.latency_budget:
+            return batch
+        now = time.time() * 1000
+        budget_ms = self.latency_budget * 1000
+        result = []
+        for event in batch:
+            if event.get("type") in DROPPABLE_TYPES and event.get("t") is not None \
+                    and now - float(event["t"]) - offset > budget_ms:
+                self.stats["droppedLate"] += 1
+                continue
+            result.append(event)
+        return result
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, queued=len(self._queue), latencyBudgetMs=round(self.latency_budget * 1000))
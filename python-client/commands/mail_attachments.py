@@ -0,0 +1,233 @@
+# File: commands/mail_attachments.py
+
+import os
+import re
+import json
+import base64
+import binascii
+import fnmatch
+import hashlib
+import tempfile
+import mimetypes
+import threading
+import logging
+
+from .mail_listing import parse_fetch
+
+log = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = ".attachment_index.json"
+# Encoded bytes requested per partial FETCH (BODY.PEEK[part]<offset.length>). imaplib
+# reads each response literal whole, so this bounds the memory an attachment takes.
+FETCH_CHUNK_SIZE = 1024 * 1024
+ENCODINGS = ("7bit", "8bit", "binary", "base64", "quoted-printable")
+
+_UNSAFE_NAME_CHARS = re.compile(r'[\x00-\x1f<>:"/\\|?*]')
+
+
+class AttachmentDecoder:
+    """Incremental Content-Transfer-Encoding decoder: feed() encoded chunks, then flush()."""
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or "7bit").lower()
+        if self.encoding not in ENCODINGS:
+            raise ValueError(f"Unsupported Content-Transfer-Encoding '{encoding}'.")
+        self._pending = b""
+
+    def feed(self, data):
+        if self.encoding == "base64":
+            data = self._pending + b"".join(data.split())
+            usable = len(data) - len(data) % 4
+            self._pending = data[usable:]
+            return binascii.a2b_base64(data[:usable]) if usable else b""
+        if self.encoding == "quoted-printable":
+            # Only whole lines are decoded, so soft breaks and =XX escapes are never split.
+            data = self._pending + data
+            end = data.rfind(b"\n") + 1
+            self._pending = data[end:]
+            return binascii.a2b_qp(data[:end])
+        return data
+
+    def flush(self):
+        data, self._pending = self._pending, b""
+        if self.encoding == "base64":
+            return base64.b64decode(data + b"=" * (-len(data) % 4)) if data.rstrip(b"=") else b""
+        if self.encoding == "quoted-printable":
+            return binascii.a2b_qp(data)
+        return data
+
+
+def stream_part(mail, uid, part_id, write, chunk_size=FETCH_CHUNK_SIZE):
+    """
+    Fetches body part part_id of message uid in chunk_size pieces (without
+    setting \\Seen) and passes each encoded chunk to write. Returns the number of
+    encoded bytes received.
+    """
+    offset = 0
+    while True:
+        status, data = mail.uid('FETCH', str(uid), f'(BODY.PEEK[{part_id}]<{offset}.{chunk_size}>)')
+        if status != "OK":
+            raise OSError(f"FETCH of part {part_id} of UID {uid} failed: {data}")
+        messages = [items for items in parse_fetch(data) if any(name.startswith("BODY[") for name in items)]
+        if not messages:
+            raise OSError(f"Message UID {uid} or its part {part_id} no longer exists.")
+        chunk = next(value for name, value in messages[0].items() if name.startswith("BODY[")) or b""
+        if chunk:
+            write(chunk)
+        offset += len(chunk)
+        if len(chunk) < chunk_size:
+            return offset
+
+
+def _matches(value, patterns):
+    value = (value or "").lower()
+    return any(fnmatch.fnmatchcase(value, pattern.lower()) for pattern in patterns)
+
+
+def estimated_size(attachment):
+    """Decoded size of an attachment, estimated from its encoded size in BODYSTRUCTURE."""
+    size = attachment.get("size")
+    if size is None:
+        return None
+    return size * 3 // 4 if attachment.get("encoding") == "base64" else size
+
+
+def select_attachments(attachments, filename_patterns=None, content_types=None, min_size=None, max_size=None,
+                       part_ids=None):
+    """Attachments (as summarized by mail_listing) passing every given filter; patterns are globs."""
+    selected = []
+    for attachment in attachments:
+        size = estimated_size(attachment)
+        if part_ids and attachment["partId"] not in part_ids:
+            continue
+        if filename_patterns and not _matches(attachment.get("filename"), filename_patterns):
+            continue
+        if content_types and not _matches(attachment.get("contentType"), content_types):
+            continue
+        if min_size is not None and (size is None or size < min_size):
+            continue
+        if max_size is not None and (size is None or size > max_size):
+            continue
+        selected.append(attachment)
+    return selected
+
+
+def safe_filename(filename, uid, part_id, content_type):
+    """A file name safe to create in the destination directory."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    name = _UNSAFE_NAME_CHARS.sub("_", name).strip(" .")
+    if not name:
+        extension = mimetypes.guess_extension(content_type or "") or ".bin"
+        name = f"{uid}-part{part_id}{extension}"
+    return name
+
+
+class AttachmentIndex:
+    """
+    Remembers, per destination directory, which file holds each content hash
+    and which message part produced it. A part seen before is not fetched
+    again while its file is intact, and content already present (e.g. the same
+    invoice attached to several mails) is not written a second time.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self._index = json.load(f)
+        except (OSError, ValueError):
+            self._index = {}
+        self._index.setdefault("files", {})
+        self._index.setdefault("parts", {})
+
+    def _intact(self, sha256):
+        entry = self._index["files"].get(sha256)
+        if entry is None:
+            return None
+        path = os.path.join(self.directory, entry["name"])
+        try:
+            if os.path.getsize(path) == entry["size"]:
+                return path
+        except OSError:
+            pass
+        del self._index["files"][sha256]
+        return None
+
+    def lookup_part(self, part_key):
+        """(path, sha256) of the file a message part was saved to, if it is still there."""
+        with self._lock:
+            sha256 = self._index["parts"].get(part_key)
+            path = self._intact(sha256) if sha256 else None
+            return (path, sha256) if path else (None, None)
+
+    def lookup_content(self, sha256):
+        with self._lock:
+            return self._intact(sha256)
+
+    def record(self, part_key, sha256, name, size):
+        with self._lock:
+            self._index["files"][sha256] = {"name": name, "size": size}
+            self._index["parts"][part_key] = sha256
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self._index, f)
+            os.replace(temp_path, self.path)
+
+
+def save_part(mail, uid, attachment, directory, index, part_key, dedupe=True):
+    """
+    Streams one attachment to directory, decoding as it arrives. Returns a
+    result dict with the file's path, size, sha256 and whether it was skipped
+    (already saved from this part) or matched existing content (duplicate).
+    """
+    if dedupe:
+        path, sha256 = index.lookup_part(part_key)
+        if path:
+            return {"path": path, "sha256": sha256, "size": os.path.getsize(path), "skipped": True, "duplicate": True}
+
+    decoder = AttachmentDecoder(attachment.get("encoding"))
+    hasher = hashlib.sha256()
+    name = safe_filename(attachment.get("filename"), uid, attachment["partId"], attachment.get("contentType"))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=".part")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            def write(chunk):
+                nonlocal size
+                data = decoder.feed(chunk)
+                hasher.update(data)
+                f.write(data)
+                size += len(data)
+            stream_part(mail, uid, attachment["partId"], write)
+            data = decoder.flush()
+            hasher.update(data)
+            f.write(data)
+            size += len(data)
+        sha256 = hasher.hexdigest()
+
+        existing = index.lookup_content(sha256) if dedupe else None
+        if existing:
+            os.remove(temp_path)
+            index.record(part_key, sha256, os.path.basename(existing), size)
+            return {"path": existing, "sha256": sha256, "size": size, "skipped": False, "duplicate": True}
+
+        path = _free_path(directory, name)
+        os.replace(temp_path, path)
+        index.record(part_key, sha256, os.path.basename(path), size)
+        return {"path": path, "sha256": sha256, "size": size, "skipped": False, "duplicate": False}
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _free_path(directory, name):
+    """directory/name, or 'name (2).ext', 'name (3).ext', ... if it is taken."""
+    stem, extension = os.path.splitext(name)
+    path, counter = os.path.join(directory, name), 1
+    while os.path.exists(path):
+        counter += 1
+        path = os.path.join(directory, f"{stem} ({counter}){extension}")
+    return path
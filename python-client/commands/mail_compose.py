@@ -0,0 +1,95 @@
+# File: commands/mail_compose.py
+
+import os
+import re
+import base64
+import mimetypes
+from string import Template
+from email import policy
+from email.message import Message
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid, getaddresses
+
+# Raw bytes per base64 line (76 encoded characters) and lines encoded per file read.
+_B64_LINE_BYTES = 57
+_B64_LINES_PER_READ = 1024
+
+_LEADING_DOT = re.compile(rb"^\.", re.MULTILINE)
+
+
+def render(template, variables):
+    """Fills $name / ${name} placeholders; a missing variable raises ValueError."""
+    if template is None:
+        return None
+    try:
+        return Template(template).substitute(variables)
+    except KeyError as e:
+        raise ValueError(f"Template variable {e} is not set.")
+    except ValueError as e:
+        raise ValueError(f"Invalid template: {e}")
+
+
+def as_list(addresses):
+    """Recipient addresses given as a list or a comma-separated string."""
+    if not addresses:
+        return []
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    return [address for _, address in getaddresses(addresses) if address]
+
+
+def _dot_stuff(data):
+    return _LEADING_DOT.sub(b"..", data)
+
+
+def _header_block(headers):
+    """Folded, encoded header lines (CRLF line ends) followed by the blank line."""
+    message = Message(policy=policy.SMTP)
+    for name, value, params in headers:
+        message.add_header(name, value, **params)
+    return message.as_bytes()
+
+
+def message_chunks(sender, to, cc, subject, body, is_html=False, attachments=()):
+    """
+    Yields an outgoing message as CRLF-terminated, dot-stuffed bytes for the
+    SMTP DATA phase. Attachments are read and base64-encoded a block at a
+    time, so a message costs little memory however large its files are.
+    """
+    headers = [("From", sender, {}), ("To", ", ".join(to), {})]
+    if cc:
+        headers.append(("Cc", ", ".join(cc), {}))
+    headers += [
+        ("Subject", subject, {}),
+        ("Date", formatdate(localtime=True), {}),
+        ("Message-ID", make_msgid(domain=sender.rpartition("@")[2] or None), {}),
+        ("MIME-Version", "1.0", {}),
+    ]
+    text = MIMEText(body, 'html' if is_html else 'plain', 'utf-8')
+    del text['MIME-Version']
+    text_bytes = text.as_bytes(policy=policy.SMTP)
+
+    if not attachments:
+        yield _dot_stuff(_header_block(headers)[:-2] + text_bytes)
+        yield b"\r\n"
+        return
+
+    boundary = f"=_rpa_{base64.b32encode(os.urandom(10)).decode('ascii')}"
+    # Written by hand: a multipart Message without parts would render an empty body here.
+    content_type = f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'.encode("ascii")
+    yield _dot_stuff(_header_block(headers)[:-2] + content_type)
+    yield _dot_stuff(f"--{boundary}\r\n".encode("ascii") + text_bytes + b"\r\n")
+    for path in attachments:
+        filename = os.path.basename(path)
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        part_headers = [
+            ("Content-Type", content_type, {}),
+            ("Content-Transfer-Encoding", "base64", {}),
+            ("Content-Disposition", "attachment", {"filename": filename}),
+        ]
+        yield _dot_stuff(f"--{boundary}\r\n".encode("ascii") + _header_block(part_headers))
+        # Base64 lines never start with '.', so the encoded file needs no dot-stuffing.
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(_B64_LINE_BYTES * _B64_LINES_PER_READ), b""):
+                yield base64.encodebytes(block).replace(b"\n", b"\r\n")
+    yield f"--{boundary}--\r\n".encode("ascii")
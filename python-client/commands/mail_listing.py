@@ -0,0 +1,305 @@
+# File: commands/mail_listing.py
+
+import os
+import re
+import json
+import threading
+import logging
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser
+from email import policy
+from urllib.parse import unquote
+
+log = logging.getLogger(__name__)
+
+STATE_FILE_NAME = ".mail_state.json"
+# Headers fetched by list_emails unless the caller names others.
+DEFAULT_HEADER_FIELDS = ("From", "To", "Cc", "Subject", "Date", "Message-ID")
+# Messages per UID FETCH command; keeps each response a manageable size.
+FETCH_BATCH_SIZE = 100
+
+_LITERAL = re.compile(rb"\{(\d+)\}$")
+
+
+def uid_set(uids):
+    """Compresses sorted UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] -> '1:3,7'."""
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+
+class UidState:
+    """
+    Last listed UID per account, mailbox and search filters, with the mailbox's
+    UIDVALIDITY, persisted as JSON in the download directory. A changed
+    UIDVALIDITY means the server renumbered the mailbox, so the remembered UID
+    no longer applies.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(config, mailbox, criteria=()):
+        """
+        State key of a listing. Filtered listings get their own cursor: a
+        filtered pass skips the mail it does not match, which an unfiltered
+        (or differently filtered) listing must still return.
+        """
+        key = f"{config['user']}@{config['imap_server']}:{config['imap_port']}/{mailbox}"
+        return f"{key}?{' '.join(criteria)}" if criteria else key
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key):
+        """(uidValidity, lastUid) remembered for key, or (None, 0)."""
+        with self._lock:
+            entry = self._load().get(key) or {}
+        return entry.get("uidValidity"), entry.get("lastUid", 0)
+
+    def set(self, key, uid_validity, last_uid):
+        with self._lock:
+            state = self._load()
+            state[key] = {"uidValidity": uid_validity, "lastUid": last_uid}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(state, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+def get_uid_state(download_dir):
+    """Returns the UidState kept in download_dir (one instance per directory)."""
+    path = os.path.join(os.path.abspath(download_dir), STATE_FILE_NAME)
+    with _states_lock:
+        if path not in _states:
+            _states[path] = UidState(path)
+        return _states[path]
+
+
+# --- FETCH response parsing ---
+
+def _flatten(data):
+    """
+    Joins imaplib's FETCH response pieces into one line, replacing each literal
+    with a \\0<index>\\0 placeholder. Returns (line, literals).
+    """
+    parts, literals = [], []
+    for item in data:
+        if isinstance(item, tuple):
+            head, literal = item
+            match = _LITERAL.search(head)
+            if match:
+                head = head[:match.start()]
+            parts.append(head + b"\0%d\0" % len(literals))
+            literals.append(literal)
+        elif item:
+            parts.append(item)
+    return b" ".join(parts), literals
+
+
+def _tokenize(line, literals):
+    i, n = 0, len(line)
+    while i < n:
+        c = line[i:i + 1]
+        if c in b" \r\n":
+            i += 1
+        elif c == b"(":
+            yield _OPEN
+            i += 1
+        elif c == b")":
+            yield _CLOSE
+            i += 1
+        elif c == b'"':
+            i += 1
+            value = bytearray()
+            while i < n and line[i:i + 1] != b'"':
+                if line[i:i + 1] == b"\\":
+                    i += 1
+                value += line[i:i + 1]
+                i += 1
+            i += 1
+            yield bytes(value)
+        elif c == b"\0":
+            end = line.index(b"\0", i + 1)
+            yield literals[int(line[i + 1:end])]
+            i = end + 1
+        else:
+            start = i
+            while i < n and line[i:i + 1] not in b" ()\0":
+                if line[i:i + 1] == b"[":
+                    # Section specs such as BODY[HEADER.FIELDS (FROM TO)] contain spaces and parentheses.
+                    i = line.index(b"]", i)
+                i += 1
+            atom = line[start:i]
+            yield None if atom.upper() == b"NIL" else _Atom(atom)
+
+
+class _Atom(bytes):
+    """An unquoted token, told apart from quoted strings so that keys can be recognised."""
+
+
+_OPEN, _CLOSE = object(), object()
+
+
+def _parse(tokens):
+    """Parses a token stream into nested lists."""
+    stack = [[]]
+    for token in tokens:
+        if token is _OPEN:
+            stack.append([])
+        elif token is _CLOSE:
+            closed = stack.pop()
+            stack[-1].append(closed)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+
+def parse_fetch(data):
+    """
+    Parses an imaplib UID FETCH response into one dict per message, mapping the
+    upper-cased item names (UID, FLAGS, RFC822.SIZE, BODYSTRUCTURE, BODY[...], ...)
+    to their values: bytes for strings and literals, lists for parenthesised data.
+    """
+    line, literals = _flatten(data)
+    values = _parse(_tokenize(line, literals))
+    messages = []
+    for value in values:
+        if isinstance(value, list):
+            items = {}
+            for name, item in zip(value[0::2], value[1::2]):
+                items[bytes(name).upper().decode("ascii", "replace")] = item
+            messages.append(items)
+    return messages
+
+
+# --- Decoding ---
+
+def _text(value):
+    if value is None:
+        return None
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+
+
+def _decode_words(value):
+    """Decodes RFC 2047 encoded words (=?utf-8?...?=) as used in attachment names."""
+    try:
+        return str(make_header(decode_header(value)))
+    except Exception:
+        return value
+
+
+def _params(value):
+    """A BODYSTRUCTURE parameter list ("NAME" "a.pdf" ...) as a dict with lower-case keys."""
+    if not isinstance(value, list):
+        return {}
+    return {_text(k).lower(): _text(v) for k, v in zip(value[0::2], value[1::2])}
+
+
+def _filename(params):
+    if params.get("filename"):
+        return _decode_words(params["filename"])
+    if params.get("filename*"):
+        # RFC 2231: charset'language'percent-encoded
+        charset, _, encoded = params["filename*"].partition("'")
+        encoded = encoded.partition("'")[2]
+        return unquote(encoded, encoding=charset or "utf-8", errors="replace")
+    if params.get("name"):
+        return _decode_words(params["name"])
+    return None
+
+
+def summarize_structure(structure):
+    """
+    Reduces a parsed BODYSTRUCTURE to the message's content type and its
+    attachments (part id, file name, content type, transfer encoding, encoded
+    size); the part id
+    is what a follow-up BODY[<part>] fetch of that attachment needs.
+    """
+    attachments = []
+
+    def walk(part, part_id):
+        if not isinstance(part, list) or not part:
+            return None
+        if isinstance(part[0], list):
+            # Child parts come first; the subtype and extension data (itself a list) follow.
+            count = next((i for i, item in enumerate(part) if not isinstance(item, list)), len(part))
+            children = part[:count]
+            subtype = _text(part[count]) if count < len(part) and part[count] is not None else "mixed"
+            for index, child in enumerate(children, start=1):
+                walk(child, f"{part_id}.{index}" if part_id else str(index))
+            return f"multipart/{subtype.lower()}"
+
+        content_type = f"{_text(part[0])}/{_text(part[1])}".lower()
+        body_params = _params(part[2]) if len(part) > 2 else {}
+        size = int(part[6]) if len(part) > 6 and part[6] is not None and bytes(part[6]).isdigit() else None
+        # Extension data starts after the type-specific fields: text/* adds a line
+        # count, message/rfc822 an envelope, body structure and line count.
+        if content_type.startswith("text/"):
+            disposition_index = 9
+        elif content_type == "message/rfc822":
+            disposition_index = 11
+        else:
+            disposition_index = 8
+        disposition = part[disposition_index] if len(part) > disposition_index else None
+        disposition_type, disposition_params = None, {}
+        if isinstance(disposition, list) and disposition:
+            disposition_type = _text(disposition[0]).lower()
+            disposition_params = _params(disposition[1]) if len(disposition) > 1 else {}
+        filename = _filename(disposition_params) or _filename(body_params)
+        if disposition_type == "attachment" or (filename and content_type not in ("text/plain", "text/html")):
+            attachments.append({
+                "partId": part_id or "1",
+                "filename": filename,
+                "contentType": content_type,
+                "encoding": _text(part[5]).lower() if len(part) > 5 and part[5] is not None else None,
+                "size": size,
+                "inline": disposition_type == "inline"
+            })
+        return content_type
+
+    content_type = walk(structure, "")
+    return {"contentType": content_type, "hasAttachments": bool(attachments), "attachments": attachments}
+
+
+def summarize_message(items):
+    """The listing entry for one parsed FETCH result."""
+    header_bytes = next((value for name, value in items.items() if name.startswith("BODY[HEADER")), b"") or b""
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(header_bytes)
+    flags = [_text(flag) for flag in items.get("FLAGS") or []]
+    size = items.get("RFC822.SIZE")
+
+    def header(name):
+        value = headers[name]
+        return str(value) if value is not None else None
+
+    summary = {
+        "uid": int(items["UID"]),
+        "from": header("from"),
+        "to": header("to"),
+        "cc": header("cc"),
+        "subject": header("subject"),
+        "date": header("date"),
+        "messageId": header("message-id"),
+        "flags": flags,
+        "seen": "\\Seen" in flags,
+        "size": int(size) if size is not None else None,
+        "internalDate": _text(items.get("INTERNALDATE"))
+    }
+    if "BODYSTRUCTURE" in items:
+        summary.update(summarize_structure(items["BODYSTRUCTURE"]))
+    return summary
@@ -0,0 +1,334 @@
+# File: commands/mail_pool.py
+
+import time
+import select
+import hashlib
+import imaplib
+import smtplib
+import ssl
+import threading
+import logging
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Logged-in connections kept per account. More are opened when all are busy; extras are closed on return.
+MAX_IDLE_PER_ACCOUNT = 2
+# A connection unused for this long is checked with NOOP before reuse.
+NOOP_AFTER_SECONDS = 60
+# Servers may log out sessions idle for 30 minutes (RFC 3501); ours are closed well before.
+MAX_IDLE_SECONDS = 20 * 60
+# IDLE is re-issued at least this often, so NAT devices see traffic and missed notifications cost little.
+IDLE_SLICE_SECONDS = 60
+# Upper bound on parallel SMTP connections per account; providers throttle or refuse beyond a few.
+MAX_SMTP_CONNECTIONS = 8
+# Many servers cap messages per session, so a connection is replaced after this many.
+MAX_MESSAGES_PER_SMTP_CONNECTION = 100
+SMTP_TIMEOUT_SECONDS = 60
+
+
+def _account_key(config, protocol):
+    # The password is part of the key (hashed), so changed credentials get fresh connections.
+    secret = hashlib.sha256(config["password"].encode("utf-8")).hexdigest()
+    return (protocol, config[f"{protocol}_server"], config[f"{protocol}_port"], config["user"], secret)
+
+
+class ImapConnection:
+    """A logged-in IMAP4_SSL connection, remembering its selected mailbox."""
+
+    def __init__(self, config):
+        self.imap = imaplib.IMAP4_SSL(config["imap_server"], config["imap_port"])
+        self.imap.login(config["user"], config["password"])
+        self.mailbox = None
+        self.last_used = time.monotonic()
+
+    def select(self, mailbox, readonly=False):
+        """Selects mailbox, or just polls for updates with NOOP if it is already selected."""
+        if self.mailbox == (mailbox, readonly):
+            self.imap.noop()
+            return
+        status, data = self.imap.select(mailbox, readonly=readonly)
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"Cannot select mailbox '{mailbox}': {data}")
+        self.mailbox = (mailbox, readonly)
+
+    def noop(self):
+        self.imap.noop()
+
+    def reusable(self):
+        return True
+
+    def supports_idle(self):
+        return "IDLE" in self.imap.capabilities
+
+    def idle(self, timeout):
+        """
+        Waits in IMAP IDLE for up to timeout seconds. Returns True as soon as the
+        server sends any untagged response (new, expunged or changed messages),
+        False on timeout; the caller re-checks the mailbox either way. imaplib has
+        no IDLE support, so the exchange is done with its line reader.
+
+        The socket is only read once select() reports data, so no read timeout is
+        ever hit. select() cannot see lines imaplib's buffered reader has already
+        pulled in, so IDLE is left on the first untagged line, before waiting
+        again; the lines batched with it are read while IDLE is being ended.
+        """
+        imap = self.imap
+        tag = imap._new_tag()
+        imap.send(tag + b" IDLE\r\n")
+        line = imap.readline()
+        changed = False
+        while line.startswith(b"* "):
+            changed = True # Untagged data sent before the continuation
+            line = imap.readline()
+        if not line.startswith(b"+"):
+            raise imaplib.IMAP4.error(f"IDLE refused: {line!r}")
+        sock = imap.socket()
+        deadline = time.monotonic() + timeout
+        try:
+            while not changed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pending = sock.pending() if hasattr(sock, "pending") else 0
+                if not pending and not select.select([sock], [], [], remaining)[0]:
+                    break
+                line = imap.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("Connection closed during IDLE.")
+                changed = line.startswith(b"* ")
+        finally:
+            imap.send(b"DONE\r\n")
+            while True:
+                line = imap.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("Connection closed while ending IDLE.")
+                if line.startswith(tag):
+                    if not line[len(tag):].strip().startswith(b"OK"):
+                        raise imaplib.IMAP4.error(f"IDLE ended with {line!r}")
+                    break
+        self.last_used = time.monotonic()
+        return changed
+
+    def close(self):
+        try:
+            self.imap.logout()
+        except Exception:
+            pass
+
+
+class SmtpConnection:
+    """
+    An SMTP connection, upgraded with STARTTLS and logged in. send() pipelines
+    the envelope (RFC 2920) when the server allows it and streams the message
+    data instead of building it in memory.
+    """
+
+    def __init__(self, config):
+        self.smtp = smtplib.SMTP(config["smtp_server"], config["smtp_port"], timeout=SMTP_TIMEOUT_SECONDS)
+        try:
+            self.smtp.starttls(context=ssl.create_default_context()) # Secure the connection
+            self.smtp.ehlo()
+            self.smtp.login(config["user"], config["password"])
+        except BaseException:
+            self.close()
+            raise
+        self.pipelining = self.smtp.has_extn("pipelining")
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def noop(self):
+        code, message = self.smtp.noop()
+        if code != 250:
+            raise smtplib.SMTPResponseException(code, message)
+
+    def reusable(self):
+        return self.sent < MAX_MESSAGES_PER_SMTP_CONNECTION
+
+    def _reset(self):
+        code, message = self.smtp.rset()
+        if code != 250:
+            raise smtplib.SMTPResponseException(code, message)
+
+    def send(self, sender, recipients, chunks):
+        """
+        Sends one message. chunks yields the message as CRLF-terminated,
+        dot-stuffed bytes. Returns the recipients the server refused, like
+        smtplib.sendmail; raises as sendmail does when the message is refused,
+        leaving the connection ready for the next message.
+        """
+        smtp = self.smtp
+        commands = [f"MAIL FROM:<{sender}>"] + [f"RCPT TO:<{recipient}>" for recipient in recipients] + ["DATA"]
+        replies = []
+        if self.pipelining:
+            # The whole envelope goes out in one write; the replies are then read in order.
+            smtp.send("".join(command + "\r\n" for command in commands))
+            replies = [smtp.getreply() for _ in commands]
+        else:
+            for index, command in enumerate(commands):
+                smtp.putcmd(command)
+                replies.append(smtp.getreply())
+                # Stop early once the sender or every recipient is refused, as sendmail does.
+                if replies[0][0] != 250 or (index == len(commands) - 2 and not any(
+                        code in (250, 251) for code, _ in replies[1:])):
+                    break
+
+        code, message = replies[0]
+        if code != 250:
+            self._finish_refused(replies, len(commands))
+            raise smtplib.SMTPSenderRefused(code, message, sender)
+        refused = {recipient: reply for recipient, reply in zip(recipients, replies[1:]) if reply[0] not in (250, 251)}
+        if len(refused) == len(recipients):
+            self._finish_refused(replies, len(commands))
+            raise smtplib.SMTPRecipientsRefused(refused)
+        code, message = replies[-1]
+        if code != 354:
+            self._reset()
+            raise smtplib.SMTPDataError(code, message)
+
+        for chunk in chunks:
+            smtp.sock.sendall(chunk)
+        smtp.sock.sendall(b".\r\n")
+        code, message = smtp.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, message)
+        self.sent += 1
+        self.last_used = time.monotonic()
+        return refused
+
+    def _finish_refused(self, replies, expected):
+        if len(replies) == expected and replies[-1][0] == 354:
+            # A server that accepted DATA regardless gets an empty message ended at once.
+            self.smtp.sock.sendall(b".\r\n")
+            self.smtp.getreply()
+        self._reset()
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class ConnectionPool:
+    """
+    Per-account pool of logged-in mail connections, so repeated mail commands
+    (e.g. an orchestrator polling for a one-time password) reuse one TLS session
+    and login instead of opening a new one per call. Idle connections are
+    checked with NOOP before reuse and closed before the server would time
+    them out; a connection that fails during use is discarded, not returned.
+    Subclasses name the protocol and how to open a connection.
+    """
+
+    protocol = None
+
+    def __init__(self, max_idle=MAX_IDLE_PER_ACCOUNT):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.stats = {"opened": 0, "reused": 0, "discarded": 0}
+
+    def _open(self, config):
+        raise NotImplementedError
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _take(self, key):
+        now = time.monotonic()
+        with self._lock:
+            connections = self._idle.get(key, [])
+            while connections:
+                connection = connections.pop()
+                if now - connection.last_used <= MAX_IDLE_SECONDS:
+                    return connection
+                connection.close()
+        return None
+
+    def _checkout(self, config):
+        key = _account_key(config, self.protocol)
+        while True:
+            connection = self._take(key)
+            if connection is None:
+                break
+            if time.monotonic() - connection.last_used < NOOP_AFTER_SECONDS:
+                self._count("reused")
+                return connection
+            try:
+                connection.noop()
+                self._count("reused")
+                return connection
+            except (imaplib.IMAP4.error, smtplib.SMTPException, OSError) as e:
+                log.info(f"[Mail] Dropping stale {self.protocol.upper()} connection for {config['user']}: {e}")
+                self._count("discarded")
+                connection.close()
+        server, port = config[f"{self.protocol}_server"], config[f"{self.protocol}_port"]
+        log.info(f"[Mail] Opening {self.protocol.upper()} connection to {server}:{port} for {config['user']}.")
+        self._count("opened")
+        return self._open(config)
+
+    def _checkin(self, config, connection):
+        connection.last_used = time.monotonic()
+        if connection.reusable():
+            key = _account_key(config, self.protocol)
+            with self._lock:
+                connections = self._idle.setdefault(key, [])
+                if len(connections) < self.max_idle:
+                    connections.append(connection)
+                    return
+        connection.close()
+
+    @contextmanager
+    def connection(self, config):
+        """Yields a logged-in connection for the account in config (as built by EmailCommands)."""
+        connection = self._checkout(config)
+        try:
+            yield connection
+        except BaseException:
+            # Its protocol state is unknown after an error (e.g. mid-IDLE); never reuse it.
+            self._count("discarded")
+            connection.close()
+            raise
+        self._checkin(config, connection)
+
+    def close_all(self):
+        with self._lock:
+            connections = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for connection in connections:
+            connection.close()
+
+
+class ImapPool(ConnectionPool):
+    protocol = "imap"
+
+    def _open(self, config):
+        return ImapConnection(config)
+
+
+class SmtpPool(ConnectionPool):
+    protocol = "smtp"
+
+    def __init__(self, max_idle=MAX_SMTP_CONNECTIONS):
+        super().__init__(max_idle)
+
+    def _open(self, config):
+        return SmtpConnection(config)
+
+
+_imap_pool = ImapPool()
+_smtp_pool = SmtpPool()
+
+
+def get_imap_pool():
+    """Returns the process-wide IMAP connection pool."""
+    return _imap_pool
+
+
+def get_smtp_pool():
+    """Returns the process-wide SMTP connection pool."""
+    return _smtp_pool
@@ -0,0 +1,317 @@
+# File: commands/processes.py
+
+import os
+import time
+import signal
+import subprocess
+import threading
+import logging
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# Finished processes are remembered (for their exit code) up to this many entries.
+MAX_FINISHED_PROCESSES = 100
+# Output of managed processes: this much of each stream is kept in memory, the rest only on disk.
+OUTPUT_TAIL_BYTES = 64 * 1024
+# Spool files stop growing at this size; later output is then only in the in-memory tail.
+MAX_SPOOL_BYTES = 256 * 1024 * 1024
+PIPE_READ_SIZE = 64 * 1024
+# Seconds between asking a process to terminate and killing it.
+KILL_GRACE_SECONDS = 5
+STREAM_NAMES = ("stdout", "stderr")
+
+
+class ProcessRegistry:
+    """
+    Keeps the handles of processes started by the node (e.g. by
+    launch_application or start_process) so later commands can refer to
+    them by process id.
+    """
+
+    def __init__(self, max_finished=MAX_FINISHED_PROCESSES):
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._processes = OrderedDict()
+
+    def register(self, process, description=None, output=None):
+        """
+        Stores a subprocess.Popen handle, with the ManagedProcess capturing its
+        output if there is one. Returns its process id.
+        """
+        with self._lock:
+            previous = self._processes.pop(process.pid, None)
+            if previous and previous["output"]:
+                previous["output"].cleanup() # The pid was reused by the OS.
+            self._processes[process.pid] = {
+                "process": process,
+                "description": description,
+                "output": output,
+                "startedAt": time.time()
+            }
+            self._prune()
+        return process.pid
+
+    def _prune(self):
+        finished = [pid for pid, entry in self._processes.items() if entry["process"].poll() is not None]
+        for pid in finished[:max(0, len(finished) - self.max_finished)]:
+            entry = self._processes.pop(pid)
+            if entry["output"]:
+                entry["output"].cleanup()
+
+    def output(self, pid):
+        """Returns the ManagedProcess of a registered process id, or None if its output is not captured."""
+        with self._lock:
+            entry = self._processes.get(int(pid))
+            if entry is None:
+                raise KeyError(pid)
+            return entry["output"]
+
+    def process_ids(self):
+        with self._lock:
+            return list(self._processes)
+
+    def get(self, pid):
+        """Returns the Popen handle for a registered process id, or None."""
+        with self._lock:
+            entry = self._processes.get(int(pid))
+            return entry["process"] if entry else None
+
+    def status(self, pid):
+        """Returns a status dict for a registered process. Raises KeyError if unknown."""
+        with self._lock:
+            entry = self._processes.get(int(pid))
+        if entry is None:
+            raise KeyError(pid)
+        return_code = entry["process"].poll()
+        status = {
+            "processId": int(pid),
+            "description": entry["description"],
+            "running": return_code is None,
+            "returnCode": return_code,
+            "startedAt": entry["startedAt"]
+        }
+        if entry["output"]:
+            status["output"] = entry["output"].snapshot()
+        return status
+
+
+class OutputStream:
+    """
+    One captured stream of a managed process. Everything is appended to a
+    spool file (up to MAX_SPOOL_BYTES) so it can be read back from any offset,
+    and the last tail_bytes are also kept in memory. Offsets count bytes.
+    """
+
+    def __init__(self, path, tail_bytes=OUTPUT_TAIL_BYTES):
+        self.path = path
+        self.tail_bytes = tail_bytes
+        self.size = 0
+        self.spooled = 0
+        self.tail = bytearray()
+        self.closed = False
+        self._file = open(path, "wb")
+
+    def append(self, data):
+        if self.spooled < MAX_SPOOL_BYTES:
+            part = data[:MAX_SPOOL_BYTES - self.spooled]
+            self._file.write(part)
+            self._file.flush()
+            self.spooled += len(part)
+        self.size += len(data)
+        self.tail += data
+        if len(self.tail) > self.tail_bytes:
+            del self.tail[:len(self.tail) - self.tail_bytes]
+
+    def close(self):
+        self.closed = True
+        self._file.close()
+
+    def read(self, offset, limit):
+        """
+        Returns (start, data): up to limit bytes from offset on. If that part was
+        neither spooled nor is still in the tail, start is moved forward to the
+        first byte that is.
+        """
+        tail_start = self.size - len(self.tail)
+        if offset < self.spooled:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                return offset, f.read(min(limit, self.spooled - offset))
+        start = max(offset, tail_start)
+        return start, bytes(self.tail[start - tail_start:start - tail_start + limit])
+
+    def snapshot(self):
+        return {"bytes": self.size, "spooledBytes": self.spooled, "complete": self.closed}
+
+
+class ManagedProcess:
+    """
+    A process started by the node whose stdout and stderr are read by
+    background threads into OutputStreams, so the command that started it
+    can return at once and later commands read its output by offset. It runs
+    in its own process group (session on POSIX), so it can be stopped with
+    everything it started.
+    """
+
+    def __init__(self, command, spool_dir, cwd=None, env=None, shell=True, tail_bytes=OUTPUT_TAIL_BYTES):
+        kwargs = {}
+        if os.name == 'nt':
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            kwargs["start_new_session"] = True
+        self.command = command
+        self.process = subprocess.Popen(
+            command,
+            shell=shell,
+            cwd=cwd,
+            env=dict(os.environ, **env) if env else None,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **kwargs
+        )
+        self.pid = self.process.pid
+        self.changed = threading.Condition()
+        self.streams = {
+            name: OutputStream(os.path.join(spool_dir, f"{self.pid}-{int(time.time() * 1000)}.{name}"), tail_bytes)
+            for name in STREAM_NAMES
+        }
+        self._readers = [
+            threading.Thread(target=self._pump, args=(name, pipe), name=f"process-{self.pid}-{name}", daemon=True)
+            for name, pipe in (("stdout", self.process.stdout), ("stderr", self.process.stderr))
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _pump(self, name, pipe):
+        stream = self.streams[name]
+        try:
+            while True:
+                data = pipe.read1(PIPE_READ_SIZE)
+                if not data:
+                    break
+                with self.changed:
+                    stream.append(data)
+                    self.changed.notify_all()
+        except (OSError, ValueError) as e:
+            log.warning(f"[Process] Reading {name} of process {self.pid} failed: {e}")
+        finally:
+            pipe.close()
+            with self.changed:
+                stream.close()
+                self.changed.notify_all()
+
+    def wait_for_output(self, stream_name, offset, timeout):
+        """Waits until the stream has data beyond offset, or is complete. Returns True if either holds."""
+        stream = self.streams[stream_name]
+        with self.changed:
+            return self.changed.wait_for(lambda: stream.size > offset or stream.closed, timeout)
+
+    def join_readers(self, timeout):
+        """Waits for the output threads to reach end of file (e.g. after the process exited)."""
+        deadline = time.monotonic() + timeout
+        for reader in self._readers:
+            reader.join(max(0, deadline - time.monotonic()))
+
+    def read(self, stream_name, offset, limit):
+        with self.changed:
+            return self.streams[stream_name].read(offset, limit)
+
+    def tail(self, stream_name):
+        with self.changed:
+            stream = self.streams[stream_name]
+            return bytes(stream.tail), stream.size
+
+    def snapshot(self):
+        with self.changed:
+            return {name: stream.snapshot() for name, stream in self.streams.items()}
+
+    def cleanup(self):
+        """Removes the spool files (the process has been forgotten)."""
+        for stream in self.streams.values():
+            try:
+                os.remove(stream.path)
+            except OSError:
+                pass
+
+
+def complete_utf8(data, final=False):
+    """
+    Length of the longest prefix of data that does not end inside a UTF-8
+    sequence, so chunks read at byte offsets decode without splitting
+    characters. With final, the whole of data is taken.
+    """
+    if final:
+        return len(data)
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 != 0x80: # Not a continuation byte: the start of the last character.
+            needed = 1 if byte < 0x80 else 2 if byte >> 5 == 0b110 else 3 if byte >> 4 == 0b1110 else 4 if byte >> 3 == 0b11110 else 1
+            return len(data) if needed <= back else len(data) - back
+    return len(data)
+
+
+def terminate_process(process, tree=True, grace=KILL_GRACE_SECONDS):
+    """
+    Stops a process: asks it to terminate, then kills it if it has not exited
+    within grace seconds. With tree, processes it started go too (its process
+    group on POSIX, if it leads one; taskkill /T on Windows). Returns the exit
+    code, or None if it is still running.
+    """
+    if process.poll() is not None:
+        return process.returncode
+    if os.name == 'nt':
+        if tree:
+            subprocess.run(["taskkill", "/T", "/F", "/PID", str(process.pid)], capture_output=True)
+        else:
+            process.terminate()
+    else:
+        try:
+            group = tree and os.getpgid(process.pid) == process.pid
+        except OSError:
+            group = False
+        send = (lambda sig: os.killpg(process.pid, sig)) if group else process.send_signal
+        try:
+            send(signal.SIGTERM)
+            try:
+                process.wait(grace)
+            except subprocess.TimeoutExpired:
+                log.info(f"[Process] Process {process.pid} ignored SIGTERM for {grace}s; killing it.")
+                send(signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    try:
+        return process.wait(grace)
+    except subprocess.TimeoutExpired:
+        return None
+
+
+_spool_dirs_prepared = set()
+_spool_lock = threading.Lock()
+
+
+def spool_directory(download_dir):
+    """
+    Directory for the output spool files of managed processes. Files left
+    behind by an earlier run of the node are removed on first use.
+    """
+    path = os.path.join(os.path.abspath(download_dir), ".processes")
+    with _spool_lock:
+        if path not in _spool_dirs_prepared:
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                try:
+                    os.remove(os.path.join(path, name))
+                except OSError:
+                    pass
+            _spool_dirs_prepared.add(path)
+    return path
+
+
+_shared_registry = ProcessRegistry()
+
+
+def get_process_registry():
+    """Returns the process-wide registry of processes started by the node."""
+    return _shared_registry
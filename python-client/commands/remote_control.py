@@ -2,10 +2,23 @@
 
 import threading
 import time
-import io
-import pyautogui
+import base64
 import logging
 
+import numpy as np
+from PIL import Image
+
+from .capture import get_screen_capture
+from .frame_delta import TileDiffer
+from .stream_controller import AdaptiveStreamController, PRESETS, CpuLoadMeter
+from .stream_pipeline import StreamPipeline, DEFAULT_ENCODE_WORKERS
+from .encoders import get_encoder, normalize_format, validate_subsampling
+from .input_executor import InputExecutor, EVENT_TYPES
+
+STREAM_MODE_FULL = "full"     # Full JPEG frame every interval
+STREAM_MODE_DELTA = "delta"   # Changed tiles only, with periodic keyframes
+KEYFRAME_INTERVAL_SECONDS = 5.0
+
 log = logging.getLogger(__name__)
 
 class RemoteControlCommands:
@@ -15,6 +28,16 @@ class RemoteControlCommands:
         self.streaming = False
         self.stream_thread = None
         self.quality = "medium"
+        self.stream_mode = STREAM_MODE_DELTA
+        self.controller = AdaptiveStreamController(self.quality)
+        self.encode_workers = DEFAULT_ENCODE_WORKERS
+        self.image_format = "jpeg"
+        self.subsampling = None
+        self.grayscale = False
+        self._keyframe_requested = threading.Event()
+        self.input_executor = InputExecutor()
+        # (controllerId, highest seq) of the last input-lane message.
+        self._input_seq = None
 
     def start_remote_control(self, params):
         controller_id = params.get('controllerId')
@@ -26,13 +49,43 @@ class RemoteControlCommands:
                 'message': f'Node {node_id} is already being controlled by {self.active_controller}',
                 'requestId': request_id
             }
+        stream_mode = params.get('streamMode', STREAM_MODE_DELTA)
+        if stream_mode not in (STREAM_MODE_FULL, STREAM_MODE_DELTA):
+            return {
+                'status': 'error',
+                'message': f"Unknown streamMode '{stream_mode}'. Use '{STREAM_MODE_FULL}' or '{STREAM_MODE_DELTA}'.",
+                'requestId': request_id
+            }
+        quality = params.get('quality', self.quality)
+        if quality not in PRESETS:
+            return {
+                'status': 'error',
+                'message': f"Unknown quality preset '{quality}'. Use one of: {', '.join(PRESETS)}.",
+                'requestId': request_id
+            }
+        try:
+            self._apply_encoder_params(params)
+        except ValueError as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'requestId': request_id
+            }
+        self.stream_mode = stream_mode
+        self.encode_workers = int(params.get('encodeWorkers', DEFAULT_ENCODE_WORKERS)) # 0 = encode on a thread
+        self.quality = quality
+        self.controller = AdaptiveStreamController(quality, adaptive=params.get('adaptive', True))
+        if params.get('viewportWidth') and params.get('viewportHeight'):
+            self.controller.set_viewport(params['viewportWidth'], params['viewportHeight'])
         self.active_controller = controller_id
+        self._input_seq = None
         self.streaming = True
         self.stream_thread = threading.Thread(target=self._stream_images, daemon=True)
         self.stream_thread.start()
         return {
             'status': 'success',
             'message': f'Remote control started for node {node_id} by {controller_id}',
+            'stream': self._stream_snapshot(),
             'requestId': request_id
         }
 
@@ -48,43 +101,206 @@ class RemoteControlCommands:
             }
         self.streaming = False
         self.active_controller = None
+        self._input_seq = None
+        self.input_executor.stop()
         return {
             'status': 'success',
             'message': f'Remote control stopped for node {node_id}',
             'requestId': request_id
         }
 
+    def update_stream_settings(self, params):
+        """
+        Updates the running stream: an explicit 'quality' preset (low/medium/high),
+        'adaptive' on/off, and the viewer's 'viewportWidth'/'viewportHeight' in device pixels.
+        """
+        request_id = params.get('requestId')
+        try:
+            quality = params.get('quality')
+            if quality:
+                self.controller.set_preset(quality)
+                self.quality = quality
+            if 'adaptive' in params:
+                self.controller.adaptive = bool(params['adaptive'])
+            self._apply_encoder_params(params)
+            if params.get('viewportWidth') and params.get('viewportHeight'):
+                self.controller.set_viewport(params['viewportWidth'], params['viewportHeight'])
+            return {
+                'status': 'success',
+                'message': 'Stream settings updated.',
+                'stream': self._stream_snapshot(),
+                'requestId': request_id
+            }
+        except ValueError as e:
+            return {
+                'status': 'error',
+                'message': str(e),
+                'requestId': request_id
+            }
+
+    def _apply_encoder_params(self, params):
+        """Validates and applies the optional 'format', 'subsampling' and 'grayscale' stream parameters."""
+        if params.get('format'):
+            image_format = normalize_format(params['format'])
+            get_encoder(image_format) # Fails early if no backend is available for the format
+            self.image_format = image_format
+        if 'subsampling' in params:
+            self.subsampling = validate_subsampling(params['subsampling'])
+        if 'grayscale' in params:
+            self.grayscale = bool(params['grayscale'])
+
+    def _encode_options(self):
+        return {
+            "format": self.image_format,
+            "quality": self.controller.quality,
+            "subsampling": self.subsampling,
+            "grayscale": self.grayscale
+        }
+
+    def _stream_snapshot(self):
+        snapshot = self.controller.snapshot()
+        snapshot.update(mode=self.stream_mode, format=self.image_format, subsampling=self.subsampling, grayscale=self.grayscale,
+                        input=self.input_executor.snapshot())
+        return snapshot
+
+    def request_keyframe(self, params):
+        """Asks the delta stream to send a full frame next, e.g. after a viewer (re)joins."""
+        request_id = params.get('requestId')
+        self._keyframe_requested.set()
+        return {
+            'status': 'success',
+            'message': 'Keyframe requested.',
+            'requestId': request_id
+        }
+
+    def _frame_counters(self):
+        """Returns (frames still queued, frames evicted so far, frame bytes sent) from the outgoing scheduler."""
+        scheduler = getattr(self.node_client_ref, 'outgoing_ws_queue', None)
+        if scheduler is None or not hasattr(scheduler, 'class_counters'):
+            return 0, 0, 0
+        counters = scheduler.class_counters('frame')
+        return scheduler.qsize('frame'), counters['dropped'], counters['bytes_sent']
+
+    def _grab_scaled(self, capture):
+        image = capture.grab()
+        self.controller.set_screen_size(image.width, image.height)
+        scale = self.controller.scale
+        if scale < 1.0:
+            size = (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR)
+        return image
+
     def _stream_images(self):
-        # Image streaming now uses a single WebSocket
-        # The quality parameter is not used in the Python client, but could be.
-        frame_interval = 0.1
+        # Image streaming uses the node's single WebSocket.
+        # Capture, encode (on a process pool) and send run as overlapping pipeline stages.
+        # In delta mode only changed tiles are sent; nothing is sent while the screen is static.
+        # FPS, JPEG quality and scale are driven by the adaptive controller.
+        if not (self.node_client_ref and hasattr(self.node_client_ref, 'send_outgoing_ws_message')):
+            log.warning("NodeClient reference or send method not available. Cannot stream image.")
+            self.streaming = False
+            return
+
+        capture = get_screen_capture()
+        differ = TileDiffer()
+        resync = threading.Event()
+        state = {"last_keyframe": 0.0, "last_dropped": self._frame_counters()[1], "frame_bytes": 0, "processing": 0.0}
+        cpu_meter = CpuLoadMeter()
+
+        def before_capture(slot_empty):
+            pending, dropped, sent_bytes = self._frame_counters()
+            self.controller.update(pending, sent_bytes, state["frame_bytes"], state["processing"], cpu_meter.read())
+            state["frame_bytes"], state["processing"] = 0, 0.0
+            if dropped != state["last_dropped"]:
+                # A delta was evicted from the outgoing queue; the viewer needs a keyframe.
+                state["last_dropped"] = dropped
+                resync.set()
+            if self.stream_mode == STREAM_MODE_FULL:
+                return True
+            # Deltas must not be coalesced away, so the next one is only captured once the previous one moved on.
+            return slot_empty and not pending
+
+        def capture_frame():
+            image = self._grab_scaled(capture)
+            if self.stream_mode == STREAM_MODE_FULL:
+                return image, [(0, 0, image.width, image.height)], True
+            now = time.monotonic()
+            if resync.is_set() or self._keyframe_requested.is_set() \
+                    or now - state["last_keyframe"] >= KEYFRAME_INTERVAL_SECONDS:
+                differ.reset()
+                resync.clear()
+                self._keyframe_requested.clear()
+            # A scale change alters the frame size, which also makes the differ request a keyframe.
+            rects = differ.diff(np.asarray(image))
+            if rects is None:
+                state["last_keyframe"] = now
+                return image, [(0, 0, image.width, image.height)], True
+            return image, rects, False
+
+        def send_frame(job, encoded):
+            if self.stream_mode == STREAM_MODE_FULL:
+                return self._send_full_frame(encoded[0], job)
+            return self._send_tile_frame(job, encoded)
+
+        def on_frame_done(frame_bytes, stage_seconds, failed):
+            if failed:
+                resync.set()
+            state["frame_bytes"], state["processing"] = frame_bytes, stage_seconds
+
+        pipeline = StreamPipeline(
+            before_capture, capture_frame, self._encode_options, send_frame, on_frame_done,
+            is_running=lambda: self.streaming, encode_workers=self.encode_workers
+        )
         try:
-            while self.streaming:
-                screenshot = pyautogui.screenshot()
-                buf = io.BytesIO()
-                screenshot.save(buf, format='JPEG', quality=95)
-                img_bytes = buf.getvalue()
-                
-                if self.node_client_ref and hasattr(self.node_client_ref, 'send_outgoing_ws_message'):
-                    message = {
-                        "type": "image_stream_frame",
-                        "image_bytes": img_bytes,
-                        "node_id": self.node_client_ref.node_id
-                    }
-                    self.node_client_ref.send_outgoing_ws_message(message)
-                else:
-                    log.warning("NodeClient reference or send method not available. Cannot stream image.")
-                    self.streaming = False
-                time.sleep(frame_interval)
+            pipeline.run(lambda: self.controller.frame_interval)
         except Exception as e:
             log.exception(f"Error during image streaming: {e}")
         finally:
             self.streaming = False
 
+    def _send_full_frame(self, image_bytes, job):
+        message = {
+            "type": "image_frame",
+            "frame_data": base64.b64encode(image_bytes).decode('utf-8'),
+            "mime_type": get_encoder(job.options["format"]).mime_type,
+            "node_id": self.node_client_ref.node_id,
+            "timestamp": time.time()
+        }
+        # Frames are latest-wins in the outgoing scheduler, so a slow link drops stale frames.
+        self.node_client_ref.send_outgoing_ws_message(message)
+        return len(message["frame_data"])
+
+    def _send_tile_frame(self, job, encoded_tiles):
+        tiles = []
+        for (x, y, w, h), tile_bytes in zip(job.rects, encoded_tiles):
+            tiles.append({"x": x, "y": y, "w": w, "h": h, "data": base64.b64encode(tile_bytes).decode('utf-8')})
+        message = {
+            "type": "image_tile_frame",
+            "node_id": self.node_client_ref.node_id,
+            "frame_id": job.frame_id,
+            "keyframe": job.keyframe,
+            "mime_type": get_encoder(job.options["format"]).mime_type,
+            "width": job.width,
+            "height": job.height,
+            "tiles": tiles,
+            "timestamp": time.time()
+        }
+        # Each delta gets its own slot so the scheduler never replaces one delta with another.
+        self.node_client_ref.send_outgoing_ws_message(message, coalesce_key=f"tiles-{job.frame_id}")
+        return sum(len(tile["data"]) for tile in tiles)
+
     def send_input(self, params):
+        """
+        Queues live input for the input executor thread and returns immediately.
+        'events' is a list of {"type": "move" | "button" | "wheel" | "key" | "text", ...,
+        "t": client timestamp in ms}; see InputBackend.inject for the fields.
+        Consecutive moves are coalesced and stale moves/wheel events are dropped.
+        'inputData' with a single event is accepted for older callers.
+        """
         controller_id = params.get('controllerId')
         node_id = params.get('nodeId')
-        input_data = params.get('inputData')
+        events = params.get('events')
+        if events is None and isinstance(params.get('inputData'), dict):
+            events = [params['inputData']]
         request_id = params.get('requestId')
         if self.active_controller != controller_id:
             return {
@@ -92,9 +308,52 @@ class RemoteControlCommands:
                 'message': 'You are not the active controller.',
                 'requestId': request_id
             }
-        # This method is not fully implemented in the provided code, but the structure is correct.
+        if not self._valid_events(events):
+            return {
+                'status': 'error',
+                'message': f"events must be a list of input events with a type of: {', '.join(EVENT_TYPES)}.",
+                'requestId': request_id
+            }
+        if 'latencyBudgetMs' in params:
+            self.input_executor.latency_budget = float(params['latencyBudgetMs']) / 1000.0
+        self.input_executor.start()
+        accepted = self.input_executor.submit(events)
         return {
             'status': 'success',
-            'message': f'Input processed for node {node_id}',
+            'message': f'{accepted} input events queued for node {node_id}',
+            'accepted': accepted,
             'requestId': request_id
-        }
\ No newline at end of file
+        }
+
+    @staticmethod
+    def _valid_events(events):
+        return isinstance(events, list) and all(isinstance(e, dict) and e.get('type') in EVENT_TYPES for e in events)
+
+    def handle_input_message(self, message):
+        """
+        Handles an 'input' message from the relay's input lane. Unlike send_input
+        it is called straight from the WebSocket thread, bypassing the command
+        queue, and sends no response. 'seq' (optional) increases per message
+        from a controller; a message whose seq is not above the last one seen
+        is stale (replayed or reordered) and is discarded. Returns the number
+        of events queued.
+        """
+        controller_id = message.get('controllerId')
+        if self.active_controller is None or self.active_controller != controller_id:
+            log.debug(f"[RemoteControl] Dropped input from {controller_id}: not the active controller.")
+            return 0
+        events = message.get('events')
+        if not self._valid_events(events):
+            log.warning(f"[RemoteControl] Dropped malformed input message (seq {message.get('seq')}).")
+            return 0
+        seq = message.get('seq')
+        if seq is not None:
+            # Sequence numbers are per controller; a new controller starts over.
+            last_controller, last_seq = self._input_seq or (None, None)
+            if last_controller == controller_id and last_seq is not None and seq <= last_seq:
+                self.input_executor.stats["droppedStale"] += len(events)
+                log.debug(f"[RemoteControl] Dropped stale input seq {seq} (last {last_seq}).")
+                return 0
+            self._input_seq = (controller_id, seq)
+        self.input_executor.start()
+        return self.input_executor.submit(events)
@@ -0,0 +1,241 @@
+# File: commands/stream_controller.py
+
+import time
+import logging
+
+try:
+    import psutil  # Optional: CPU load on platforms without /proc/stat
+except ImportError:
+    psutil = None
+
+log = logging.getLogger(__name__)
+
+# Ceilings for each preset. The controller starts at the ceiling and degrades
+# towards the floors when the link, the encoder or the CPU cannot keep up.
+PRESETS = {
+    "low": {"fps": 5, "quality": 50, "scale": 0.5},
+    "medium": {"fps": 10, "quality": 70, "scale": 0.75},
+    "high": {"fps": 15, "quality": 90, "scale": 1.0},
+}
+DEFAULT_PRESET = "medium"
+
+MIN_FPS = 1
+MIN_QUALITY = 30
+MIN_SCALE = 0.25
+
+QUALITY_STEP = 10
+SCALE_FACTOR = 0.8
+FPS_FACTOR = 0.7
+
+# Number of consecutive healthy frames before stepping back up.
+RECOVERY_FRAMES = 20
+# Frames to wait after a step down before stepping down again, so one burst does not collapse quality.
+DEGRADE_COOLDOWN_FRAMES = 3
+# Fraction of the measured send throughput the stream is allowed to use.
+THROUGHPUT_HEADROOM = 0.8
+# Fraction of CPU time busy (all cores) above which the CPU counts as saturated.
+CPU_HIGH_WATERMARK = 0.9
+# Shortest window CPU usage is measured over; shorter ones are too coarse (10 ms clock ticks).
+CPU_SAMPLE_SECONDS = 0.5
+# Fraction of the frame interval that capture + encode may take before FPS is capped.
+PROCESSING_BUDGET = 0.8
+# Weight of the newest sample in the exponential moving averages.
+EMA_ALPHA = 0.3
+
+
+def _ema(previous, sample):
+    return sample if previous is None else previous + EMA_ALPHA * (sample - previous)
+
+
+def _proc_stat_times():
+    """(busy, total) CPU ticks of all cores from /proc/stat, or None if it cannot be read."""
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(value) for value in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0) # idle + iowait
+    total = sum(fields[:8]) # guest time is already counted in user time
+    return total - idle, total
+
+
+class CpuLoadMeter:
+    """
+    CPU usage of the whole machine over the last CPU_SAMPLE_SECONDS or so,
+    normalised to 0..1 (1 = all cores busy). Unlike the load average, which
+    trails by a minute, it drops as soon as the stream backs off.
+    """
+
+    def __init__(self):
+        self._last_time = None
+        self._last_times = None
+        self._load = None
+        self.read()
+
+    def read(self):
+        """Returns the latest measurement, or None if CPU usage cannot be measured here."""
+        now = time.monotonic()
+        if self._last_time is not None and now - self._last_time < CPU_SAMPLE_SECONDS:
+            return self._load
+        if psutil is not None:
+            # Usage since the previous call; the first call has no window yet.
+            load = psutil.cpu_percent(interval=None) / 100.0
+            self._load = load if self._last_time is not None else None
+        else:
+            times = _proc_stat_times()
+            if times and self._last_times and times[1] > self._last_times[1]:
+                self._load = (times[0] - self._last_times[0]) / (times[1] - self._last_times[1])
+            self._last_times = times
+        self._last_time = now
+        return self._load
+
+
+class AdaptiveStreamController:
+    """
+    Feedback controller for remote control streaming. After every frame it
+    is fed the outgoing backlog, bytes sent, capture/encode time and CPU load,
+    and it adjusts FPS, JPEG quality and the downscale factor:
+
+    - congestion (a frame still queued when the next one is due) decreases
+      quality first, then resolution, then FPS;
+    - the send throughput measured while congested keeps recovery from
+      stepping straight back into congestion;
+    - capture + encode time and CPU load cap the FPS directly;
+    - after RECOVERY_FRAMES healthy frames the settings step back up in the
+      reverse order, never beyond the preset ceiling;
+    - the viewer's viewport bounds the scale, since pixels beyond what the
+      viewer displays are wasted bandwidth.
+    """
+
+    def __init__(self, preset=DEFAULT_PRESET, adaptive=True):
+        self.adaptive = adaptive
+        self.screen_size = None
+        self.viewport = None
+        self._throughput = None
+        self._frame_bytes = None
+        self._processing = None
+        self._last_sent_bytes = None
+        self._last_sample_time = None
+        self._healthy_frames = 0
+        self._cooldown = 0
+        self.set_preset(preset)
+
+    def set_preset(self, preset):
+        if preset not in PRESETS:
+            raise ValueError(f"Unknown quality preset '{preset}'. Use one of: {', '.join(PRESETS)}.")
+        self.preset = preset
+        self.ceiling = dict(PRESETS[preset])
+        self.fps = self.ceiling["fps"]
+        self.quality = self.ceiling["quality"]
+        self.scale = self.ceiling["scale"]
+        self._healthy_frames = 0
+
+    def set_viewport(self, width, height):
+        """Records the viewer's displayed size in device pixels."""
+        self.viewport = (int(width), int(height)) if width and height else None
+        self.scale = min(self.scale, self.max_scale())
+
+    def set_screen_size(self, width, height):
+        if self.screen_size != (width, height):
+            self.screen_size = (width, height)
+            self.scale = min(self.scale, self.max_scale())
+
+    def max_scale(self):
+        scale = self.ceiling["scale"]
+        if self.viewport and self.screen_size:
+            fit = min(self.viewport[0] / self.screen_size[0], self.viewport[1] / self.screen_size[1])
+            scale = min(scale, max(fit, MIN_SCALE))
+        return scale
+
+    @property
+    def frame_interval(self):
+        return 1.0 / self.fps
+
+    def update(self, pending_frames, sent_bytes, frame_bytes, processing_seconds, cpu_load=None):
+        """
+        Feeds one frame's measurements into the controller.
+
+        pending_frames: frames still queued in the outgoing scheduler
+        sent_bytes: cumulative frame bytes written to the socket
+        frame_bytes: size of the frame just produced (0 if it was skipped)
+        processing_seconds: capture + encode time of the frame just produced
+        cpu_load: recent CPU usage from CpuLoadMeter (0..1), or None if unknown
+        """
+        now = time.monotonic()
+        if self._last_sent_bytes is not None and pending_frames and now > self._last_sample_time:
+            # The link's capacity is only observable while frames are backed up.
+            rate = (sent_bytes - self._last_sent_bytes) / (now - self._last_sample_time)
+            self._throughput = _ema(self._throughput, rate)
+        self._last_sent_bytes = sent_bytes
+        self._last_sample_time = now
+        if frame_bytes:
+            self._frame_bytes = _ema(self._frame_bytes, frame_bytes)
+        if processing_seconds:
+            self._processing = _ema(self._processing, processing_seconds)
+
+        if not self.adaptive:
+            return
+
+        # A frame still queued a full interval after it was produced means the link cannot keep up.
+        congested = pending_frames > 0
+        cpu_bound = cpu_load is not None and cpu_load > CPU_HIGH_WATERMARK
+
+        if self._cooldown:
+            self._cooldown -= 1
+        if congested:
+            self._healthy_frames = 0
+            if not self._cooldown:
+                self._cooldown = DEGRADE_COOLDOWN_FRAMES
+                self._degrade()
+        elif cpu_bound:
+            self._healthy_frames = 0
+            if not self._cooldown:
+                self._cooldown = DEGRADE_COOLDOWN_FRAMES
+                self.fps = max(MIN_FPS, int(self.fps * FPS_FACTOR))
+        else:
+            self._healthy_frames += 1
+            if self._healthy_frames >= RECOVERY_FRAMES:
+                self._healthy_frames = 0
+                self._recover()
+
+        # Never schedule frames faster than capture + encode can produce them.
+        if self._processing:
+            processing_cap = max(MIN_FPS, int(PROCESSING_BUDGET / self._processing))
+            self.fps = min(self.fps, processing_cap)
+
+    def _degrade(self):
+        if self.quality > MIN_QUALITY:
+            self.quality = max(MIN_QUALITY, self.quality - QUALITY_STEP)
+        elif self.scale > MIN_SCALE:
+            self.scale = max(MIN_SCALE, round(self.scale * SCALE_FACTOR, 3))
+        else:
+            self.fps = max(MIN_FPS, int(self.fps * FPS_FACTOR))
+        log.debug(f"[Stream] Congestion: fps={self.fps}, quality={self.quality}, scale={self.scale}")
+
+    def _recover(self):
+        demand = (self._frame_bytes or 0) * self.fps
+        if self._throughput is not None and demand > self._throughput * THROUGHPUT_HEADROOM:
+            # The last measured capacity says a step up would congest again. Forget the
+            # estimate so the next recovery round probes the link instead of waiting forever.
+            self._throughput = None
+            return
+        if self.fps < self.ceiling["fps"]:
+            self.fps = min(self.ceiling["fps"], self.fps + 1)
+        elif self.scale < self.max_scale():
+            self.scale = min(self.max_scale(), round(self.scale / SCALE_FACTOR, 3))
+        elif self.quality < self.ceiling["quality"]:
+            self.quality = min(self.ceiling["quality"], self.quality + QUALITY_STEP // 2)
+
+    def snapshot(self):
+        """Current settings and measurements, for status responses and logging."""
+        return {
+            "preset": self.preset,
+            "adaptive": self.adaptive,
+            "fps": self.fps,
+            "quality": self.quality,
+            "scale": self.scale,
+            "viewport": list(self.viewport) if self.viewport else None,
+            "throughputBytesPerSec": round(self._throughput) if self._throughput is not None else None,
+            "avgFrameBytes": round(self._frame_bytes) if self._frame_bytes is not None else None,
+            "avgProcessingMs": round(self._processing * 1000, 1) if self._processing is not None else None,
+        }
@@ -0,0 +1,292 @@
+# File: commands/stream_pipeline.py
+
+import os
+import time
+import threading
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+from .encoders import get_encoder, prepare_image
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ENCODE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def encode_shared_frame(shm_name, width, height, rects, options):
+    """
+    Process pool worker: encodes the given rectangles of an RGB frame stored
+    in a shared memory block. Only the block name, geometry and encoder
+    options (format, quality, subsampling, grayscale) are pickled. Pillow
+    cannot map a packed RGB buffer, so the frame is copied out of the block
+    once (a memcpy, instead of pickling it through a pipe) and the block is
+    closed before encoding.
+    """
+    encoder = get_encoder(options.get("format", "jpeg"))
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        pixels = shm.buf[:width * height * 3]
+        try:
+            image = Image.frombuffer("RGB", (width, height), pixels, "raw", "RGB", 0, 1)
+        finally:
+            pixels.release()
+    finally:
+        shm.close()
+    encoded = []
+    for x, y, w, h in rects:
+        region = image if (w, h) == (width, height) else image.crop((x, y, x + w, y + h))
+        region = prepare_image(region, grayscale=options.get("grayscale", False))
+        encoded.append(encoder.encode(region, quality=options.get("quality"), subsampling=options.get("subsampling")))
+    return encoded
+
+
+class FrameJob:
+    """A captured frame travelling through the pipeline."""
+    __slots__ = ("frame_id", "block", "width", "height", "rects", "keyframe", "options", "captured_at", "capture_seconds")
+
+    def __init__(self, frame_id, block, width, height, rects, keyframe, options, captured_at, capture_seconds):
+        self.frame_id = frame_id
+        self.block = block
+        self.width = width
+        self.height = height
+        self.rects = rects
+        self.keyframe = keyframe
+        self.options = options
+        self.captured_at = captured_at
+        self.capture_seconds = capture_seconds
+
+
+class FrameSlot:
+    """
+    Single-entry hand-off between two stages. put() replaces a job that has not
+    been taken yet and returns it, so the producer can release its buffer; the
+    consumer therefore always gets the most recent frame.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._job = None
+        self._closed = False
+
+    def put(self, job):
+        with self._cond:
+            stale, self._job = self._job, job
+            self._cond.notify()
+            return stale
+
+    def is_empty(self):
+        with self._cond:
+            return self._job is None
+
+    def take(self, timeout=None):
+        with self._cond:
+            if self._job is None and not self._closed:
+                self._cond.wait(timeout)
+            job, self._job = self._job, None
+            return job
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class SharedFrameRing:
+    """
+    Fixed set of shared memory blocks holding captured frames while they are
+    encoded. Blocks are reused between frames and only reallocated when the
+    frame size grows.
+    """
+
+    def __init__(self, count):
+        self._cond = threading.Condition()
+        self._free = [None] * count
+        self._all = []
+
+    def acquire(self, nbytes, timeout=None):
+        with self._cond:
+            if not self._free and not self._cond.wait_for(lambda: self._free, timeout):
+                return None
+            block = self._free.pop()
+            if block is None or block.size < nbytes:
+                if block is not None:
+                    self._all.remove(block)
+                    self._destroy(block)
+                block = shared_memory.SharedMemory(create=True, size=nbytes)
+                self._all.append(block)
+            return block
+
+    def release(self, block):
+        with self._cond:
+            self._free.append(block)
+            self._cond.notify()
+
+    @staticmethod
+    def _destroy(block):
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        with self._cond:
+            for block in self._all:
+                self._destroy(block)
+            self._all.clear()
+            self._free.clear()
+
+
+class StreamPipeline:
+    """
+    Runs remote control streaming as three overlapping stages:
+
+    capture  grabs and (in delta mode) diffs the screen, copies the pixels into
+             a shared memory block and hands the job to the encode stage;
+    encode   submits jobs to a process pool (image encoding runs on other cores,
+             outside the GIL) with a bounded number in flight;
+    send     collects results in frame order and queues the messages.
+
+    Hand-offs are bounded: a full frame waiting for the encoder is replaced by
+    a newer one, and delta frames are only captured once the encoder and the
+    outgoing queue have room, so the viewer never receives stale frames.
+    Sustained FPS is limited by the slowest stage rather than their sum.
+
+    The owner supplies callbacks:
+    before_capture(slot_empty) -> bool  called every interval; False skips the capture
+    capture_frame() -> (image, rects, keyframe)  rects is [] when nothing changed
+    get_encode_options() -> dict  encoder options (format, quality, ...) for the frame being captured
+    send_frame(job, encoded) -> int  queues the encoded frame, returns its size
+    on_frame_done(frame_bytes, stage_seconds, failed)  called after each frame is sent
+    """
+
+    def __init__(self, before_capture, capture_frame, get_encode_options, send_frame, on_frame_done, is_running,
+                 encode_workers=DEFAULT_ENCODE_WORKERS):
+        self.before_capture = before_capture
+        self.capture_frame = capture_frame
+        self.get_encode_options = get_encode_options
+        self.send_frame = send_frame
+        self.on_frame_done = on_frame_done
+        self.is_running = is_running
+        self.max_in_flight = max(1, encode_workers)
+
+        self._slot = FrameSlot()
+        # One block per in-flight encode, one waiting in the slot, one being filled by capture.
+        self._ring = SharedFrameRing(self.max_in_flight + 2)
+        self._in_flight = deque()
+        self._in_flight_cond = threading.Condition()
+        self._frame_id = 0
+        self.stage_seconds = {"capture": 0.0, "encode": 0.0, "send": 0.0}
+        self.frames_dropped = 0
+        self._executor = self._create_executor(encode_workers)
+
+    @staticmethod
+    def _create_executor(workers):
+        if workers > 0:
+            try:
+                # Workers are spawned, not forked: forking the multithreaded client could copy
+                # locks held by other threads (WebSocket, X11, logging) into the child.
+                return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            except (OSError, NotImplementedError, ImportError) as e:
+                log.warning(f"[Stream] Process pool unavailable ({e}); encoding on a thread instead.")
+        return ThreadPoolExecutor(max_workers=1)
+
+    def run(self, frame_interval):
+        """Runs the pipeline until is_running() returns False. frame_interval is a callable."""
+        encode_thread = threading.Thread(target=self._encode_stage, daemon=True)
+        send_thread = threading.Thread(target=self._send_stage, daemon=True)
+        encode_thread.start()
+        send_thread.start()
+        try:
+            self._capture_stage(frame_interval)
+        finally:
+            self._slot.close()
+            with self._in_flight_cond:
+                self._in_flight_cond.notify_all()
+            encode_thread.join(timeout=5)
+            send_thread.join(timeout=5)
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._ring.close()
+
+    def _capture_stage(self, frame_interval):
+        while self.is_running():
+            started = time.monotonic()
+            job = None
+            if self.before_capture(self._slot.is_empty()):
+                job = self._capture(started)
+            if job is not None:
+                stale = self._slot.put(job)
+                if stale is not None:
+                    self.frames_dropped += 1
+                    self._ring.release(stale.block)
+            time.sleep(max(0.0, frame_interval() - (time.monotonic() - started)))
+
+    def _capture(self, started):
+        image, rects, keyframe = self.capture_frame()
+        if image is None or not rects:
+            return None
+        pixels = np.asarray(image)
+        block = self._ring.acquire(pixels.nbytes, timeout=1)
+        if block is None:
+            # The diff reference already moved on, so the owner must resynchronise.
+            self.on_frame_done(0, 0.0, True)
+            return None
+        target = np.ndarray(pixels.shape, dtype=np.uint8, buffer=block.buf)
+        target[...] = pixels
+        del target
+        self._frame_id += 1
+        capture_seconds = time.monotonic() - started
+        self.stage_seconds["capture"] = capture_seconds
+        return FrameJob(self._frame_id, block, image.width, image.height, rects, keyframe,
+                        self.get_encode_options(), started, capture_seconds)
+
+    def _encode_stage(self):
+        while self.is_running():
+            job = self._slot.take(timeout=0.5)
+            if job is None:
+                continue
+            with self._in_flight_cond:
+                while len(self._in_flight) >= self.max_in_flight and self.is_running():
+                    self._in_flight_cond.wait(0.5)
+                if not self.is_running():
+                    self._ring.release(job.block)
+                    return
+                future = self._executor.submit(
+                    encode_shared_frame, job.block.name, job.width, job.height, job.rects, job.options
+                )
+                self._in_flight.append((job, future, time.monotonic()))
+                self._in_flight_cond.notify_all()
+
+    def _send_stage(self):
+        while True:
+            with self._in_flight_cond:
+                while not self._in_flight and self.is_running():
+                    self._in_flight_cond.wait(0.5)
+                if not self._in_flight:
+                    return
+                job, future, submitted = self._in_flight[0]
+            try:
+                encoded = future.result()
+                encode_seconds = time.monotonic() - submitted
+            except Exception as e:
+                log.error(f"[Stream] Encoding frame {job.frame_id} failed: {e}")
+                encoded = None
+                encode_seconds = 0.0
+            finally:
+                with self._in_flight_cond:
+                    self._in_flight.popleft()
+                    self._in_flight_cond.notify_all()
+                self._ring.release(job.block)
+
+            sent_started = time.monotonic()
+            frame_bytes = self.send_frame(job, encoded) if encoded else 0
+            self.stage_seconds["encode"] = encode_seconds / self.max_in_flight
+            self.stage_seconds["send"] = time.monotonic() - sent_started
+            # The pipeline runs as fast as its slowest stage.
+            self.on_frame_done(frame_bytes, max(self.stage_seconds.values()), encoded is None)
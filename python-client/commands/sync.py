@@ -0,0 +1,280 @@
+# File: commands/sync.py
+
+import os
+import mmap
+import struct
+import hashlib
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Delta format shared with the orchestrator (Qsome/DeltaSync.java). Big-endian records after the magic:
+#   'F' path size mtimeMs blockSize   start of a file; its content follows as C/D records
+#   'C' blockIndex count              copy blocks of the destination's current version of the file
+#   'D' length bytes                  literal data
+#   'E' sha256                        end of file, with the digest of the result
+#   'X' path                          delete path
+#   'Z'                               end of delta
+DELTA_MAGIC = b"RPADELTA1\n"
+DEFAULT_BLOCK_SIZE = 64 * 1024
+MAX_LITERAL = 1024 * 1024
+# Rolling checksums are computed this many offsets at a time to bound memory on large files.
+SCAN_SEGMENT = 1024 * 1024
+SYNC_DIR_NAME = ".sync"
+
+
+def scan_directory(root):
+    """Returns {relative posix path: [size, mtime in ms]} for the files under root."""
+    manifest = {}
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if d != SYNC_DIR_NAME]
+        for name in files:
+            path = os.path.join(directory, name)
+            st = os.stat(path)
+            manifest[os.path.relpath(path, root).replace(os.sep, "/")] = [st.st_size, st.st_mtime_ns // 1_000_000]
+    return manifest
+
+
+def changed_paths(source, destination):
+    """Paths of the source manifest that are missing from the destination or differ in size or mtime."""
+    return [path for path, entry in source.items() if list(destination.get(path) or []) != list(entry)]
+
+
+def resolve_relative(root, relpath):
+    """Joins a manifest path to root, refusing paths that would escape it."""
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, *relpath.split("/")))
+    if os.path.commonpath([root, path]) != root or path == root:
+        raise ValueError(f"Path '{relpath}' is outside the sync directory.")
+    return path
+
+
+def strong_hash(data):
+    return hashlib.md5(data).hexdigest()[:16]
+
+
+def weak_hash(block):
+    """rsync-style checksum: a = sum of bytes, b = sum of (L - i) * byte_i, both mod 2^16."""
+    values = np.frombuffer(block, dtype=np.uint8).astype(np.int64)
+    a = int(values.sum()) & 0xFFFF
+    b = int(((len(values) - np.arange(len(values))) * values).sum()) & 0xFFFF
+    return a | (b << 16)
+
+
+def _weak_hashes(data, start, end, block_size):
+    """Weak checksums of every block-sized window starting at offsets start..end-1."""
+    window = np.frombuffer(data[start:end + block_size - 1], dtype=np.uint8).astype(np.int64)
+    sums = np.concatenate(([0], np.cumsum(window)))
+    weighted = np.concatenate(([0], np.cumsum(window * np.arange(len(window)))))
+    i = np.arange(end - start)
+    a = sums[i + block_size] - sums[i]
+    b = (block_size + i) * a - (weighted[i + block_size] - weighted[i])
+    return (a & 0xFFFF) | ((b & 0xFFFF) << 16)
+
+
+def block_signatures(path, block_size=DEFAULT_BLOCK_SIZE):
+    """[[weak, strong], ...] for each full block of the file; a short last block cannot be matched and is left out."""
+    signatures = []
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if len(block) < block_size:
+                break
+            signatures.append([weak_hash(block), strong_hash(block)])
+    return signatures
+
+
+class DeltaWriter:
+    """Writes delta records to a binary file object."""
+
+    def __init__(self, out):
+        self.out = out
+        self.literal_bytes = 0
+        self.copied_blocks = 0
+        out.write(DELTA_MAGIC)
+
+    @staticmethod
+    def _path(path):
+        encoded = path.encode("utf-8")
+        return struct.pack(">I", len(encoded)) + encoded
+
+    def begin_file(self, path, size, mtime_ms, block_size):
+        self.out.write(b"F" + self._path(path) + struct.pack(">QQI", size, mtime_ms, block_size))
+
+    def copy(self, block_index, count):
+        self.out.write(b"C" + struct.pack(">II", block_index, count))
+        self.copied_blocks += count
+
+    def literal(self, data):
+        for start in range(0, len(data), MAX_LITERAL):
+            piece = data[start:start + MAX_LITERAL]
+            self.out.write(b"D" + struct.pack(">I", len(piece)))
+            self.out.write(piece)
+            self.literal_bytes += len(piece)
+
+    def end_file(self, sha256_hex):
+        self.out.write(b"E" + bytes.fromhex(sha256_hex))
+
+    def delete(self, path):
+        self.out.write(b"X" + self._path(path))
+
+    def finish(self):
+        self.out.write(b"Z")
+
+
+def write_file_delta(writer, relpath, source_path, mtime_ms, signatures=None, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Appends the delta that turns the destination's version of a file (described
+    by its block signatures; None for a new file) into source_path. Unchanged
+    blocks are found at any offset with the rolling checksum and sent as copies.
+    """
+    size = os.path.getsize(source_path)
+    writer.begin_file(relpath, size, mtime_ms, block_size)
+    hasher = hashlib.sha256()
+    with open(source_path, "rb") as f:
+        if size == 0:
+            writer.end_file(hasher.hexdigest())
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            pending = None # [first block, count] of a run of copies not yet written
+
+            def flush_copies():
+                nonlocal pending
+                if pending:
+                    writer.copy(*pending)
+                    pending = None
+
+            def emit_literal(start, end):
+                if end > start:
+                    flush_copies()
+                for piece in range(start, end, MAX_LITERAL):
+                    writer.literal(data[piece:min(piece + MAX_LITERAL, end)])
+
+            pos = 0
+            if signatures and size >= block_size:
+                blocks = {}
+                for index, (weak, strong) in enumerate(signatures):
+                    blocks.setdefault(weak, []).append((index, strong))
+                keys = np.fromiter(blocks.keys(), dtype=np.int64)
+                last_offset = size - block_size + 1
+                for start in range(0, last_offset, SCAN_SEGMENT):
+                    end = min(start + SCAN_SEGMENT, last_offset)
+                    weak = _weak_hashes(data, start, end, block_size)
+                    for offset in np.nonzero(np.isin(weak, keys))[0] + start:
+                        offset = int(offset)
+                        if offset < pos:
+                            continue
+                        strong = strong_hash(data[offset:offset + block_size])
+                        index = next((i for i, s in blocks[int(weak[offset - start])] if s == strong), None)
+                        if index is None:
+                            continue
+                        emit_literal(pos, offset)
+                        if pending and pending[0] + pending[1] == index:
+                            pending[1] += 1
+                        else:
+                            flush_copies()
+                            pending = [index, 1]
+                        pos = offset + block_size
+            emit_literal(pos, size)
+            flush_copies()
+            for start in range(0, size, MAX_LITERAL):
+                hasher.update(data[start:start + MAX_LITERAL])
+    writer.end_file(hasher.hexdigest())
+
+
+class _Reader:
+    def __init__(self, f):
+        self.f = f
+
+    def exact(self, n):
+        data = self.f.read(n)
+        if len(data) != n:
+            raise ValueError("Delta is truncated.")
+        return data
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.exact(struct.calcsize(fmt)))
+
+    def path(self):
+        (length,) = self.unpack(">I")
+        return self.exact(length).decode("utf-8")
+
+
+def apply_delta(delta_path, root):
+    """
+    Applies a delta to the directory root. Every file is first written to a
+    temporary file beside its destination and checked against its SHA-256;
+    only when the whole delta has been staged are the files renamed into
+    place and deletions made, so a bad or truncated delta changes nothing.
+    Returns counts of updated and deleted files.
+    """
+    staged = [] # (temp path, final path, mtime ms)
+    deletions = []
+    try:
+        with open(delta_path, "rb") as f:
+            reader = _Reader(f)
+            if reader.exact(len(DELTA_MAGIC)) != DELTA_MAGIC:
+                raise ValueError("Not a sync delta.")
+            while True:
+                record = reader.exact(1)
+                if record == b"Z":
+                    break
+                if record == b"X":
+                    deletions.append(resolve_relative(root, reader.path()))
+                    continue
+                if record != b"F":
+                    raise ValueError(f"Unexpected delta record {record!r}.")
+                relpath = reader.path()
+                size, mtime_ms, block_size = reader.unpack(">QQI")
+                target = resolve_relative(root, relpath)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temp = os.path.join(os.path.dirname(target), f".{os.path.basename(target)}.sync")
+                staged.append((temp, target, mtime_ms))
+                hasher = hashlib.sha256()
+                basis = open(target, "rb") if os.path.isfile(target) else None
+                try:
+                    with open(temp, "wb") as out:
+                        while True:
+                            record = reader.exact(1)
+                            if record == b"C":
+                                index, count = reader.unpack(">II")
+                                if basis is None:
+                                    raise ValueError(f"Delta copies blocks of '{relpath}', which does not exist.")
+                                basis.seek(index * block_size)
+                                for _ in range(count):
+                                    block = basis.read(block_size)
+                                    if len(block) != block_size:
+                                        raise ValueError(f"'{relpath}' changed since its signatures were taken.")
+                                    out.write(block)
+                                    hasher.update(block)
+                            elif record == b"D":
+                                (length,) = reader.unpack(">I")
+                                data = reader.exact(length)
+                                out.write(data)
+                                hasher.update(data)
+                            elif record == b"E":
+                                if reader.exact(32) != hasher.digest():
+                                    raise ValueError(f"SHA-256 mismatch for '{relpath}'.")
+                                break
+                            else:
+                                raise ValueError(f"Unexpected delta record {record!r} in '{relpath}'.")
+                        if out.tell() != size:
+                            raise ValueError(f"'{relpath}' is {out.tell()} bytes, expected {size}.")
+                finally:
+                    if basis:
+                        basis.close()
+    except BaseException:
+        for temp, _, _ in staged:
+            if os.path.exists(temp):
+                os.remove(temp)
+        raise
+
+    for temp, target, mtime_ms in staged:
+        os.utime(temp, ns=(mtime_ms * 1_000_000, mtime_ms * 1_000_000))
+        os.replace(temp, target)
+    for path in deletions:
+        if os.path.isfile(path):
+            os.remove(path)
+    return {"updated": len(staged), "deleted": len(deletions)}
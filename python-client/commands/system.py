@@ -4,7 +4,9 @@ import time
 import os
 import base64
 import io
+import hashlib
 import subprocess
+import threading
 import logging
 import pyautogui  
 import uuid  
@@ -12,8 +14,33 @@ import webbrowser
 import requests
 import traceback
 from .utils import normalize_path  
+from .capture import get_screen_capture, image_content_hash
+from .processes import (get_process_registry, ManagedProcess, STREAM_NAMES, KILL_GRACE_SECONDS, spool_directory,
+                        terminate_process, complete_utf8)
+from .transfers import get_transfer_manager, resolve_destination, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE, DEFAULT_WINDOW
+from .blob_store import get_blob_store, is_sha256, MATERIALIZE_MODES
+from .downloads import Download, DEFAULT_CONNECTIONS
+from .http_session import DEFAULT_TIMEOUT
+from .archive import select_files, ArchiveStream, ResumableStream
+from .sync import (scan_directory, changed_paths, resolve_relative, block_signatures, DeltaWriter,
+                   write_file_delta, apply_delta, DEFAULT_BLOCK_SIZE, SYNC_DIR_NAME)
+from .encoders import encode_image, prepare_image
+from .stream_controller import PRESETS as STREAM_PRESETS
 log = logging.getLogger(__name__)
 
+# Interim "progress" responses of long-running commands are sent at most this often.
+PROGRESS_INTERVAL_SECONDS = 1.0
+# Deltas built by sync_pull are kept (so their download can resume) until they are this old.
+SYNC_DELTA_MAX_AGE_SECONDS = 24 * 3600
+# Most output text per stream in one streamed run_shell_command push; the rest follows in later pushes.
+STREAM_PUSH_MAX_BYTES = 64 * 1024
+# After a streamed command exits, output still in its pipes is collected for up to this long.
+OUTPUT_DRAIN_SECONDS = 2
+DEFAULT_READ_OUTPUT_BYTES = 64 * 1024
+MAX_READ_OUTPUT_BYTES = 1024 * 1024
+MAX_READ_OUTPUT_WAIT_SECONDS = 30
+MAX_KILL_GRACE_SECONDS = 30
+
 class SystemCommands:
     def __init__(self, node_client_ref=None):
         self.node_client = node_client_ref
@@ -62,23 +89,78 @@ class SystemCommands:
             }
 
     def screenshot(self, params):
+        """
+        Captures the screen, or a region of it, and returns the encoded image inline in the response.
+        Every response carries 'contentHash', a hash of the captured pixels after scale/grayscale.
+        If 'if_none_match' equals the current hash, nothing is encoded and a small
+        {"unchanged": true} response is returned instead. Set 'inline' to false to send the
+        image as an image_frame message (used by the remote control viewer) instead.
+        """
         request_id = params.get('requestId')
-        log.info(f"[System] Capturing screenshot. RequestId: {request_id}")
+        region = params.get("region") # Optional [left, top, width, height] relative to the monitor
+        monitor = params.get("monitor") # Optional monitor index: 0 = all monitors, 1..N = single monitor
+        image_format = params.get("format", "jpeg") # 'jpeg', 'png' (lossless) or 'webp'
+        quality = params.get("quality") # 1-100, or a stream preset name ('low', 'medium', 'high')
+        if_none_match = params.get("if_none_match") # contentHash of the image the caller already has
+        inline = params.get("inline", True)
+        log.info(f"[System] Capturing screenshot (region={region}, monitor={monitor}, format={image_format}). RequestId: {request_id}")
         try:
-            # Capture the screenshot into an in-memory bytes buffer
-            screenshot_buffer = io.BytesIO()
-            pyautogui.screenshot().save(screenshot_buffer, format='JPEG') # Use JPEG for better performance
-            image_bytes = screenshot_buffer.getvalue()
+            if isinstance(quality, str):
+                if quality not in STREAM_PRESETS:
+                    raise ValueError(f"quality must be 1-100 or one of: {', '.join(STREAM_PRESETS)}.")
+                quality = STREAM_PRESETS[quality]["quality"]
+            image = get_screen_capture().grab(region=region, monitor=monitor)
+            image = prepare_image(image, scale=params.get("scale"), grayscale=params.get("grayscale", False))
+            content_hash = image_content_hash(image)
+
+            if if_none_match and if_none_match == content_hash:
+                log.info(f"[System] Screenshot unchanged (hash {content_hash}); skipping image transfer. RequestId: {request_id}")
+                return {
+                    "status": "success",
+                    "action": "screenshot",
+                    "unchanged": True,
+                    "contentHash": content_hash,
+                    "requestId": request_id
+                }
+
+            image_bytes, mime_type, (width, height) = encode_image(
+                image,
+                image_format=image_format,
+                quality=quality,
+                subsampling=params.get("subsampling"), # '4:4:4', '4:2:2' or '4:2:0' (JPEG only)
+                backend=params.get("encoder") # Optional explicit encoder backend, e.g. 'pillow-jpeg'
+            )
+
+            if inline:
+                log.info(f"[System] Screenshot captured ({len(image_bytes)} bytes), returning inline. RequestId: {request_id}")
+                return {
+                    "status": "success",
+                    "action": "screenshot",
+                    "unchanged": False,
+                    "contentHash": content_hash,
+                    "mimeType": mime_type,
+                    "width": width,
+                    "height": height,
+                    "size": len(image_bytes),
+                    "image_base64": base64.b64encode(image_bytes).decode('utf-8'),
+                    "requestId": request_id
+                }
 
             # Use the dedicated send_image_frame method from NodeClient.
             # This ensures images are always encoded and sent the same way.
             if self.node_client and hasattr(self.node_client, 'send_image_frame'):
-                self.node_client.send_image_frame(image_bytes)
+                self.node_client.send_image_frame(image_bytes, mime_type=mime_type)
                 log.info(f"[System] Screenshot captured and sent as image_frame. RequestId: {request_id}")
                 return {
                     "status": "success",
                     "action": "screenshot",
                     "message": "Screenshot captured and sent.",
+                    "unchanged": False,
+                    "contentHash": content_hash,
+                    "mimeType": mime_type,
+                    "width": width,
+                    "height": height,
+                    "size": len(image_bytes),
                     "requestId": request_id
                 }
             else:
@@ -104,11 +186,14 @@ class SystemCommands:
         log.info(f"[System] Getting screen size. RequestId: {request_id}")
         try:
             width, height = pyautogui.size()
+            capture = get_screen_capture()
             return {
                 "status": "success",
                 "action": "get_screen_size",
                 "width": width,
                 "height": height,
+                "monitors": capture.monitors(), # Index 0 is the bounding box of all monitors
+                "captureBackend": capture.backend_name,
                 "requestId": request_id
             }
         except Exception as e:
@@ -210,6 +295,14 @@ class SystemCommands:
             }
 
     def download_file(self, params):
+        """
+        Downloads 'url' to 'destinationPath' through the shared connection pool
+        (see downloads.Download): over up to 'connections' parallel ranged
+        requests when the server supports them, resuming a previous partial
+        download, and checking 'sha256' if given. Optional 'headers' and
+        'timeout' (read timeout in seconds). While it runs, "progress"
+        responses with downloaded and total bytes are sent for the request.
+        """
         request_id = params.get('requestId')
         self._normalize_param_path(params, "destinationPath")
         url = params.get("url")
@@ -219,21 +312,28 @@ class SystemCommands:
             if not (url and destination_path):
                 raise ValueError("URL or destinationPath parameter is missing.")
 
-            response = requests.get(url, stream=True)
-            response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-            
-            os.makedirs(os.path.dirname(destination_path), exist_ok=True)
-            with open(destination_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            return {
-                "status": "success",
-                "action": "download_file",
-                "url": url,
-                "destinationPath": destination_path,
-                "requestId": request_id
-            }
+            started = time.monotonic()
+            download = Download(
+                url, destination_path,
+                connections=params.get("connections", DEFAULT_CONNECTIONS),
+                sha256=params.get("sha256"),
+                headers=params.get("headers"),
+                timeout=(DEFAULT_TIMEOUT[0], params.get("timeout", DEFAULT_TIMEOUT[1])),
+                progress=self._progress_reporter(request_id, "download_file", started)
+            )
+            result = download.run()
+            elapsed = time.monotonic() - started
+            log.info(f"[System] Downloaded {result['size']} bytes from {url} in {elapsed:.1f}s "
+                     f"({result['segments']} connections, {result['resumedBytes']} bytes resumed). RequestId: {request_id}")
+            return dict(
+                result,
+                status="success",
+                action="download_file",
+                url=url,
+                destinationPath=destination_path,
+                seconds=round(elapsed, 3),
+                requestId=request_id
+            )
         except requests.exceptions.RequestException as e:
             log.error(f"[System] download_file HTTP error for Req ID: {request_id}: {e}", exc_info=True)
             return {
@@ -253,10 +353,59 @@ class SystemCommands:
                 "requestId": request_id
             }
 
+    def _progress_reporter(self, request_id, action, started):
+        """
+        Returns a progress(done, total) callback that sends an interim "progress"
+        node_response for request_id, at most every PROGRESS_INTERVAL_SECONDS.
+        The orchestrator's poll sees it as a non-final status until the result replaces it.
+        """
+        if not self._can_send_progress():
+            return None
+        lock = threading.Lock()
+        last = [0.0]
+
+        def report(done, total):
+            now = time.monotonic()
+            with lock:
+                if now - last[0] < PROGRESS_INTERVAL_SECONDS:
+                    return
+                last[0] = now
+            self._send_progress(request_id, {
+                "action": action,
+                "done": done,
+                "total": total,
+                "bytesPerSecond": int(done / max(now - started, 1e-6))
+            })
+        return report
+
+    def _can_send_progress(self):
+        return bool(self.node_client and hasattr(self.node_client, 'send_outgoing_ws_message'))
+
+    def _send_progress(self, request_id, payload):
+        """Sends an interim, non-final "progress" node_response for request_id."""
+        self.node_client.send_outgoing_ws_message({
+            "type": "node_response",
+            "response": {
+                "requestId": request_id,
+                "status": "progress",
+                "responsePayload": payload,
+                "node_id": getattr(self.node_client, "node_id", None),
+                "timestamp": time.time()
+            }
+        })
+
+    def _exceeds_outgoing_budget(self, file_size):
+        """True if a file_upload message carrying file_size bytes would not fit the outgoing byte budget."""
+        max_bytes = getattr(getattr(self.node_client, 'outgoing_ws_queue', None), 'max_bytes', None)
+        # Base64 adds a third; 4 KiB covers the rest of the message.
+        return max_bytes is not None and (file_size + 2) // 3 * 4 + 4096 > max_bytes
+
     def upload_file(self, params):
         """
         Uploads a file by sending its base64 encoded content via the WebSocket
         to the Relay Server. This replaces the HTTP POST upload mechanism.
+        A file too large for one message goes over the chunked transfer instead
+        (the response then carries a 'transferId', see _stream_file).
         """
         request_id = params.get('requestId')
         self._normalize_param_path(params, "filePath")
@@ -269,6 +418,8 @@ class SystemCommands:
                 raise FileNotFoundError(f"File not found: {file_path}")
             if not os.path.isfile(file_path):
                 raise ValueError(f"Path is not a file: {file_path}")
+            if self._exceeds_outgoing_budget(os.path.getsize(file_path)):
+                return self._stream_file(file_path, params, "upload_file")
 
             with open(file_path, 'rb') as f:
                 encoded_content = base64.b64encode(f.read()).decode('utf-8')
@@ -290,7 +441,8 @@ class SystemCommands:
             }
             
             if self.node_client and hasattr(self.node_client, 'outgoing_ws_queue'):
-                self.node_client.outgoing_ws_queue.put(file_upload_message)
+                if not self.node_client.outgoing_ws_queue.put(file_upload_message):
+                    raise ValueError(f"File '{filename}' ({file_size} bytes) exceeds the outgoing message budget.")
                 log.info(f"[System] File '{filename}' content queued for WebSocket upload. RequestId: {request_id}")
                 return {
                     "status": "success",
@@ -344,11 +496,13 @@ class SystemCommands:
             decoded_content = base64.b64decode(file_content_base64)
             with open(file_path, 'wb') as f:
                 f.write(decoded_content)
+            sha256 = self._cache_blob(file_path, hashlib.sha256(decoded_content).hexdigest())
             
             return {
                 "status": "success",
                 "action": "receive_file",
                 "saved_path": file_path,
+                "sha256": sha256,
                 "requestId": request_id
             }
         except Exception as e:
@@ -361,7 +515,242 @@ class SystemCommands:
                 "requestId": request_id
             }
 
+    def _cache_blob(self, file_path, sha256):
+        """Adds a received file to the blob store; a failure only costs a later re-send."""
+        try:
+            return get_blob_store(self.download_dir).add_file(file_path, sha256)
+        except Exception as e:
+            log.warning(f"[System] Could not cache '{file_path}' in the blob store: {e}")
+            return sha256
+
+    def has_blobs(self, params):
+        """
+        Reports which of 'hashes' (SHA-256 hex digests) are in the node's blob
+        store, i.e. can be placed with 'materialize' instead of being sent.
+        """
+        request_id = params.get('requestId')
+        hashes = params.get("hashes")
+        log.info(f"[System] Checking {len(hashes) if isinstance(hashes, list) else 0} blob hashes. RequestId: {request_id}")
+        try:
+            if not isinstance(hashes, list) or not all(is_sha256(h) for h in hashes):
+                raise ValueError("hashes must be a list of SHA-256 hex digests.")
+            store = get_blob_store(self.download_dir)
+            present = [h for h in hashes if store.has(h)]
+            return {
+                "status": "success",
+                "action": "has_blobs",
+                "present": present,
+                "missing": [h for h in hashes if h not in present],
+                "store": store.snapshot(),
+                "requestId": request_id
+            }
+        except Exception as e:
+            log.error(f"[System] has_blobs error for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "has_blobs",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
+
+    def materialize(self, params):
+        """
+        Places a cached blob ('sha256') at 'destination' (relative to the download
+        directory, like receive_file). 'mode': 'copy' (default) or 'link' (a hard
+        link; instant, but the file must not be edited in place). If the blob is
+        not cached the error carries 'blobMissing': true and the orchestrator
+        sends the file instead.
+        """
+        request_id = params.get('requestId')
+        sha256 = params.get("sha256")
+        destination = params.get("destination")
+        mode = params.get("mode", "copy")
+        log.info(f"[System] Materializing blob {sha256} at {destination} ({mode}). RequestId: {request_id}")
+        try:
+            if not is_sha256(sha256):
+                raise ValueError("sha256 must be a SHA-256 hex digest.")
+            if not destination:
+                raise ValueError("destination parameter is missing.")
+            if mode not in MATERIALIZE_MODES:
+                raise ValueError(f"mode must be one of: {', '.join(MATERIALIZE_MODES)}.")
+            # Confined like a pushed file: no '..', absolute paths or blob cache entries.
+            file_path = resolve_destination(self.download_dir, destination)
+            size = get_blob_store(self.download_dir).materialize(sha256, file_path, mode=mode)
+            return {
+                "status": "success",
+                "action": "materialize",
+                "saved_path": file_path,
+                "size": size,
+                "sha256": sha256.lower(),
+                "requestId": request_id
+            }
+        except KeyError:
+            return {
+                "status": "error",
+                "action": "materialize",
+                "blobMissing": True,
+                "sha256": sha256,
+                "message": f"Blob {sha256} is not cached on this node; send the file instead.",
+                "requestId": request_id
+            }
+        except Exception as e:
+            log.error(f"[System] materialize error for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "materialize",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
+
+    def _sync_error(self, action, request_id, e):
+        log.error(f"[System] {action} error for Req ID: {request_id}: {e}", exc_info=True)
+        return {
+            "status": "error",
+            "action": action,
+            "message": str(e) or "Unhandled exception",
+            "traceback": traceback.format_exc(),
+            "requestId": request_id
+        }
+
+    def sync_signatures(self, params):
+        """
+        First step of sync_push. Given the source's manifest ('files': {path:
+        [size, mtimeMs]}), returns block signatures of the node's versions of the
+        files that differ from it, so the orchestrator can send only changed
+        blocks. Also lists the node's files missing from the source ('extra').
+        """
+        request_id = params.get('requestId')
+        self._normalize_param_path(params, "directory")
+        directory = params.get("directory")
+        log.info(f"[System] Computing sync signatures for {directory}. RequestId: {request_id}")
+        try:
+            if not directory:
+                raise ValueError("directory parameter is missing.")
+            source = params.get("files") or {}
+            block_size = int(params.get("blockSize", DEFAULT_BLOCK_SIZE))
+            local = scan_directory(directory) if os.path.isdir(directory) else {}
+            changed = changed_paths(source, local)
+            return {
+                "status": "success",
+                "action": "sync_signatures",
+                "blockSize": block_size,
+                "changed": changed,
+                "signatures": {path: block_signatures(resolve_relative(directory, path), block_size) for path in changed if path in local},
+                "extra": [path for path in local if path not in source],
+                "unchanged": len(source) - len(changed),
+                "requestId": request_id
+            }
+        except Exception as e:
+            return self._sync_error("sync_signatures", request_id, e)
+
+    def sync_push(self, params):
+        """
+        Applies a delta pushed by the orchestrator ('delta': its path under the
+        download directory) to 'directory'. All files are staged and verified
+        before any is replaced (see sync.apply_delta). The delta is removed afterwards.
+        """
+        request_id = params.get('requestId')
+        self._normalize_param_path(params, "directory")
+        directory = params.get("directory")
+        delta = params.get("delta")
+        log.info(f"[System] Applying sync delta {delta} to {directory}. RequestId: {request_id}")
+        try:
+            if not (directory and delta):
+                raise ValueError("directory and delta parameters are required.")
+            delta_path = resolve_relative(self.download_dir, delta.replace(os.sep, "/"))
+            os.makedirs(directory, exist_ok=True)
+            try:
+                result = apply_delta(delta_path, directory)
+            finally:
+                if os.path.exists(delta_path):
+                    os.remove(delta_path)
+            return dict(result, status="success", action="sync_push", directory=directory, requestId=request_id)
+        except Exception as e:
+            return self._sync_error("sync_push", request_id, e)
+
+    def sync_pull(self, params):
+        """
+        Builds a delta that brings the orchestrator's copy ('files': its manifest)
+        up to date with 'directory' on the node, and returns its path for a
+        streaming get_file. Files the orchestrator already has in an older version
+        need their block 'signatures'; if any are missing the response lists them
+        in 'needSignatures' (with 'complete': false) and the call is repeated with
+        them. 'delete': true also removes the orchestrator's files the node lacks.
+        """
+        request_id = params.get('requestId')
+        self._normalize_param_path(params, "directory")
+        directory = params.get("directory")
+        log.info(f"[System] Building sync delta for {directory}. RequestId: {request_id}")
+        try:
+            if not directory or not os.path.isdir(directory):
+                raise ValueError(f"directory '{directory}' does not exist.")
+            remote = params.get("files") or {}
+            signatures = params.get("signatures") or {}
+            block_size = int(params.get("blockSize", DEFAULT_BLOCK_SIZE))
+            local = scan_directory(directory)
+            changed = changed_paths(local, remote)
+            need = [path for path in changed if path in remote and path not in signatures]
+            if need:
+                return {
+                    "status": "success",
+                    "action": "sync_pull",
+                    "complete": False,
+                    "needSignatures": need,
+                    "blockSize": block_size,
+                    "requestId": request_id
+                }
+
+            sync_dir = os.path.join(self.download_dir, SYNC_DIR_NAME)
+            os.makedirs(sync_dir, exist_ok=True)
+            self._prune_sync_deltas(sync_dir)
+            delta_path = os.path.join(sync_dir, f"{uuid.uuid4().hex}.delta")
+            deleted = [path for path in remote if path not in local] if params.get("delete") else []
+            with open(delta_path, "wb") as out:
+                writer = DeltaWriter(out)
+                for path in changed:
+                    write_file_delta(writer, path, resolve_relative(directory, path), local[path][1],
+                                     signatures.get(path), block_size)
+                for path in deleted:
+                    writer.delete(path)
+                writer.finish()
+            return {
+                "status": "success",
+                "action": "sync_pull",
+                "complete": True,
+                "deltaPath": delta_path,
+                "deltaSize": os.path.getsize(delta_path),
+                "changed": len(changed),
+                "deleted": len(deleted),
+                "unchanged": len(local) - len(changed),
+                "literalBytes": writer.literal_bytes,
+                "copiedBlocks": writer.copied_blocks,
+                "requestId": request_id
+            }
+        except Exception as e:
+            return self._sync_error("sync_pull", request_id, e)
+
+    @staticmethod
+    def _prune_sync_deltas(sync_dir):
+        cutoff = time.time() - SYNC_DELTA_MAX_AGE_SECONDS
+        for name in os.listdir(sync_dir):
+            path = os.path.join(sync_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
     def run_shell_command(self, params):
+        """
+        Runs a shell command and returns its exit code and output. With stream,
+        the command runs as a managed process: output is pushed while it runs
+        as interim "progress" responses (new stdout/stderr text with its byte
+        offset, at most every PROGRESS_INTERVAL_SECONDS), only the last
+        OUTPUT_TAIL_BYTES of each stream are returned at the end, and the whole
+        output stays readable with read_output(processId, offset).
+        """
         request_id = params.get('requestId')
         command = params.get("command")
         timeout = params.get("timeout", 60) # Add timeout for shell commands
@@ -370,6 +759,9 @@ class SystemCommands:
             if not command:
                 raise ValueError("command parameter is missing.")
 
+            if params.get("stream"):
+                return self._run_shell_command_streaming(command, timeout, params.get("cwd"), request_id)
+
             result = subprocess.run(
                 command, 
                 shell=True, 
@@ -419,6 +811,208 @@ class SystemCommands:
                 "requestId": request_id
             }
 
+    def _run_shell_command_streaming(self, command, timeout, cwd, request_id):
+        started = time.monotonic()
+        managed = ManagedProcess(command, spool_directory(self.download_dir), cwd=cwd)
+        process_id = get_process_registry().register(managed.process, command, output=managed)
+        sent = {name: 0 for name in STREAM_NAMES}
+        timed_out = False
+        while True:
+            remaining = started + timeout - time.monotonic()
+            try:
+                managed.process.wait(max(0, min(PROGRESS_INTERVAL_SECONDS, remaining)))
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if time.monotonic() - started >= timeout:
+                timed_out = True
+                terminate_process(managed.process)
+                break
+            if self._can_send_progress():
+                payload = {"action": "run_shell_command", "processId": process_id,
+                           "elapsedSeconds": round(time.monotonic() - started, 3)}
+                for name in STREAM_NAMES:
+                    offset, data = managed.read(name, sent[name], STREAM_PUSH_MAX_BYTES)
+                    data = data[:complete_utf8(data)]
+                    sent[name] = offset + len(data)
+                    payload[name] = {"offset": offset, "data": data.decode("utf-8", errors="replace")}
+                if payload["stdout"]["data"] or payload["stderr"]["data"]:
+                    self._send_progress(request_id, payload)
+        # Output still in the pipes (or held by processes the command left running) is collected briefly.
+        managed.join_readers(OUTPUT_DRAIN_SECONDS)
+
+        return_code = managed.process.returncode
+        result = {"action": "run_shell_command", "processId": process_id, "returnCode": return_code,
+                  "elapsedSeconds": round(time.monotonic() - started, 3), "requestId": request_id}
+        for name in STREAM_NAMES:
+            tail, size = managed.tail(name)
+            result[name] = tail.decode("utf-8", errors="replace")
+            result[f"{name}Bytes"] = size
+            result[f"{name}Truncated"] = size > len(tail)
+        if timed_out:
+            log.error(f"[System] Shell command timed out for Req ID: {request_id} after {timeout}s.")
+            return dict(result, status="error", message=f"Command timed out after {timeout} seconds.", timedOut=True)
+        if return_code != 0:
+            log.error(f"[System] Shell command failed for Req ID: {request_id} (Exit Code: {return_code}).")
+            return dict(result, status="error", message=f"Command failed with exit code {return_code}")
+        return dict(result, status="success")
+
+    def start_process(self, params):
+        """
+        Starts a background process and returns its processId at once; its
+        output is captured for read_output, and process_status / kill_process
+        follow it. A command string runs through the shell; a list is executed
+        directly.
+        Params: command (str or list), cwd (optional), env (optional dict, added to the node's
+        environment), description (optional).
+        """
+        request_id = params.get('requestId')
+        command = params.get("command")
+        log.info(f"[System] Starting background process: {command!r}. RequestId: {request_id}")
+        try:
+            if not command or not isinstance(command, (str, list)):
+                raise ValueError("command must be a non-empty string or list.")
+            env = params.get("env")
+            if env is not None and not isinstance(env, dict):
+                raise ValueError("env must be an object of variable names and values.")
+            managed = ManagedProcess(
+                command,
+                spool_directory(self.download_dir),
+                cwd=params.get("cwd"),
+                env={str(k): str(v) for k, v in env.items()} if env else None,
+                shell=isinstance(command, str)
+            )
+            description = params.get("description") or (command if isinstance(command, str) else subprocess.list2cmdline(command))
+            process_id = get_process_registry().register(managed.process, description, output=managed)
+            return {
+                "status": "success",
+                "action": "start_process",
+                "message": f"Process {process_id} started.",
+                "processId": process_id,
+                "requestId": request_id
+            }
+        except ValueError as e:
+            return {"status": "error", "action": "start_process", "message": str(e), "requestId": request_id}
+        except Exception as e:
+            log.error(f"[System] Failed to start process for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "start_process",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
+
+    def process_status(self, params):
+        """Status of one registered process (processId), or of all of them if processId is omitted."""
+        request_id = params.get('requestId')
+        registry = get_process_registry()
+        process_id = params.get("processId")
+        try:
+            if process_id is None:
+                processes = []
+                for pid in registry.process_ids():
+                    try:
+                        processes.append(registry.status(pid))
+                    except KeyError:
+                        pass # Pruned meanwhile
+                return {"status": "success", "action": "process_status", "processes": processes, "requestId": request_id}
+            return dict(registry.status(process_id), status="success", action="process_status", requestId=request_id)
+        except (KeyError, ValueError):
+            return {"status": "error", "action": "process_status", "message": f"Unknown process id: {process_id}", "requestId": request_id}
+
+    def read_output(self, params):
+        """
+        Reads captured output of a process started with start_process (or a
+        streamed run_shell_command) from a byte offset.
+        Params: processId, stream ('stdout' or 'stderr', default 'stdout'), offset (default 0),
+        limit (bytes, default 64 KiB), wait (seconds to wait for output beyond offset, default 0).
+        Returns data and nextOffset (the offset for the next call); eof once the process has
+        exited and everything has been read.
+        """
+        request_id = params.get('requestId')
+        process_id = params.get("processId")
+        stream = params.get("stream", "stdout")
+        try:
+            if stream not in STREAM_NAMES:
+                raise ValueError(f"stream must be one of: {', '.join(STREAM_NAMES)}.")
+            offset = max(0, int(params.get("offset", 0)))
+            # At least one whole UTF-8 character fits, so trimming a partial one never leaves nothing.
+            limit = max(4, min(int(params.get("limit", DEFAULT_READ_OUTPUT_BYTES)), MAX_READ_OUTPUT_BYTES))
+            wait = max(0.0, min(float(params.get("wait", 0)), MAX_READ_OUTPUT_WAIT_SECONDS))
+            registry = get_process_registry()
+            try:
+                managed = registry.output(process_id)
+            except KeyError:
+                raise ValueError(f"Unknown process id: {process_id}")
+            if managed is None:
+                raise ValueError(f"The output of process {process_id} is not captured; start it with start_process.")
+
+            if wait:
+                managed.wait_for_output(stream, offset, wait)
+            complete = managed.snapshot()[stream]["complete"]
+            start, data = managed.read(stream, offset, limit)
+            data = data[:complete_utf8(data, final=complete)]
+            next_offset = start + len(data)
+            size = managed.snapshot()[stream]["bytes"]
+            return_code = managed.process.poll()
+            return {
+                "status": "success",
+                "action": "read_output",
+                "processId": int(process_id),
+                "stream": stream,
+                "offset": start,
+                "skippedBytes": start - offset,
+                "data": data.decode("utf-8", errors="replace"),
+                "nextOffset": next_offset,
+                "size": size,
+                "running": return_code is None,
+                "returnCode": return_code,
+                "eof": complete and next_offset >= size,
+                "requestId": request_id
+            }
+        except ValueError as e:
+            return {"status": "error", "action": "read_output", "message": str(e), "requestId": request_id}
+        except Exception as e:
+            log.error(f"[System] read_output failed for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "read_output",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
+
+    def kill_process(self, params):
+        """
+        Stops a registered process (and, with tree, the default, what it
+        started): terminate first, kill after grace seconds (default 5).
+        """
+        request_id = params.get('requestId')
+        process_id = params.get("processId")
+        try:
+            process = get_process_registry().get(process_id) if process_id is not None else None
+        except ValueError:
+            process = None
+        if process is None:
+            return {"status": "error", "action": "kill_process", "message": f"Unknown process id: {process_id}", "requestId": request_id}
+        was_running = process.poll() is None
+        grace = max(0.0, min(float(params.get("grace", KILL_GRACE_SECONDS)), MAX_KILL_GRACE_SECONDS))
+        log.info(f"[System] Stopping process {process_id}. RequestId: {request_id}")
+        return_code = terminate_process(process, tree=bool(params.get("tree", True)), grace=grace)
+        if return_code is None:
+            return {"status": "error", "action": "kill_process", "message": f"Process {process_id} did not exit.",
+                    "processId": int(process_id), "requestId": request_id}
+        return {
+            "status": "success",
+            "action": "kill_process",
+            "message": f"Process {process_id} stopped." if was_running else f"Process {process_id} had already exited.",
+            "processId": int(process_id),
+            "wasRunning": was_running,
+            "returnCode": return_code,
+            "requestId": request_id
+        }
+
     def launch_application(self, params):
         request_id = params.get('requestId')
         self._normalize_param_path(params, "appPath")
@@ -428,19 +1022,32 @@ class SystemCommands:
             if not app_path:
                 raise ValueError("appPath parameter is missing.")
             
-            # This is platform-dependent; consider using subprocess.Popen with args
-            # or a more robust library like 'applaunch' if needed.
+            # Executables are started directly so the returned processId tracks the application itself
+            # (wait_for can then wait for it to exit). Documents go through the platform's opener.
+            process = None
             if os.name == 'nt':  # Windows
-                os.startfile(app_path)
+                if app_path.lower().endswith(('.exe', '.bat', '.cmd')):
+                    process = subprocess.Popen([app_path])
+                else:
+                    os.startfile(app_path) # No process handle is available for shell-opened documents
             elif os.uname().sysname == 'Darwin': # macOS
-                subprocess.Popen(['open', app_path])
+                # -W keeps 'open' running until the application quits.
+                process = subprocess.Popen(['open', '-W', app_path])
             else: # Linux/Unix
-                subprocess.Popen(['xdg-open', app_path])
-            
+                if os.path.isfile(app_path) and os.access(app_path, os.X_OK):
+                    process = subprocess.Popen([app_path])
+                else:
+                    # xdg-open hands the document to the desktop's handler and exits at once, so its
+                    # pid says nothing about the application: like os.startfile, no processId.
+                    opener = subprocess.Popen(['xdg-open', app_path])
+                    threading.Thread(target=opener.wait, daemon=True).start() # Reap it when it exits
+
+            process_id = get_process_registry().register(process, app_path) if process else None
             return {
                 "status": "success",
                 "action": "launch_application",
                 "appPath": app_path,
+                "processId": process_id,
                 "requestId": request_id
             }
         except FileNotFoundError:
@@ -501,7 +1108,131 @@ class SystemCommands:
                 "requestId": request_id
             }
 
+    def get_outgoing_metrics(self, params):
+        request_id = params.get('requestId')
+        log.info(f"[System] Getting outgoing message metrics. RequestId: {request_id}")
+        try:
+            if not (self.node_client and hasattr(self.node_client, 'get_outgoing_metrics')):
+                raise ValueError("NodeClient outgoing scheduler not available.")
+            return {
+                "status": "success",
+                "action": "get_outgoing_metrics",
+                "metrics": self.node_client.get_outgoing_metrics(),
+                "requestId": request_id
+            }
+        except Exception as e:
+            log.error(f"[System] get_outgoing_metrics error for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "get_outgoing_metrics",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
+
+    def _stream_file(self, file_path, params, action):
+        """
+        Starts a chunked transfer of file_path (see transfers.py) and returns at once.
+        The relay buffers the 'file_chunk' messages for the orchestrator to pull.
+        Params: 'offset' to resume from, 'chunkSize', 'window' and 'transferId'.
+        """
+        request_id = params.get("requestId")
+        if not (self.node_client and hasattr(self.node_client, 'send_outgoing_ws_message')):
+            raise RuntimeError("WebSocket queue unavailable for file transfer.")
+        transfer = get_transfer_manager().send_file(
+            file_path,
+            request_id,
+            self.node_client.send_outgoing_ws_message,
+            transfer_id=params.get("transferId"),
+            offset=int(params.get("offset", 0)),
+            chunk_size=params.get("chunkSize", DEFAULT_CHUNK_SIZE),
+            window=params.get("window", DEFAULT_WINDOW)
+        )
+        log.info(f"[System] Streaming '{file_path}' from offset {transfer.offset} as transfer {transfer.transfer_id}. RequestId: {request_id}")
+        return {
+            "status": "success",
+            "action": action,
+            "message": f"Streaming {transfer.size - transfer.offset} bytes.",
+            "transferId": transfer.transfer_id,
+            "filePath": file_path,
+            "fileName": os.path.basename(file_path),
+            "fileSize": transfer.size,
+            "offset": transfer.offset,
+            "requestId": request_id
+        }
+
+    def get_files(self, params):
+        """
+        Streams the files under 'directory' matching the glob 'patterns' (e.g.
+        ["**/*.log"]) as one archive built on the fly, over the same chunked
+        transfer as a streaming get_file. Optional filters: 'minSize' and
+        'maxSize' in bytes, 'modifiedAfter' and 'modifiedBefore' as epoch
+        seconds. 'format' is tar (default) or zip; 'compression' is none, gzip
+        or zstd for tar, none or deflate for zip. The archive ends with a
+        manifest of per-file SHA-256 digests (archive.MANIFEST_NAME). It is
+        rebuilt identically from the same files, so 'offset' resumes it.
+        """
+        request_id = params.get("requestId")
+        self._normalize_param_path(params, "directory")
+        directory = params.get("directory")
+        log.info(f"[System] Processing get_files for {directory}. RequestId: {request_id}")
+        try:
+            if not directory or not os.path.isdir(directory):
+                raise ValueError(f"directory '{directory}' does not exist.")
+            patterns = params.get("patterns") or ["**/*"]
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            if not (self.node_client and hasattr(self.node_client, 'send_outgoing_ws_message')):
+                raise RuntimeError("WebSocket queue unavailable for file transfer.")
+            files = select_files(
+                directory, patterns,
+                min_size=params.get("minSize"), max_size=params.get("maxSize"),
+                modified_after=params.get("modifiedAfter"), modified_before=params.get("modifiedBefore")
+            )
+            archive = ArchiveStream(
+                files, fmt=params.get("format", "tar"), compression=params.get("compression", "none"),
+                chunk_size=max(1, min(int(params.get("chunkSize", DEFAULT_CHUNK_SIZE)), MAX_CHUNK_SIZE)),
+                level=params.get("level")
+            )
+            offset = int(params.get("offset", 0))
+            stream = ResumableStream(archive, offset)
+            transfer = get_transfer_manager().send_stream(
+                stream.chunks(), request_id, self.node_client.send_outgoing_ws_message,
+                transfer_id=params.get("transferId"), offset=offset, prefix=stream.prefix(),
+                window=params.get("window", DEFAULT_WINDOW)
+            )
+            total_bytes = sum(size for _, _, size, _ in files)
+            log.info(f"[System] Streaming {len(files)} files ({total_bytes} bytes) from '{directory}' as transfer {transfer.transfer_id}. RequestId: {request_id}")
+            return {
+                "status": "success",
+                "action": "get_files",
+                "message": f"Streaming {len(files)} files as a {archive.format} archive.",
+                "transferId": transfer.transfer_id,
+                "directory": directory,
+                "format": archive.format,
+                "compression": archive.compression,
+                "fileCount": len(files),
+                "totalBytes": total_bytes,
+                "offset": offset,
+                "requestId": request_id
+            }
+        except Exception as e:
+            log.error(f"[System] get_files exception for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "get_files",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
+
     def get_file(self, params):
+        """
+        Sends a file to the relay. By default the whole file goes in one message;
+        with 'stream': true, or when the file is too large for one message, it is
+        sent in acknowledged chunks with a SHA-256 and can be resumed from
+        'offset' (see _stream_file).
+        """
         # This command is expected to send the file content back to the Relay via WebSocket.
         # The Relay's consumer.py should then process the 'file_upload' message type.
         
@@ -526,6 +1257,9 @@ class SystemCommands:
             if not os.path.isfile(normalized_file_path):
                 raise FileNotFoundError(f"File not found or is not a file: {normalized_file_path}")
 
+            if params.get("stream") or self._exceeds_outgoing_budget(os.path.getsize(normalized_file_path)):
+                return self._stream_file(normalized_file_path, params, "get_file")
+
             with open(normalized_file_path, 'rb') as f:
                 encoded_content = base64.b64encode(f.read()).decode('utf-8')
             
@@ -547,7 +1281,8 @@ class SystemCommands:
             }
             
             if self.node_client and hasattr(self.node_client, 'outgoing_ws_queue'):
-                self.node_client.outgoing_ws_queue.put(message)
+                if not self.node_client.outgoing_ws_queue.put(message):
+                    raise ValueError(f"File '{filename}' ({file_size} bytes) exceeds the outgoing message budget.")
                 log.info(f"[System] File '{filename}' content queued for upload. RequestId: {request_id}")
                 return {
                     "status": "success",
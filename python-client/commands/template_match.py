@@ -0,0 +1,247 @@
+# File: commands/template_match.py
+
+import io
+import base64
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2  # Optional: OpenCV's matchTemplate is faster than the NumPy implementation below
+except ImportError:
+    cv2 = None
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONFIDENCE = 0.9
+DEFAULT_TEMPLATE_CACHE_SIZE = 64
+# The coarse pass of a pyramid search accepts slightly weaker matches; the full-resolution pass decides.
+COARSE_CONFIDENCE_MARGIN = 0.1
+# Upper bound on candidate positions considered by locate_all before non-maximum suppression.
+MAX_CANDIDATES = 10000
+# Windows whose pixel variance is below this are flat and cannot match a textured template.
+MIN_VARIANCE = 1e-6
+
+
+class TemplateMissingError(KeyError):
+    """Raised when a template is requested by a hash that is not in the cache."""
+
+    def __init__(self, key):
+        super().__init__(key)
+        self.key = key
+
+
+def template_hash(data):
+    """Content hash used to address cached templates: SHA-256 of the encoded image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class TemplateCache:
+    """
+    LRU cache of decoded template images keyed by template_hash(), so an
+    orchestrator only uploads a template once and then refers to it by hash.
+    """
+
+    def __init__(self, max_entries=DEFAULT_TEMPLATE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._templates = OrderedDict()
+
+    def add(self, data):
+        """Decodes and stores an encoded image (PNG, JPEG, ...). Returns its hash."""
+        key = template_hash(data)
+        with self._lock:
+            if key in self._templates:
+                self._templates.move_to_end(key)
+                return key
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        image = image.convert("RGB")
+        with self._lock:
+            self._templates[key] = image
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            image = self._templates.get(key)
+            if image is not None:
+                self._templates.move_to_end(key)
+            return image
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._templates
+
+    def __len__(self):
+        with self._lock:
+            return len(self._templates)
+
+    def resolve(self, template_b64=None, key=None):
+        """
+        Returns (hash, image) for a template given as base64 and/or by hash.
+        Raises TemplateMissingError if only a hash is given and it is not cached.
+        """
+        if template_b64:
+            key = self.add(base64.b64decode(template_b64))
+        elif not key:
+            raise ValueError("Either 'template' (base64) or 'templateHash' is required.")
+        image = self.get(key)
+        if image is None:
+            raise TemplateMissingError(key)
+        return key, image
+
+
+def _fast_len(n):
+    """Smallest 2/3/5-smooth number >= n; FFTs of these sizes are fast."""
+    while True:
+        m = n
+        for p in (2, 3, 5):
+            while m % p == 0:
+                m //= p
+        if m == 1:
+            return n
+        n += 1
+
+
+def _window_sums(a, h, w):
+    """Sum of every h x w window of a 2-D array, via an integral image."""
+    c = np.zeros((a.shape[0] + 1, a.shape[1] + 1))
+    np.cumsum(a, axis=0, out=c[1:, 1:])
+    np.cumsum(c[1:, 1:], axis=1, out=c[1:, 1:])
+    return c[h:, w:] - c[:-h, w:] - c[h:, :-w] + c[:-h, :-w]
+
+
+def _ncc_numpy(image, template):
+    """
+    Zero-mean normalised cross-correlation of every template position inside
+    the image (the 'valid' positions), computed with FFTs. Colour channels are
+    treated as one vector, so the score is a single value per position.
+    """
+    if image.ndim == 2:
+        image, template = image[:, :, None], template[:, :, None]
+    H, W = image.shape[:2]
+    h, w = template.shape[:2]
+    n = h * w
+    shape = (_fast_len(H), _fast_len(W))
+
+    numerator = np.zeros((H - h + 1, W - w + 1))
+    variance = np.zeros_like(numerator)
+    template_energy = 0.0
+    for c in range(image.shape[2]):
+        channel = image[:, :, c].astype(np.float64)
+        kernel = template[:, :, c].astype(np.float64)
+        kernel -= kernel.mean()
+        template_energy += float(np.sum(kernel * kernel))
+        # Circular convolution with the flipped kernel; the valid positions never wrap around.
+        spectrum = np.fft.rfft2(channel, shape) * np.fft.rfft2(kernel[::-1, ::-1], shape)
+        numerator += np.fft.irfft2(spectrum, shape)[h - 1:H, w - 1:W]
+        sums = _window_sums(channel, h, w)
+        variance += _window_sums(channel * channel, h, w) - sums * sums / n
+
+    denominator = np.sqrt(np.maximum(variance, 0.0) * template_energy)
+    scores = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=scores, where=denominator > MIN_VARIANCE)
+    return np.clip(scores, -1.0, 1.0, out=scores).astype(np.float32)
+
+
+def match_scores(image, template):
+    """
+    Returns the normalised correlation score (-1..1) for every position where
+    the template fits inside the image, as a (H - h + 1, W - w + 1) array.
+    Both arguments are uint8 arrays, (height, width) or (height, width, 3).
+    """
+    if template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+        return np.zeros((0, 0), dtype=np.float32)
+    if cv2 is not None:
+        return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+    return _ncc_numpy(image, template)
+
+
+def _peaks(scores, threshold, h, w, limit):
+    """Best-first (x, y, score) positions above threshold, suppressing overlapping ones."""
+    ys, xs = np.nonzero(scores >= threshold)
+    if not len(ys):
+        return []
+    values = scores[ys, xs]
+    if len(values) > MAX_CANDIDATES:
+        keep = np.argpartition(-values, MAX_CANDIDATES)[:MAX_CANDIDATES]
+        ys, xs, values = ys[keep], xs[keep], values[keep]
+    order = np.argsort(-values, kind="stable")
+    ys, xs, values = ys[order], xs[order], values[order]
+
+    suppressed = np.zeros(len(ys), dtype=bool)
+    peaks = []
+    for i in range(len(ys)):
+        if suppressed[i]:
+            continue
+        peaks.append((int(xs[i]), int(ys[i]), float(values[i])))
+        if len(peaks) >= limit:
+            break
+        suppressed |= (np.abs(xs - xs[i]) < w) & (np.abs(ys - ys[i]) < h)
+    return peaks
+
+
+def _to_array(image, grayscale):
+    return np.asarray(image.convert("L") if grayscale else image.convert("RGB"))
+
+
+def locate(haystack, needle, confidence=DEFAULT_CONFIDENCE, grayscale=False, downscale=None, limit=1):
+    """
+    Finds occurrences of the needle image in the haystack image (both PIL).
+    Returns up to `limit` matches as dicts with x, y, width, height and
+    confidence, best first, in haystack pixel coordinates.
+
+    grayscale matches on luminance only (about 3x less work). downscale (0..1)
+    runs a coarse search on both images shrunk by that factor and then verifies
+    each candidate at full resolution in a small window around it.
+    """
+    confidence = float(confidence)
+    if not 0 < confidence <= 1:
+        raise ValueError(f"confidence must be in (0, 1], got {confidence}.")
+    w, h = needle.size
+    if w > haystack.width or h > haystack.height:
+        return []
+    image = _to_array(haystack, grayscale)
+    template = _to_array(needle, grayscale)
+
+    if downscale is not None:
+        downscale = float(downscale)
+        if not 0 < downscale <= 1:
+            raise ValueError(f"downscale must be in (0, 1], got {downscale}.")
+    small_w, small_h = (int(w * downscale), int(h * downscale)) if downscale else (w, h)
+    if not downscale or downscale == 1 or min(small_w, small_h) < 8:
+        # A template that small no longer carries enough detail for a coarse pass.
+        return [{"x": x, "y": y, "width": w, "height": h, "confidence": round(score, 4)}
+                for x, y, score in _peaks(match_scores(image, template), confidence, h, w, limit)]
+
+    small_size = (max(1, int(haystack.width * downscale)), max(1, int(haystack.height * downscale)))
+    small_image = _to_array(haystack.resize(small_size, Image.BILINEAR), grayscale)
+    small_template = _to_array(needle.resize((small_w, small_h), Image.BILINEAR), grayscale)
+    coarse = _peaks(match_scores(small_image, small_template), confidence - COARSE_CONFIDENCE_MARGIN,
+                    small_h, small_w, max(limit * 4, limit + 8))
+
+    margin = int(round(2 / downscale)) + 1
+    matches = []
+    for cx, cy, _ in coarse:
+        left = max(0, int(cx / downscale) - margin)
+        top = max(0, int(cy / downscale) - margin)
+        right = min(image.shape[1], int(cx / downscale) + w + margin)
+        bottom = min(image.shape[0], int(cy / downscale) + h + margin)
+        refined = _peaks(match_scores(image[top:bottom, left:right], template), confidence, h, w, 1)
+        if refined:
+            x, y, score = refined[0]
+            matches.append({"x": left + x, "y": top + y, "width": w, "height": h, "confidence": round(score, 4)})
+
+    # Neighbouring coarse candidates can refine to the same spot.
+    matches.sort(key=lambda m: -m["confidence"])
+    unique = []
+    for match in matches:
+        if all(abs(match["x"] - u["x"]) >= w or abs(match["y"] - u["y"]) >= h for u in unique):
+            unique.append(match)
+    return unique[:limit]
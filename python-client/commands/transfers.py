@@ -0,0 +1,396 @@
+# File: commands/transfers.py
+
+import os
+import mmap
+import time
+import uuid
+import base64
+import hashlib
+import tempfile
+import threading
+import logging
+
+from .utils import normalize_path
+from .blob_store import get_blob_store, BLOB_DIR_NAME
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# Chunks sent but not yet acknowledged by the relay. Node and relay each hold at most
+# chunk size x window bytes of a transfer.
+DEFAULT_WINDOW = 8
+MAX_WINDOW = 64
+# Files at least this large are read through a memory map instead of read() calls.
+MMAP_THRESHOLD = 8 * 1024 * 1024
+# A transfer whose window stays full this long (relay or orchestrator gone) is abandoned;
+# the orchestrator resumes it with a new transfer from the last offset it received.
+ACK_TIMEOUT_SECONDS = 120
+
+
+class FileChunkReader:
+    """
+    Reads a file in fixed-size chunks from a byte offset. Large files are
+    memory-mapped, so a chunk is a view into the page cache rather than a
+    copy held by the node.
+    """
+
+    def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._file = open(path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = None
+        if self.size >= MMAP_THRESHOLD:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, offset, length):
+        if self._map is not None:
+            return memoryview(self._map)[offset:offset + length]
+        self._file.seek(offset)
+        return self._file.read(length)
+
+    def chunks(self, start=0, end=None):
+        end = self.size if end is None else min(end, self.size)
+        offset = start
+        while offset < end:
+            data = self.read(offset, min(self.chunk_size, end - offset))
+            length = len(data)
+            if not length:
+                break # Truncated while being read
+            try:
+                yield data
+            finally:
+                # A view must be released before the map can be closed.
+                if isinstance(data, memoryview):
+                    data.release()
+            offset += length
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class OutgoingTransfer(threading.Thread):
+    """
+    Streams a byte source to the relay as 'file_chunk' messages on the bulk
+    traffic class, keeping at most `window` unacknowledged chunks in flight.
+    The SHA-256 covers the whole content: when resuming from `offset`, the
+    bytes before it are hashed first by `prefix` (an iterable of chunks,
+    not sent). The last message has 'eof' set and carries the digest and size.
+    """
+
+    def __init__(self, transfer_id, request_id, chunks, send, offset=0, prefix=(), window=DEFAULT_WINDOW,
+                 on_close=None, metadata=None):
+        super().__init__(name=f"transfer-{transfer_id}", daemon=True)
+        self.transfer_id = transfer_id
+        self.request_id = request_id
+        self.offset = offset
+        self.window = window
+        self.metadata = metadata or {}
+        self._chunks = chunks
+        self._prefix = prefix
+        self._send = send
+        self._on_close = on_close
+        self._cond = threading.Condition()
+        self._sent_offsets = []
+        self._acked = offset
+        self._cancelled = False
+        self.started_at = time.time()
+        self.state = "running"
+        self.error = None
+
+    def ack(self, offset):
+        with self._cond:
+            self._acked = max(self._acked, offset)
+            self._sent_offsets = [o for o in self._sent_offsets if o > self._acked]
+            self._cond.notify_all()
+
+    def cancel(self):
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def _wait_for_window(self):
+        deadline = time.monotonic() + ACK_TIMEOUT_SECONDS
+        with self._cond:
+            while len(self._sent_offsets) >= self.window and not self._cancelled:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"No acknowledgement for {ACK_TIMEOUT_SECONDS}s at offset {self._acked}.")
+                self._cond.wait(remaining)
+            if self._cancelled:
+                raise InterruptedError("Transfer cancelled.")
+
+    def _message(self, data, **extra):
+        message = {
+            "type": "file_chunk",
+            "transferId": self.transfer_id,
+            "requestId": self.request_id,
+            "offset": self.offset,
+            "data": base64.b64encode(data).decode("ascii"),
+            "eof": False
+        }
+        message.update(extra)
+        return message
+
+    def _put(self, message):
+        # The scheduler refuses messages over its byte budget; chunks are small, so wait for room.
+        while not self._send(message):
+            if self._cancelled:
+                raise InterruptedError("Transfer cancelled.")
+            time.sleep(0.1)
+
+    def run(self):
+        hasher = hashlib.sha256()
+        try:
+            for block in self._prefix:
+                hasher.update(block)
+            for data in self._chunks:
+                self._wait_for_window()
+                hasher.update(data)
+                self._put(self._message(data))
+                self.offset += len(data)
+                with self._cond:
+                    self._sent_offsets.append(self.offset)
+            self._put(self._message(b"", eof=True, size=self.offset, sha256=hasher.hexdigest(), **self.metadata))
+            self.state = "completed"
+            log.info(f"[Transfer] {self.transfer_id} sent {self.offset} bytes. RequestId: {self.request_id}")
+        except Exception as e:
+            self.state = "cancelled" if isinstance(e, InterruptedError) else "failed"
+            self.error = str(e)
+            log.warning(f"[Transfer] {self.transfer_id} {self.state} at offset {self.offset}: {e}")
+            try:
+                self._send({"type": "file_chunk", "transferId": self.transfer_id, "requestId": self.request_id,
+                            "offset": self.offset, "eof": True, "error": self.error})
+            except Exception:
+                pass
+        finally:
+            for source in (self._chunks, self._prefix):
+                if hasattr(source, "close"):
+                    source.close()
+            if self._on_close:
+                self._on_close(self)
+
+    def snapshot(self):
+        return {
+            "transferId": self.transfer_id,
+            "requestId": self.request_id,
+            "state": self.state,
+            "offset": self.offset,
+            "acked": self._acked,
+            "error": self.error,
+            "startedAt": self.started_at
+        }
+
+
+class IncomingTransfer:
+    """
+    Receives a file pushed through the relay. Chunks must arrive in order and
+    are appended to a temporary file beside the destination while being
+    hashed; finish() checks size and SHA-256 and renames the temporary file
+    over the destination, so the destination is never seen half written.
+    """
+
+    def __init__(self, transfer_id, path):
+        self.transfer_id = transfer_id
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+        self._hasher = hashlib.sha256()
+        self.offset = 0
+        self.updated = time.monotonic()
+
+    def write(self, offset, data):
+        if offset != self.offset:
+            raise ValueError(f"Expected a chunk at offset {self.offset}, got {offset}.")
+        self._file.write(data)
+        self._hasher.update(data)
+        self.offset += len(data)
+        self.updated = time.monotonic()
+
+    def finish(self, sha256=None, size=None):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        digest = self._hasher.hexdigest()
+        if size is not None and size != self.offset:
+            raise ValueError(f"Received {self.offset} bytes, expected {size}.")
+        if sha256 and sha256.lower() != digest:
+            raise ValueError(f"SHA-256 mismatch: received {digest}, expected {sha256}.")
+        os.replace(self.temp_path, self.path)
+        return digest
+
+    def abort(self):
+        try:
+            self._file.close()
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+
+def resolve_destination(base_dir, filename):
+    """Joins a relative filename to base_dir, refusing names that would escape it."""
+    if not filename:
+        raise ValueError("filename is missing.")
+    base = os.path.abspath(base_dir)
+    path = os.path.abspath(os.path.join(base, normalize_path(filename).lstrip("/\\")))
+    if os.path.commonpath([base, path]) != base or path == base:
+        raise ValueError(f"filename '{filename}' is outside the download directory.")
+    if os.path.commonpath([os.path.join(base, BLOB_DIR_NAME), path]) == os.path.join(base, BLOB_DIR_NAME):
+        raise ValueError(f"filename '{filename}' is inside the blob cache.")
+    return path
+
+
+class TransferManager:
+    """
+    Tracks the node's chunked transfers: running outgoing transfers, so relay
+    acknowledgements can reach them, and incoming pushes being written.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._incoming = {}
+
+    def start(self, transfer):
+        with self._lock:
+            previous = self._transfers.get(transfer.transfer_id)
+            self._transfers[transfer.transfer_id] = transfer
+        if previous:
+            previous.cancel()
+        transfer.start()
+        return transfer
+
+    def _closed(self, transfer):
+        with self._lock:
+            if self._transfers.get(transfer.transfer_id) is transfer:
+                del self._transfers[transfer.transfer_id]
+
+    def send_file(self, path, request_id, send, transfer_id=None, offset=0, chunk_size=DEFAULT_CHUNK_SIZE,
+                  window=DEFAULT_WINDOW, metadata=None):
+        """Starts streaming `path` from `offset`. Returns the transfer (already running)."""
+        chunk_size = max(1, min(int(chunk_size), MAX_CHUNK_SIZE))
+        window = max(1, min(int(window), MAX_WINDOW))
+        reader = FileChunkReader(path, chunk_size=chunk_size)
+        if not 0 <= offset <= reader.size:
+            reader.close()
+            raise ValueError(f"offset {offset} is outside the file (size {reader.size}).")
+
+        def close(transfer):
+            reader.close()
+            self._closed(transfer)
+
+        transfer = OutgoingTransfer(
+            transfer_id or uuid.uuid4().hex, request_id, reader.chunks(offset), send,
+            offset=offset, prefix=reader.chunks(0, offset), window=window, on_close=close,
+            metadata=metadata
+        )
+        transfer.size = reader.size
+        return self.start(transfer)
+
+    def send_stream(self, chunks, request_id, send, transfer_id=None, offset=0, prefix=(), window=DEFAULT_WINDOW,
+                    metadata=None):
+        """
+        Starts streaming an iterable of chunks produced on the fly (e.g. an archive).
+        To resume, `chunks` starts at `offset` and `prefix` yields the bytes before it.
+        """
+        window = max(1, min(int(window), MAX_WINDOW))
+        transfer = OutgoingTransfer(
+            transfer_id or uuid.uuid4().hex, request_id, chunks, send,
+            offset=offset, prefix=prefix, window=window, on_close=self._closed, metadata=metadata
+        )
+        return self.start(transfer)
+
+    def ack(self, transfer_id, offset):
+        with self._lock:
+            transfer = self._transfers.get(transfer_id)
+        if transfer:
+            transfer.ack(offset)
+        return transfer is not None
+
+    def cancel(self, transfer_id):
+        with self._lock:
+            transfer = self._transfers.get(transfer_id)
+        if transfer:
+            transfer.cancel()
+        return transfer is not None
+
+    def receive_chunk(self, message, base_dir):
+        """
+        Applies one 'file_push_chunk' message to its incoming transfer (created by
+        the chunk at offset 0, written under base_dir). Returns the acknowledgement
+        for the relay: the new offset, and on completion the saved path and digest,
+        or an 'error' after which the transfer is discarded.
+        """
+        transfer_id = message.get("transferId")
+        offset = message.get("offset", 0)
+        ack = {"transferId": transfer_id, "offset": offset}
+        with self._lock:
+            self._prune_incoming()
+            transfer = self._incoming.get(transfer_id)
+        try:
+            if message.get("abort"):
+                if transfer:
+                    self._discard(transfer)
+                return dict(ack, error=message.get("error") or "Aborted by the relay.")
+            if transfer is None:
+                if offset != 0:
+                    raise ValueError(f"Unknown transfer {transfer_id}.")
+                transfer = IncomingTransfer(transfer_id, resolve_destination(base_dir, message.get("filename")))
+                with self._lock:
+                    self._incoming[transfer_id] = transfer
+                log.info(f"[Transfer] Receiving push {transfer_id} into '{transfer.path}'.")
+            transfer.write(offset, base64.b64decode(message.get("data") or ""))
+            ack["offset"] = transfer.offset
+            if message.get("eof"):
+                with self._lock:
+                    self._incoming.pop(transfer_id, None)
+                digest = transfer.finish(sha256=message.get("sha256"), size=message.get("size"))
+                log.info(f"[Transfer] Push {transfer_id} saved to '{transfer.path}' ({transfer.offset} bytes).")
+                cached = message.get("cache", True) and self._cache(base_dir, transfer.path, digest)
+                ack.update(done=True, path=transfer.path, size=transfer.offset, sha256=digest, cached=bool(cached))
+            return ack
+        except Exception as e:
+            log.warning(f"[Transfer] Push {transfer_id} failed at offset {offset}: {e}")
+            if transfer:
+                self._discard(transfer)
+            return dict(ack, error=str(e))
+
+    @staticmethod
+    def _cache(base_dir, path, digest):
+        # A later push of the same content can then be served by 'materialize'.
+        try:
+            get_blob_store(base_dir).add_file(path, digest)
+            return True
+        except Exception as e:
+            log.warning(f"[Transfer] Could not cache '{path}': {e}")
+            return False
+
+    def _discard(self, transfer):
+        with self._lock:
+            self._incoming.pop(transfer.transfer_id, None)
+        transfer.abort()
+
+    def _prune_incoming(self):
+        # Pushes whose relay went away never finish; drop their temporary files.
+        cutoff = time.monotonic() - ACK_TIMEOUT_SECONDS
+        for transfer_id, transfer in list(self._incoming.items()):
+            if transfer.updated < cutoff:
+                del self._incoming[transfer_id]
+                transfer.abort()
+
+    def snapshot(self):
+        with self._lock:
+            return [t.snapshot() for t in self._transfers.values()]
+
+
+_shared_manager = TransferManager()
+
+
+def get_transfer_manager():
+    """Returns the process-wide manager of outgoing chunked transfers."""
+    return _shared_manager
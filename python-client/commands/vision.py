@@ -0,0 +1,121 @@
+# File: commands/vision.py
+
+import time
+import logging
+import traceback
+
+from .capture import get_screen_capture
+from .template_match import TemplateCache, TemplateMissingError, locate, DEFAULT_CONFIDENCE
+
+log = logging.getLogger(__name__)
+
+DEFAULT_LOCATE_ALL_LIMIT = 100
+
+
+class VisionCommands:
+    """
+    Finds template images on the node's screen so the orchestrator only
+    receives coordinates instead of full screenshots. Templates are cached on
+    the node by SHA-256 of their encoded bytes; after the first upload a
+    command can pass 'templateHash' alone.
+    """
+
+    def __init__(self, node_client_ref=None):
+        self.node_client_ref = node_client_ref
+        self.templates = TemplateCache()
+
+    def find(self, template, region=None, monitor=None, confidence=DEFAULT_CONFIDENCE, grayscale=False,
+             downscale=None, limit=1):
+        """Grabs the area and returns up to `limit` matches of the template image, in screen coordinates."""
+        capture = get_screen_capture()
+        left, top, _, _ = capture.resolve_area(region, monitor)
+        screen = capture.grab(region=region, monitor=monitor)
+        matches = locate(screen, template, confidence=confidence, grayscale=grayscale, downscale=downscale, limit=limit)
+        for match in matches:
+            match["x"] += left
+            match["y"] += top
+            match["center"] = [match["x"] + match["width"] // 2, match["y"] + match["height"] // 2]
+        return matches
+
+    def _locate(self, params, limit):
+        """Returns (template hash, matches, search milliseconds) for a locate command."""
+        key, template = self.templates.resolve(params.get("template"), params.get("templateHash"))
+        started = time.monotonic()
+        matches = self.find(
+            template,
+            region=params.get("region"),
+            monitor=params.get("monitor"),
+            confidence=params.get("confidence", DEFAULT_CONFIDENCE),
+            grayscale=params.get("grayscale", False),
+            downscale=params.get("downscale"),
+            limit=limit
+        )
+        return key, matches, round((time.monotonic() - started) * 1000, 1)
+
+    @staticmethod
+    def template_missing_response(action, request_id, key):
+        # The orchestrator re-sends the command with the template data.
+        return {
+            "status": "error",
+            "action": action,
+            "templateMissing": True,
+            "templateHash": key,
+            "message": f"Template {key} is not cached on this node; send it as 'template'.",
+            "requestId": request_id
+        }
+
+    def _error(self, action, request_id, e):
+        if isinstance(e, TemplateMissingError):
+            return self.template_missing_response(action, request_id, e.key)
+        log.error(f"[Vision] {action} error for Req ID: {request_id}: {e}", exc_info=True)
+        return {
+            "status": "error",
+            "action": action,
+            "message": str(e) or "Unhandled exception",
+            "traceback": traceback.format_exc(),
+            "requestId": request_id
+        }
+
+    def locate_image(self, params):
+        """
+        Finds the best match of a template on screen.
+        Params: 'template' (base64 image) or 'templateHash', optional 'region',
+        'monitor', 'confidence' (0..1, default 0.9), 'grayscale' and 'downscale'.
+        """
+        request_id = params.get('requestId')
+        log.info(f"[Vision] Locating image (region={params.get('region')}, confidence={params.get('confidence', DEFAULT_CONFIDENCE)}). RequestId: {request_id}")
+        try:
+            key, matches, elapsed_ms = self._locate(params, limit=1)
+            result = {
+                "status": "success",
+                "action": "locate_image",
+                "found": bool(matches),
+                "templateHash": key,
+                "elapsedMs": elapsed_ms,
+                "requestId": request_id
+            }
+            if matches:
+                result.update(matches[0])
+            return result
+        except Exception as e:
+            return self._error("locate_image", request_id, e)
+
+    def locate_all_images(self, params):
+        """Like locate_image, but returns every non-overlapping match (up to 'limit'), best first."""
+        request_id = params.get('requestId')
+        log.info(f"[Vision] Locating all images (region={params.get('region')}). RequestId: {request_id}")
+        try:
+            limit = int(params.get("limit", DEFAULT_LOCATE_ALL_LIMIT))
+            key, matches, elapsed_ms = self._locate(params, limit=max(1, limit))
+            return {
+                "status": "success",
+                "action": "locate_all_images",
+                "found": bool(matches),
+                "count": len(matches),
+                "matches": matches,
+                "templateHash": key,
+                "elapsedMs": elapsed_ms,
+                "requestId": request_id
+            }
+        except Exception as e:
+            return self._error("locate_all_images", request_id, e)
@@ -0,0 +1,303 @@
+# File: commands/wait_for.py
+
+import os
+import time
+import subprocess
+import logging
+import traceback
+
+import numpy as np
+import pyautogui
+
+from .capture import get_screen_capture, image_content_hash
+from .processes import get_process_registry
+from .template_match import DEFAULT_CONFIDENCE, TemplateMissingError
+from .utils import normalize_path
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT_SECONDS = 30.0
+DEFAULT_INTERVAL_SECONDS = 0.1
+MIN_INTERVAL_SECONDS = 0.01
+DEFAULT_STABLE_SECONDS = 1.0
+
+
+class Condition:
+    """A wait condition. check() returns None while it does not hold, or a dict of details once it does."""
+    type = None
+
+    def check(self):
+        raise NotImplementedError
+
+
+class RegionChangedCondition(Condition):
+    """
+    Holds once the region differs from the screen at the start of the wait (or
+    from 'baselineHash', a contentHash returned by screenshot). 'tolerance' is
+    the fraction of pixels allowed to differ without counting as a change.
+    """
+    type = "region_changed"
+
+    def __init__(self, spec):
+        self.region, self.monitor = spec.get("region"), spec.get("monitor")
+        self.baseline_hash = spec.get("baselineHash")
+        self.tolerance = float(spec.get("tolerance", 0.0))
+        self.baseline = None
+        if not self.baseline_hash:
+            self.baseline = np.asarray(self._grab())
+
+    def _grab(self):
+        return get_screen_capture().grab(region=self.region, monitor=self.monitor)
+
+    def check(self):
+        image = self._grab()
+        if self.baseline_hash:
+            content_hash = image_content_hash(image)
+            return {"contentHash": content_hash} if content_hash != self.baseline_hash else None
+        pixels = np.asarray(image)
+        if pixels.shape != self.baseline.shape:
+            return {"changedFraction": 1.0, "contentHash": image_content_hash(image)}
+        changed = float(np.any(pixels != self.baseline, axis=-1).mean())
+        if changed > self.tolerance:
+            return {"changedFraction": round(changed, 6), "contentHash": image_content_hash(image)}
+        return None
+
+
+class RegionStableCondition(Condition):
+    """Holds once the region has not changed for 'stableSeconds'."""
+    type = "region_stable"
+
+    def __init__(self, spec):
+        self.region, self.monitor = spec.get("region"), spec.get("monitor")
+        self.stable_seconds = float(spec.get("stableSeconds", DEFAULT_STABLE_SECONDS))
+        self._hash = None
+        self._since = None
+
+    def check(self):
+        content_hash = image_content_hash(get_screen_capture().grab(region=self.region, monitor=self.monitor))
+        now = time.monotonic()
+        if content_hash != self._hash:
+            self._hash, self._since = content_hash, now
+        if now - self._since >= self.stable_seconds:
+            return {"contentHash": content_hash, "stableSeconds": round(now - self._since, 3)}
+        return None
+
+
+class ImageCondition(Condition):
+    """Holds once a template is on screen ('image_appears') or no longer on screen ('image_disappears')."""
+
+    def __init__(self, spec, vision, appears):
+        self.type = "image_appears" if appears else "image_disappears"
+        self.appears = appears
+        self.vision = vision
+        # Resolved once; a missing templateHash raises TemplateMissingError before the wait starts.
+        self.template_hash, self.template = vision.templates.resolve(spec.get("template"), spec.get("templateHash"))
+        self.options = {
+            "region": spec.get("region"),
+            "monitor": spec.get("monitor"),
+            "confidence": spec.get("confidence", DEFAULT_CONFIDENCE),
+            "grayscale": spec.get("grayscale", False),
+            "downscale": spec.get("downscale"),
+        }
+
+    def check(self):
+        matches = self.vision.find(self.template, limit=1, **self.options)
+        if self.appears and matches:
+            return dict(matches[0], templateHash=self.template_hash)
+        if not self.appears and not matches:
+            return {"templateHash": self.template_hash}
+        return None
+
+
+def find_window_titles(title):
+    """
+    Titles of open windows containing `title` (case-insensitive). Uses
+    pyautogui's window support where available (Windows) and wmctrl elsewhere.
+    """
+    if hasattr(pyautogui, "getWindowsWithTitle"):
+        return [window.title for window in pyautogui.getWindowsWithTitle(title)]
+    try:
+        output = subprocess.run(["wmctrl", "-l"], capture_output=True, text=True, timeout=5).stdout
+    except FileNotFoundError:
+        raise ValueError("Window conditions need window support in pyautogui (Windows) or wmctrl (Linux).")
+    titles = [fields[3] for fields in (line.split(None, 3) for line in output.splitlines()) if len(fields) == 4]
+    return [t for t in titles if title.lower() in t.lower()]
+
+
+class WindowCondition(Condition):
+    """Holds once a window whose title contains 'windowTitle' exists ('window_exists') or is gone ('window_closed')."""
+
+    def __init__(self, spec, exists):
+        self.type = "window_exists" if exists else "window_closed"
+        self.exists = exists
+        self.title = spec.get("windowTitle")
+        if not self.title:
+            raise ValueError(f"{self.type} requires 'windowTitle'.")
+
+    def check(self):
+        titles = find_window_titles(self.title)
+        if self.exists and titles:
+            return {"windowTitles": titles}
+        if not self.exists and not titles:
+            return {"windowTitle": self.title}
+        return None
+
+
+def _stat_signature(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+
+class PathCondition(Condition):
+    """
+    'path_exists' / 'path_missing' hold once the path exists / does not exist;
+    'path_changed' holds once its modification time or size (or existence)
+    differs from the start of the wait.
+    """
+
+    def __init__(self, spec, mode):
+        self.type = mode
+        path = spec.get("path")
+        if not path:
+            raise ValueError(f"{mode} requires 'path'.")
+        self.path = normalize_path(path)
+        self.baseline = _stat_signature(self.path) if mode == "path_changed" else None
+
+    def check(self):
+        signature = _stat_signature(self.path)
+        exists = signature is not None
+        if self.type == "path_exists" and exists \
+                or self.type == "path_missing" and not exists \
+                or self.type == "path_changed" and signature != self.baseline:
+            return {"path": self.path, "exists": exists, "size": signature[1] if exists else None}
+        return None
+
+
+class ProcessExitedCondition(Condition):
+    """Holds once a process started by launch_application ('processId') has exited."""
+    type = "process_exited"
+
+    def __init__(self, spec):
+        if spec.get("processId") is None:
+            raise ValueError("process_exited requires 'processId' (returned by launch_application).")
+        self.process_id = int(spec["processId"])
+        self.registry = get_process_registry()
+        try:
+            self.registry.status(self.process_id)
+        except KeyError:
+            raise ValueError(f"Unknown processId {self.process_id}; only processes started by launch_application can be waited for.") from None
+
+    def check(self):
+        try:
+            status = self.registry.status(self.process_id)
+        except KeyError:
+            # Pruned from the registry, which only happens to processes that already finished.
+            return {"processId": self.process_id, "returnCode": None}
+        return None if status["running"] else {"processId": self.process_id, "returnCode": status["returnCode"]}
+
+
+class WaitForCommands:
+    """
+    Evaluates wait conditions on the node and returns as soon as one holds,
+    replacing orchestrator-side polling loops of screenshots or file reads.
+    """
+
+    def __init__(self, node_client_ref=None, vision_cmds=None):
+        self.node_client_ref = node_client_ref
+        self.vision_cmds = vision_cmds
+        self.condition_factories = {
+            "region_changed": RegionChangedCondition,
+            "region_stable": RegionStableCondition,
+            "image_appears": lambda spec: ImageCondition(spec, self.vision_cmds, appears=True),
+            "image_disappears": lambda spec: ImageCondition(spec, self.vision_cmds, appears=False),
+            "window_exists": lambda spec: WindowCondition(spec, exists=True),
+            "window_closed": lambda spec: WindowCondition(spec, exists=False),
+            "path_exists": lambda spec: PathCondition(spec, "path_exists"),
+            "path_missing": lambda spec: PathCondition(spec, "path_missing"),
+            "path_changed": lambda spec: PathCondition(spec, "path_changed"),
+            "process_exited": ProcessExitedCondition,
+        }
+
+    def _condition_specs(self, params):
+        """Accepts 'conditions' (a list of dicts) or a single 'condition' (a dict, or a type name with its options in params)."""
+        if params.get("conditions"):
+            return list(params["conditions"])
+        condition = params.get("condition")
+        if isinstance(condition, dict):
+            return [condition]
+        if isinstance(condition, str):
+            return [dict(params, type=condition)]
+        raise ValueError("wait_for requires 'condition' or 'conditions'.")
+
+    def _build(self, spec):
+        factory = self.condition_factories.get(spec.get("type"))
+        if factory is None:
+            raise ValueError(f"Unknown condition type '{spec.get('type')}'. Use one of: {', '.join(self.condition_factories)}.")
+        return factory(spec)
+
+    def wait_for(self, params):
+        """
+        Waits until any of the given conditions holds, checking every
+        'intervalSeconds' (default 0.1), or until 'timeoutSeconds' (default 30)
+        expires. Returns the index, type and details of the condition that held.
+        """
+        request_id = params.get('requestId')
+        try:
+            timeout = float(params.get("timeoutSeconds", DEFAULT_TIMEOUT_SECONDS))
+            interval = max(MIN_INTERVAL_SECONDS, float(params.get("intervalSeconds", DEFAULT_INTERVAL_SECONDS)))
+            conditions = [self._build(spec) for spec in self._condition_specs(params)]
+            log.info(f"[Wait] Waiting up to {timeout}s for {[c.type for c in conditions]}. RequestId: {request_id}")
+
+            started = time.monotonic()
+            deadline = started + timeout
+            checks = 0
+            while True:
+                tick = time.monotonic()
+                checks += 1
+                for index, condition in enumerate(conditions):
+                    details = condition.check()
+                    if details is not None:
+                        elapsed = round(time.monotonic() - started, 3)
+                        log.info(f"[Wait] Condition '{condition.type}' held after {elapsed}s. RequestId: {request_id}")
+                        return {
+                            "status": "success",
+                            "action": "wait_for",
+                            "satisfied": True,
+                            "conditionIndex": index,
+                            "condition": condition.type,
+                            "details": details,
+                            "elapsedSeconds": elapsed,
+                            "checks": checks,
+                            "requestId": request_id
+                        }
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                time.sleep(min(max(0.0, interval - (now - tick)), deadline - now))
+
+            log.info(f"[Wait] Timed out after {timeout}s. RequestId: {request_id}")
+            return {
+                "status": "error",
+                "action": "wait_for",
+                "satisfied": False,
+                "timedOut": True,
+                "message": f"No condition held within {timeout} seconds.",
+                "elapsedSeconds": round(time.monotonic() - started, 3),
+                "checks": checks,
+                "requestId": request_id
+            }
+        except TemplateMissingError as e:
+            # A templateHash that is not cached on this node.
+            return self.vision_cmds.template_missing_response("wait_for", request_id, e.key)
+        except Exception as e:
+            log.error(f"[Wait] wait_for error for Req ID: {request_id}: {e}", exc_info=True)
+            return {
+                "status": "error",
+                "action": "wait_for",
+                "message": str(e) or "Unhandled exception",
+                "traceback": traceback.format_exc(),
+                "requestId": request_id
+            }
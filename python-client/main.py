@@ -16,6 +16,7 @@ from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 import platform
 import shutil
+import multiprocessing
 
 # Import the NodeClient from the local file
 from NodeClient import NodeClient # Assuming NodeClient.py is in the same directory
@@ -396,4 +397,6 @@ def main():
         logger.error("Failed to connect WebSocket after waiting. RPA Client will exit.")
 
 if __name__ == "__main__":
+    # Needed for the frame encoding process pool in frozen (PyInstaller) builds.
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
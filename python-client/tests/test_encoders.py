@@ -0,0 +1,14 @@
+import unittest
+
+from commands.encoders import get_encoder
+
+
+class GetEncoderTest(unittest.TestCase):
+    def test_backend_of_another_format_is_refused_after_use(self):
+        get_encoder("png", "pillow-png")
+        with self.assertRaises(ValueError):
+            get_encoder("jpeg", "pillow-png")
+
+
+if __name__ == "__main__":
+    unittest.main()
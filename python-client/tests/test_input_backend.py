@@ -0,0 +1,67 @@
+import unittest
+
+from commands.input_backend import InputBackend, XTestInputBackend
+
+SHIFT, KEY_A, KEY_1 = 50, 38, 10
+KEYSYMS = {"Shift_L": 0xFFE1}
+
+
+class FakeXlib:
+    def XStringToKeysym(self, name):
+        return KEYSYMS.get(name.decode("ascii"), 0)
+
+    def XFlush(self, display):
+        pass
+
+
+class FakeXTest:
+    def __init__(self):
+        self.events = []
+
+    def XTestFakeKeyEvent(self, display, keycode, down, delay):
+        self.events.append((keycode, down))
+
+
+def xtest_backend():
+    """An XTest backend with a recorded XTEST extension and a fixed US keyboard map."""
+    backend = XTestInputBackend.__new__(XTestInputBackend)
+    InputBackend.__init__(backend)
+    backend._display = None
+    backend._xlib = FakeXlib()
+    backend._xtst = FakeXTest()
+    backend._shift = SHIFT
+    backend._keycodes = {
+        0xFFE1: (SHIFT, False),
+        ord("a"): (KEY_A, False), ord("A"): (KEY_A, True),
+        ord("1"): (KEY_1, False), ord("!"): (KEY_1, True),
+    }
+    return backend
+
+
+class XTestShiftTest(unittest.TestCase):
+    def test_uppercase_key_is_pressed_with_shift(self):
+        backend = xtest_backend()
+        backend.press("A")
+        self.assertEqual(backend._xtst.events, [
+            (SHIFT, 1), (KEY_A, 1), (SHIFT, 0),
+            (SHIFT, 1), (KEY_A, 0), (SHIFT, 0),
+        ])
+
+    def test_shifted_symbol_key_down(self):
+        backend = xtest_backend()
+        backend.key("!", True)
+        self.assertEqual(backend._xtst.events, [(SHIFT, 1), (KEY_1, 1), (SHIFT, 0)])
+
+    def test_unshifted_key_has_no_shift(self):
+        backend = xtest_backend()
+        backend.press("a")
+        self.assertEqual(backend._xtst.events, [(KEY_A, 1), (KEY_A, 0)])
+
+    def test_held_shift_is_not_pressed_again(self):
+        backend = xtest_backend()
+        backend.hotkey(["shift", "A"])
+        self.assertEqual(backend._xtst.events, [(SHIFT, 1), (KEY_A, 1), (KEY_A, 0), (SHIFT, 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
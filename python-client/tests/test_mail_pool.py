@@ -0,0 +1,70 @@
+import socket
+import threading
+import time
+import imaplib
+import unittest
+
+from commands.mail_pool import ImapConnection
+
+
+class FakeIdleServer(threading.Thread):
+    """Answers CAPABILITY and one IDLE, sending the given untagged lines in a single write."""
+
+    def __init__(self, untagged, delay):
+        super().__init__(daemon=True)
+        self.untagged = untagged
+        self.delay = delay
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.port = self.listener.getsockname()[1]
+
+    def run(self):
+        conn, _ = self.listener.accept()
+        with conn, conn.makefile("rb") as lines:
+            conn.sendall(b"* OK ready\r\n")
+            for line in lines:
+                tag, command = line.split(b" ", 1)[0], line.split(b" ", 1)[-1].strip().upper()
+                if command == b"CAPABILITY":
+                    conn.sendall(b"* CAPABILITY IMAP4rev1 IDLE\r\n" + tag + b" OK done\r\n")
+                elif command == b"IDLE":
+                    idle_tag = tag
+                    conn.sendall(b"+ idling\r\n")
+                    time.sleep(self.delay)
+                    if self.untagged:
+                        conn.sendall(self.untagged)
+                elif line.strip() == b"DONE":
+                    conn.sendall(idle_tag + b" OK IDLE terminated\r\n")
+                elif command == b"LOGOUT":
+                    conn.sendall(b"* BYE\r\n" + tag + b" OK bye\r\n")
+                    return
+
+
+def connect(server):
+    connection = ImapConnection.__new__(ImapConnection)
+    connection.imap = imaplib.IMAP4("127.0.0.1", server.port)
+    connection.mailbox = None
+    connection.last_used = time.monotonic()
+    return connection
+
+
+class ImapIdleTest(unittest.TestCase):
+    def test_batched_untagged_lines_end_idle_at_once(self):
+        server = FakeIdleServer(b"* 1 EXPUNGE\r\n* 5 EXISTS\r\n", delay=0.5)
+        server.start()
+        connection = connect(server)
+        started = time.monotonic()
+        self.assertTrue(connection.idle(10))
+        self.assertLess(time.monotonic() - started, 3)
+        connection.close()
+
+    def test_timeout_without_untagged_data(self):
+        server = FakeIdleServer(b"", delay=0)
+        server.start()
+        connection = connect(server)
+        started = time.monotonic()
+        self.assertFalse(connection.idle(0.5))
+        self.assertGreaterEqual(time.monotonic() - started, 0.5)
+        connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
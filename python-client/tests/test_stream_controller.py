@@ -0,0 +1,29 @@
+import time
+import unittest
+
+from commands.stream_controller import AdaptiveStreamController, CpuLoadMeter, DEGRADE_COOLDOWN_FRAMES, PRESETS
+
+
+class CpuBoundTest(unittest.TestCase):
+    def test_cpu_bound_steps_down_once_per_cooldown(self):
+        controller = AdaptiveStreamController("medium")
+        start = PRESETS["medium"]["fps"]
+        controller.update(0, 0, 0, 0, cpu_load=1.0)
+        stepped = controller.fps
+        self.assertLess(stepped, start)
+        for _ in range(DEGRADE_COOLDOWN_FRAMES - 1):
+            controller.update(0, 0, 0, 0, cpu_load=1.0)
+        self.assertEqual(controller.fps, stepped)
+
+    def test_cpu_meter_reports_a_fraction(self):
+        meter = CpuLoadMeter()
+        time.sleep(0.6)
+        load = meter.read()
+        if load is None:
+            self.skipTest("CPU usage cannot be measured on this platform.")
+        self.assertGreaterEqual(load, 0.0)
+        self.assertLessEqual(load, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,19 @@
+import unittest
+
+from commands.vision import VisionCommands
+
+
+class VisionErrorTest(unittest.TestCase):
+    def test_unknown_template_hash_is_reported_as_missing(self):
+        result = VisionCommands().locate_image({"templateHash": "0" * 64, "requestId": "r1"})
+        self.assertTrue(result.get("templateMissing"))
+        self.assertEqual(result["templateHash"], "0" * 64)
+
+    def test_other_key_errors_are_not_template_misses(self):
+        result = VisionCommands()._error("locate_image", "r1", KeyError("region"))
+        self.assertEqual(result["status"], "error")
+        self.assertNotIn("templateMissing", result)
+
+
+if __name__ == "__main__":
+    unittest.main()
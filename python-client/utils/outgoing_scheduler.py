@@ -0,0 +1,325 @@
+# File: utils/outgoing_scheduler.py
+
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+
+log = logging.getLogger(__name__)
+
+# Traffic classes for messages leaving the node over the relay WebSocket.
+CLASS_CONTROL = "control"   # Command responses, status messages
+CLASS_FRAME = "frame"       # Screenshot / remote control image frames
+CLASS_BULK = "bulk"         # File uploads and other large transfers
+
+TRAFFIC_CLASSES = (CLASS_CONTROL, CLASS_FRAME, CLASS_BULK)
+
+DEFAULT_WEIGHTS = {CLASS_CONTROL: 8, CLASS_FRAME: 3, CLASS_BULK: 1}
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# When the byte budget is exceeded, queued messages are evicted oldest-first
+# from the first class in this order that still has something queued.
+# Control messages (command responses) are never evicted or rejected; they
+# may take the queue over budget.
+DEFAULT_DROP_ORDER = (CLASS_FRAME, CLASS_BULK)
+
+# Default classification of outgoing messages by their 'type' field.
+MESSAGE_TYPE_CLASSES = {
+    "node_response": CLASS_CONTROL,
+    "image_frame": CLASS_FRAME,
+    "image_stream_frame": CLASS_FRAME,
+    "image_tile_frame": CLASS_FRAME,
+    "file_upload": CLASS_BULK,
+    "file_chunk": CLASS_BULK,
+}
+
+
+class _OutgoingItem:
+    __slots__ = ("payload", "size", "msg_type", "request_id", "enqueued_at", "key")
+
+    def __init__(self, payload, msg_type, request_id=None, key=None):
+        self.payload = payload
+        self.size = len(payload)
+        self.msg_type = msg_type
+        self.request_id = request_id
+        self.enqueued_at = time.monotonic()
+        self.key = key
+
+
+def _request_id(message):
+    """The orchestrator request a message belongs to, if it names one."""
+    if not isinstance(message, dict):
+        return None
+    return (message.get("requestId")
+            or (message.get("file") or {}).get("request_id")
+            or (message.get("response") or {}).get("requestId"))
+
+
+class OutgoingScheduler:
+    """
+    Priority-aware, byte-bounded replacement for the single FIFO outgoing queue.
+
+    Messages are serialized to JSON when they are queued (so the byte budget is
+    exact and the sender thread only has to write) and placed in one of three
+    traffic classes. The sender dequeues using smooth weighted round robin over
+    the non-empty classes, so a backlog of file uploads can no longer delay a
+    command response by more than one message.
+
+    Frames are latest-wins: a frame queued with the same key as a frame that
+    has not been sent yet replaces it in place, so a slow link shows the most
+    recent screen instead of an ever-growing backlog.
+
+    The interface mirrors the parts of queue.Queue used by the client (put/get)
+    so existing callers keep working.
+
+    on_drop, if given, is called as on_drop(traffic_class, item) for every
+    message evicted after put() accepted it, outside the scheduler's lock, so
+    the owner can report the loss (e.g. fail the request a bulk message
+    belonged to).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, weights=None, drop_order=DEFAULT_DROP_ORDER, on_drop=None):
+        self.max_bytes = max_bytes
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if weights:
+            self.weights.update(weights)
+        self.drop_order = tuple(c for c in drop_order if c != CLASS_CONTROL)
+        self.on_drop = on_drop
+
+        self._cond = threading.Condition()
+        self._queues = {
+            CLASS_CONTROL: deque(),
+            CLASS_FRAME: OrderedDict(),  # key -> _OutgoingItem (latest wins)
+            CLASS_BULK: deque(),
+        }
+        self._current_weights = {c: 0 for c in TRAFFIC_CLASSES}
+        self._queued_bytes = 0
+        self._metrics = {c: self._new_class_metrics() for c in TRAFFIC_CLASSES}
+
+    @staticmethod
+    def _new_class_metrics():
+        return {
+            "enqueued": 0,
+            "sent": 0,
+            "replaced": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "bytes_enqueued": 0,
+            "bytes_sent": 0,
+            "bytes_dropped": 0,
+            "max_wait_ms": 0.0,
+            "total_wait_ms": 0.0,
+        }
+
+    @staticmethod
+    def classify(message):
+        """Returns the traffic class for a message based on its 'type'."""
+        return MESSAGE_TYPE_CLASSES.get(message.get("type"), CLASS_CONTROL)
+
+    def put(self, message, traffic_class=None, coalesce_key=None):
+        """
+        Queues a message for sending.
+
+        traffic_class defaults to the classification of the message type.
+        coalesce_key only applies to frames; frames sharing a key replace each
+        other while unsent. It defaults to the message type, so all frames of
+        one kind form a single latest-wins slot.
+
+        Returns True if the message was queued, False if it was rejected
+        because it alone exceeds the byte budget (never for control messages).
+        """
+        traffic_class = traffic_class or self.classify(message)
+        if traffic_class not in self._queues:
+            raise ValueError(f"Unknown traffic class: {traffic_class}")
+
+        payload = message if isinstance(message, str) else json.dumps(message)
+        msg_type = message.get("type") if isinstance(message, dict) else None
+
+        with self._cond:
+            metrics = self._metrics[traffic_class]
+            item = _OutgoingItem(payload, msg_type, _request_id(message))
+
+            if item.size > self.max_bytes and traffic_class != CLASS_CONTROL:
+                metrics["rejected"] += 1
+                metrics["bytes_dropped"] += item.size
+                log.warning(f"OutgoingScheduler: Rejected {traffic_class} message '{msg_type}' of {item.size} bytes (budget {self.max_bytes}).")
+                return False
+
+            if traffic_class == CLASS_FRAME:
+                key = coalesce_key if coalesce_key is not None else msg_type
+                item.key = key
+                frames = self._queues[CLASS_FRAME]
+                previous = frames.pop(key, None)
+                if previous is not None:
+                    self._queued_bytes -= previous.size
+                    metrics["replaced"] += 1
+                    # Keep the original wait time so a replaced frame is not starved.
+                    item.enqueued_at = previous.enqueued_at
+                frames[key] = item
+            else:
+                self._queues[traffic_class].append(item)
+
+            self._queued_bytes += item.size
+            metrics["enqueued"] += 1
+            metrics["bytes_enqueued"] += item.size
+
+            dropped = self._enforce_budget(protect=item)
+            self._cond.notify()
+        self._report_dropped(dropped)
+        return True
+
+    def _enforce_budget(self, protect):
+        """
+        Evicts queued messages according to the drop policy until within budget.
+        Returns the evicted (traffic_class, item) pairs.
+        """
+        dropped = []
+        while self._queued_bytes > self.max_bytes:
+            victim_class = None
+            for traffic_class in self.drop_order:
+                if any(entry is not protect for entry in self._iter_class(traffic_class)):
+                    victim_class = traffic_class
+                    break
+            if victim_class is None:
+                break
+            victim = self._pop_oldest(victim_class, skip=protect)
+            self._queued_bytes -= victim.size
+            metrics = self._metrics[victim_class]
+            metrics["dropped"] += 1
+            metrics["bytes_dropped"] += victim.size
+            log.warning(f"OutgoingScheduler: Dropped queued {victim_class} message '{victim.msg_type}' ({victim.size} bytes) to stay within byte budget.")
+            dropped.append((victim_class, victim))
+        return dropped
+
+    def _report_dropped(self, dropped):
+        if not self.on_drop:
+            return
+        for traffic_class, item in dropped:
+            try:
+                self.on_drop(traffic_class, item)
+            except Exception as e:
+                log.error(f"OutgoingScheduler: on_drop callback failed for '{item.msg_type}': {e}", exc_info=True)
+
+    def _iter_class(self, traffic_class):
+        queue_ = self._queues[traffic_class]
+        return queue_.values() if traffic_class == CLASS_FRAME else queue_
+
+    def _pop_oldest(self, traffic_class, skip=None):
+        queue_ = self._queues[traffic_class]
+        if traffic_class == CLASS_FRAME:
+            for key, entry in queue_.items():
+                if entry is not skip:
+                    return queue_.pop(key)
+        else:
+            if queue_[0] is not skip:
+                return queue_.popleft()
+            for index, entry in enumerate(queue_):
+                if entry is not skip:
+                    del queue_[index]
+                    return entry
+        return None
+
+    def _select_class(self):
+        """Smooth weighted round robin over the classes that have data queued."""
+        ready = [c for c in TRAFFIC_CLASSES if self._queues[c]]
+        if not ready:
+            return None
+        total = 0
+        best = None
+        for traffic_class in ready:
+            weight = self.weights.get(traffic_class, 1)
+            self._current_weights[traffic_class] += weight
+            total += weight
+            if best is None or self._current_weights[traffic_class] > self._current_weights[best]:
+                best = traffic_class
+        self._current_weights[best] -= total
+        return best
+
+    def get(self, timeout=None):
+        """
+        Returns the next message as (traffic_class, item), where item.payload is
+        the serialized JSON. Returns None if nothing arrives within timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                traffic_class = self._select_class()
+                if traffic_class is not None:
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+            queue_ = self._queues[traffic_class]
+            if traffic_class == CLASS_FRAME:
+                _, item = queue_.popitem(last=False)
+            else:
+                item = queue_.popleft()
+            self._queued_bytes -= item.size
+
+            metrics = self._metrics[traffic_class]
+            wait_ms = (time.monotonic() - item.enqueued_at) * 1000
+            metrics["total_wait_ms"] += wait_ms
+            metrics["max_wait_ms"] = max(metrics["max_wait_ms"], wait_ms)
+            return traffic_class, item
+
+    def mark_sent(self, traffic_class, item):
+        """Records a successfully written message in the per-class metrics."""
+        with self._cond:
+            metrics = self._metrics[traffic_class]
+            metrics["sent"] += 1
+            metrics["bytes_sent"] += item.size
+
+    def requeue(self, traffic_class, item):
+        """Puts an item that could not be written back at the head of its class."""
+        with self._cond:
+            if traffic_class == CLASS_FRAME:
+                frames = self._queues[CLASS_FRAME]
+                if item.key in frames:
+                    # A newer frame arrived meanwhile; the failed one is stale.
+                    self._metrics[CLASS_FRAME]["replaced"] += 1
+                    return
+                frames[item.key] = item
+                frames.move_to_end(item.key, last=False)
+            else:
+                self._queues[traffic_class].appendleft(item)
+            self._queued_bytes += item.size
+            dropped = self._enforce_budget(protect=item)
+            self._cond.notify()
+        self._report_dropped(dropped)
+
+    def qsize(self, traffic_class=None):
+        with self._cond:
+            if traffic_class:
+                return len(self._queues[traffic_class])
+            return sum(len(q) for q in self._queues.values())
+
+    def class_counters(self, traffic_class):
+        """Returns a copy of the raw counters of one traffic class (cheaper than get_metrics)."""
+        with self._cond:
+            return dict(self._metrics[traffic_class])
+
+    def queued_bytes(self):
+        with self._cond:
+            return self._queued_bytes
+
+    def get_metrics(self):
+        """Returns a snapshot of the per-class counters and current queue state."""
+        with self._cond:
+            snapshot = {}
+            for traffic_class in TRAFFIC_CLASSES:
+                metrics = dict(self._metrics[traffic_class])
+                sent = metrics["sent"]
+                metrics["avg_wait_ms"] = round(metrics.pop("total_wait_ms") / sent, 2) if sent else 0.0
+                metrics["max_wait_ms"] = round(metrics["max_wait_ms"], 2)
+                metrics["queue_depth"] = len(self._queues[traffic_class])
+                metrics["queued_bytes"] = sum(item.size for item in self._iter_class(traffic_class))
+                metrics["weight"] = self.weights.get(traffic_class, 1)
+                snapshot[traffic_class] = metrics
+            return {
+                "classes": snapshot,
+                "queued_bytes": self._queued_bytes,
+                "max_bytes": self.max_bytes,
+                "drop_order": list(self.drop_order),
+            }
@@ -1,9 +1,12 @@
 # File: relay_server/consumers.py
 
 import json
+import base64
 import logging
 import asyncio
+import threading
 import traceback
+from collections import deque
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
 from oauth2_provider.models import AccessToken
@@ -19,9 +22,38 @@ logger = logging.getLogger(__name__)
 req_resp = {}
 nodes_available = {}
 node_connections = {}
+# (node_id, transfer_id) -> {"chunks": deque of decoded chunks, "updated": datetime}.
+# Nodes keep at most a window of unacknowledged chunks per transfer, which bounds each deque.
+file_transfers = {}
 
 CLEANUP_INTERVAL_MINUTES = 60
 
+class PushTransfer:
+    """
+    Flow-control state of a file being pushed to a node by PushView. The view
+    (a sync thread) waits on it for acknowledgements that NodeConsumer.receive
+    records as 'file_push_ack' messages arrive.
+    """
+    def __init__(self, transfer_id):
+        self.transfer_id = transfer_id
+        self.acked = 0
+        self.result = None
+        self.cond = threading.Condition()
+
+    def acknowledge(self, ack):
+        with self.cond:
+            self.acked = max(self.acked, ack.get("offset", 0))
+            if ack.get("done") or ack.get("error"):
+                self.result = ack
+            self.cond.notify_all()
+
+    def wait(self, predicate, timeout):
+        with self.cond:
+            return self.cond.wait_for(lambda: self.result is not None or predicate(), timeout)
+
+# (node_id, transfer_id) -> PushTransfer for pushes in progress.
+file_pushes = {}
+
 class CustomJsonEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
@@ -80,6 +112,33 @@ class NodeConsumer(AsyncWebsocketConsumer):
         await self.send(text_data=json.dumps(command))
         logger.info(f"Command sent to node {self.node_id} Req ID: {request_id}")
 
+    async def send_input_to_node(self, controller_id, seq, events):
+        """
+        Forwards live remote control input. Nothing is recorded in req_resp and
+        the node sends no response, so per-event traffic leaves no state behind.
+        """
+        await self.send(text_data=json.dumps({ "type": "input", "controllerId": controller_id, "seq": seq, "events": events }))
+        logger.debug(f"Input seq {seq} ({len(events)} events) sent to node {self.node_id}")
+
+    async def ack_transfer(self, transfer_id, offset):
+        """Tells the node that chunks of a transfer up to `offset` were handed to the orchestrator."""
+        await self.send(text_data=json.dumps({ "type": "file_chunk_ack", "transferId": transfer_id, "offset": offset }))
+
+    async def push_file_chunk(self, chunk):
+        await self.send(text_data=json.dumps(dict(chunk, type="file_push_chunk")))
+
+    def store_file_chunk(self, message):
+        transfer = file_transfers.setdefault((self.node_id, message.get('transferId')), { "chunks": deque(), "updated": timezone.now() })
+        transfer["chunks"].append({
+            "offset": message.get("offset", 0),
+            "data": base64.b64decode(message.get("data") or ""),
+            "eof": message.get("eof", False),
+            "size": message.get("size"),
+            "sha256": message.get("sha256"),
+            "error": message.get("error"),
+        })
+        transfer["updated"] = timezone.now()
+
     async def receive(self, text_data=None, bytes_data=None):
         if not text_data: return
         try:
@@ -94,6 +153,12 @@ class NodeConsumer(AsyncWebsocketConsumer):
                 if req_id:
                     req_resp.setdefault((self.node_id, req_id), [{}, {}])[1] = response
                     logger.info(f"Updated command status for {req_id}.")
+            elif msg_type == 'file_chunk':
+                self.store_file_chunk(message)
+            elif msg_type == 'file_push_ack':
+                push = file_pushes.get((self.node_id, message.get('transferId')))
+                if push:
+                    push.acknowledge(message)
             elif msg_type == 'image_frame':
                 frame_data_base64 = message.get("frame_data")
                 if not frame_data_base64:
@@ -103,12 +168,22 @@ class NodeConsumer(AsyncWebsocketConsumer):
                 if controller_consumer:
                     try:
                         # Directly call the specific method on the controller's consumer instance
-                        await controller_consumer.send_image_frame(frame_data_base64)
+                        await controller_consumer.send_image_frame(frame_data_base64, message.get("mime_type", "image/jpeg"))
                         logger.info(f"Forwarded image_frame from node {self.node_id} to controller.")
                     except Exception as e:
                         logger.exception(f"Failed to forward image_frame from {self.node_id}: {e}")
                 else:
                     logger.warning(f"No controller attached to node {self.node_id}; dropped image_frame.")
+            elif msg_type == 'image_tile_frame':
+                controller_consumer = node_connections.get(self.node_id)
+                if controller_consumer:
+                    try:
+                        await controller_consumer.send_tile_frame(message)
+                        logger.debug(f"Forwarded image_tile_frame {message.get('frame_id')} from node {self.node_id} to controller.")
+                    except Exception as e:
+                        logger.exception(f"Failed to forward image_tile_frame from {self.node_id}: {e}")
+                else:
+                    logger.warning(f"No controller attached to node {self.node_id}; dropped image_tile_frame.")
             else:
                 logger.warning(f"Unknown message type: {msg_type}")
         except Exception as e:
@@ -120,5 +195,8 @@ async def cleanup_commands():
         cutoff = timezone.now() - timezone.timedelta(minutes=CLEANUP_INTERVAL_MINUTES)
         for key, data in list(req_resp.items()):
             timestamp = data[0].get('timestamp', 0)
-            if datetime.fromtimestamp(timestamp) < cutoff:
+            if timestamp < cutoff.timestamp():
                 del req_resp[key]
+        for key, transfer in list(file_transfers.items()):
+            if transfer["updated"] < cutoff:
+                file_transfers.pop(key, None)
@@ -9,6 +9,8 @@ urlpatterns = [
     path('node/filter/', views.NodeMetadataView.as_view(), name='nodes_metadata'),
     path('<str:batch_id>/node/<str:node_id>/request/<str:request_id>/', views.RequestView.as_view(), name='command_send'),
     path('<str:batch_id>/node/<str:node_id>/response/<str:request_id>/', views.ResponseView.as_view(), name='command_status'),
+    path('<str:batch_id>/node/<str:node_id>/transfer/<str:transfer_id>/', views.TransferView.as_view(), name='transfer_pull'),
+    path('<str:batch_id>/node/<str:node_id>/push/', views.PushView.as_view(), name='file_push'),
     path('<str:batch_id>/node/<str:node_id>/release/', views.NodeReleaseView.as_view()),
 
     # File retrieval by batch server
@@ -1,5 +1,8 @@
 # File: django-rpa-relay-standalone/relay_server/views.py
 
+import uuid
+import base64
+import hashlib
 import logging
 import json
 from django.http import JsonResponse, HttpResponse
@@ -20,10 +23,16 @@ from asgiref.sync import async_to_sync
 
 from channels.db import database_sync_to_async
 
-from .consumers import nodes_available, req_resp, node_connections
+from .consumers import nodes_available, req_resp, node_connections, file_transfers, file_pushes, PushTransfer
 
 logger = logging.getLogger(__name__)
 
+# File pushes (PushView): bytes per WebSocket chunk, unacknowledged chunks per push,
+# and how long to wait for the node to acknowledge before giving up.
+PUSH_CHUNK_SIZE = 1024 * 1024
+PUSH_WINDOW = 8
+PUSH_ACK_TIMEOUT_SECONDS = 60
+
 # --- APIView for handling RPA Command Requests (from Orchestrator to RPA Node) ---
 class RequestView(APIView):
     authentication_classes = [OAuth2Authentication]
@@ -108,6 +117,129 @@ class ResponseView(APIView):
         
         return Response(response_data, status=status.HTTP_200_OK)
 
+# --- APIView for pulling chunked transfers (from RPA Node to Orchestrator) ---
+class TransferView(APIView):
+    """
+    Serves the next buffered chunk of a transfer started with a streaming command
+    (e.g. get_file with 'stream': true) as a raw body. X-Transfer-Offset gives its
+    position; the last chunk is empty and carries X-Transfer-Eof, X-Transfer-Size and
+    X-Transfer-Sha256. Serving a chunk acknowledges it to the node, which opens its
+    send window, so the relay never holds more than a window of any transfer.
+    """
+    authentication_classes = [OAuth2Authentication]
+
+    def get(self, request, batch_id, node_id, transfer_id, *args, **kwargs):
+        key = (node_id, transfer_id)
+        transfer = file_transfers.get(key)
+        if not transfer or not transfer["chunks"]:
+            return Response({"status": "pending", "message": "No chunk available yet.", "transfer_id": transfer_id}, status=status.HTTP_202_ACCEPTED)
+
+        chunk = transfer["chunks"].popleft()
+        if chunk["error"]:
+            file_transfers.pop(key, None)
+            logger.warning(f"TransferView: Transfer {transfer_id} from node {node_id} failed at offset {chunk['offset']}: {chunk['error']}")
+            return Response({"status": "error", "message": chunk["error"], "offset": chunk["offset"], "transfer_id": transfer_id}, status=status.HTTP_200_OK)
+
+        response = HttpResponse(chunk["data"], content_type="application/octet-stream")
+        response["X-Transfer-Offset"] = str(chunk["offset"])
+        if chunk["eof"]:
+            file_transfers.pop(key, None)
+            response["X-Transfer-Eof"] = "1"
+            response["X-Transfer-Size"] = str(chunk["size"])
+            response["X-Transfer-Sha256"] = chunk["sha256"] or ""
+            logger.info(f"TransferView: Transfer {transfer_id} from node {node_id} complete ({chunk['size']} bytes).")
+        else:
+            node_consumer = nodes_available.get(node_id)
+            if node_consumer:
+                async_to_sync(node_consumer.ack_transfer)(transfer_id, chunk["offset"] + len(chunk["data"]))
+        return response
+
+
+# --- APIView for streaming a file to an RPA Node (from Orchestrator to RPA Node) ---
+class PushView(APIView):
+    """
+    Streams a file to a node. The body is either the raw file (with ?filename=...)
+    or multipart with a 'file' field; it is read in PUSH_CHUNK_SIZE pieces and
+    relayed as 'file_push_chunk' messages, with at most PUSH_WINDOW chunks
+    unacknowledged by the node. Neither the relay nor the node ever holds the
+    whole file. An optional ?sha256= is checked against the received bytes
+    before the node is told to commit. The node writes the file under its
+    download directory and renames it into place only after verifying it.
+    """
+    authentication_classes = [OAuth2Authentication]
+
+    def post(self, request, batch_id, node_id, *args, **kwargs):
+        node_consumer = nodes_available.get(node_id)
+        if not node_consumer:
+            return Response({"status": "node_unavailable", "message": f"RPA Node {node_id} is not currently connected."}, status=status.HTTP_200_OK)
+
+        if request.content_type.startswith("multipart/"):
+            upload = request.FILES.get("file")
+            if upload is None:
+                return Response({"status": "error", "message": "Multipart push requires a 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+            source, filename = upload, request.query_params.get("filename") or upload.name
+        else:
+            source, filename = request.stream, request.query_params.get("filename")
+        if not filename:
+            return Response({"status": "error", "message": "filename is required."}, status=status.HTTP_400_BAD_REQUEST)
+        expected_sha256 = (request.query_params.get("sha256") or "").lower()
+        # ?cache=0 keeps one-off content (e.g. sync deltas) out of the node's blob cache.
+        cache = request.query_params.get("cache", "1") not in ("0", "false")
+
+        transfer_id = uuid.uuid4().hex
+        key = (node_id, transfer_id)
+        push = file_pushes[key] = PushTransfer(transfer_id)
+        send = async_to_sync(node_consumer.push_file_chunk)
+        hasher = hashlib.sha256()
+        offset = 0
+        try:
+            while True:
+                data = source.read(PUSH_CHUNK_SIZE) if source is not None else b""
+                if not data:
+                    break
+                if not push.wait(lambda: offset - push.acked < PUSH_WINDOW * PUSH_CHUNK_SIZE, PUSH_ACK_TIMEOUT_SECONDS):
+                    raise TimeoutError(f"Node did not acknowledge the push at offset {push.acked}.")
+                if push.result is not None:
+                    break
+                hasher.update(data)
+                send({"transferId": transfer_id, "filename": filename, "offset": offset, "data": base64.b64encode(data).decode("ascii")})
+                offset += len(data)
+
+            if push.result is None:
+                digest = hasher.hexdigest()
+                if expected_sha256 and expected_sha256 != digest:
+                    send({"transferId": transfer_id, "offset": offset, "abort": True, "error": "SHA-256 of the uploaded body does not match."})
+                    return Response({"status": "error", "message": f"SHA-256 mismatch: received {digest}, expected {expected_sha256}.", "transfer_id": transfer_id}, status=status.HTTP_400_BAD_REQUEST)
+                send({"transferId": transfer_id, "filename": filename, "offset": offset, "data": "", "eof": True, "size": offset, "sha256": digest, "cache": cache})
+                if not push.wait(lambda: False, PUSH_ACK_TIMEOUT_SECONDS):
+                    raise TimeoutError("Node did not confirm the completed push.")
+
+            result = push.result
+            if result.get("error"):
+                logger.warning(f"PushView: Push {transfer_id} to node {node_id} failed: {result['error']}")
+                return Response({"status": "error", "message": result["error"], "offset": result.get("offset"), "transfer_id": transfer_id}, status=status.HTTP_502_BAD_GATEWAY)
+            logger.info(f"PushView: Pushed '{filename}' ({offset} bytes) to node {node_id} as {result.get('path')}.")
+            return Response({
+                "status": "success",
+                "transfer_id": transfer_id,
+                "node_id": node_id,
+                "path": result.get("path"),
+                "size": result.get("size"),
+                "sha256": result.get("sha256")
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            logger.exception(f"PushView: Push {transfer_id} to node {node_id} failed: {e}")
+            consumer = nodes_available.get(node_id)
+            if consumer:
+                try:
+                    async_to_sync(consumer.push_file_chunk)({"transferId": transfer_id, "offset": offset, "abort": True, "error": str(e)})
+                except Exception:
+                    pass
+            return Response({"status": "error", "message": str(e), "transfer_id": transfer_id}, status=status.HTTP_504_GATEWAY_TIMEOUT if isinstance(e, TimeoutError) else status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            file_pushes.pop(key, None)
+
+
 # --- Standard Django Views (no changes needed for CSRF if they don't accept POST from external clients) ---
 class NodeMetadataView(View):
     def get(self, request, *args, **kwargs):
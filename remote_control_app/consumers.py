@@ -2,6 +2,7 @@
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
+import uuid
 import logging
 import base64
 
@@ -19,21 +20,46 @@ class RemoteControlConsumer(AsyncWebsocketConsumer):
             await self.close(code=4004)
             return
 
+        # The controller identity belongs to this connection, never to the message body,
+        # so one viewer cannot act as (or stop) another viewer's session.
+        user = self.scope.get('user')
+        username = user.get_username() if user is not None and user.is_authenticated else 'anonymous'
+        self.controller_id = f"{username}-{uuid.uuid4().hex}"
+
         await self.accept()
         node_connections[self.node_id] = self
-        logger.info(f"[RemoteControl] Controller for node {self.node_id} connected.")
+        await self.send(text_data=json.dumps({ "type": "controller_assigned", "controllerId": self.controller_id }))
+        logger.info(f"[RemoteControl] Controller {self.controller_id} for node {self.node_id} connected.")
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'controller_id'):
+            return
         if node_connections.get(self.node_id) == self:
             node_connections.pop(self.node_id, None)
-        logger.info(f"[RemoteControl] Controller for node {self.node_id} disconnected.")
+        # Release the node if this viewer still holds it; the node ignores the stop otherwise.
+        node_consumer = nodes_available.get(self.node_id)
+        if node_consumer:
+            request_id = f"rc_stop_{uuid.uuid4().hex}"
+            await node_consumer.send_command_to_node(request_id, {
+                "commandType": "stop_remote_control",
+                "requestId": request_id,
+                "params": { "controllerId": self.controller_id, "nodeId": self.node_id }
+            })
+        logger.info(f"[RemoteControl] Controller {self.controller_id} for node {self.node_id} disconnected.")
 
     async def receive(self, text_data=None, bytes_data=None):
         if text_data:
             try:
                 data = json.loads(text_data)
+                if data.get("type") == "input":
+                    await self.forward_input(data)
+                    return
                 command_type = data.get("commandType")
                 request_id = data.get("requestId", "unknown")
+                params = data.get("params")
+                if not isinstance(params, dict):
+                    params = data["params"] = {}
+                params["controllerId"] = self.controller_id
                 node_consumer = nodes_available.get(self.node_id)
                 if node_consumer:
                     await node_consumer.send_command_to_node(request_id, data)
@@ -44,11 +70,42 @@ class RemoteControlConsumer(AsyncWebsocketConsumer):
             except Exception as e:
                 logger.exception(f"Error processing command from controller for node {self.node_id}: {e}")
 
-    async def send_image_frame(self, frame_data_base64):
+    async def forward_input(self, data):
+        """
+        Input lane: forwards live input events to the node without request bookkeeping.
+        Input for a node that is gone is dropped; the viewer sees the disconnect on its own.
+        """
+        events = data.get("events")
+        if not isinstance(events, list):
+            logger.warning(f"[RemoteControl] Malformed input message for node {self.node_id}; dropped.")
+            return
+        node_consumer = nodes_available.get(self.node_id)
+        if node_consumer:
+            await node_consumer.send_input_to_node(self.controller_id, data.get("seq"), events)
+        else:
+            logger.debug(f"[RemoteControl] Node {self.node_id} not available; dropped input seq {data.get('seq')}.")
+
+    async def send_image_frame(self, frame_data_base64, mime_type='image/jpeg'):
         """
         Receives a base64 encoded image frame and sends it to the web controller.
         """
         await self.send(text_data=json.dumps({
             'type': 'image_frame',
-            'frame_data': frame_data_base64
+            'frame_data': frame_data_base64,
+            'mime_type': mime_type
+        }))
+
+    async def send_tile_frame(self, tile_frame):
+        """
+        Sends a delta frame (changed tiles with their coordinates) to the web controller,
+        which composites the tiles onto its canvas. Keyframes carry a single full-screen tile.
+        """
+        await self.send(text_data=json.dumps({
+            'type': 'image_tile_frame',
+            'frame_id': tile_frame.get('frame_id'),
+            'keyframe': tile_frame.get('keyframe', False),
+            'mime_type': tile_frame.get('mime_type', 'image/jpeg'),
+            'width': tile_frame.get('width'),
+            'height': tile_frame.get('height'),
+            'tiles': tile_frame.get('tiles', [])
         }))